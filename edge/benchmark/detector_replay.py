@@ -0,0 +1,247 @@
+# benchmark/detector_replay.py
+#
+# 以現場錄製檔 (data_capture/frame_recorder.py 產生的 .edgerec) 直接驅動偵測器，不執行模型：
+# 錄製的偵測結果與雲端結果依錄製時間順序送入與主程式相同的 追蹤器 -> 偵測器 -> 捕獲/上傳 路徑，
+# 事件冷卻時間與限流依錄製時間計算，因此可以快速比較不同偵測器設定 (ROI、區域、閾值) 觸發的事件。
+#
+# 用法 (在 edge/ 目錄下):
+#   python -m benchmark.detector_replay --recording recordings/ --config config/settings.yaml --output replay.json
+
+import sys
+import json
+import time
+import queue
+import signal
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+import yaml
+
+from benchmark.replay_benchmark import BENCHMARK_THING_NAME, prepare_settings
+from benchmark.stubs import MockIoTClient, MockS3Client, StubInferenceBackend
+from data_capture.capture_manager import CaptureManager
+from data_capture.recording import RecordedFrame, RecordingReader, list_recordings
+from detectors.tracker import MultiObjectTracker
+from events.event_manager import EventManager
+from events.event_publisher import EventPublisher
+from events.result_store import CloudResult, ResultStore
+from inference.backends import Detection
+from inference.detection_table import DetectionTable
+from inference.inferencer import ObjectDetector
+from utils.s3_uploader import S3Uploader
+from main import create_detectors
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayClock:
+    """
+    重播時鐘：返回目前重播到的錄製時間，取代 EventManager 與偵測器的時鐘。
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def detections_from_records(records: np.ndarray) -> List[Detection]:
+    """
+    將錄製的偵測結果表轉換回偵測結果物件 (座標為原始分辨率)。
+    """
+    return [Detection(class_id, confidence, *bbox)
+            for class_id, confidence, bbox in zip(records['class_id'].tolist(), records['confidence'].tolist(),
+                                                  records['bbox'].tolist())]
+
+
+def run_replay(settings: dict, args: argparse.Namespace, stop_event: threading.Event) -> Dict[str, Any]:
+    """
+    以錄製檔驅動偵測器。
+    Args:
+        settings (dict): 完整設定 (偵測器使用這份設定，而不是錄製時的設定)。
+        args (argparse.Namespace): 命令列參數。
+        stop_event (threading.Event): 停止標誌。
+    Returns:
+        Dict[str, Any]: 重播報告。
+    """
+    paths = list_recordings(args.recording)
+    if not paths:
+        raise ValueError(f"'{args.recording}' 中沒有錄製檔。")
+
+    work_dir = tempfile.mkdtemp(prefix="edge-replay-")
+    settings = prepare_settings(settings, work_dir)
+    # 事件直接發布 (不經過寄件匣執行緒)，短片錄製依實際時間收集幀，重播時停用
+    settings['events'].setdefault('outbox', {})['enabled'] = False
+    settings['capture'].setdefault('clip', {})['enabled'] = False
+
+    clock = ReplayClock()
+    s3_client = MockS3Client()
+    s3_settings = settings['aws']['s3']
+    s3_uploader = S3Uploader(settings['aws'], queue.Queue(maxsize=s3_settings.get('upload_queue_maxsize', 10)),
+                             s3_client=s3_client)
+    s3_uploader.start()
+    iot_client = MockIoTClient(keep_payloads=True, clock=clock)
+
+    event_settings = settings.get('events', {})
+    event_manager = EventManager(event_settings, clock=clock)
+    event_publisher = EventPublisher(iot_client, BENCHMARK_THING_NAME, event_settings.get('outbox', {}))
+    result_store = ResultStore(event_settings.get('result_store', {}), default_camera_id=BENCHMARK_THING_NAME)
+    capture_manager = CaptureManager(s3_uploader, s3_settings, settings.get('capture', {}))
+
+    # 偵測器只需要推論器的類別映射 (不載入模型，推論後端不會被調用)
+    class_mapping = settings.get('models', {}).get('object_detection', {}).get('class_mapping', {}) or {}
+    object_detector = ObjectDetector(model=StubInferenceBackend(), class_mapping=class_mapping)
+    detectors, _, qr_service = create_detectors(
+        settings, object_detector, event_manager, event_publisher, capture_manager, result_store, {}
+    )
+    for detector in detectors:
+        detector.clock = clock
+    tracker = None
+    tracker_settings = settings.get('detectors', {}).get('tracker', {}) or {}
+    if tracker_settings.get('enabled', False):
+        tracker = MultiObjectTracker(tracker_settings)
+
+    frame_size = None
+    frames = results = skipped = 0
+    first_time = last_time = None
+    start_time = time.monotonic()
+    for path in paths:
+        if stop_event.is_set():
+            break
+        try:
+            reader = RecordingReader(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"略過無法讀取的錄製檔: {e}")
+            continue
+        header = reader.header
+        size = (int(header["frame_width"]), int(header["frame_height"]))
+        if frame_size is None:
+            frame_size = size
+            capture_manager.configure_frame_shape(size[1], size[0])
+        elif size != frame_size:
+            logger.warning(f"錄製檔 '{path}' 的分辨率 {size} 與第一個錄製檔 {frame_size} 不同，已略過。")
+            reader.close()
+            continue
+        logger.info(f"重播錄製檔: {path} ({reader.frame_count} 幀，{reader.result_count} 筆雲端結果)")
+
+        for record in reader.iter_records(args.start, args.end):
+            if stop_event.is_set():
+                break
+            clock.now = record.timestamp
+            first_time = record.timestamp if first_time is None else first_time
+            last_time = record.timestamp
+
+            if not isinstance(record, RecordedFrame):
+                result_store.insert(CloudResult(record.kind, record.key, record.camera_id, record.timestamp, record.data))
+                results += 1
+                continue
+
+            # 錄製的是縮小的幀，放大回原始分辨率後寫入緩衝區 (偵測結果與 ROI 都是原始分辨率的座標)
+            frame = record.decode()
+            if frame is None:
+                skipped += 1
+                continue
+            seq, slot = capture_manager.acquire_frame_slot()
+            if frame.shape[1::-1] != frame_size:
+                frame = cv2.resize(frame, frame_size, dst=slot, interpolation=cv2.INTER_LINEAR)
+            capture_manager.commit_frame(seq, frame, record.timestamp)
+
+            detections = detections_from_records(record.records)
+            table = DetectionTable.from_detections(detections, object_detector.class_index)
+            tracks = tracker.update(table) if tracker is not None else None
+            capture_manager.set_frame_detections(seq, None, detections, table)
+            frame_data = capture_manager.get_frame(seq)
+            for detector in detectors:
+                try:
+                    detector.process(None, detections, tracks=tracks, detection_table=table, frame_data=frame_data)
+                except Exception as e:
+                    logger.error(f"偵測器 '{detector.__class__.__name__}' 處理失敗: {e}", exc_info=True)
+            frames += 1
+        reader.close()
+    elapsed = time.monotonic() - start_time
+
+    if qr_service:
+        qr_service.shutdown()
+    capture_manager.shutdown()
+    s3_uploader.wait_for_completion(timeout=s3_settings.get('shutdown_timeout_sec', 30))
+    s3_uploader.stop()
+    s3_uploader.join()
+    event_publisher.close()
+
+    events = [
+        {"recorded_time": round(publish_time, 3), "event_type": payload.get("event_type"),
+         "s3_image_path": payload.get("s3_image_path"), "metadata": payload.get("metadata")}
+        for publish_time, payload in zip(iot_client.publish_times, iot_client.payloads)
+    ]
+    media_sec = (last_time - first_time) if first_time is not None else 0.0
+    report = {
+        "recording": args.recording,
+        "segments": len(paths),
+        "wall_time_sec": round(elapsed, 3),
+        "recorded_time_sec": round(media_sec, 3),
+        "start_time": first_time,
+        "end_time": last_time,
+        "frames": frames,
+        "frames_skipped": skipped,
+        "cloud_results": results,
+        "events": {
+            "triggered": event_manager.get_metrics()["accepted"],
+            "total": len(events),
+            "by_type": dict(iot_client.published_by_type),
+        },
+        "uploads": {"total": s3_client.upload_count, "bytes": s3_client.upload_bytes},
+        "event_list": events,
+    }
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="以現場錄製檔重播偵測器 (不執行模型)")
+    parser.add_argument("--recording", required=True, help="錄製檔，或包含錄製檔分段的目錄")
+    parser.add_argument("--config", default="config/settings.yaml", help="設定檔案 (偵測器使用這份設定)")
+    parser.add_argument("--start", type=float, default=None, help="開始時間 (Unix 時間戳)")
+    parser.add_argument("--end", type=float, default=None, help="結束時間 (Unix 時間戳)")
+    parser.add_argument("--output", default=None, help="報告輸出路徑 (預設輸出到標準輸出)")
+    parser.add_argument("--log-level", default="WARNING", help="日誌級別")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            settings = yaml.safe_load(f) or {}
+    except (FileNotFoundError, yaml.YAMLError) as e:
+        logger.error(f"載入設定檔案時發生錯誤: {e}")
+        return 1
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    try:
+        report = run_replay(settings, args, stop_event)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    report_json = json.dumps(report, indent=2, ensure_ascii=False, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report_json)
+        print(f"重播報告已寫入 {args.output}", file=sys.stderr)
+    else:
+        print(report_json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
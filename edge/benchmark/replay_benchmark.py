@@ -0,0 +1,346 @@
+# benchmark/replay_benchmark.py
+#
+# 以影片檔案或影像目錄重播，走與主程式相同的 擷取 -> 推論 -> 偵測器 -> 捕獲/上傳 路徑，
+# 以可替換的推論後端與模擬的 IoT/S3 接收端測量吞吐量與延遲，輸出 JSON 報告。
+#
+# 用法 (在 edge/ 目錄下):
+#   python -m benchmark.replay_benchmark --source videos/dock.mp4 --clock fast \
+#       --stub-latency-ms 25 --random-objects 3 --output bench.json
+
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import signal
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import yaml
+
+from benchmark.replay_source import ReplaySource, CLOCK_FAST, CLOCK_REALTIME
+from benchmark.stubs import StubInferenceBackend, MockIoTClient, MockS3Client
+from data_capture.capture_manager import CaptureManager
+from detectors.tracker import MultiObjectTracker
+from events.event_manager import EventManager
+from events.event_publisher import EventPublisher
+from events.result_store import ResultStore
+from inference.inferencer import ObjectDetector
+from inference.model_manager import ModelManager
+from pipeline.frame_pipeline import FramePipeline
+from utils.s3_uploader import S3Uploader
+from main import create_detectors
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_THING_NAME = "benchmark"
+BENCHMARK_BUCKET = "benchmark-bucket"
+MAX_LATENCY_SAMPLES = 100000 # 每個階段最多保留的延遲樣本數 (超出時保留最新的)
+
+
+class LatencyRecorder:
+    """
+    收集各階段的延遲樣本 (作為 FramePipeline 的 stage_observer)，並計算百分位數。
+    """
+    def __init__(self, max_samples: int = MAX_LATENCY_SAMPLES):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+
+    def __call__(self, name: str, elapsed_sec: float):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.max_samples)
+            samples.append(elapsed_sec)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            Dict[str, Dict[str, float]]: 階段名稱 -> 樣本數、平均、p50/p95/p99 與最大延遲 (毫秒)。
+        """
+        with self._lock:
+            snapshot = {name: np.fromiter(samples, dtype=np.float64) for name, samples in self._samples.items()}
+        result = {}
+        for name, values in sorted(snapshot.items()):
+            if values.size == 0:
+                continue
+            values_ms = values * 1000.0
+            p50, p95, p99 = np.percentile(values_ms, [50, 95, 99])
+            result[name] = {
+                "count": int(values.size),
+                "mean_ms": round(float(values_ms.mean()), 3),
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+                "max_ms": round(float(values_ms.max()), 3),
+            }
+        return result
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """
+    Returns:
+        Dict[str, float]: 本進程與已結束子進程 (例如 QR 解碼、短片編碼工作進程) 的峰值 RSS (MB)。
+    """
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為位元組
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+
+def _per_minute(count: int, seconds: float) -> float:
+    return round(count * 60.0 / seconds, 2) if seconds > 0 else 0.0
+
+
+def prepare_settings(settings: dict, work_dir: str) -> dict:
+    """
+    複製設定並將所有本地寫入 (S3 暫存區、事件寄件匣、短片暫存目錄) 導向基準測試的工作目錄，
+    避免影響設備上的實際暫存資料。
+    """
+    settings = copy.deepcopy(settings)
+    aws_settings = settings.setdefault('aws', {})
+    s3_settings = aws_settings.setdefault('s3', {})
+    s3_settings['bucket_name'] = s3_settings.get('bucket_name') or BENCHMARK_BUCKET
+    s3_settings['spool_dir'] = os.path.join(work_dir, "s3")
+
+    event_settings = settings.setdefault('events', {})
+    outbox_settings = event_settings.get('outbox') or {}
+    if outbox_settings.get('enabled', False):
+        outbox_settings['path'] = os.path.join(work_dir, "event_outbox.db")
+
+    clip_settings = settings.setdefault('capture', {}).get('clip') or {}
+    if clip_settings.get('enabled', False):
+        clip_settings['output_dir'] = os.path.join(work_dir, "clips")
+    return settings
+
+
+def create_inference_backend(settings: dict, args: argparse.Namespace):
+    """
+    建立推論後端：預設為 StubInferenceBackend，指定 --real-model 時依設定載入實際模型。
+    Returns:
+        Tuple[InferenceBackend, Optional[ModelManager]]: 推論後端與 (實際模型時的) 模型管理器。
+    """
+    model_settings = settings.get('models', {})
+    if args.real_model:
+        model_manager = ModelManager(model_settings)
+        backend = model_manager.get_model("object_detection") if model_manager.preload() else None
+        if backend is None:
+            raise RuntimeError("無法載入物件偵測模型。")
+        return backend, model_manager
+
+    fixed_detections = None
+    if args.detections:
+        with open(args.detections, 'r', encoding='utf-8') as f:
+            fixed_detections = json.load(f)
+    class_mapping = model_settings.get('object_detection', {}).get('class_mapping', {}) or {}
+    class_ids = [int(class_id) for class_id in class_mapping] or [1]
+    return StubInferenceBackend(
+        latency_ms=args.stub_latency_ms, jitter_ms=args.stub_jitter_ms, detections=fixed_detections,
+        random_objects=args.random_objects, class_ids=class_ids, seed=args.seed
+    ), None
+
+
+def run_benchmark(settings: dict, args: argparse.Namespace, stop_event: threading.Event) -> Dict[str, Any]:
+    """
+    執行一次重播基準測試。
+    Args:
+        settings (dict): 完整設定 (與主程式相同的 settings.yaml)。
+        args (argparse.Namespace): 命令列參數。
+        stop_event (threading.Event): 停止標誌 (收到信號或超過 --duration 時設置)。
+    Returns:
+        Dict[str, Any]: 基準測試報告。
+    """
+    work_dir = tempfile.mkdtemp(prefix="edge-benchmark-")
+    settings = prepare_settings(settings, work_dir)
+    source = ReplaySource(args.source, clock=args.clock, fps=args.fps, loop=args.loop, max_frames=args.max_frames)
+
+    s3_client = MockS3Client(latency_ms=args.s3_latency_ms, bandwidth_mbps=args.s3_bandwidth_mbps)
+    s3_settings = settings['aws']['s3']
+    s3_uploader = S3Uploader(settings['aws'], queue.Queue(maxsize=s3_settings.get('upload_queue_maxsize', 10)),
+                             s3_client=s3_client)
+    s3_uploader.start()
+    iot_client = MockIoTClient(publish_latency_ms=args.iot_latency_ms)
+
+    backend, model_manager = create_inference_backend(settings, args)
+    model_settings = settings.get('models', {})
+    object_detector = ObjectDetector(
+        model=backend, class_mapping=model_settings.get('object_detection', {}).get('class_mapping', {})
+    )
+
+    # fast 時鐘下冷卻時間與限流依影片時間計算，事件數量才能與實際播放速度比較
+    event_settings = settings.get('events', {})
+    event_manager = EventManager(event_settings, clock=source.media_time if args.clock == CLOCK_FAST else time.monotonic)
+    event_publisher = EventPublisher(iot_client, BENCHMARK_THING_NAME, event_settings.get('outbox', {}))
+    result_store = ResultStore(event_settings.get('result_store', {}), default_camera_id=BENCHMARK_THING_NAME)
+    capture_manager = CaptureManager(s3_uploader, s3_settings, settings.get('capture', {}))
+    capture_manager.configure_frame_shape(source.frame_height, source.frame_width)
+
+    detectors, _, qr_service = create_detectors(
+        settings, object_detector, event_manager, event_publisher, capture_manager, result_store, {}
+    )
+    tracker = None
+    tracker_settings = settings.get('detectors', {}).get('tracker', {}) or {}
+    if tracker_settings.get('enabled', False):
+        tracker = MultiObjectTracker(tracker_settings)
+
+    recorder = LatencyRecorder()
+
+    def observe(name: str, elapsed_sec: float):
+        # 擷取延遲只計算解碼與寫入槽位，不包含等待播放節奏或管線的時間 (觀察者在擷取執行緒中緊接著 read() 調用)
+        if name == "capture":
+            elapsed_sec = max(0.0, elapsed_sec - source.last_wait_sec)
+        recorder(name, elapsed_sec)
+
+    pipeline = FramePipeline(source, capture_manager, object_detector, detectors, settings.get('pipeline', {}),
+                             stop_event, display_enabled=False, tracker=tracker, stage_observer=observe)
+    if args.clock == CLOCK_FAST:
+        # 等待上一幀離開佇列再讀取下一幀，每一幀都會被處理 (測量的是管線本身的最大吞吐量)
+        source.gate = lambda: pipeline.inference_queue.qsize() == 0 and pipeline.dispatch_queue.qsize() == 0
+
+    logger.info(f"開始重播基準測試: {args.source} (時鐘: {args.clock}，偵測器: {[d.__class__.__name__ for d in detectors]})")
+    start_time = time.monotonic()
+    pipeline.start()
+    while not stop_event.is_set():
+        if source.finished.is_set():
+            break
+        if args.duration and time.monotonic() - start_time >= args.duration:
+            break
+        stop_event.wait(0.1)
+
+    # 播放結束後等待管線中剩餘的幀處理完成
+    drain_deadline = time.monotonic() + 10.0
+    while (pipeline.inference_queue.qsize() or pipeline.dispatch_queue.qsize()) and time.monotonic() < drain_deadline:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start_time
+    pipeline_metrics = pipeline.get_metrics()
+    pipeline.stop()
+    pipeline.join()
+
+    # 等待背景的編碼與上傳完成，讓上傳數量反映這次播放觸發的所有事件
+    if qr_service:
+        qr_service.shutdown()
+    capture_manager.shutdown()
+    s3_uploader.wait_for_completion(timeout=s3_settings.get('shutdown_timeout_sec', 30))
+    s3_uploader.stop()
+    s3_uploader.join()
+    event_publisher.close()
+    source.release()
+    model_metrics = {}
+    if model_manager is not None:
+        model_metrics = model_manager.get_metrics()
+        model_manager.unload_all_models()
+
+    media_sec = source.media_time()
+    stages = pipeline_metrics["stages"]
+    events_total = sum(iot_client.published_by_type.values())
+    dropped = sum(q["dropped"] for q in pipeline_metrics["queues"].values())
+    report = {
+        "source": args.source,
+        "clock": args.clock,
+        "inference": getattr(backend, "name", backend.__class__.__name__),
+        "wall_time_sec": round(elapsed, 3),
+        "media_time_sec": round(media_sec, 3),
+        "frames": {
+            "read": source.frames_read,
+            "captured": pipeline_metrics["captured_frames"],
+            "inferred": stages["inference"]["processed"],
+            "dispatched": stages["dispatch"]["processed"],
+            "dropped": dropped,
+        },
+        "fps": {
+            "capture": round(pipeline_metrics["captured_frames"] / elapsed, 2) if elapsed > 0 else 0.0,
+            "processed": round(stages["dispatch"]["processed"] / elapsed, 2) if elapsed > 0 else 0.0,
+        },
+        "latency_ms": recorder.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+        "events": {
+            "triggered": event_manager.get_metrics()["accepted"],
+            "total": events_total,
+            "per_minute": _per_minute(events_total, elapsed),
+            "per_media_minute": _per_minute(events_total, media_sec),
+            "by_type": dict(iot_client.published_by_type),
+        },
+        "uploads": {
+            "total": s3_client.upload_count,
+            "bytes": s3_client.upload_bytes,
+            "per_minute": _per_minute(s3_client.upload_count, elapsed),
+            "per_media_minute": _per_minute(s3_client.upload_count, media_sec),
+        },
+        "components": {
+            "pipeline": pipeline_metrics,
+            "encoder": capture_manager.get_encoder_metrics(),
+            "clips": capture_manager.get_clip_metrics(),
+            "s3": s3_uploader.get_metrics(),
+            "event_manager": event_manager.get_metrics(),
+            "qr": qr_service.get_metrics() if qr_service else {},
+            "models": model_metrics,
+        },
+    }
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="邊緣偵測管線的重播基準測試")
+    parser.add_argument("--source", required=True, help="影片檔案或影像目錄")
+    parser.add_argument("--config", default="config/settings.yaml", help="設定檔案 (與主程式相同)")
+    parser.add_argument("--clock", choices=[CLOCK_REALTIME, CLOCK_FAST], default=CLOCK_FAST,
+                        help="realtime: 依來源幀率播放；fast: 盡可能快地播放 (不丟幀)")
+    parser.add_argument("--fps", type=float, default=None, help="播放幀率 (預設為影片幀率，影像目錄為 30)")
+    parser.add_argument("--loop", type=int, default=1, help="重複播放次數")
+    parser.add_argument("--max-frames", type=int, default=None, help="最多播放的幀數")
+    parser.add_argument("--duration", type=float, default=None, help="最長執行秒數")
+    parser.add_argument("--real-model", action="store_true", help="使用設定中的實際模型，而不是模擬推論")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="模擬推論延遲 (毫秒)")
+    parser.add_argument("--stub-jitter-ms", type=float, default=0.0, help="模擬推論延遲的隨機抖動 (毫秒)")
+    parser.add_argument("--random-objects", type=int, default=2, help="模擬推論中隨機移動的物件數量")
+    parser.add_argument("--detections", default=None,
+                        help="每幀固定返回的偵測結果 JSON 檔案 ([{class_id, confidence, bbox: [x1, y1, x2, y2] (0~1)}])")
+    parser.add_argument("--seed", type=int, default=0, help="模擬推論的隨機種子")
+    parser.add_argument("--s3-latency-ms", type=float, default=0.0, help="模擬 S3 請求延遲 (毫秒)")
+    parser.add_argument("--s3-bandwidth-mbps", type=float, default=0.0, help="模擬 S3 上傳頻寬 (Mbit/s，0 表示不限制)")
+    parser.add_argument("--iot-latency-ms", type=float, default=0.0, help="模擬 MQTT PUBACK 延遲 (毫秒)")
+    parser.add_argument("--output", default=None, help="報告輸出路徑 (預設輸出到標準輸出)")
+    parser.add_argument("--log-level", default="WARNING", help="日誌級別")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            settings = yaml.safe_load(f) or {}
+    except (FileNotFoundError, yaml.YAMLError) as e:
+        logger.error(f"載入設定檔案時發生錯誤: {e}")
+        return 1
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    report = run_benchmark(settings, args, stop_event)
+    report_json = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report_json)
+        print(f"基準測試報告已寫入 {args.output}", file=sys.stderr)
+    else:
+        print(report_json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
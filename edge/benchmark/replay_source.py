@@ -0,0 +1,164 @@
+# benchmark/replay_source.py
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from data_capture.capture_source import CaptureSource
+
+logger = logging.getLogger(__name__)
+
+CLOCK_REALTIME = "realtime" # 依來源幀率播放 (與實際攝影機相同的節奏，下游較慢時照常丟幀)
+CLOCK_FAST = "fast"         # 盡可能快地播放 (等待管線取走上一幀，測量最大吞吐量)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class ReplaySource(CaptureSource):
+    """
+    以影片檔案或影像目錄取代攝影機的重播來源，介面與 cv2.VideoCapture 相同 (read/isOpened/get/release)，
+    因此可以直接交給 FramePipeline 走與實際攝影機相同的擷取路徑 (包含直接寫入環形緩衝區槽位)。
+    也可以作為主程式的 'file' 擷取來源 (config.camera.backend)。
+    """
+    name = "file"
+    estimate_drops = False # 重播不會丟幀 (realtime 時鐘下的延遲來自下游)
+    def __init__(self, path: str, clock: str = CLOCK_FAST, fps: Optional[float] = None, loop: int = 1,
+                 max_frames: Optional[int] = None):
+        """
+        初始化重播來源。
+        Args:
+            path (str): 影片檔案路徑，或包含影像檔案 (依檔名排序) 的目錄。
+            clock (str): 'realtime' 或 'fast'。
+            fps (float, optional): 播放幀率。Defaults to 影片的幀率 (影像目錄為 30)。
+            loop (int): 重複播放次數。
+            max_frames (int, optional): 最多讀取的幀數。
+        """
+        if clock not in (CLOCK_REALTIME, CLOCK_FAST):
+            raise ValueError(f"未知的重播時鐘 '{clock}' (可用: {CLOCK_REALTIME}, {CLOCK_FAST})。")
+        super().__init__()
+        self.path = path
+        self.clock = clock
+        self.loop = max(1, int(loop))
+        self.max_frames = max_frames
+        self.gate: Optional[Callable[[], bool]] = None # fast 時鐘下讀取下一幀前等待的條件 (例如管線佇列已清空)
+        self.gate_timeout_sec = 5.0
+
+        self._image_files: Optional[List[str]] = None
+        self._cap: Optional[cv2.VideoCapture] = None
+        if os.path.isdir(path):
+            self._image_files = sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            if not self._image_files:
+                raise ValueError(f"目錄 '{path}' 中沒有影像檔案。")
+            source_fps = 30.0
+        else:
+            self._cap = cv2.VideoCapture(path)
+            if not self._cap.isOpened():
+                raise ValueError(f"無法開啟影片檔案 '{path}'。")
+            source_fps = self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.fps = float(fps) if fps else float(source_fps)
+
+        self._pass = 0 # 已完成的播放次數
+        self._index = 0 # 目前播放中的幀索引 (影像目錄)
+        self.read_wait_sec = 0.0 # 等待播放節奏或管線的總時間
+        self.last_wait_sec = 0.0 # 最近一次 read() 中等待的時間 (計算擷取延遲時扣除)
+        self.finished = threading.Event()
+        self._start_time: Optional[float] = None
+        self._opened = True
+
+        # 預先讀取第一幀以得知分辨率 (管線依此配置環形緩衝區)
+        self._pending = self._decode_next()
+        if self._pending is None:
+            raise ValueError(f"無法從 '{path}' 讀取任何幀。")
+        self.frame_height, self.frame_width = self._pending.shape[:2]
+        logger.info(f"重播來源已開啟: {path} ({self.frame_width}x{self.frame_height}, {self.fps:.1f} FPS, 時鐘: {clock})。")
+
+    def _decode_next(self) -> Optional[np.ndarray]:
+        """
+        解碼下一幀 (到達結尾時依 loop 設定從頭開始)。
+        """
+        while self._pass < self.loop:
+            if self._image_files is not None:
+                if self._index < len(self._image_files):
+                    frame = cv2.imread(self._image_files[self._index], cv2.IMREAD_COLOR)
+                    self._index += 1
+                    if frame is None:
+                        logger.warning(f"無法讀取影像 '{self._image_files[self._index - 1]}'，已略過。")
+                        continue
+                    return frame
+                self._index = 0
+            else:
+                ret, frame = self._cap.read()
+                if ret:
+                    return frame
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self._pass += 1
+        return None
+
+    def media_time(self) -> float:
+        """
+        已播放的影片時間 (秒)。fast 時鐘下可作為 EventManager 的時鐘，讓冷卻時間與限流依影片時間計算。
+        """
+        return self.frames_read / self.fps
+
+    def _wait_turn(self):
+        wait_start = time.monotonic()
+        if self.clock == CLOCK_REALTIME:
+            delay = self._start_time + self.frames_read / self.fps - wait_start
+            if delay > 0:
+                time.sleep(delay)
+        elif self.gate is not None:
+            while not self.gate() and time.monotonic() - wait_start < self.gate_timeout_sec:
+                time.sleep(0.0005)
+        self.last_wait_sec = time.monotonic() - wait_start
+        self.read_wait_sec += self.last_wait_sec
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        讀取下一幀 (與 cv2.VideoCapture.read 相同，提供 image 時寫入該陣列)。
+        Returns:
+            Tuple[bool, Optional[np.ndarray]]: (是否成功, BGR 幀)。播放結束後返回 (False, None) 並設置 finished。
+        """
+        if not self._opened or (self.max_frames is not None and self.frames_read >= self.max_frames):
+            self.finished.set()
+            return False, None
+        if self._start_time is None:
+            self._start_time = time.monotonic()
+
+        frame = self._pending if self._pending is not None else self._decode_next()
+        self._pending = None
+        if frame is None:
+            self.finished.set()
+            return False, None
+        if frame.shape[:2] != (self.frame_height, self.frame_width):
+            frame = cv2.resize(frame, (self.frame_width, self.frame_height), interpolation=cv2.INTER_AREA)
+
+        self._wait_turn()
+        self._on_frame(time.time())
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.frames_read)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            count = len(self._image_files) if self._image_files is not None else self._cap.get(cv2.CAP_PROP_FRAME_COUNT)
+            return float(count * self.loop)
+        return super().get(prop_id)
+
+    def release(self):
+        self._opened = False
+        if self._cap is not None:
+            self._cap.release()
+        self.finished.set()
@@ -0,0 +1,172 @@
+# benchmark/stubs.py
+
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from inference.backends import Detection, InferenceBackend
+
+logger = logging.getLogger(__name__)
+
+
+class StubInferenceBackend(InferenceBackend):
+    """
+    基準測試用的推論後端：以固定延遲 (加上隨機抖動) 模擬模型推論，返回設定的固定偵測結果，
+    以及在畫面中以等速移動 (碰到邊界反彈) 的隨機物件，讓追蹤器與偵測器有穩定的軌跡可以處理。
+    """
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 detections: Optional[List[Dict[str, Any]]] = None,
+                 random_objects: int = 0, class_ids: Sequence[int] = (1,), seed: int = 0):
+        """
+        Args:
+            latency_ms (float): 每次推論的模擬延遲 (毫秒)。
+            jitter_ms (float): 延遲的隨機抖動上限 (毫秒)。
+            detections (List[Dict[str, Any]], optional): 每幀固定返回的偵測結果，
+                                                         每項包含 class_id, confidence, bbox ([x1, y1, x2, y2]，0~1 正規化座標)。
+            random_objects (int): 隨機移動物件的數量。
+            class_ids (Sequence[int]): 隨機物件使用的類別 ID。
+            seed (int): 隨機種子 (相同種子產生相同的物件軌跡，便於比較不同版本)。
+        """
+        self.latency_sec = max(0.0, float(latency_ms)) / 1000.0
+        self.jitter_sec = max(0.0, float(jitter_ms)) / 1000.0
+        self.fixed_detections = list(detections or [])
+        self._rng = random.Random(seed)
+        self._objects = []
+        for idx in range(max(0, int(random_objects))):
+            width, height = self._rng.uniform(0.08, 0.25), self._rng.uniform(0.15, 0.45)
+            self._objects.append({
+                "class_id": int(class_ids[idx % len(class_ids)]) if class_ids else 1,
+                "confidence": self._rng.uniform(0.55, 0.95),
+                "pos": np.array([self._rng.uniform(0, 1 - width), self._rng.uniform(0, 1 - height)]),
+                "size": np.array([width, height]),
+                "vel": np.array([self._rng.uniform(-0.01, 0.01), self._rng.uniform(-0.005, 0.005)]),
+            })
+        self.infer_count = 0
+
+    def prepare_input(self, frame_bgr: np.ndarray) -> Any:
+        return frame_bgr
+
+    def detect(self, model_input: Any) -> List:
+        delay = self.latency_sec + (self._rng.uniform(0, self.jitter_sec) if self.jitter_sec else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        self.infer_count += 1
+
+        frame_height, frame_width = model_input.shape[:2]
+        scale = np.array([frame_width, frame_height, frame_width, frame_height], dtype=np.float64)
+        results = []
+        for item in self.fixed_detections:
+            x1, y1, x2, y2 = np.asarray(item['bbox'], dtype=np.float64) * scale
+            results.append(Detection(item.get('class_id', 1), item.get('confidence', 0.9), x1, y1, x2, y2))
+        for obj in self._objects:
+            obj["pos"] += obj["vel"]
+            for axis in (0, 1):
+                if obj["pos"][axis] < 0 or obj["pos"][axis] + obj["size"][axis] > 1:
+                    obj["vel"][axis] = -obj["vel"][axis]
+                    obj["pos"][axis] = min(max(obj["pos"][axis], 0.0), 1 - obj["size"][axis])
+            x1, y1 = obj["pos"] * scale[:2]
+            x2, y2 = (obj["pos"] + obj["size"]) * scale[:2]
+            results.append(Detection(obj["class_id"], obj["confidence"], x1, y1, x2, y2))
+        return results
+
+
+class MockIoTClient:
+    """
+    取代 AWSIoTClient 的事件接收端：發布立即成功 (或在設定的延遲後完成)，並記錄每種事件的發布次數與時間。
+    只實作 EventPublisher 與主迴圈使用的方法。
+    """
+    def __init__(self, publish_latency_ms: float = 0.0, keep_payloads: bool = False,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            publish_latency_ms (float): 模擬 PUBACK 延遲 (毫秒)。
+            keep_payloads (bool): 是否保留每個事件的 Payload (偵測器重播時比較事件內容)。
+            clock (Callable[[], float]): 記錄發布時間的時鐘函數 (重播錄製檔時為錄製時間)。
+        """
+        self.publish_latency_sec = max(0.0, float(publish_latency_ms)) / 1000.0
+        self.keep_payloads = keep_payloads
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.published_by_type: Counter = Counter()
+        self.publish_times: List[float] = []
+        self.payloads: List[Dict[str, Any]] = []
+        self._connection_resumed_callbacks: List[Callable[[], None]] = []
+
+    def is_connected(self) -> bool:
+        return True
+
+    def add_connection_resumed_callback(self, callback: Callable[[], None]):
+        self._connection_resumed_callbacks.append(callback)
+
+    def publish_event(self, event_payload: Dict[str, Any]) -> Future:
+        with self._lock:
+            self.published_by_type[event_payload.get("event_type")] += 1
+            self.publish_times.append(self.clock())
+            if self.keep_payloads:
+                self.payloads.append(event_payload)
+        future = Future()
+        if self.publish_latency_sec > 0:
+            timer = threading.Timer(self.publish_latency_sec, future.set_result, args=(None,))
+            timer.daemon = True
+            timer.start()
+        else:
+            future.set_result(None)
+        return future
+
+    def get_publish_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"single_published": sum(self.published_by_type.values()), "by_type": dict(self.published_by_type)}
+
+    def get_dispatch_metrics(self) -> Dict[str, int]:
+        return {}
+
+    def disconnect(self):
+        pass
+
+
+class MockS3Client:
+    """
+    取代 boto3 S3 客戶端的上傳接收端 (只實作 S3Uploader 使用的 put_object 與 upload_file)，
+    以設定的延遲與頻寬模擬網路，記錄上傳次數、位元組數與時間，不保存內容。
+    """
+    def __init__(self, latency_ms: float = 0.0, bandwidth_mbps: float = 0.0):
+        """
+        Args:
+            latency_ms (float): 每次請求的固定延遲 (毫秒)。
+            bandwidth_mbps (float): 模擬上傳頻寬 (Mbit/s)，0 表示不限制。
+        """
+        self.latency_sec = max(0.0, float(latency_ms)) / 1000.0
+        self.bytes_per_sec = float(bandwidth_mbps) * 1e6 / 8 if bandwidth_mbps else 0.0
+        self._lock = threading.Lock()
+        self.upload_count = 0
+        self.upload_bytes = 0
+        self.upload_times: List[float] = []
+        self.keys: List[str] = []
+
+    def _record(self, key: str, size: int):
+        delay = self.latency_sec + (size / self.bytes_per_sec if self.bytes_per_sec else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            self.upload_count += 1
+            self.upload_bytes += size
+            self.upload_times.append(time.monotonic())
+            self.keys.append(key)
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs) -> Dict[str, Any]:
+        self._record(Key, len(Body))
+        return {}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs=None, Callback=None, Config=None):
+        with open(Filename, 'rb') as f:
+            f.seek(0, 2)
+            size = f.tell()
+        self._record(Key, size)
@@ -1,32 +1,46 @@
 # data_capture/capture_manager.py
 
 import cv2
+import math
 import numpy as np
 import time
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional, List # 引入類型提示
+from typing import Dict, Any, Optional, List, Tuple # 引入類型提示
 import threading
 import queue # 引入 queue 模組
-import jetson.inference
-import jetson.utils
 
 # 引入 S3 上傳器和 FrameData 結構
-from utils.s3_uploader import S3Uploader
+from utils.s3_uploader import S3Uploader, build_object_key
+from data_capture.frame_ring_buffer import FrameRingBuffer
+from data_capture.image_encoder import ImageEncoder
+from data_capture.clip_recorder import ClipRecorder
+from utils.image_utils import INTERPOLATIONS, scale_bbox
 
 logger = logging.getLogger(__name__)
 
 class FrameData:
-    def __init__(self, frame_np: np.ndarray, frame_cuda: jetson.utils.cudaImage,
-                 timestamp: float, detections_raw: List):
-        self.frame_np = frame_np # NumPy 格式的原始幀 (用於裁剪等 OpenCV 操作)
-        self.frame_cuda = frame_cuda # CUDA 格式的原始幀 (用於 jetson-inference 推論)
+    def __init__(self, frame_np: np.ndarray, frame_cuda: Any,
+                 timestamp: float, detections_raw: List, seq: int = -1, detection_table: Any = None,
+                 scale: float = 1.0):
+        self.frame_np = frame_np # NumPy 格式的原始幀 (用於裁剪等 OpenCV 操作；來自緩衝區時為唯讀視圖)
+        self.frame_cuda = frame_cuda # 推論後端的模型輸入 (Jetson 後端為 CUDA 影像)
         self.timestamp = timestamp
-        self.detections_raw = detections_raw # 這幀的物件偵測結果 (預期是 jetson_inference.Detection 列表)
+        self.detections_raw = detections_raw # 這幀的物件偵測結果 (具有 jetson.inference.Detection 相同屬性的列表)
+        self.seq = seq # 幀在環形緩衝區中的序號 (-1 表示不在緩衝區中)
+        self.detection_table = detection_table # 這幀的結構化偵測結果表 (DetectionTable，未建立時為 None)
+        self.scale = scale # frame_np 相對偵測座標 (攝影機原始分辨率) 的縮放比例 (雙分辨率模式下小於 1)
 
 class CaptureManager:
     """
     管理事件觸發時的影像/短片捕獲和上傳。
+
+    啟用雙分辨率模式 (capture.dual_stream) 時，攝影機的原始分辨率幀只保存在另一個較小的環形緩衝區中
+    (供證據影像上傳與 QR 裁剪使用)，擷取時縮小一份寫入主環形緩衝區；推論、偵測器、顯示、短片與錄製都使用縮小的幀。
+    偵測結果一律使用原始分辨率的座標 (與區域、ROI 設定相同)，裁剪與繪製時再依 coord_scale 映射。
+
+    MJPEG 直通模式 (camera.pixel_format: mjpeg) 下，每幀附帶攝影機輸出的 JPEG，主環形緩衝區保存縮小解碼的幀；
+    整幀證據影像直接上傳攝影機的 JPEG，需要原始分辨率的裁剪時才完整解碼。
     """
     def __init__(self, s3_uploader: S3Uploader, s3_settings: dict, capture_settings: dict):
         """
@@ -40,107 +54,333 @@ class CaptureManager:
         self.s3_settings = s3_settings
         self.capture_settings = capture_settings
 
-        # 幀緩衝區 (使用列表實現簡單的循環緩衝)
-        self._frame_buffer: List[FrameData] = []
+        # 幀緩衝區 (預先配置的 NumPy 環形緩衝區，攝影機直接寫入槽位，避免每幀拷貝)
         self._buffer_size = self.capture_settings.get('frame_buffer_size', 15) # 預設緩衝 15 幀
+        self._frame_ring = FrameRingBuffer(self._buffer_size)
+        self._latest_inferred_seq = -1 # 最新已附加推論結果的幀序號
+
+        # 可選：雙分辨率模式 (主環形緩衝區保存推論分辨率的幀，原始分辨率的幀保存在較小的環形緩衝區)
+        dual_settings = self.capture_settings.get('dual_stream', {}) or {}
+        self._full_ring: Optional[FrameRingBuffer] = None
+        self._inference_width = int(dual_settings.get('width', 960))
+        self._interpolation = INTERPOLATIONS.get(dual_settings.get('interpolation', 'linear'), cv2.INTER_LINEAR)
+        if dual_settings.get('enabled', False):
+            self._full_ring = FrameRingBuffer(dual_settings.get('full_buffer_size', 5))
+        self._coord_scale = 1.0 # 主環形緩衝區的幀相對原始分辨率的縮放比例
+        self._camera_shape: Optional[Tuple[int, ...]] = None # MJPEG 直通模式下的攝影機分辨率 (沒有原始分辨率的環形緩衝區)
+        self.full_frame_misses = 0 # 需要原始分辨率的幀時已被覆寫 (改用推論分辨率的幀) 的次數
 
-        # 保護緩衝區的鎖 (因為主循環和選幀邏輯可能同時訪問)
-        self._buffer_lock = threading.Lock()
+        # JPEG 編碼執行緒 (避免在幀處理執行緒上同步編碼)；雙分辨率模式下以原始分辨率的幀編碼證據影像
+        self._image_encoder = ImageEncoder(self._full_ring or self._frame_ring, self.s3_uploader,
+                                           self.capture_settings.get('encode', {}))
+        self._image_encoder.start()
+
+        # 可選：事件短片錄製 (預錄 + 後錄，於獨立進程編碼)
+        self._clip_recorder: Optional[ClipRecorder] = None
+        clip_settings = self.capture_settings.get('clip', {}) or {}
+        if clip_settings.get('enabled', False):
+            self._clip_recorder = ClipRecorder(self._frame_ring, self.s3_uploader, clip_settings)
+            self._clip_recorder.start()
 
         logger.info(f"CaptureManager 初始化成功，幀緩衝區大小: {self._buffer_size}")
 
-    def add_frame_to_buffer(self, frame_np: np.ndarray, frame_cuda: jetson.utils.cudaImage,
-                           detections_raw: List):
+    @property
+    def frame_ring(self) -> FrameRingBuffer:
+        return self._frame_ring
+
+    @property
+    def full_ring(self) -> Optional[FrameRingBuffer]:
+        """
+        原始分辨率幀的環形緩衝區 (未啟用雙分辨率模式時為 None)。
+        """
+        return self._full_ring
+
+    @property
+    def coord_scale(self) -> float:
+        """
+        主環形緩衝區 (推論、偵測器與顯示使用) 的幀相對原始分辨率座標的縮放比例 (未啟用雙分辨率模式時為 1.0)。
+        """
+        return self._coord_scale
+
+    @property
+    def frame_shape(self) -> Optional[Tuple[int, ...]]:
+        """
+        攝影機原始分辨率的幀形狀 (H, W, C)，即偵測結果、區域與 ROI 使用的座標空間。
+        """
+        if self._camera_shape is not None:
+            return self._camera_shape
+        ring = self._full_ring or self._frame_ring
+        return ring.frame_shape
+
+    def configure_frame_shape(self, height: int, width: int, channels: int = 3, input_scale: float = 1.0):
+        """
+        根據攝影機實際分辨率預先配置幀緩衝區 (雙分辨率模式下同時配置推論分辨率的主環形緩衝區)。
+        Args:
+            height (int): 幀高度 (攝影機分辨率)。
+            width (int): 幀寬度 (攝影機分辨率)。
+            channels (int): 通道數。
+            input_scale (float): 擷取來源輸出的幀相對攝影機分辨率的縮放比例 (MJPEG 直通模式的縮小解碼)。
+        """
+        if height <= 0 or width <= 0:
+            return
+        self._camera_shape = None
+        if input_scale != 1.0:
+            # 來源已輸出縮小的幀 (原始分辨率只以 JPEG 保存)，不需要另外保存原始分辨率的幀
+            if self._full_ring is not None:
+                logger.warning("擷取來源輸出縮小解碼的幀 (MJPEG 直通模式)，已停用雙分辨率模式。")
+                self._full_ring = None
+                self._image_encoder.frame_ring = self._frame_ring
+            # libjpeg 縮小解碼的尺寸為向上取整
+            inference_shape = (math.ceil(height * input_scale), math.ceil(width * input_scale), channels)
+            self._frame_ring.allocate(inference_shape)
+            self._coord_scale = inference_shape[1] / width
+            self._camera_shape = (height, width, channels)
+            logger.info(f"MJPEG 直通模式: 原始分辨率 {width}x{height}，推論分辨率 {inference_shape[1]}x{inference_shape[0]}。")
+            return
+        if self._full_ring is None:
+            self._frame_ring.allocate((height, width, channels))
+            return
+        self._full_ring.allocate((height, width, channels))
+        scale = min(1.0, self._inference_width / width) if self._inference_width > 0 else 1.0
+        inference_shape = (max(1, int(round(height * scale))), max(1, int(round(width * scale))), channels)
+        self._frame_ring.allocate(inference_shape)
+        self._coord_scale = inference_shape[1] / width
+        logger.info(f"雙分辨率模式: 原始分辨率 {width}x{height}，推論分辨率 {inference_shape[1]}x{inference_shape[0]}。")
+
+    def acquire_frame_slot(self) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        取得下一個供攝影機直接寫入的緩衝區槽位 (僅供擷取執行緒調用)。
+        雙分辨率模式下返回原始分辨率環形緩衝區的槽位。
+        Returns:
+            Tuple[int, Optional[np.ndarray]]: (幀序號, 可寫入的槽位)。緩衝區尚未配置時槽位為 None。
+        """
+        if self._full_ring is not None:
+            return self._full_ring.acquire_write_slot()
+        return self._frame_ring.acquire_write_slot()
+
+    def commit_frame(self, seq: int, frame_np: np.ndarray, timestamp: float = None,
+                     encoded: Optional[np.ndarray] = None) -> int:
+        """
+        提交攝影機寫入的幀。如果 frame_np 不是槽位本身，會拷貝進緩衝區。
+        雙分辨率模式下提交原始分辨率的幀，並縮小一份寫入主環形緩衝區
+        (兩個緩衝區每幀各提交一次，因此同一幀在兩者中的序號相同)。
+        Args:
+            seq (int): acquire_frame_slot() 返回的序號。
+            frame_np (np.ndarray): 攝影機讀取到的幀。
+            timestamp (float, optional): 幀的時間戳，預設為目前時間。
+            encoded (np.ndarray, optional): 攝影機輸出的原始分辨率 JPEG (MJPEG 直通模式)。
+        Returns:
+            int: 幀序號。
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+        if self._full_ring is None:
+            return self._frame_ring.commit(seq, timestamp, frame_np, encoded)
+
+        if self._full_ring.frame_shape != frame_np.shape:
+            self.configure_frame_shape(*frame_np.shape)
+        self._full_ring.commit(seq, timestamp, frame_np, encoded)
+        seq, slot = self._frame_ring.acquire_write_slot()
+        cv2.resize(frame_np, (slot.shape[1], slot.shape[0]), dst=slot, interpolation=self._interpolation)
+        return self._frame_ring.commit(seq, timestamp)
+
+    def get_full_resolution_frame(self, frame_data: FrameData) -> Tuple[np.ndarray, float]:
+        """
+        取得用於裁剪的最高分辨率影像 (例如 QR 掃描)。
+        雙分辨率模式下返回原始分辨率環形緩衝區中的同一幀；該幀已被覆寫時改用推論分辨率的幀。
+        MJPEG 直通模式下完整解碼該幀的 JPEG (只在需要裁剪時解碼)。
+        Args:
+            frame_data (FrameData): get_frame()/get_latest_frame() 返回的幀數據。
+        Returns:
+            Tuple[np.ndarray, float]: (唯讀影像, 影像相對偵測座標的縮放比例)。偵測座標需以 scale_bbox 映射後再裁剪。
+        """
+        if self._full_ring is not None and frame_data.seq >= 0:
+            entry = self._full_ring.get(frame_data.seq)
+            if entry is not None and entry[1] == frame_data.timestamp:
+                return entry[0], 1.0
+            self.full_frame_misses += 1
+            logger.debug(f"幀 {frame_data.seq} 的原始分辨率影像已被覆寫，改用推論分辨率的幀。")
+        elif frame_data.scale != 1.0 and frame_data.seq >= 0:
+            encoded = self._frame_ring.get_encoded(frame_data.seq)
+            image = cv2.imdecode(encoded, cv2.IMREAD_COLOR) if encoded is not None else None
+            if image is not None:
+                return image, 1.0
+            self.full_frame_misses += 1
+            logger.debug(f"幀 {frame_data.seq} 沒有可解碼的 JPEG，改用推論分辨率的幀。")
+        return frame_data.frame_np, frame_data.scale
+
+    def set_frame_detections(self, seq: int, frame_cuda: Any, detections_raw: List, detection_table: Any = None):
+        """
+        將推論結果附加到緩衝區中的幀。
+        Args:
+            seq (int): 幀序號。
+            frame_cuda (Any): 模型輸入 (Jetson 後端為 CUDA 影像)。
+            detections_raw (List): 這幀的物件偵測結果。
+            detection_table (DetectionTable, optional): 這幀的結構化偵測結果表。
+        """
+        if self._frame_ring.set_metadata(seq, frame_cuda, (detections_raw, detection_table)):
+            if seq > self._latest_inferred_seq:
+                self._latest_inferred_seq = seq
+        else:
+            logger.debug(f"幀 {seq} 已被覆寫，無法附加偵測結果。")
+
+    def add_frame_to_buffer(self, frame_np: np.ndarray, frame_cuda: Any,
+                           detections_raw: List) -> int:
         """
-        將一幀影像數據添加到緩衝區。
+        將一幀影像數據拷貝到緩衝區 (用於無法直接寫入槽位的來源)。
         Args:
             frame_np (np.ndarray): OpenCV 格式的影像幀。
-            frame_cuda (jetson.utils.cudaImage): CUDA 格式的影像幀。
-            detections_raw (List[jetson.inference.Detection]): 這幀的物件偵測結果。
-        """
-        # 創建 FrameData 實例
-        # 注意：深度複製影像可能消耗較多記憶體，對於邊緣設備需要謹慎。
-        # 這裡為了示例，複製 NumPy 幀
-        new_frame_data = FrameData(
-            frame_np=frame_np.copy(), # 複製 NumPy 幀
-            frame_cuda=frame_cuda, # CUDA 幀通常是設備內存，不需要複製
-            timestamp=time.time(),
-            detections_raw=detections_raw # detections_raw 已經是新列表
-        )
-
-        with self._buffer_lock:
-            # 添加到緩衝區尾部
-            self._frame_buffer.append(new_frame_data)
-            # 如果緩衝區超過設定大小，移除最舊的幀 (頭部)
-            while len(self._frame_buffer) > self._buffer_size:
-                oldest_frame = self._frame_buffer.pop(0)
-                # 如果 FrameData 中有需要顯式釋放的資源 (如 CUDA 內存)，在這裡處理
-                # jetson_utils.cudaFromNumpy 創建的 CUDA 影像生命週期由它管理，通常不需要手動釋放
-                del oldest_frame
-
-            # logger.debug(f"幀已添加到緩衝區，當前大小: {len(self._frame_buffer)}")
+            frame_cuda (Any): 模型輸入 (Jetson 後端為 CUDA 影像)。
+            detections_raw (List): 這幀的物件偵測結果。
+        Returns:
+            int: 幀序號。
+        """
+        seq, _ = self.acquire_frame_slot()
+        seq = self.commit_frame(seq, frame_np)
+        self.set_frame_detections(seq, frame_cuda, detections_raw)
+        return seq
+
+    def get_frame(self, seq: int) -> Optional[FrameData]:
+        """
+        獲取指定序號的幀 (唯讀視圖，不拷貝影像)。
+        Args:
+            seq (int): 幀序號。
+        Returns:
+            Optional[FrameData]: 幀數據，如果已被覆寫則為 None。
+        """
+        entry = self._frame_ring.get(seq)
+        if entry is None:
+            return None
+        frame_np, timestamp, frame_cuda, detections = entry
+        detections_raw, detection_table = detections if detections is not None else ([], None)
+        return FrameData(frame_np, frame_cuda, timestamp, detections_raw, seq=seq, detection_table=detection_table,
+                         scale=self._coord_scale)
+
+    def get_latest_frame(self) -> Optional[FrameData]:
+        """
+        獲取最新已完成推論的幀 (唯讀視圖，不拷貝影像)。
+        Returns:
+            Optional[FrameData]: 最新幀數據，緩衝區為空時為 None。
+        """
+        seq = self._latest_inferred_seq
+        if seq < 0:
+            return None
+        return self.get_frame(seq)
 
     def get_frame_buffer(self) -> List[FrameData]:
         """
-        獲取當前的幀緩衝區內容。
-        返回緩衝區的拷貝，避免外部修改影響內部狀態。
+        獲取當前緩衝區中已完成推論的幀 (由舊到新)。
+        返回的影像是唯讀視圖，不會拷貝影像數據；只需要最新一幀時請使用 get_latest_frame()。
         Returns:
-            List[FrameData]: 幀緩衝區的拷貝。
+            List[FrameData]: 幀數據列表。
         """
-        with self._buffer_lock:
-            return list(self._frame_buffer) # 返回列表的淺拷貝
+        frames = []
+        for seq in self._frame_ring.get_recent_seqs():
+            if seq > self._latest_inferred_seq:
+                break
+            frame_data = self.get_frame(seq)
+            if frame_data is not None:
+                frames.append(frame_data)
+        return frames
 
     def capture_and_upload_image(self, event_type: str, frame_data: FrameData,
-                                 s3_folder_prefix: str, metadata: Dict[str, Any] = None):
+                                 s3_folder_prefix: str, metadata: Dict[str, Any] = None,
+                                 crop: Optional[List[int]] = None):
         """
-        捕獲指定 FrameData 中的影像並添加到 S3 上傳佇列。
+        將指定 FrameData 中的影像提交給編碼執行緒，編碼完成後加入 S3 上傳佇列。
+        JPEG 編碼在背景執行，此方法會立即返回目標 S3 URL。
         Args:
             event_type (str): 觸發捕獲的事件類型。
             frame_data (FrameData): 要捕獲的特定幀數據。
             s3_folder_prefix (str): 上傳到 S3 的檔案夾前綴 (例如 "face_recognition_images/" 或 "cargo_checkin_images/")。
             metadata (Dict[str, Any], optional): 與捕獲相關的元數據。Defaults to None.
+            crop (List[int], optional): 只上傳幀中的裁剪區域 [x1, y1, x2, y2] (原始分辨率座標)。Defaults to None.
         Returns:
-            str | None: 如果成功添加到佇列，返回 S3 的目標 URL (包含 bucket)；否則返回 None。
+            str | None: 如果成功提交編碼任務，返回 S3 的目標 URL (包含 bucket)；否則返回 None。
         """
         if frame_data is None or frame_data.frame_np is None:
             logger.warning("指定的 FrameData 或影像數據為 None，無法捕獲。")
             return None
 
-        frame_to_save = frame_data.frame_np
-
-        # 生成 S3 檔案路徑
-        timestamp_str = datetime.fromtimestamp(frame_data.timestamp).strftime("%Y%m%d_%H%M%S_%f")
-        # 使用傳入的檔案夾前綴和動態命名
-        s3_key = f"{s3_folder_prefix}.jpg"
-
-        # 將影像編碼為 JPG 格式的 Bytes
-        try:
-            ret, buffer = cv2.imencode('.jpg', frame_to_save)
-            if not ret:
-                logger.error(f"影像編碼失敗: {s3_key}")
-                return None
-            image_data = buffer.tobytes()
-        except Exception as e:
-            logger.error(f"影像編碼時發生錯誤: {e}", exc_info=True)
+        bucket_name = self.s3_settings.get('bucket_name')
+        if not bucket_name:
+            logger.error("S3 bucket_name 未設定。無法生成 S3 URL。")
             return None
 
-        # 將上傳任務添加到 S3 上傳器佇列
-        try:
-            self.s3_uploader.put_upload_task(image_data, s3_key)
-            logger.info(f"已將影像捕獲任務添加到 S3 上傳佇列，S3 Key: {s3_key}")
-            bucket_name = self.s3_settings.get('bucket_name')
-            if bucket_name:
-                return f"s3://{bucket_name}/{s3_key}"
+        # 生成 S3 檔案路徑 (檔案夾前綴 + 幀時間戳 + 隨機碼，避免互相覆蓋)
+        s3_key = build_object_key(s3_folder_prefix, frame_data.timestamp, "jpg")
+
+        # 將編碼任務交給編碼執行緒 (緩衝區中的幀以序號引用，不拷貝影像；雙分辨率模式下引用原始分辨率的幀)
+        if frame_data.seq >= 0 and self._full_ring is None:
+            submitted = self._image_encoder.submit(s3_key, frame_seq=frame_data.seq, crop=crop)
+        elif frame_data.seq >= 0:
+            image, scale = self.get_full_resolution_frame(frame_data)
+            if scale == 1.0:
+                submitted = self._image_encoder.submit(s3_key, frame_seq=frame_data.seq, crop=crop)
             else:
-                 logger.error("S3 bucket_name 未設定。無法生成 S3 URL。")
-                 return None
-        except Exception as e:
-            logger.error(f"添加上傳任務到佇列時發生錯誤: {e}", exc_info=True)
+                # 原始分辨率的幀已被覆寫：拷貝推論分辨率的幀 (裁剪區域映射到推論分辨率)，避免編碼前被覆寫
+                if crop is not None:
+                    x1, y1, x2, y2 = scale_bbox(crop, scale)
+                    image = image[max(0, y1):y2, max(0, x1):x2]
+                submitted = self._image_encoder.submit(s3_key, frame_np=image.copy())
+        else:
+            crop = scale_bbox(crop, frame_data.scale) if crop is not None else None
+            submitted = self._image_encoder.submit(s3_key, frame_np=frame_data.frame_np, crop=crop)
+
+        if not submitted:
+            logger.warning(f"未能提交影像編碼任務，事件 '{event_type}'，S3 Key: {s3_key}")
+            return None
+
+        logger.info(f"已將影像捕獲任務提交到編碼佇列，S3 Key: {s3_key}")
+        return f"s3://{bucket_name}/{s3_key}"
+
+    def capture_clip(self, event_type: str, s3_folder_prefix: str, timestamp: Optional[float] = None) -> Optional[str]:
+        """
+        請求一段事件短片 (預錄 pre_roll_sec 秒 + 後錄 post_roll_sec 秒)。錄製、編碼與上傳都在背景執行，此方法立即返回。
+        Args:
+            event_type (str): 觸發捕獲的事件類型。
+            s3_folder_prefix (str): 上傳到 S3 的檔案夾前綴。
+            timestamp (float, optional): 事件時間戳。Defaults to time.time().
+        Returns:
+            str | None: 短片的 S3 目標 URL (包含 bucket)；未啟用短片錄製或無法錄製時為 None。
+        """
+        if self._clip_recorder is None:
+            return None
+        bucket_name = self.s3_settings.get('bucket_name')
+        if not bucket_name:
+            logger.error("S3 bucket_name 未設定。無法生成 S3 URL。")
             return None
+        s3_key = self._clip_recorder.request_clip(s3_folder_prefix, timestamp)
+        if s3_key is None:
+            logger.warning(f"未能開始錄製事件短片，事件 '{event_type}'。")
+            return None
+        return f"s3://{bucket_name}/{s3_key}"
+
+    @property
+    def clips_enabled(self) -> bool:
+        return self._clip_recorder is not None
 
+    def get_clip_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 短片錄製器的統計 (未啟用時為空字典)。
+        """
+        return self._clip_recorder.get_metrics() if self._clip_recorder is not None else {}
 
-    # 可擴展實現短片捕獲邏輯 (需要維護一個幀緩衝區和一個視訊寫入器)
-    # def start_clip_capture(self, duration_seconds: int):
-    #     pass
-    # def stop_clip_capture_and_upload(self, event_type: str, metadata: Dict[str, Any] = None):
-    #     pass
\ No newline at end of file
+    def get_encoder_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 編碼執行緒的延遲與積壓統計。
+        """
+        return self._image_encoder.get_metrics()
+
+    def shutdown(self):
+        """
+        停止短片錄製與編碼執行緒，並等待已提交的編碼任務完成 (應在停止 S3Uploader 之前調用)。
+        """
+        if self._clip_recorder is not None:
+            self._clip_recorder.stop()
+            self._clip_recorder.join(timeout=30.0)
+            logger.info("事件短片錄製器已停止。")
+        self._image_encoder.stop()
+        self._image_encoder.join(timeout=10.0)
+        logger.info("影像編碼執行緒已停止。")
@@ -0,0 +1,312 @@
+# data_capture/capture_source.py
+
+import re
+import sys
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 原始像素格式 -> 轉換為 BGR 的 cvtColor 代碼 (攝影機輸出非 BGR 時，在擷取執行緒直接轉換進緩衝區槽位)
+_RAW_CONVERSIONS = {
+    "yuyv": cv2.COLOR_YUV2BGR_YUYV,
+    "uyvy": cv2.COLOR_YUV2BGR_UYVY,
+    "nv12": cv2.COLOR_YUV2BGR_NV12,
+    "i420": cv2.COLOR_YUV2BGR_I420,
+    "rgb": cv2.COLOR_RGB2BGR,
+    "gray": cv2.COLOR_GRAY2BGR,
+}
+
+# MJPEG 直通模式的解碼縮小倍數 -> imdecode 旗標 (libjpeg 在解碼時直接縮小，比完整解碼再縮放便宜得多)
+_JPEG_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class CaptureSource:
+    """
+    攝影機擷取來源的基類，介面與 cv2.VideoCapture 相同 (read/isOpened/get/set/release)，
+    因此 FramePipeline 可以不區分來源地直接把環形緩衝區槽位交給 read() 寫入。
+    read() 輸出 BGR 幀 (捕獲、編碼與錄製都使用 BGR)，並記錄幀的時間戳與來源端丟棄的幀數。
+    """
+    name = "base"
+    estimate_drops = True # 是否依幀間隔估算丟棄的幀數 (重播來源不會丟幀)
+
+    def __init__(self, fps: float = 0.0):
+        """
+        Args:
+            fps (float): 來源的標稱幀率 (用於依幀間隔估算丟棄的幀數，0 表示不估算)。
+        """
+        self.frame_width = 0
+        self.frame_height = 0
+        self.fps = float(fps or 0.0)
+        self.last_timestamp: Optional[float] = None # 最近一次 read() 讀到的幀的時間戳 (Unix)
+        self.frames_read = 0
+        self.read_failures = 0
+        self.dropped_count = 0 # 來源端丟棄 (幀間隔超出標稱間隔) 的估算幀數
+        self.last_encoded: Optional[np.ndarray] = None # 最近一幀的攝影機壓縮數據 (MJPEG 直通模式；其他來源為 None)
+        self.decode_scale = 1.0 # read() 輸出的幀相對 frame_width/frame_height (攝影機分辨率) 的縮放比例
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        讀取下一幀 (與 cv2.VideoCapture.read 相同，提供 image 時寫入該陣列)。
+        Returns:
+            Tuple[bool, Optional[np.ndarray]]: (是否成功, BGR 幀)。
+        """
+        raise NotImplementedError("Subclass must implement abstract method 'read'")
+
+    def isOpened(self) -> bool:
+        raise NotImplementedError("Subclass must implement abstract method 'isOpened'")
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.frame_width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frame_height)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        return False
+
+    def release(self):
+        pass
+
+    def _on_frame(self, timestamp: float):
+        """
+        記錄讀到一幀：以與上一幀的間隔估算來源端 (驅動程式佇列、appsink) 丟棄的幀數。
+        """
+        if self.estimate_drops and self.fps > 0 and self.last_timestamp is not None:
+            missed = int(round((timestamp - self.last_timestamp) * self.fps)) - 1
+            if missed > 0:
+                self.dropped_count += missed
+        self.last_timestamp = timestamp
+        self.frames_read += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 來源名稱、分辨率、讀取/失敗幀數與估算的丟棄幀數。
+        """
+        return {
+            "source": self.name,
+            "resolution": f"{self.frame_width}x{self.frame_height}",
+            "frames_read": self.frames_read,
+            "read_failures": self.read_failures,
+            "dropped": self.dropped_count,
+        }
+
+
+class VideoCaptureSource(CaptureSource):
+    """
+    以 cv2.VideoCapture 讀取的來源 (OpenCV/V4L2 與 GStreamer 共用)。
+    先 grab() 再以 retrieve() 寫入呼叫者提供的槽位，幀時間戳取 grab() 返回的時間。
+    攝影機輸出非 BGR 的原始格式時，原始幀讀入預先配置的緩衝區後以 cvtColor(dst=槽位) 轉換。
+    MJPEG 直通模式下取得攝影機輸出的 JPEG (保留在 last_encoded)，並以 imdecode 的縮小解碼產生推論用的幀。
+    """
+    def __init__(self, cap: cv2.VideoCapture, fps: float = 0.0, conversion: Optional[int] = None,
+                 jpeg_decode_scale: Optional[int] = None):
+        """
+        Args:
+            cap (cv2.VideoCapture): 已開啟的 VideoCapture。
+            fps (float): 標稱幀率 (0 表示使用 VideoCapture 回報的幀率)。
+            conversion (int, optional): 原始幀轉換為 BGR 的 cvtColor 代碼，None 表示 VideoCapture 已輸出 BGR。
+            jpeg_decode_scale (int, optional): MJPEG 直通模式的解碼縮小倍數 (1/2/4/8)，None 表示不使用直通模式。
+        """
+        super().__init__(fps or cap.get(cv2.CAP_PROP_FPS) or 0.0)
+        self._cap = cap
+        self._conversion = conversion
+        self._decode_flag: Optional[int] = None
+        if jpeg_decode_scale is not None:
+            self._decode_flag = _JPEG_DECODE_FLAGS[jpeg_decode_scale]
+            self.decode_scale = 1.0 / jpeg_decode_scale
+        self._raw: Optional[np.ndarray] = None # 預先配置的原始幀緩衝區
+        self.frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._cap.grab():
+            self.read_failures += 1
+            return False, None
+        timestamp = time.time()
+        if self._decode_flag is not None:
+            return self._read_jpeg(image, timestamp)
+        if self._conversion is None:
+            ret, frame = self._cap.retrieve(image) if image is not None else self._cap.retrieve()
+        else:
+            ret, self._raw = self._cap.retrieve(self._raw)
+            frame = cv2.cvtColor(self._raw, self._conversion, dst=image) if ret else None
+        if not ret:
+            self.read_failures += 1
+            return False, None
+        self._on_frame(timestamp)
+        return True, frame
+
+    def _read_jpeg(self, image: Optional[np.ndarray], timestamp: float) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        MJPEG 直通模式：取出攝影機的 JPEG (不拷貝，下一幀使用新的陣列)，縮小解碼後寫入呼叫者提供的槽位。
+        """
+        ret, encoded = self._cap.retrieve()
+        frame = None
+        if ret and encoded is not None and encoded.size and encoded.dtype == np.uint8:
+            try:
+                frame = cv2.imdecode(encoded, self._decode_flag)
+            except cv2.error:
+                frame = None # 不是 JPEG 數據 (例如攝影機不支援 MJPG 而輸出了其他格式)
+        if frame is None:
+            self.read_failures += 1
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            frame = image
+        self.last_encoded = encoded.reshape(-1)
+        self._on_frame(timestamp)
+        return True, frame
+
+    def isOpened(self) -> bool:
+        return self._cap.isOpened()
+
+    def get(self, prop_id: int) -> float:
+        return self._cap.get(prop_id)
+
+    def set(self, prop_id: int, value: float) -> bool:
+        return self._cap.set(prop_id, value)
+
+    def release(self):
+        self._cap.release()
+
+
+class OpenCVSource(VideoCaptureSource):
+    """
+    USB/V4L2 攝影機 (Linux 上裝置 ID 使用 V4L2 後端)。
+    設定 pixel_format (例如 yuyv) 時停用 OpenCV 的自動轉換，由擷取執行緒直接轉換進緩衝區槽位。
+    pixel_format 為 mjpeg 時使用直通模式：保留攝影機的 JPEG 供證據影像直接上傳，推論使用縮小解碼的幀。
+    """
+    name = "opencv"
+
+    def __init__(self, camera_settings: dict):
+        """
+        Args:
+            camera_settings (dict): 攝影機設定 (config.camera)，使用 source、codec、set_resolution、width、height、
+                                    fps、pixel_format、buffer_size、jpeg_decode_scale。
+        """
+        source = camera_settings.get('source', 0)
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        api = cv2.CAP_V4L2 if isinstance(source, int) and sys.platform.startswith("linux") else cv2.CAP_ANY
+        cap = cv2.VideoCapture(source, api)
+
+        codec = camera_settings.get('codec')
+        if codec:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*codec))
+        if camera_settings.get('set_resolution', False):
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, int(camera_settings.get('width', 1280)))
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, int(camera_settings.get('height', 720)))
+        if camera_settings.get('fps'):
+            cap.set(cv2.CAP_PROP_FPS, float(camera_settings['fps']))
+        # 驅動程式佇列只保留最新的少量幀，處理較慢時丟棄舊幀而不是累積延遲
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, int(camera_settings.get('buffer_size', 1)))
+
+        pixel_format = str(camera_settings.get('pixel_format', 'bgr')).lower()
+        conversion = _RAW_CONVERSIONS.get(pixel_format)
+        jpeg_decode_scale = None
+        if pixel_format == 'mjpeg':
+            jpeg_decode_scale = int(camera_settings.get('jpeg_decode_scale', 2))
+            if jpeg_decode_scale not in _JPEG_DECODE_FLAGS:
+                cap.release()
+                raise ValueError(f"jpeg_decode_scale 必須是 {', '.join(map(str, _JPEG_DECODE_FLAGS))} 之一。")
+            if not codec:
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            # 取得未解碼的數據：V4L2 後端停用 RGB 轉換，其他後端 (FFmpeg：影片檔案、網路串流) 使用原始封包模式
+            # (FFmpeg 後端停用 RGB 轉換會輸出解碼後的 YUV，因此兩者不能同時設定)
+            if cap.isOpened() and cap.getBackendName() == "V4L2":
+                cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            else:
+                cap.set(cv2.CAP_PROP_FORMAT, -1)
+        elif pixel_format != 'bgr' and conversion is None:
+            cap.release()
+            raise ValueError(f"不支援的像素格式 '{pixel_format}' (可用: bgr, mjpeg, {', '.join(_RAW_CONVERSIONS)})。")
+        elif conversion is not None:
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        self.source = source
+        self.pixel_format = pixel_format
+        super().__init__(cap, camera_settings.get('fps', 0), conversion, jpeg_decode_scale)
+
+
+def build_gstreamer_pipeline(camera_settings: dict) -> str:
+    """
+    根據攝影機設定建立預設的 GStreamer 管線字串：解碼、色彩轉換與縮放都在 GStreamer 中完成，輸出 BGR 到 appsink。
+    Args:
+        camera_settings (dict): 攝影機設定，使用 source (裝置 ID 或路徑)、width、height、fps、codec、
+                                output_width/output_height (可選：輸出分辨率)、hardware (Jetson 硬體解碼/轉換)。
+    Returns:
+        str: GStreamer 管線字串。
+    """
+    source = camera_settings.get('source', 0)
+    device = f"/dev/video{source}" if isinstance(source, int) or str(source).isdigit() else str(source)
+    width = int(camera_settings.get('width', 1280))
+    height = int(camera_settings.get('height', 720))
+    fps = int(camera_settings.get('fps', 30))
+    out_width = int(camera_settings.get('output_width', width))
+    out_height = int(camera_settings.get('output_height', height))
+    hardware = camera_settings.get('hardware', False)
+    codec = str(camera_settings.get('codec', 'MJPG')).upper()
+
+    caps = f"width={width},height={height},framerate={fps}/1"
+    if codec == 'MJPG':
+        decode = f"image/jpeg,{caps} ! " + ("nvv4l2decoder mjpeg=1 ! nvvidconv" if hardware else "jpegdec ! videoconvert")
+    else:
+        decode = f"video/x-raw,{caps} ! " + ("nvvidconv" if hardware else "videoconvert")
+    scale = "" if hardware or (out_width, out_height) == (width, height) else " ! videoscale"
+    convert = " ! video/x-raw,format=BGRx ! videoconvert" if hardware else ""
+    return (f"v4l2src device={device} io-mode=2 ! {decode}{scale}"
+            f" ! video/x-raw,width={out_width},height={out_height}{convert}"
+            f" ! video/x-raw,format=BGR ! appsink drop=true max-buffers=1 sync=false")
+
+
+class GStreamerSource(VideoCaptureSource):
+    """
+    以 GStreamer 管線字串讀取攝影機 (OpenCV 需以 GStreamer 支援編譯)。
+    解碼、色彩轉換與縮放在管線中完成 (Jetson 上可使用硬體解碼與 nvvidconv)，appsink 只保留最新一幀。
+    """
+    name = "gstreamer"
+
+    def __init__(self, camera_settings: dict):
+        """
+        Args:
+            camera_settings (dict): 攝影機設定，使用 gstreamer_pipeline (未設定時由 build_gstreamer_pipeline 產生) 與 fps。
+        """
+        if not re.search(r"GStreamer:\s*YES", cv2.getBuildInformation()):
+            raise RuntimeError("OpenCV 未以 GStreamer 支援編譯，無法使用 'gstreamer' 擷取來源。")
+        self.pipeline = camera_settings.get('gstreamer_pipeline') or build_gstreamer_pipeline(camera_settings)
+        logger.info(f"GStreamer 擷取管線: {self.pipeline}")
+        super().__init__(cv2.VideoCapture(self.pipeline, cv2.CAP_GSTREAMER), camera_settings.get('fps', 0))
+
+
+def create_capture_source(camera_settings: dict) -> CaptureSource:
+    """
+    根據設定建立擷取來源。
+    Args:
+        camera_settings (dict): 攝影機設定 (config.camera)，backend 為 'opencv' (預設)、'gstreamer' 或 'file'。
+    Returns:
+        CaptureSource: 擷取來源 (呼叫者需以 isOpened() 檢查是否成功開啟)。
+    """
+    backend = str(camera_settings.get('backend', 'opencv')).lower()
+    if backend == OpenCVSource.name:
+        return OpenCVSource(camera_settings)
+    if backend == GStreamerSource.name:
+        return GStreamerSource(camera_settings)
+    if backend == "file":
+        # 影片檔案或影像目錄 (依來源幀率播放，例如在沒有攝影機的環境測試整個應用程式)
+        from benchmark.replay_source import ReplaySource, CLOCK_REALTIME
+        return ReplaySource(str(camera_settings.get('source')), clock=camera_settings.get('clock', CLOCK_REALTIME),
+                            fps=camera_settings.get('fps'), loop=camera_settings.get('loop', 1))
+    raise ValueError(f"未知的擷取來源 '{backend}' (可用: opencv, gstreamer, file)。")
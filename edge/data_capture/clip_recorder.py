@@ -0,0 +1,276 @@
+# data_capture/clip_recorder.py
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.s3_uploader import S3Uploader, build_object_key
+from data_capture.frame_ring_buffer import FrameRingBuffer
+from utils import image_utils
+
+logger = logging.getLogger(__name__)
+
+
+def _write_clip(frames_jpeg: List[bytes], fps: float, output_path: str, codec: str) -> Tuple[str, int]:
+    """
+    在編碼進程中執行：將 JPEG 幀序列寫成影片檔 (需為模組層級函數才能被 pickle)。
+    Args:
+        frames_jpeg (List[bytes]): JPEG 編碼的幀 (由舊到新)。
+        fps (float): 影片幀率。
+        output_path (str): 輸出檔案路徑。
+        codec (str): VideoWriter 的 FourCC (例如 "mp4v"、"avc1"、"MJPG")。
+    Returns:
+        Tuple[str, int]: (輸出檔案路徑, 寫入的幀數)。
+    """
+    writer = None
+    written = 0
+    try:
+        for jpeg in frames_jpeg:
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            if writer is None:
+                h, w = frame.shape[:2]
+                writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*codec), fps, (w, h))
+                if not writer.isOpened():
+                    raise RuntimeError(f"無法以編碼 {codec} 開啟 VideoWriter: {output_path}")
+            writer.write(frame)
+            written += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    return output_path, written
+
+
+class ClipJob:
+    """
+    一個事件短片：觸發時的預錄幀加上之後 post_roll_sec 秒的幀。
+    """
+    def __init__(self, s3_key: str, trigger_time: float, end_time: float, frames: List[Tuple[float, bytes]]):
+        self.s3_key = s3_key
+        self.trigger_time = trigger_time
+        self.end_time = end_time # 收集到此時間 (幀時間戳) 後結束
+        self.frames = frames # (時間戳, JPEG 位元組)
+        self.bytes = sum(len(jpeg) for _, jpeg in frames)
+        self.truncated = False # 超出 clip_max_mb 後不再加入新幀
+
+
+class ClipRecorder(threading.Thread):
+    """
+    事件短片錄製器。
+    背景執行緒以 clip fps 從幀環形緩衝區取樣最新幀，縮小並編碼為 JPEG 後放入預錄緩衝區 (以位元組預算限制大小)；
+    事件觸發時取出預錄幀，繼續收集 post_roll_sec 秒，再交給獨立的編碼進程以 VideoWriter 寫成影片，
+    最後以 S3Uploader 的檔案任務 (分段上傳) 上傳。擷取執行緒只寫入環形緩衝區，不受短片編碼影響。
+    """
+    def __init__(self, frame_ring: FrameRingBuffer, s3_uploader: S3Uploader, clip_settings: dict):
+        """
+        初始化短片錄製器。
+        Args:
+            frame_ring (FrameRingBuffer): 幀環形緩衝區。
+            s3_uploader (S3Uploader): S3 上傳器實例。
+            clip_settings (dict): 短片設定 (config.capture.clip)。
+        """
+        super().__init__(name="clip-recorder", daemon=True)
+        self.frame_ring = frame_ring
+        self.s3_uploader = s3_uploader
+        self.settings = clip_settings or {}
+
+        self.fps = max(1.0, float(self.settings.get('fps', 10)))
+        self.pre_roll_sec = float(self.settings.get('pre_roll_sec', 5))
+        self.post_roll_sec = float(self.settings.get('post_roll_sec', 5))
+        self.max_width = int(self.settings.get('max_width', 960)) # 短片幀的最大寬度 (0 表示原始分辨率)
+        self.jpeg_quality = int(self.settings.get('jpeg_quality', 80))
+        self.preroll_max_bytes = int(float(self.settings.get('preroll_max_mb', 32)) * 1024 * 1024)
+        self.clip_max_bytes = int(float(self.settings.get('clip_max_mb', 48)) * 1024 * 1024)
+        self.max_active_clips = max(1, int(self.settings.get('max_active_clips', 2)))
+        self.max_pending_encodes = max(1, int(self.settings.get('max_pending_encodes', 2)))
+        self.codec = self.settings.get('codec', 'mp4v')
+        self.extension = self.settings.get('extension', 'mp4')
+        self.output_dir = self.settings.get('output_dir', 'spool/clips')
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        # 編碼進程 (VideoWriter 的 CPU 負載不與擷取/推論執行緒競爭 GIL)
+        self._executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context(self.settings.get('start_method', 'spawn'))
+        )
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._preroll: Deque[Tuple[float, bytes]] = deque()
+        self._preroll_bytes = 0
+        self._active: List[ClipJob] = []
+        self._pending_encodes: Dict[Future, ClipJob] = {}
+        self._last_seq = -1
+        self._small: Optional[np.ndarray] = None # 預先配置的縮小幀緩衝區
+
+        self.sampled_count = 0
+        self.clips_requested = 0
+        self.clips_rejected = 0
+        self.clips_encoded = 0
+        self.clips_failed = 0
+        self.frames_dropped = 0 # 因位元組預算而捨棄的幀數
+
+    def request_clip(self, s3_folder_prefix: str, timestamp: Optional[float] = None) -> Optional[str]:
+        """
+        請求一段事件短片 (非阻塞)，立即返回目標 S3 Key。
+        Args:
+            s3_folder_prefix (str): 上傳到 S3 的檔案夾前綴。
+            timestamp (float, optional): 事件時間戳。Defaults to time.time().
+        Returns:
+            Optional[str]: S3 Key；錄製中的短片已達上限或錄製器已停止時為 None。
+        """
+        trigger_time = timestamp if timestamp is not None else time.time()
+        s3_key = build_object_key(s3_folder_prefix, trigger_time, self.extension)
+        with self._lock:
+            if self._stop_event.is_set() or len(self._active) >= self.max_active_clips:
+                self.clips_rejected += 1
+                logger.warning(f"錄製中的事件短片已達上限 ({self.max_active_clips})，略過短片: {s3_key}")
+                return None
+            frames = [(ts, jpeg) for ts, jpeg in self._preroll if ts >= trigger_time - self.pre_roll_sec]
+            self._active.append(ClipJob(s3_key, trigger_time, trigger_time + self.post_roll_sec, frames))
+            self.clips_requested += 1
+        logger.info(f"開始錄製事件短片 (預錄 {len(frames)} 幀): {s3_key}")
+        return s3_key
+
+    def run(self):
+        logger.info("事件短片錄製執行緒啟動...")
+        interval = 1.0 / self.fps
+        while not self._stop_event.wait(interval):
+            try:
+                self._sample()
+            except Exception as e:
+                logger.error(f"短片取樣時發生錯誤: {e}", exc_info=True)
+            self._finish_jobs(time.time())
+        self._finish_jobs(float("inf")) # 停止時結束所有錄製中的短片
+        logger.info("事件短片錄製執行緒已終止。")
+
+    def _sample(self):
+        """
+        從環形緩衝區取樣最新一幀，縮小並編碼為 JPEG 後加入預錄緩衝區與錄製中的短片。
+        """
+        seq = self.frame_ring.latest_seq
+        if seq < 0 or seq == self._last_seq:
+            return
+        entry = self.frame_ring.get(seq)
+        if entry is None:
+            return
+        self._last_seq = seq
+        frame_np, timestamp = entry[0], entry[1]
+
+        frame_np, self._small = image_utils.shrink_to_width(frame_np, self.max_width, self._small)
+        ret, buffer = cv2.imencode('.jpg', frame_np, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if not ret:
+            return
+        jpeg = buffer.tobytes()
+
+        with self._lock:
+            self.sampled_count += 1
+            self._preroll.append((timestamp, jpeg))
+            self._preroll_bytes += len(jpeg)
+            # 預錄緩衝區同時以時間與位元組預算限制
+            while self._preroll and (self._preroll_bytes > self.preroll_max_bytes or
+                                     self._preroll[0][0] < timestamp - self.pre_roll_sec):
+                if self._preroll_bytes > self.preroll_max_bytes:
+                    self.frames_dropped += 1
+                _, old_jpeg = self._preroll.popleft()
+                self._preroll_bytes -= len(old_jpeg)
+
+            for job in self._active:
+                if timestamp <= job.trigger_time or timestamp > job.end_time or job.truncated:
+                    continue
+                if job.bytes + len(jpeg) > self.clip_max_bytes:
+                    job.truncated = True
+                    self.frames_dropped += 1
+                    logger.warning(f"事件短片超出大小上限，提早結束: {job.s3_key}")
+                    continue
+                job.frames.append((timestamp, jpeg))
+                job.bytes += len(jpeg)
+
+    def _finish_jobs(self, now: float):
+        """
+        將錄製完成 (超過 end_time 或被截斷) 的短片交給編碼進程。
+        """
+        with self._lock:
+            done = [job for job in self._active if now >= job.end_time or job.truncated]
+            self._active = [job for job in self._active if job not in done]
+        for job in done:
+            self._submit_encode(job)
+
+    def _submit_encode(self, job: ClipJob):
+        if not job.frames:
+            logger.warning(f"事件短片沒有任何幀，略過: {job.s3_key}")
+            return
+        with self._lock:
+            if len(self._pending_encodes) >= self.max_pending_encodes:
+                self.clips_failed += 1
+                logger.warning(f"短片編碼任務已滿 ({self.max_pending_encodes})，丟棄短片: {job.s3_key}")
+                return
+        output_path = os.path.join(self.output_dir, job.s3_key.replace('/', '_'))
+        # 以實際收集到的幀時間範圍估算幀率，讓播放速度接近真實時間
+        duration = job.frames[-1][0] - job.frames[0][0]
+        fps = (len(job.frames) - 1) / duration if duration > 0 and len(job.frames) > 1 else self.fps
+        try:
+            future = self._executor.submit(_write_clip, [jpeg for _, jpeg in job.frames], fps, output_path, self.codec)
+        except RuntimeError as e: # 編碼進程已關閉
+            logger.error(f"無法提交短片編碼任務: {e}. Key: {job.s3_key}")
+            with self._lock:
+                self.clips_failed += 1
+            return
+        with self._lock:
+            self._pending_encodes[future] = job
+        future.add_done_callback(self._on_encoded)
+
+    def _on_encoded(self, future: Future):
+        with self._lock:
+            job = self._pending_encodes.pop(future, None)
+        if job is None:
+            return
+        try:
+            output_path, written = future.result()
+        except Exception as e:
+            logger.error(f"事件短片編碼失敗: {e}. Key: {job.s3_key}")
+            with self._lock:
+                self.clips_failed += 1
+            return
+        with self._lock:
+            self.clips_encoded += 1
+        logger.info(f"事件短片編碼完成 ({written} 幀): {job.s3_key}")
+        self.s3_uploader.put_file_task(output_path, job.s3_key, delete_after=True)
+
+    def stop(self):
+        """
+        請求停止錄製 (錄製中的短片會以目前收集到的幀結束並編碼)。
+        """
+        self._stop_event.set()
+
+    def join(self, timeout: Optional[float] = None):
+        super().join(timeout)
+        # 等待編碼進程完成已提交的短片 (完成回調會把檔案加入上傳佇列)
+        self._executor.shutdown(wait=True)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 取樣幀數、預錄緩衝區大小、短片請求/拒絕/編碼/失敗數量與因預算捨棄的幀數。
+        """
+        with self._lock:
+            return {
+                "sampled": self.sampled_count,
+                "preroll_frames": len(self._preroll),
+                "preroll_mb": round(self._preroll_bytes / 1e6, 2),
+                "active_clips": len(self._active),
+                "pending_encodes": len(self._pending_encodes),
+                "clips_requested": self.clips_requested,
+                "clips_rejected": self.clips_rejected,
+                "clips_encoded": self.clips_encoded,
+                "clips_failed": self.clips_failed,
+                "frames_dropped": self.frames_dropped,
+            }
@@ -0,0 +1,209 @@
+# data_capture/frame_recorder.py
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import cv2
+import numpy as np
+
+from data_capture.recording import RecordingWriter, RECORDING_EXTENSION, list_recordings
+from events.result_store import CloudResult
+from inference.detection_table import DETECTION_DTYPE
+from utils import image_utils
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRecorder(threading.Thread):
+    """
+    現場錄製器。
+    背景執行緒以 sample_fps 取樣最新已完成推論的幀，縮小並編碼為 JPEG，連同該幀的偵測結果表與期間收到的雲端結果
+    寫入錄製檔 (data_capture/recording.py)；錄製檔依時間與大小切分為多個分段，總大小超出預算時刪除最舊的分段。
+    之後可以用 benchmark/detector_replay.py 直接以錄製檔驅動偵測器，不需要重新執行模型。
+    """
+    def __init__(self, capture_manager, result_store, record_settings: dict, class_mapping: Optional[dict] = None):
+        """
+        初始化錄製器。
+        Args:
+            capture_manager (CaptureManager): 捕獲管理器 (從幀環形緩衝區取樣)。
+            result_store (ResultStore): 雲端結果儲存 (註冊監聽器以錄製雲端結果)。
+            record_settings (dict): 錄製設定 (config.capture.record)。
+            class_mapping (dict, optional): 模型類別映射，寫入檔頭供重播時參考。
+        """
+        super().__init__(name="frame-recorder", daemon=True)
+        self.capture_manager = capture_manager
+        self.settings = record_settings or {}
+        self.class_mapping = {str(class_id): name for class_id, name in (class_mapping or {}).items()}
+
+        self.sample_fps = max(0.1, float(self.settings.get('sample_fps', 5)))
+        self.max_width = int(self.settings.get('max_width', 640)) # 錄製幀的最大寬度 (0 表示原始分辨率)
+        self.jpeg_quality = int(self.settings.get('jpeg_quality', 75))
+        self.chunk_bytes = int(float(self.settings.get('chunk_kb', 1024)) * 1024)
+        self.chunk_max_sec = float(self.settings.get('chunk_max_sec', 2.0))
+        self.segment_sec = float(self.settings.get('segment_sec', 600)) # 每個分段的最長時間
+        self.segment_max_bytes = int(float(self.settings.get('segment_max_mb', 256)) * 1024 * 1024)
+        self.max_total_bytes = int(float(self.settings.get('max_total_mb', 2048)) * 1024 * 1024) # 所有分段的總大小上限
+        self.output_dir = self.settings.get('output_dir', 'recordings')
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._pending_results: Deque[CloudResult] = deque(maxlen=1024) # 由 MQTT 回調加入，錄製執行緒寫入
+        self._writer: Optional[RecordingWriter] = None
+        self._segment_started = 0.0
+        self._last_seq = -1
+        self._small: Optional[np.ndarray] = None # 預先配置的縮小幀緩衝區
+
+        self.frames_recorded = 0
+        self.results_recorded = 0
+        self.bytes_written = 0 # 已關閉分段的總大小
+        self.segments_closed = 0
+        self.segments_deleted = 0
+        self.errors = 0
+
+        if self.settings.get('include_results', True) and result_store is not None:
+            result_store.add_listener(self._on_result)
+
+    def _on_result(self, result: CloudResult):
+        self._pending_results.append(result)
+
+    def run(self):
+        logger.info(f"現場錄製執行緒啟動 (取樣 {self.sample_fps} FPS，輸出到 {self.output_dir})...")
+        interval = 1.0 / self.sample_fps
+        while not self._stop_event.wait(interval):
+            try:
+                self._write_results()
+                self._sample()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"錄製幀時發生錯誤: {e}", exc_info=True)
+        try:
+            self._write_results()
+        finally:
+            self._close_segment()
+        logger.info("現場錄製執行緒已終止。")
+
+    def _sample(self):
+        """
+        取樣最新已完成推論的幀 (同一幀只錄製一次)，縮小並編碼為 JPEG 後連同偵測結果寫入錄製檔。
+        """
+        frame_data = self.capture_manager.get_latest_frame()
+        if frame_data is None or frame_data.seq == self._last_seq:
+            return
+        self._last_seq = frame_data.seq
+        frame_np = frame_data.frame_np
+        h, w = frame_np.shape[:2]
+
+        stored, self._small = image_utils.shrink_to_width(frame_np, self.max_width, self._small)
+        ret, buffer = cv2.imencode('.jpg', stored, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if not ret:
+            return
+
+        # 偵測結果保留原始分辨率的座標 (重播時放大回原始分辨率，像素 ROI 與區域設定不需要換算)；
+        # 雙分辨率模式下取樣的是推論分辨率的幀，檔頭記錄的是偵測座標使用的原始分辨率
+        frame_width, frame_height = int(round(w / frame_data.scale)), int(round(h / frame_data.scale))
+        writer = self._ensure_segment(frame_width, frame_height, stored.shape[1], stored.shape[0])
+        table = frame_data.detection_table
+        records = table.records if table is not None else np.zeros(0, dtype=DETECTION_DTYPE)
+        writer.write_frame(frame_data.timestamp, frame_data.seq, buffer, records)
+        with self._lock:
+            self.frames_recorded += 1
+
+    def _write_results(self):
+        while self._pending_results:
+            result = self._pending_results.popleft()
+            if self._writer is None:
+                continue # 還沒有錄製任何幀 (分段在第一幀時才知道分辨率)
+            self._writer.write_result(result.timestamp, result.kind, result.key, result.camera_id, dict(result.data))
+            with self._lock:
+                self.results_recorded += 1
+
+    def _ensure_segment(self, frame_width: int, frame_height: int, stored_width: int, stored_height: int) -> RecordingWriter:
+        """
+        返回目前的分段寫入器，分段超過時間或大小上限 (或分辨率改變) 時關閉並開始新的分段。
+        """
+        writer = self._writer
+        if writer is not None:
+            header = writer.header
+            if (time.monotonic() - self._segment_started >= self.segment_sec or writer.size >= self.segment_max_bytes or
+                    (header["frame_width"], header["frame_height"]) != (frame_width, frame_height)):
+                self._close_segment()
+                writer = None
+        if writer is None:
+            path = os.path.join(self.output_dir, time.strftime("rec_%Y%m%d_%H%M%S", time.localtime()) +
+                                f"_{int(time.time() * 1000) % 1000:03d}{RECORDING_EXTENSION}")
+            writer = RecordingWriter(path, {
+                "frame_width": frame_width,
+                "frame_height": frame_height,
+                "stored_width": stored_width,
+                "stored_height": stored_height,
+                "jpeg_quality": self.jpeg_quality,
+                "sample_fps": self.sample_fps,
+                "class_mapping": self.class_mapping,
+            }, chunk_bytes=self.chunk_bytes, chunk_max_sec=self.chunk_max_sec)
+            self._writer = writer
+            self._segment_started = time.monotonic()
+            logger.info(f"開始錄製分段: {path}")
+        return writer
+
+    def _close_segment(self):
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        try:
+            writer.close()
+        except OSError as e:
+            self.errors += 1
+            logger.error(f"關閉錄製分段失敗: {e}. 檔案: {writer.path}")
+            return
+        with self._lock:
+            self.segments_closed += 1
+            self.bytes_written += writer.size
+        logger.info(f"錄製分段已關閉 ({writer.frame_count} 幀，{writer.result_count} 筆雲端結果): {writer.path}")
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        """
+        所有分段的總大小超出 max_total_mb 時，刪除最舊的分段。
+        """
+        segments = [(path, os.path.getsize(path)) for path in list_recordings(self.output_dir) if os.path.isfile(path)]
+        total = sum(size for _, size in segments)
+        for path, size in segments:
+            if total <= self.max_total_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"無法刪除舊的錄製分段: {e}")
+                continue
+            total -= size
+            with self._lock:
+                self.segments_deleted += 1
+            logger.info(f"錄製檔總大小超出上限，已刪除最舊的分段: {path}")
+
+    def stop(self):
+        """
+        請求停止錄製 (目前的分段會寫入索引後關閉)。
+        """
+        self._stop_event.set()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 錄製的幀數、雲端結果數、分段數量與大小。
+        """
+        with self._lock:
+            writer = self._writer
+            return {
+                "frames": self.frames_recorded,
+                "results": self.results_recorded,
+                "segments_closed": self.segments_closed,
+                "segments_deleted": self.segments_deleted,
+                "current_segment_mb": round(writer.size / 1e6, 2) if writer is not None else 0.0,
+                "written_mb": round(self.bytes_written / 1e6, 2),
+                "errors": self.errors,
+            }
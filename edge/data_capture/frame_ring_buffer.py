@@ -0,0 +1,247 @@
+# data_capture/frame_ring_buffer.py
+
+import logging
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRingBuffer:
+    """
+    以單一預先配置的 NumPy 區塊 (N x H x W x C) 實現的幀環形緩衝區。
+
+    攝影機可以直接寫入 acquire_write_slot() 返回的槽位 (例如 cap.read(slot))，
+    避免每幀配置與拷貝 4K 影像。每幀以遞增的序號 (seq) 索引，槽位為 seq % N。
+    讀取者取得的是唯讀視圖，在大約 N 幀之後該槽位會被覆寫；
+    需要長時間持有某幀 (例如等待 JPEG 編碼) 時，應調用 retain(seq)，
+    該幀被覆寫前會先拷貝出來，直到 release(seq)。
+    每幀可以附帶攝影機輸出的壓縮數據 (MJPEG 攝影機的 JPEG)，上傳證據影像時直接使用而不重新編碼。
+
+    寫入端假設只有一個執行緒 (擷取執行緒)。
+    """
+    def __init__(self, capacity: int, frame_shape: Optional[Tuple[int, ...]] = None, dtype=np.uint8):
+        """
+        初始化環形緩衝區。
+        Args:
+            capacity (int): 槽位數量。
+            frame_shape (Tuple[int, ...], optional): 幀的形狀 (H, W, C)。未指定時在第一幀寫入時配置。
+            dtype: 幀的數據類型。
+        """
+        self.capacity = max(1, int(capacity))
+        self.dtype = dtype
+        self._lock = threading.Lock()
+
+        self._frames: Optional[np.ndarray] = None
+        self._slot_seq = np.full(self.capacity, -1, dtype=np.int64) # 每個槽位目前保存的幀序號 (-1 表示無效/寫入中)
+        self._timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self._frame_cuda: List[Any] = [None] * self.capacity
+        self._detections: List[Any] = [None] * self.capacity
+        self._encoded: List[Optional[np.ndarray]] = [None] * self.capacity # 每個槽位的幀的壓縮數據 (沒有時為 None)
+
+        self._next_seq = 0 # 下一個要寫入的序號
+        self._latest_seq = -1 # 最新已提交的序號
+
+        # 被持有的幀：seq -> 引用計數；被覆寫前拷貝出來的幀：seq -> (frame, timestamp, frame_cuda, detections, encoded)
+        self._retained: Dict[int, int] = {}
+        self._evicted: Dict[int, Tuple[np.ndarray, float, Any, Any, Optional[np.ndarray]]] = {}
+
+        if frame_shape is not None:
+            self.allocate(frame_shape)
+
+    @property
+    def frame_shape(self) -> Optional[Tuple[int, ...]]:
+        return None if self._frames is None else self._frames.shape[1:]
+
+    @property
+    def latest_seq(self) -> int:
+        return self._latest_seq
+
+    def allocate(self, frame_shape: Tuple[int, ...]):
+        """
+        (重新) 配置緩衝區。現有的幀會被清除。
+        Args:
+            frame_shape (Tuple[int, ...]): 幀的形狀 (H, W, C)。
+        """
+        frame_shape = tuple(int(d) for d in frame_shape)
+        with self._lock:
+            if self._frames is not None and self._frames.shape[1:] == frame_shape:
+                return
+            self._frames = np.empty((self.capacity,) + frame_shape, dtype=self.dtype)
+            self._slot_seq[:] = -1
+            self._frame_cuda = [None] * self.capacity
+            self._detections = [None] * self.capacity
+            self._encoded = [None] * self.capacity
+        logger.info(f"幀環形緩衝區已配置: {self.capacity} x {frame_shape} ({self._frames.nbytes / 1e6:.1f} MB)")
+
+    def acquire_write_slot(self) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        取得下一個可寫入的槽位。槽位在 commit() 之前對讀取者不可見。
+        Returns:
+            Tuple[int, Optional[np.ndarray]]: (序號, 可寫入的槽位陣列)。緩衝區尚未配置時槽位為 None。
+        """
+        with self._lock:
+            seq = self._next_seq
+            if self._frames is None:
+                return seq, None
+            slot = seq % self.capacity
+            old_seq = int(self._slot_seq[slot])
+            if old_seq >= 0 and old_seq in self._retained and old_seq not in self._evicted:
+                # 被持有的幀即將被覆寫，先拷貝出來
+                self._evicted[old_seq] = (self._frames[slot].copy(), float(self._timestamps[slot]),
+                                          self._frame_cuda[slot], self._detections[slot], self._encoded[slot])
+            self._slot_seq[slot] = -1
+            self._frame_cuda[slot] = None
+            self._detections[slot] = None
+            self._encoded[slot] = None
+            return seq, self._frames[slot]
+
+    def commit(self, seq: int, timestamp: float, frame_np: Optional[np.ndarray] = None,
+               encoded: Optional[np.ndarray] = None):
+        """
+        提交已寫入的槽位，使其對讀取者可見。
+        Args:
+            seq (int): acquire_write_slot() 返回的序號。
+            timestamp (float): 幀的時間戳。
+            frame_np (np.ndarray, optional): 實際讀取到的幀。如果它不是槽位本身
+                (例如攝影機配置了新的陣列)，會拷貝進槽位；形狀不同時重新配置緩衝區。
+            encoded (np.ndarray, optional): 幀的壓縮數據 (例如攝影機輸出的 JPEG，保存引用而不拷貝)。
+        """
+        if frame_np is not None:
+            if self._frames is None or self._frames.shape[1:] != frame_np.shape:
+                self.allocate(frame_np.shape)
+                seq, _ = self.acquire_write_slot()
+            slot_view = self._frames[seq % self.capacity]
+            if not np.shares_memory(slot_view, frame_np):
+                np.copyto(slot_view, frame_np)
+
+        with self._lock:
+            slot = seq % self.capacity
+            self._timestamps[slot] = timestamp
+            self._encoded[slot] = encoded
+            self._slot_seq[slot] = seq
+            self._latest_seq = seq
+            self._next_seq = seq + 1
+        return seq
+
+    def write(self, frame_np: np.ndarray, timestamp: float) -> int:
+        """
+        將幀拷貝到下一個槽位並提交 (用於無法直接寫入槽位的來源)。
+        Args:
+            frame_np (np.ndarray): 幀數據。
+            timestamp (float): 幀的時間戳。
+        Returns:
+            int: 幀的序號。
+        """
+        seq, _ = self.acquire_write_slot()
+        return self.commit(seq, timestamp, frame_np)
+
+    def set_metadata(self, seq: int, frame_cuda: Any = None, detections_raw: Any = None) -> bool:
+        """
+        附加推論結果到指定的幀。
+        Returns:
+            bool: 如果該幀仍在緩衝區中則為 True。
+        """
+        with self._lock:
+            slot = seq % self.capacity
+            if int(self._slot_seq[slot]) == seq:
+                self._frame_cuda[slot] = frame_cuda
+                self._detections[slot] = detections_raw
+                return True
+            if seq in self._evicted:
+                frame, ts, _, _, encoded = self._evicted[seq]
+                self._evicted[seq] = (frame, ts, frame_cuda, detections_raw, encoded)
+                return True
+            return False
+
+    def get(self, seq: int) -> Optional[Tuple[np.ndarray, float, Any, Any]]:
+        """
+        取得指定序號的幀。
+        Returns:
+            Optional[Tuple]: (唯讀幀視圖, 時間戳, CUDA 影像, 偵測結果)，如果該幀已不在緩衝區則為 None。
+        """
+        with self._lock:
+            if seq in self._evicted:
+                frame, ts, frame_cuda, detections, _ = self._evicted[seq]
+                return _readonly(frame), ts, frame_cuda, detections
+            if seq < 0 or self._frames is None:
+                return None
+            slot = seq % self.capacity
+            if int(self._slot_seq[slot]) != seq:
+                return None
+            return (_readonly(self._frames[slot]), float(self._timestamps[slot]),
+                    self._frame_cuda[slot], self._detections[slot])
+
+    def get_encoded(self, seq: int) -> Optional[np.ndarray]:
+        """
+        取得指定幀的壓縮數據。
+        Returns:
+            Optional[np.ndarray]: 壓縮數據 (uint8)，該幀沒有壓縮數據或已不在緩衝區時為 None。
+        """
+        with self._lock:
+            if seq in self._evicted:
+                return self._evicted[seq][4]
+            slot = seq % self.capacity
+            if seq < 0 or int(self._slot_seq[slot]) != seq:
+                return None
+            return self._encoded[slot]
+
+    def get_recent_seqs(self, count: Optional[int] = None) -> List[int]:
+        """
+        Args:
+            count (int, optional): 最多返回的數量，預設為整個緩衝區。
+        Returns:
+            List[int]: 緩衝區中有效幀的序號，由舊到新。
+        """
+        with self._lock:
+            valid = self._slot_seq[self._slot_seq >= 0]
+            seqs = np.sort(valid)
+        if count is not None:
+            seqs = seqs[-count:]
+        return [int(s) for s in seqs]
+
+    def retain(self, seq: int) -> bool:
+        """
+        持有指定的幀，確保它在 release() 前不會因槽位覆寫而遺失。
+        Returns:
+            bool: 如果該幀仍可取得則為 True。
+        """
+        with self._lock:
+            slot = seq % self.capacity
+            available = seq in self._evicted or (seq >= 0 and int(self._slot_seq[slot]) == seq)
+            if available:
+                self._retained[seq] = self._retained.get(seq, 0) + 1
+            return available
+
+    def release(self, seq: int):
+        """
+        釋放 retain() 持有的幀。
+        """
+        with self._lock:
+            count = self._retained.get(seq, 0) - 1
+            if count > 0:
+                self._retained[seq] = count
+            else:
+                self._retained.pop(seq, None)
+                self._evicted.pop(seq, None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "latest_seq": self._latest_seq,
+                "retained": len(self._retained),
+                "evicted_copies": len(self._evicted),
+                "allocated_mb": round(self._frames.nbytes / 1e6, 1) if self._frames is not None else 0.0,
+                "encoded_mb": round(sum(e.nbytes for e in self._encoded if e is not None) / 1e6, 1),
+            }
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    """
+    返回陣列的唯讀視圖 (不拷貝數據)。
+    """
+    view = array.view()
+    view.flags.writeable = False
+    return view
@@ -0,0 +1,240 @@
+# data_capture/image_encoder.py
+
+import cv2
+import numpy as np
+import time
+import logging
+import threading
+import queue
+from typing import Any, Dict, List, Optional
+
+from utils import metrics
+from utils.s3_uploader import S3Uploader
+from data_capture.frame_ring_buffer import FrameRingBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class EncodeTask:
+    """
+    一個 JPEG 編碼任務：引用緩衝區中的幀 (或獨立的影像陣列) 及編碼參數。
+    """
+    def __init__(self, s3_key: str, frame_seq: int = -1, frame_np: Optional[np.ndarray] = None,
+                 quality: int = 90, max_width: int = 0, max_height: int = 0,
+                 crop: Optional[List[int]] = None):
+        self.s3_key = s3_key
+        self.frame_seq = frame_seq # 環形緩衝區中的幀序號 (-1 表示使用 frame_np)
+        self.frame_np = frame_np # 不在緩衝區中的影像 (例如外部傳入的 FrameData)
+        self.quality = quality # JPEG 品質 (0-100)
+        self.max_width = max_width # 最大寬度 (0 表示不限制)
+        self.max_height = max_height # 最大高度 (0 表示不限制)
+        self.crop = crop # 可選的裁剪區域 [x1, y1, x2, y2]
+        self.submitted_at = time.perf_counter()
+
+
+class ImageEncoder(threading.Thread):
+    """
+    在獨立執行緒中執行 JPEG 編碼，並將結果交給 S3Uploader 上傳。
+    讓偵測器觸發事件時不必在幀處理執行緒上同步編碼 4K 影像。
+    緩衝區中的幀附帶攝影機輸出的 JPEG (MJPEG 直通模式) 時，整幀影像直接上傳該 JPEG，不重新編碼；
+    需要裁剪或縮小時先完整解碼該 JPEG (緩衝區中的幀是縮小解碼的，座標以原始分辨率為準)。
+    """
+    def __init__(self, frame_ring: FrameRingBuffer, s3_uploader: S3Uploader, encode_settings: dict):
+        """
+        初始化編碼執行緒。
+        Args:
+            frame_ring (FrameRingBuffer): 幀環形緩衝區 (任務以序號引用其中的幀)。
+            s3_uploader (S3Uploader): S3 上傳器實例。
+            encode_settings (dict): 編碼設定 (config.capture.encode)。
+        """
+        super().__init__(name="image-encoder", daemon=True)
+        self.frame_ring = frame_ring
+        self.s3_uploader = s3_uploader
+        self.settings = encode_settings or {}
+
+        self.default_quality = int(self.settings.get('jpeg_quality', 90))
+        self.default_max_width = int(self.settings.get('max_width', 0))
+        self.default_max_height = int(self.settings.get('max_height', 0))
+        self.passthrough = bool(self.settings.get('passthrough', True)) # 整幀影像直接上傳攝影機的 JPEG
+        self._task_queue: queue.Queue = queue.Queue(maxsize=self.settings.get('queue_maxsize', 8))
+        self._stop_event = threading.Event()
+
+        self._metrics_lock = threading.Lock()
+        self._encoded_count = 0
+        self._failed_count = 0
+        self._rejected_count = 0
+        self._passthrough_count = 0
+        self._total_encode_time = 0.0
+        self._max_encode_time = 0.0
+        self._total_wait_time = 0.0
+
+    def submit(self, s3_key: str, frame_seq: int = -1, frame_np: Optional[np.ndarray] = None,
+               quality: Optional[int] = None, max_width: Optional[int] = None,
+               max_height: Optional[int] = None, crop: Optional[List[int]] = None) -> bool:
+        """
+        提交一個編碼任務 (非阻塞)。
+        Args:
+            s3_key (str): 上傳到 S3 的目標 Key。
+            frame_seq (int): 環形緩衝區中的幀序號。為 -1 時使用 frame_np。
+            frame_np (np.ndarray, optional): 不在緩衝區中的影像。
+            quality (int, optional): JPEG 品質，預設使用設定值。
+            max_width (int, optional): 最大寬度，預設使用設定值。
+            max_height (int, optional): 最大高度，預設使用設定值。
+            crop (List[int], optional): 裁剪區域 [x1, y1, x2, y2]。
+        Returns:
+            bool: 如果任務成功加入佇列則為 True。
+        """
+        if frame_seq >= 0:
+            # 持有該幀，確保編碼前不會因緩衝區覆寫而遺失
+            if not self.frame_ring.retain(frame_seq):
+                logger.warning(f"幀 {frame_seq} 已不在緩衝區中，無法編碼: {s3_key}")
+                return False
+        elif frame_np is None:
+            logger.warning(f"編碼任務沒有影像數據: {s3_key}")
+            return False
+
+        task = EncodeTask(
+            s3_key, frame_seq=frame_seq, frame_np=frame_np,
+            quality=self.default_quality if quality is None else quality,
+            max_width=self.default_max_width if max_width is None else max_width,
+            max_height=self.default_max_height if max_height is None else max_height,
+            crop=crop
+        )
+        try:
+            self._task_queue.put_nowait(task)
+            return True
+        except queue.Full:
+            logger.warning(f"影像編碼佇列已滿，丟棄任務: {s3_key}")
+            with self._metrics_lock:
+                self._rejected_count += 1
+            if frame_seq >= 0:
+                self.frame_ring.release(frame_seq)
+            return False
+
+    def run(self):
+        logger.info("影像編碼執行緒啟動...")
+        while not self._stop_event.is_set():
+            try:
+                task = self._task_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            if task is None:
+                break
+
+            try:
+                self._encode_and_upload(task)
+            finally:
+                if task.frame_seq >= 0:
+                    self.frame_ring.release(task.frame_seq)
+                self._task_queue.task_done()
+
+        logger.info("影像編碼執行緒已終止。")
+
+    def _encode_and_upload(self, task: EncodeTask):
+        wait_time = time.perf_counter() - task.submitted_at
+        start = time.perf_counter()
+        try:
+            image = task.frame_np
+            if task.frame_seq >= 0:
+                encoded = self.frame_ring.get_encoded(task.frame_seq)
+                if encoded is not None:
+                    if self.passthrough and not task.crop and not task.max_width and not task.max_height:
+                        self._upload_passthrough(task, encoded, wait_time)
+                        return
+                    image = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+                else:
+                    entry = self.frame_ring.get(task.frame_seq)
+                    image = entry[0] if entry is not None else None
+            if image is None:
+                raise ValueError(f"幀 {task.frame_seq} 已不在緩衝區中")
+
+            if task.crop:
+                h, w = image.shape[:2]
+                x1, y1, x2, y2 = [int(v) for v in task.crop]
+                x1, y1 = max(0, x1), max(0, y1)
+                x2, y2 = min(w, x2), min(h, y2)
+                if x2 <= x1 or y2 <= y1:
+                    raise ValueError(f"裁剪區域無效: {task.crop}")
+                image = image[y1:y2, x1:x2]
+
+            image = _limit_resolution(image, task.max_width, task.max_height)
+
+            ret, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), int(task.quality)])
+            if not ret:
+                raise ValueError("cv2.imencode 返回失敗")
+            image_data = buffer.tobytes()
+        except Exception as e:
+            logger.error(f"影像編碼時發生錯誤: {e}. Key: {task.s3_key}", exc_info=True)
+            metrics.count_error("jpeg_encode")
+            with self._metrics_lock:
+                self._failed_count += 1
+            return
+
+        encode_time = time.perf_counter() - start
+        metrics.observe_stage("jpeg_encode", encode_time)
+        with self._metrics_lock:
+            self._encoded_count += 1
+            self._total_encode_time += encode_time
+            self._total_wait_time += wait_time
+            if encode_time > self._max_encode_time:
+                self._max_encode_time = encode_time
+
+        logger.debug(f"影像編碼完成 ({len(image_data)} bytes, {encode_time * 1000:.1f} ms): {task.s3_key}")
+        self.s3_uploader.put_upload_task(image_data, task.s3_key)
+
+    def _upload_passthrough(self, task: EncodeTask, encoded: np.ndarray, wait_time: float):
+        """
+        直接上傳攝影機輸出的 JPEG (不解碼、不重新編碼，沒有畫質損失)。
+        """
+        with self._metrics_lock:
+            self._passthrough_count += 1
+            self._total_wait_time += wait_time
+        logger.debug(f"直接上傳攝影機的 JPEG ({encoded.nbytes} bytes): {task.s3_key}")
+        self.s3_uploader.put_upload_task(encoded.tobytes(), task.s3_key)
+
+    def stop(self):
+        """
+        請求停止編碼執行緒 (佇列中已提交的任務會先處理完)。
+        """
+        try:
+            self._task_queue.put(None, timeout=1.0)
+        except queue.Full:
+            self._stop_event.set()
+
+    def wait_for_completion(self):
+        self._task_queue.join()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 編碼數量、直接上傳攝影機 JPEG 的數量、失敗/拒絕數量、佇列積壓與編碼耗時 (毫秒)。
+        """
+        with self._metrics_lock:
+            count = self._encoded_count
+            return {
+                "encoded": count,
+                "passthrough": self._passthrough_count,
+                "failed": self._failed_count,
+                "rejected": self._rejected_count,
+                "backlog": self._task_queue.qsize(),
+                "avg_encode_ms": round(self._total_encode_time / count * 1000, 2) if count else 0.0,
+                "max_encode_ms": round(self._max_encode_time * 1000, 2),
+                "avg_queue_wait_ms": round(self._total_wait_time / (count + self._passthrough_count) * 1000, 2)
+                                     if count + self._passthrough_count else 0.0,
+            }
+
+
+def _limit_resolution(image: np.ndarray, max_width: int, max_height: int) -> np.ndarray:
+    """
+    依最大寬高等比例縮小影像 (0 表示該方向不限制)。
+    """
+    h, w = image.shape[:2]
+    scale = 1.0
+    if max_width and w > max_width:
+        scale = min(scale, max_width / w)
+    if max_height and h > max_height:
+        scale = min(scale, max_height / h)
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,347 @@
+# data_capture/recording.py
+#
+# 精簡的錄製檔格式 (.edgerec)：取樣幀 (JPEG) + 每幀的偵測結果表 + 雲端結果，附時間索引。
+#
+#   檔頭:   MAGIC (8) | 檔頭長度 <I | JSON 檔頭 | 補齊到 8 位元組
+#   記錄:   <4sIdq (標籤, 內容長度, 時間戳, 幀序號) | 內容 | 補齊到 8 位元組
+#             FRME: <II (JPEG 長度, 偵測數量) | JPEG | 補齊 | DETECTION_DTYPE 陣列
+#             RSLT: JSON {kind, key, camera_id, data}
+#   索引:   INDEX_DTYPE 陣列 (關閉時寫入)
+#   檔尾:   <QQ8s (索引位移, 索引筆數, INDEX_MAGIC)
+#
+# 記錄以區塊 (chunk) 為單位寫入；沒有正常關閉 (缺少檔尾) 的檔案在讀取時掃描記錄重建索引，忽略寫到一半的結尾。
+# 讀取端以 mmap 開啟，JPEG 與偵測結果都是檔案的零拷貝視圖。
+
+import os
+import json
+import mmap
+import time
+import struct
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import cv2
+import numpy as np
+
+from inference.detection_table import DETECTION_DTYPE
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b"EDGEREC1"
+INDEX_MAGIC = b"EDGEIDX1"
+FORMAT_VERSION = 1
+RECORDING_EXTENSION = ".edgerec"
+
+TAG_FRAME = b"FRME"
+TAG_RESULT = b"RSLT"
+KIND_FRAME = 1
+KIND_RESULT = 2
+_TAG_TO_KIND = {TAG_FRAME: KIND_FRAME, TAG_RESULT: KIND_RESULT}
+
+_RECORD_HEADER = struct.Struct("<4sIdq") # 標籤, 內容長度, 時間戳, 幀序號 (雲端結果為 -1)
+_FRAME_HEADER = struct.Struct("<II")     # JPEG 長度, 偵測數量
+_TRAILER = struct.Struct("<QQ8s")        # 索引位移, 索引筆數, INDEX_MAGIC
+
+INDEX_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('offset', '<u8'),  # 記錄標頭在檔案中的位移
+    ('seq', '<i8'),
+    ('kind', '<u4'),    # KIND_FRAME 或 KIND_RESULT
+    ('length', '<u4'),  # 內容長度 (不含標頭與補齊)
+])
+
+
+def _pad(length: int) -> int:
+    return (-length) % 8
+
+
+def _dtype_from_descr(descr: List) -> np.dtype:
+    """
+    由 JSON 檔頭中的 dtype 描述重建偵測結果的 dtype (JSON 會把 tuple 轉為 list)。
+    """
+    return np.dtype([tuple(tuple(part) if isinstance(part, list) else part for part in field) for field in descr])
+
+
+def list_recordings(path: str) -> List[str]:
+    """
+    Args:
+        path (str): 錄製檔，或包含錄製檔分段的目錄。
+    Returns:
+        List[str]: 錄製檔路徑 (目錄中的分段依檔名，也就是開始時間排序)。
+    """
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(RECORDING_EXTENSION))
+    return [path]
+
+
+class RecordingWriter:
+    """
+    錄製檔寫入器 (非執行緒安全，由單一執行緒寫入)。
+    記錄先累積在記憶體中的區塊，達到 chunk_bytes 或區塊時間超過 chunk_max_sec 時一次寫入檔案，
+    時間索引在寫入時同步建立，close() 時寫到檔案結尾。
+    """
+    def __init__(self, path: str, header: Dict[str, Any], chunk_bytes: int = 1024 * 1024, chunk_max_sec: float = 2.0):
+        """
+        初始化寫入器並寫入檔頭。
+        Args:
+            path (str): 輸出檔案路徑。
+            header (Dict[str, Any]): 檔頭內容 (例如原始/儲存分辨率、class_mapping)，會附加格式版本與偵測結果 dtype。
+            chunk_bytes (int): 區塊大小上限 (位元組)。
+            chunk_max_sec (float): 區塊最長累積時間 (秒)，限制異常終止時遺失的資料量。
+        """
+        self.path = path
+        self.header = dict(header)
+        self.header.update({
+            "version": FORMAT_VERSION,
+            "created_at": time.time(),
+            "detection_dtype": DETECTION_DTYPE.descr,
+        })
+        self.chunk_bytes = max(4096, int(chunk_bytes))
+        self.chunk_max_sec = float(chunk_max_sec)
+
+        self._file = open(path, 'wb')
+        header_json = json.dumps(self.header, ensure_ascii=False).encode('utf-8')
+        self._file.write(FILE_MAGIC + struct.pack("<I", len(header_json)) + header_json + b"\0" * _pad(12 + len(header_json)))
+        self._file_offset = self._file.tell() # 已寫入檔案的位元組數 (不含目前的區塊)
+        self._chunk = bytearray()
+        self._chunk_started = 0.0
+        self._index: List[tuple] = []
+        self.frame_count = 0
+        self.result_count = 0
+
+    @property
+    def size(self) -> int:
+        """
+        目前的檔案大小 (包含尚未寫入的區塊)。
+        """
+        return self._file_offset + len(self._chunk)
+
+    def write_frame(self, timestamp: float, seq: int, jpeg: Union[bytes, memoryview, np.ndarray], records: np.ndarray):
+        """
+        寫入一幀。
+        Args:
+            timestamp (float): 幀的時間戳。
+            seq (int): 幀序號。
+            jpeg (bytes | np.ndarray): JPEG 編碼的幀 (cv2.imencode 的輸出可直接傳入)。
+            records (np.ndarray): 這幀的偵測結果 (DETECTION_DTYPE，座標為原始分辨率)。
+        """
+        jpeg = memoryview(jpeg).cast('B')
+        records = np.ascontiguousarray(records, dtype=DETECTION_DTYPE)
+        parts = [_FRAME_HEADER.pack(len(jpeg), len(records)), jpeg, b"\0" * _pad(len(jpeg)), records.tobytes()]
+        self._append(TAG_FRAME, timestamp, seq, parts)
+        self.frame_count += 1
+
+    def write_result(self, timestamp: float, kind: str, key: str, camera_id: str, data: Dict[str, Any]):
+        """
+        寫入一筆雲端結果 (對應 events.result_store.CloudResult 的欄位)。
+        """
+        payload = json.dumps({"kind": kind, "key": key, "camera_id": camera_id, "data": data},
+                             ensure_ascii=False, default=str).encode('utf-8')
+        self._append(TAG_RESULT, timestamp, -1, [payload])
+        self.result_count += 1
+
+    def _append(self, tag: bytes, timestamp: float, seq: int, parts: List):
+        length = sum(len(part) for part in parts)
+        if not self._chunk:
+            self._chunk_started = time.monotonic()
+        self._index.append((timestamp, self.size, seq, _TAG_TO_KIND[tag], length))
+        self._chunk += _RECORD_HEADER.pack(tag, length, timestamp, seq)
+        for part in parts:
+            self._chunk += part
+        self._chunk += b"\0" * _pad(length)
+        if len(self._chunk) >= self.chunk_bytes or time.monotonic() - self._chunk_started >= self.chunk_max_sec:
+            self.flush()
+
+    def flush(self):
+        """
+        將目前的區塊寫入檔案。
+        """
+        if self._chunk:
+            self._file.write(self._chunk)
+            self._file_offset += len(self._chunk)
+            self._chunk = bytearray()
+        self._file.flush()
+
+    def close(self):
+        """
+        寫入剩餘的區塊、時間索引與檔尾後關閉檔案。
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        index = np.array(self._index, dtype=INDEX_DTYPE)
+        index_offset = self._file_offset
+        self._file.write(index.tobytes())
+        self._file.write(_TRAILER.pack(index_offset, len(index), INDEX_MAGIC))
+        self._file.close()
+
+
+class RecordedFrame:
+    """
+    錄製檔中的一幀 (jpeg 與 records 為檔案的唯讀零拷貝視圖，只在讀取器關閉前有效)。
+    """
+    __slots__ = ("timestamp", "seq", "jpeg", "records")
+
+    def __init__(self, timestamp: float, seq: int, jpeg: memoryview, records: np.ndarray):
+        self.timestamp = timestamp
+        self.seq = seq
+        self.jpeg = jpeg
+        self.records = records
+
+    def decode(self, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        """
+        Args:
+            flags (int): cv2.imdecode 的旗標 (例如 cv2.IMREAD_REDUCED_COLOR_2 以縮小一半解碼)。
+        Returns:
+            Optional[np.ndarray]: BGR 幀，解碼失敗時為 None。
+        """
+        return cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), flags)
+
+
+class RecordedResult:
+    """
+    錄製檔中的一筆雲端結果。
+    """
+    __slots__ = ("timestamp", "kind", "key", "camera_id", "data")
+
+    def __init__(self, timestamp: float, kind: str, key: str, camera_id: str, data: Dict[str, Any]):
+        self.timestamp = timestamp
+        self.kind = kind
+        self.key = key
+        self.camera_id = camera_id
+        self.data = data
+
+
+class RecordingReader:
+    """
+    以 mmap 開啟錄製檔，依時間索引隨機存取或依時間順序逐筆讀取記錄。
+    """
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 錄製檔路徑。
+        Raises:
+            ValueError: 檔案不是錄製檔，或格式版本不支援。
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # 空檔案
+            self._file.close()
+            raise ValueError(f"'{path}' 不是錄製檔 (檔案為空)。")
+        if self._mm[:8] != FILE_MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' 不是錄製檔。")
+        header_len = struct.unpack_from("<I", self._mm, 8)[0]
+        self.header: Dict[str, Any] = json.loads(bytes(self._mm[12:12 + header_len]).decode('utf-8'))
+        if self.header.get("version") != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"不支援的錄製檔版本: {self.header.get('version')}")
+        self._data_start = 12 + header_len + _pad(12 + header_len)
+        self.detection_dtype = _dtype_from_descr(self.header["detection_dtype"])
+
+        self.complete = True # 是否有完整的檔尾 (False 表示錄製中斷，索引由掃描重建)
+        index = self._load_index()
+        # 雲端結果與幀由不同執行緒產生，寫入順序不一定依時間排序
+        self.index = index[np.argsort(index['timestamp'], kind='stable')]
+
+    def _load_index(self) -> np.ndarray:
+        size = len(self._mm)
+        if size >= self._data_start + _TRAILER.size:
+            index_offset, count, magic = _TRAILER.unpack_from(self._mm, size - _TRAILER.size)
+            if magic == INDEX_MAGIC and index_offset + count * INDEX_DTYPE.itemsize == size - _TRAILER.size:
+                return np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=count, offset=index_offset).copy()
+        self.complete = False
+        return self._scan_index(size)
+
+    def _scan_index(self, size: int) -> np.ndarray:
+        """
+        依序掃描記錄重建索引 (錄製中斷時檔尾不存在，最後一筆可能只寫了一半)。
+        """
+        entries = []
+        offset = self._data_start
+        while offset + _RECORD_HEADER.size <= size:
+            tag, length, timestamp, seq = _RECORD_HEADER.unpack_from(self._mm, offset)
+            end = offset + _RECORD_HEADER.size + length + _pad(length)
+            if tag not in _TAG_TO_KIND or end > size:
+                break
+            entries.append((timestamp, offset, seq, _TAG_TO_KIND[tag], length))
+            offset = end
+        logger.warning(f"錄製檔 '{self.path}' 沒有完整的索引 (錄製中斷)，已掃描重建 {len(entries)} 筆記錄。")
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def frame_count(self) -> int:
+        return int(np.count_nonzero(self.index['kind'] == KIND_FRAME))
+
+    @property
+    def result_count(self) -> int:
+        return int(np.count_nonzero(self.index['kind'] == KIND_RESULT))
+
+    @property
+    def start_time(self) -> Optional[float]:
+        return float(self.index['timestamp'][0]) if len(self.index) else None
+
+    @property
+    def end_time(self) -> Optional[float]:
+        return float(self.index['timestamp'][-1]) if len(self.index) else None
+
+    def find(self, timestamp: float) -> int:
+        """
+        Returns:
+            int: 第一筆時間戳 >= timestamp 的記錄在索引中的位置。
+        """
+        return int(np.searchsorted(self.index['timestamp'], timestamp, side='left'))
+
+    def record_at(self, position: int) -> Union[RecordedFrame, RecordedResult]:
+        """
+        讀取索引中第 position 筆記錄。
+        """
+        entry = self.index[position]
+        start = int(entry['offset']) + _RECORD_HEADER.size
+        timestamp = float(entry['timestamp'])
+        if entry['kind'] == KIND_FRAME:
+            jpeg_len, det_count = _FRAME_HEADER.unpack_from(self._mm, start)
+            jpeg_start = start + _FRAME_HEADER.size
+            records_start = jpeg_start + jpeg_len + _pad(jpeg_len)
+            jpeg = memoryview(self._mm)[jpeg_start:jpeg_start + jpeg_len]
+            records = np.frombuffer(self._mm, dtype=self.detection_dtype, count=det_count, offset=records_start)
+            return RecordedFrame(timestamp, int(entry['seq']), jpeg, records)
+        payload = json.loads(bytes(self._mm[start:start + int(entry['length'])]).decode('utf-8'))
+        return RecordedResult(timestamp, payload["kind"], payload.get("key"), payload.get("camera_id"),
+                              payload.get("data") or {})
+
+    def iter_records(self, start: Optional[float] = None, end: Optional[float] = None,
+                     kind: Optional[int] = None) -> Iterator[Union[RecordedFrame, RecordedResult]]:
+        """
+        依時間順序讀取記錄。
+        Args:
+            start (float, optional): 開始時間 (包含)。
+            end (float, optional): 結束時間 (不包含)。
+            kind (int, optional): 只讀取 KIND_FRAME 或 KIND_RESULT。
+        """
+        first = self.find(start) if start is not None else 0
+        last = self.find(end) if end is not None else len(self.index)
+        kinds = self.index['kind']
+        for position in range(first, last):
+            if kind is None or kinds[position] == kind:
+                yield self.record_at(position)
+
+    def close(self):
+        if not self._mm.closed:
+            try:
+                self._mm.close()
+            except BufferError:
+                # 仍有記錄視圖被引用時無法關閉，交由垃圾回收釋放
+                pass
+        self._file.close()
+
+    def __enter__(self) -> "RecordingReader":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,15 +1,17 @@
 # detectors/base_detector.py
 
+import time
 import logging
-from typing import List, Any
+from typing import List, Any, Iterable, Optional, Set
 import numpy as np
-import jetson.inference
 
 # 引入需要的模組
 from inference.inferencer import ObjectDetector # 假設主要使用 ObjectDetector
+from inference.detection_table import DetectionTable
+from detectors.zones import ZoneMap, ZONE_TYPE_RESTRICTED, anchor_points
 from events.event_manager import EventManager
 from events.event_publisher import EventPublisher
-from data_capture.capture_manager import CaptureManager
+from data_capture.capture_manager import CaptureManager, FrameData
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +19,9 @@ class BaseDetector:
     """
     所有邊緣偵測器的基類。
     """
+    default_zone_type = ZONE_TYPE_RESTRICTED # 區域設定未指定 type 時使用的類型
+    default_zone_anchor = "center" # 判斷物件是否在區域內時使用的邊框錨點
+
     def __init__(self, settings: dict,
                  object_detector: ObjectDetector,
                  event_manager: EventManager,
@@ -38,16 +43,31 @@ class BaseDetector:
         self.capture_manager = capture_manager
 
         self.is_enabled = self.settings.get('enabled', False)
+        self.clock = time.time # 事件時間的時鐘函數 (重播錄製檔時替換為錄製時間)
+
+        # 具名多邊形區域 (settings.zones)，啟動後可透過 update_zones 重新載入
+        self.zone_map = ZoneMap(self.settings.get('zones', []), default_type=self.default_zone_type)
+        self.zone_anchor = self.settings.get('zone_anchor', self.default_zone_anchor)
+        self.zone_cooldown_seconds = self.settings.get('zone_cooldown_seconds', 30)
+        self.s3_zone_events_folder = self.capture_manager.s3_settings.get('s3_zone_events_folder', 'zone_events')
+        self.s3_events_folder = self.capture_manager.s3_settings.get('s3_events_folder', 'events')
+        # 事件短片 (需同時啟用 capture.clip)：觸發事件時附加一段預錄 + 後錄的短片
+        self.capture_clip = self.settings.get('capture_clip', False)
+        self.s3_event_clips_folder = self.capture_manager.s3_settings.get('s3_event_clips_folder', 'event_clips')
         if not self.is_enabled:
             logger.info(f"偵測器 '{self.__class__.__name__}' 已禁用。")
 
-    def process(self, frame_cuda: jetson.utils.cudaImage, detections_raw: List):
+    def process(self, frame_cuda: Any, detections_raw: List, tracks: Optional[List] = None,
+                detection_table: Optional[DetectionTable] = None, frame_data: Optional[FrameData] = None):
         """
         處理單個影像幀和原始偵測結果。
         這是核心邏輯，應由子類實現。
         Args:
-            frame_cuda (jetson.utils.cudaImage): 當前幀的 CUDA 影像數據。
+            frame_cuda (Any): 當前幀的模型輸入 (Jetson 後端為 CUDA 影像)。
             detections_raw (List): 物件偵測模型輸出的原始偵測結果列表。
+            tracks (List[Track], optional): 多目標追蹤器的追蹤快照；未啟用追蹤器時為 None。
+            detection_table (DetectionTable, optional): 管線每幀建立一次的結構化偵測結果表。
+            frame_data (FrameData, optional): 偵測結果所屬的幀 (捕獲與裁剪影像使用)；為 None 時觸發的事件不捕獲影像。
         """
         if not self.is_enabled:
             return
@@ -58,18 +78,113 @@ class BaseDetector:
         # 範例：簡單地印出正在處理
         # logger.debug(f"偵測器 '{self.__class__.__name__}' 正在處理幀...")
 
-    def _trigger_event(self, event_type: str, metadata: dict = None, cooldown_override: float = None):
+    def _get_detection_table(self, detections_raw: List, detection_table: Optional[DetectionTable]) -> DetectionTable:
+        """
+        返回管線提供的偵測結果表；單獨調用偵測器 (未經管線) 時從 detections_raw 建立。
+        """
+        if detection_table is not None:
+            return detection_table
+        return DetectionTable.from_detections(detections_raw, self.object_detector.class_index)
+
+    def update_zones(self, zones_config: List[dict]):
+        """
+        替換此偵測器的區域設定 (處理雲端命令)。
+        Args:
+            zones_config (List[dict]): 區域設定列表，每個項目包含 name, polygon (或 rect)，可選 type 與 normalized。
+        """
+        if not isinstance(zones_config, list):
+            logger.warning(f"收到的區域設定格式無效，未更新: {zones_config}")
+            return
+        self.zone_map.update(zones_config)
+        logger.info(f"偵測器 '{self.__class__.__name__}' 已更新 {len(self.zone_map)} 個區域。")
+
+    def _check_zones(self, table: DetectionTable, class_names: List[str], event_type: str,
+                     frame_data: Optional[FrameData]):
+        """
+        對指定類別的所有邊框一次完成區域判斷，並對違規的物件觸發事件 (每個區域/追蹤有各自的冷卻時間)。
+        Args:
+            table (DetectionTable): 這幀的偵測結果表。
+            class_names (List[str]): 要判斷的內部類別名稱。
+            event_type (str): 違規時觸發的事件類型。
+            frame_data (FrameData, optional): 偵測結果所屬的幀。
+        """
+        if len(self.zone_map) == 0 or len(table) == 0:
+            return
+        frame_shape = self.capture_manager.frame_shape
+        if frame_shape is None:
+            return
+        frame_height, frame_width = frame_shape[:2]
+
+        rows = np.flatnonzero(table.class_mask(class_names))
+        if len(rows) == 0:
+            return
+        points = anchor_points(table.bboxes[rows], self.zone_anchor)
+        violations = self.zone_map.violations(points, frame_width, frame_height)
+        if not violations:
+            return
+
+        if frame_data is None:
+            logger.error("沒有偵測結果所屬的幀，無法捕獲影像用於區域事件。")
+            return
+        for point_idx, zone_name in violations:
+            row = int(rows[point_idx])
+            track_id = int(table.track_ids[row])
+            cooldown_key = f"{event_type}_{zone_name}" + (f"_{track_id}" if track_id >= 0 else "")
+            if not self.event_manager.try_acquire(cooldown_key, cooldown_override=self.zone_cooldown_seconds,
+                                                  event_type=event_type):
+                continue
+
+            logger.info(f"事件 '{event_type}' 觸發 (區域 '{zone_name}')。")
+            metadata = {
+                "zone_name": zone_name,
+                "object_class": table.class_name_of(row),
+                "object_bbox": table.bbox_of(row),
+                "object_confidence": float(table.confidences[row]),
+                "track_id": track_id if track_id >= 0 else None,
+                "frame_timestamp": frame_data.timestamp,
+            }
+            s3_image_path = self.capture_manager.capture_and_upload_image(
+                event_type, frame_data, self.s3_zone_events_folder, metadata
+            )
+            self._attach_clip(event_type, metadata, frame_data.timestamp)
+            self.event_publisher.publish_event(event_type, s3_image_path=s3_image_path, metadata=metadata)
+
+    def _attach_clip(self, event_type: str, metadata: dict, timestamp: Optional[float] = None):
+        """
+        偵測器啟用 capture_clip 時請求一段事件短片，並將短片的 S3 URL 加入元數據 (s3_clip_path)。
+        """
+        if not self.capture_clip or not self.capture_manager.clips_enabled:
+            return
+        s3_clip_path = self.capture_manager.capture_clip(event_type, self.s3_event_clips_folder, timestamp)
+        if s3_clip_path:
+            metadata["s3_clip_path"] = s3_clip_path
+
+    def _class_ids_for(self, class_names: Iterable[str]) -> Set[int]:
+        """
+        將內部類別名稱轉換為模型原始類別 ID 集合 (依 class_mapping)。
+        """
+        class_names = set(class_names)
+        return {class_id for class_id, name in self.object_detector.class_mapping.items() if name in class_names}
+
+    def _trigger_event(self, event_type: str, metadata: dict = None, cooldown_override: float = None,
+                       frame_data: Optional[FrameData] = None, s3_folder_prefix: Optional[str] = None):
         """
-        內部方法，用於觸發一個事件。會先經過 EventManager 檢查冷卻時間。
+        內部方法，用於觸發一個事件。會先經過 EventManager 原子地檢查並記錄冷卻時間與限流。
         Args:
             event_type (str): 要觸發的事件類型 (string 或 EventType value)。
             metadata (dict, optional): 事件相關的元數據。Defaults to None.
             cooldown_override (float, optional): 此觸發的冷卻時間覆蓋值。Defaults to None.
+            frame_data (FrameData, optional): 偵測結果所屬的幀 (process() 收到的 frame_data)。Defaults to None.
+            s3_folder_prefix (str, optional): 影像上傳的 S3 檔案夾。Defaults to aws.s3.s3_events_folder.
         """
-        if self.event_manager.should_trigger_event(event_type, cooldown_override):
+        if self.event_manager.try_acquire(event_type, cooldown_override):
             logger.info(f"事件 '{event_type}' 觸發。")
             # 捕獲相關影像並添加到 S3 上傳佇列
-            s3_path = self.capture_manager.capture_and_upload_image(event_type, metadata)
+            s3_path = None
+            if frame_data is not None:
+                s3_path = self.capture_manager.capture_and_upload_image(
+                    event_type, frame_data, s3_folder_prefix or self.s3_events_folder, metadata
+                )
 
             # 如果影像成功添加到上傳佇列 (即使尚未完成上傳)，發布事件訊息
             # 注意：這裡只檢查 s3_path 是否為 None，表示捕獲管理器是否成功創建了上傳任務
@@ -77,15 +192,15 @@ class BaseDetector:
             if s3_path is not None:
                 # 修正：將關鍵字參數名稱從 s3_path 改為 s3_image_path
                 self.event_publisher.publish_event(event_type, s3_image_path=s3_path, metadata=metadata)
-                self.event_manager.record_event_triggered(event_type) # 記錄觸發時間
             else:
                  # 如果 capture_and_upload_image 返回 None (表示捕獲或添加到佇列失敗)
                  # 這裡可以選擇是否仍然發布一個不包含影像路徑的事件，或者完全不發布
                  # 目前的邏輯是如果不包含路徑就不發布，可以根據需求調整
                  logger.warning(f"未能捕獲或添加到佇列影像用於事件 '{event_type}'，跳過發布事件訊息。")
+                 self.event_manager.release(event_type) # 撤銷冷卻，下一幀可以重試
                  # 如果需要即使沒有影像也發布事件，取消註釋下面一行
                  # self.event_publisher.publish_event(event_type, metadata=metadata)
-                 # self.event_manager.record_event_triggered(event_type) # 記錄觸發時間 (如果決定發布事件)
+                 # self.event_manager.try_acquire(event_type) # 記錄觸發時間 (如果決定發布事件)
 
 # 可擴展其他基類方法，例如根據 ROI 判斷目標是否在區域內
 # def is_in_roi(self, detection: jetson.inference.Detection, roi: list) -> bool:
@@ -1,25 +1,27 @@
 # detectors/cargo_detector.py
 
+import uuid
 import logging
-import time
 from typing import List, Dict, Optional, Any
-import jetson.inference
-import jetson.utils
-import threading
+
+import numpy as np
 
 from events.event_types import EventType
 from events.event_manager import EventManager
 from events.event_publisher import EventPublisher
+from events.result_store import ResultStore
 from data_capture.capture_manager import CaptureManager, FrameData
 
 from .base_detector import BaseDetector
 
 from inference.inferencer import ObjectDetector
+from .tracker import select_new_tracks
+from inference.detection_table import DetectionTable
 
 from utils import qr_scanner
+from utils.qr_service import QRService, NOT_ATTEMPTED
 from utils import image_utils
-import cv2
-import uuid
+
 logger = logging.getLogger(__name__)
 
 class CargoDetector(BaseDetector):
@@ -27,14 +29,14 @@ class CargoDetector(BaseDetector):
     專注於偵測貨物和與貨物相關的事件，根據人員識別結果調整行為，並提取貨物信息。
     可以讀取最新的貨物處理結果（例如，分配的位置）用於顯示或進一步判斷。
     """
+    default_zone_type = "allowed" # 貨物區域預設為允許區域 (貨物不在任何允許區域內即觸發 CARGO_OUT_OF_BOUNDS)
     def __init__(self, settings: dict,
                 object_detector: ObjectDetector,
                 event_manager: EventManager,
                 event_publisher: EventPublisher,
                 capture_manager: CaptureManager,
-                recognition_result_state: Dict[str, Any], # <-- 人臉識別結果狀態
-                cargo_result_state: Dict[str, Any], # <-- 新增：貨物處理結果狀態
-                recognition_result_lock: threading.Lock): # <-- 保護共享狀態的鎖
+                result_store: ResultStore, # <-- 雲端人臉識別與貨物處理結果
+                qr_service: Optional[QRService] = None): # <-- 非同步 QR 解碼服務
         """
         初始化貨物偵測器。
         Args:
@@ -43,9 +45,8 @@ class CargoDetector(BaseDetector):
             event_manager (EventManager): 事件管理器實例。
             event_publisher (EventPublisher): 事件發布器實例。
             capture_manager (CaptureManager): 捕獲管理器實例。
-            recognition_result_state (Dict[str, Any]): 共享的最新雲端**人臉識別**結果字典。
-            cargo_result_state (Dict[str, Any]): 共享的最新雲端**貨物處理**結果字典。
-            recognition_result_lock (threading.Lock): 保護共享狀態的鎖。
+            result_store (ResultStore): 雲端**人臉識別**與**貨物處理**結果儲存 (以無鎖快照讀取)。
+            qr_service (QRService, optional): 非同步 QR 解碼服務；未提供時在偵測器執行緒中同步掃描。
         """
         # 父類只需要部分依賴，這裡傳遞所有需要的
         super().__init__(settings, object_detector, event_manager, event_publisher, capture_manager)
@@ -62,9 +63,7 @@ class CargoDetector(BaseDetector):
         self.s3_cargo_checkin_folder = self.capture_manager.s3_settings.get('s3_cargo_checkin_folder')
         self.cooldown_seconds = self.settings.get('cooldown_seconds', 30)
 
-        self.recognition_result_state = recognition_result_state # 人臉識別結果狀態
-        self.cargo_result_state = cargo_result_state # 貨物處理結果狀態
-        self.recognition_result_lock = recognition_result_lock
+        self.result_store = result_store # 雲端結果儲存
 
         self.allowed_person_ids = self.settings.get('allowed_person_ids', [])
         self.recognition_result_validity_sec = self.settings.get('recognition_result_validity_sec', 10)
@@ -77,63 +76,79 @@ class CargoDetector(BaseDetector):
 
         self.enable_ocr_fallback = self.settings.get('enable_ocr_fallback', True)
         if self.enable_ocr_fallback and qr_scanner.pyzbar is None:
-            logger.warning("已啟用 OCR 備案，但 pyzbar 未安裝。QR Code 掃描功能將不可用，OCR 備案標記可能被設置。")
+            logger.warning("已啟用 OCR 備案，但 pyzbar 未安裝。QR Code 掃描將改用 OpenCV 解碼器，解碼率較低，OCR 備案標記可能較常被設置。")
         elif not self.enable_ocr_fallback:
             logger.info("已禁用 OCR 備案。")
+        self.qr_service = qr_service
+        self.qr_bbox_expansion = float(self.settings.get('qr_bbox_expansion', 0.1)) # QR 掃描時貨物邊框向外擴展的比例
 
 
         self.cargo_processing_event_type = EventType.CARGO_INFO_FOR_PROCESSING.value
 
+        # false：簡化流程，只要識別到允許的人員就發布貨物處理事件 (不檢查貨物偵測)
+        # true：需要在 ROI 內偵測到貨物，並進行 QR 掃描與影像上傳
+        self.require_cargo_detection = self.settings.get('require_cargo_detection', False)
+
+        # 啟用追蹤器時，每個新的貨物追蹤只觸發一次 (僅在 require_cargo_detection 為 true 時有效)
+        self.trigger_once_per_track = self.settings.get('trigger_once_per_track', True)
+        self.cargo_class_ids = self._class_ids_for(self.cargo_class_names or [])
+        self._reported_track_ids = set()
+
         logger.info("CargoDetector 初始化成功。")
 
     # 添加一個方法用於從 main 函數更新 ROI 設定 (處理雲端命令)
-    def update_roi(self, new_roi: List[int]):
+    def update_roi(self, new_roi: Any):
         """
         更新 CargoDetector 的 ROI 設定。
         Args:
-            new_roi (List[int]): 新的 ROI 座標 [x1, y1, x2, y2]。
+            new_roi (Any): 新的 ROI 座標 [x1, y1, x2, y2]，或多邊形區域設定列表 (見 BaseDetector.update_zones)。
         """
-        if isinstance(new_roi, list) and len(new_roi) == 4:
+        if isinstance(new_roi, list) and new_roi and all(isinstance(zone, dict) for zone in new_roi):
+            self.update_zones(new_roi)
+        elif isinstance(new_roi, list) and len(new_roi) == 4:
             self.cargo_roi = new_roi
             logger.info(f"CargoDetector 已更新 ROI 設定為: {self.cargo_roi}")
         else:
             logger.warning(f"收到的新 ROI 格式無效，未更新: {new_roi}")
 
 
-    def process(self, frame_cuda: jetson.utils.cudaImage, detections_raw: List[Any]):
+    def process(self, frame_cuda: Any, detections_raw: List[Any], tracks: Optional[List] = None,
+                detection_table: Optional[DetectionTable] = None, frame_data: Optional[FrameData] = None):
         """
         處理貨物偵測邏輯。
         Args:
-            frame_cuda (jetson.utils.cudaImage): 當前幀的 CUDA 影像數據。
+            frame_cuda (Any): 當前幀的模型輸入 (Jetson 後端為 CUDA 影像)。
             detections_raw (List[Any]): 物件偵測模型輸出的原始偵測結果列表 (預期類型為 List)。
+            tracks (List[Track], optional): 多目標追蹤器的追蹤快照；提供時每個新的貨物追蹤只觸發一次。
+            detection_table (DetectionTable, optional): 管線每幀建立一次的結構化偵測結果表。
+            frame_data (FrameData, optional): 偵測結果所屬的幀 (上傳入庫影像與 QR 裁剪使用)。
         """
         # ... (process 方法開頭的檢查和獲取人臉識別結果邏輯，保持不變) ...
-        if not self.is_enabled or not self.cargo_class_names or not self.s3_cargo_checkin_folder:
+        if not self.is_enabled or not self.cargo_class_names:
             # ... 日誌 ...
             return
 
-        # 獲取最新的人臉識別結果
-        latest_person_id = "no_person"
-        latest_result_timestamp = 0
-        latest_original_event_timestamp = 0
-        latest_match_confidence = None
-        latest_person_is_allowed = False
-
-        with self.recognition_result_lock: # 使用鎖保護
-            latest_person_id = self.recognition_result_state.get("person_id", "no_person")
-            latest_result_timestamp = self.recognition_result_state.get("timestamp", 0)
-            latest_original_event_timestamp = self.recognition_result_state.get("original_event_timestamp", 0)
-            latest_match_confidence = self.recognition_result_state.get("match_confidence")
-            if_violation = self.recognition_result_state.get("if_violation")
-            violation_description = self.recognition_result_state.get("violation_description")
-
-        current_time = time.time()
-
-        is_recognition_result_valid = (current_time - latest_result_timestamp) < self.recognition_result_validity_sec
-        if latest_person_id != "no_person" and latest_person_id != "unknown" and not latest_person_id.startswith("error_"):
-             if self.allowed_person_ids and latest_person_id in self.allowed_person_ids:
-                 if is_recognition_result_valid:
-                      latest_person_is_allowed = True
+        table = self._get_detection_table(detections_raw, detection_table)
+
+        # 貨物超出允許區域 (與人員識別結果無關，所有貨物邊框一次完成區域判斷)
+        self._check_zones(table, self.cargo_class_names, EventType.CARGO_OUT_OF_BOUNDS.value, frame_data)
+
+        if not self.s3_cargo_checkin_folder:
+            return
+
+        # 獲取此刻最近的有效人臉識別結果 (無鎖快照，不會被之後的 unknown/no_person 結果覆蓋)
+        current_time = self.clock()
+        identity = self.result_store.identity_at(current_time, self.recognition_result_validity_sec)
+
+        latest_person_id = identity.key if identity else "no_person"
+        latest_result_timestamp = identity.timestamp if identity else 0
+        latest_match_confidence = identity.get("match_confidence") if identity else None
+        if_violation = identity.get("if_violation") if identity else None
+        violation_description = identity.get("violation_description") if identity else None
+
+        is_recognition_result_valid = identity is not None
+        latest_person_is_allowed = bool(is_recognition_result_valid and self.allowed_person_ids and
+                                        latest_person_id in self.allowed_person_ids)
 
         logger.debug(f"CargoDetector Status: Time={current_time:.2f}, Latest Person='{latest_person_id}', RecvTime={latest_result_timestamp:.2f}, Valid={is_recognition_result_valid}, Allowed={latest_person_is_allowed}")
 
@@ -143,166 +158,100 @@ class CargoDetector(BaseDetector):
         if not latest_person_is_allowed:
             return
         
-        # cargo = cup
-        cooldown_key = f"{self.cargo_processing_event_type}_{latest_person_id}" # 冷卻鍵包含人物 ID
-
-        # 檢查貨物事件冷卻時間
-        if self.event_manager.should_trigger_event(cooldown_key, cooldown_override=self.cooldown_seconds):
-            metadata = {
-                "user_id": latest_person_id,
-                "timestamp": latest_result_timestamp,
-                "id": str(uuid.uuid4()),
-                "cargo": "cup",
-                "if_violation": if_violation,
-                "violation_description": violation_description
-            }
-            self.event_publisher.publish_event(self.cargo_processing_event_type, metadata=metadata)
-            # 記錄事件觸發時間 (用於冷卻)
-            self.event_manager.record_event_triggered(cooldown_key)
-        return
+        if not self.require_cargo_detection:
+            # cargo = cup
+            cooldown_key = f"{self.cargo_processing_event_type}_{latest_person_id}" # 冷卻鍵包含人物 ID
+
+            # 原子地檢查並記錄貨物事件冷卻時間與限流
+            if self.event_manager.try_acquire(cooldown_key, cooldown_override=self.cooldown_seconds,
+                                              event_type=self.cargo_processing_event_type):
+                metadata = {
+                    "user_id": latest_person_id,
+                    "timestamp": latest_result_timestamp,
+                    "id": str(uuid.uuid4()),
+                    "cargo": "cup",
+                    "if_violation": if_violation,
+                    "violation_description": violation_description
+                }
+                self.event_publisher.publish_event(self.cargo_processing_event_type, metadata=metadata)
+            return
         # --------------------------------------------------------------------
         # 如果識別到允許的人物，則進行貨物偵測和處理
         # --------------------------------------------------------------------
 
-        # 篩選出貨物偵測結果，並只考慮在 ROI 內的貨物
-        cargo_detections = []
-        cargo_detections_raw = [
-            det for det in detections_raw
-            if det and self.object_detector.class_mapping.get(det.ClassID) in self.cargo_class_names
-        ]
-        logger.debug(f"CargoDetector - Raw cargo detections ({len(self.cargo_class_names) if self.cargo_class_names else 0} classes): {len(cargo_detections_raw)}")
-
-
-        if self.cargo_roi:
-            frame_buffer = self.capture_manager.get_frame_buffer()
-            current_frame_data = frame_buffer[-1] if frame_buffer else None
+        # 篩選出貨物偵測結果，並只考慮在 ROI 內的貨物 (類別與 ROI 判斷皆以布林遮罩完成)
+        cargo_mask = table.class_mask(self.cargo_class_names)
+        per_track = tracks is not None and self.trigger_once_per_track
+        if per_track:
+            # 只處理新出現 (尚未觸發過) 的貨物追蹤
+            new_tracks = select_new_tracks(tracks, self.cargo_class_ids, self._reported_track_ids)
+            cargo_mask &= np.isin(table.track_ids, [track.track_id for track in new_tracks])
+        logger.debug(f"CargoDetector - Raw cargo detections ({len(self.cargo_class_names) if self.cargo_class_names else 0} classes): {int(cargo_mask.sum())}")
 
-            if current_frame_data:
-                for det in cargo_detections_raw:
-                    center_x = (det.Left + det.Right) / 2
-                    center_y = (det.Top + det.Bottom) / 2
-                    if self.cargo_roi[0] <= center_x <= self.cargo_roi[2] and \
-                        self.cargo_roi[1] <= center_y <= self.cargo_roi[3]:
-                        cargo_detections.append(det)
-            else:
-                logger.warning("捕獲管理器緩衝區為空，無法檢查貨物 ROI。所有原始偵測到的貨物將被忽略 (如果配置了 ROI)。")
-                cargo_detections = []
-
-
-        else: # 沒有設定 ROI，處理所有偵測到的貨物
-            cargo_detections = cargo_detections_raw
+        # 沒有設定 ROI 時，處理所有偵測到的貨物
+        cargo_mask &= table.center_in_rect_mask(self.cargo_roi)
+        cargo_detections = table.select(cargo_mask)
 
         logger.debug(f"CargoDetector - Filtered cargo detections (in ROI): {len(cargo_detections)}")
 
 
         # 如果在 ROI 內偵測到貨物，則觸發貨物信息處理事件
         if len(cargo_detections) > 0:
-            first_cargo_detection = cargo_detections[0]
+            first_cargo_bbox = cargo_detections.bbox_of(0)
+            cargo_track_id = int(cargo_detections.track_ids[0]) if per_track else None
 
             event_type = self.cargo_processing_event_type
             cooldown_key = f"{event_type}_{latest_person_id}" # 冷卻鍵包含人物 ID
+            if cargo_track_id is not None:
+                cooldown_key += f"_{cargo_track_id}" # 追蹤模式：每個貨物追蹤各自觸發一次
 
-            # 檢查貨物事件冷卻時間
-            if self.event_manager.should_trigger_event(cooldown_key, cooldown_override=self.cooldown_seconds):
+            # 原子地檢查並記錄貨物事件冷卻時間與限流 (捕獲失敗時撤銷)
+            if self.event_manager.try_acquire(cooldown_key, cooldown_override=self.cooldown_seconds, event_type=event_type):
                 logger.info(f"事件 '{event_type}' 觸發 (與人物 {latest_person_id} 相關)。")
 
-                # 獲取當前幀數據用於捕獲和 QR 掃描
-                frame_buffer = self.capture_manager.get_frame_buffer()
-                current_frame_data = frame_buffer[-1] if frame_buffer else None
-
-                qr_data: Optional[str] = None
-                needs_ocr_fallback = False
+                # 偵測結果所屬的幀用於捕獲和 QR 掃描 (邊框座標與影像屬於同一幀)
+                current_frame_data = frame_data
 
                 if current_frame_data:
-                    # ... 掃描 QR Code 邏輯 ...
-                    cargo_bbox_np = [int(first_cargo_detection.Left), int(first_cargo_detection.Top), int(first_cargo_detection.Right), int(first_cargo_detection.Bottom)]
-                    h, w = current_frame_data.frame_np.shape[:2]
-                    x1, y1, x2, y2 = cargo_bbox_np
-                    # 添加邊界擴展，確保QR碼完全在裁剪區域內
-                    expansion_factor = 0.1  # 擴展原始邊界框10%
-                    box_width = x2 - x1
-                    box_height = y2 - y1
-
-                    # 計算擴展值
-                    x_expansion = int(box_width * expansion_factor)
-                    y_expansion = int(box_height * expansion_factor)
-
-                    # 擴展邊界，同時確保不超出圖像範圍
-                    x1 = max(0, x1 - x_expansion)
-                    y1 = max(0, y1 - y_expansion)
-                    x2 = min(w, x2 + x_expansion)
-                    y2 = min(h, y2 + y_expansion)
-                    cargo_image_np = current_frame_data.frame_np[y1:y2, x1:x2]
-
-                    # 添加驗證程式碼
-                    if (x2 - x1) < 20 or (y2 - y1) < 20:
-                        logger.warning(f"裁剪區域太小: {x2-x1}x{y2-y1}，可能影響QR碼識別")
-
-                    # 可視化裁剪區域（用於調試）
-                    # debug_frame = current_frame_data.frame_np.copy()
-                    # cv2.rectangle(debug_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    # cv2.imwrite("/tmp/debug_crop_area.jpg", debug_frame)
-
-                    qr_data = qr_scanner.scan_qr_code(cargo_image_np)
-
-                    # ... 判斷是否需要 OCR 備案 ...
-                    if qr_data is None and self.enable_ocr_fallback:
-                        logger.warning("QR Code 掃描失敗，已啟用 OCR 備案，將標記需要雲端 OCR。")
-                        needs_ocr_fallback = True
-                    elif qr_data is None and not self.enable_ocr_fallback:
-                        pass
-                    elif qr_data is not None:
-                        logger.info("QR Code 掃描成功。")
-
-                else:
-                    logger.error("捕獲管理器緩衝區為空，無法獲取當前幀進行 QR 掃描。")
-                    qr_data = None
-                    needs_ocr_fallback = False
-
-                # --------------------------------------------------------------------
-                # 步驟：構建貨物事件元數據
-                # --------------------------------------------------------------------
-                metadata: Dict[str, Any] = {
-                    "cargo_count_in_frame": len(cargo_detections),
-                    "cargo_detection_bbox_edge": [int(first_cargo_detection.Left), int(first_cargo_detection.Top), int(first_cargo_detection.Right), int(first_cargo_detection.Bottom)],
-                    "cargo_detection_confidence_edge": float(first_cargo_detection.Confidence),
-                    "frame_timestamp_edge": time.time(),
-
-                    "related_person_id": latest_person_id,
-                    "person_recognition_time": latest_result_timestamp,
-                    "person_match_confidence": latest_match_confidence,
-
-                    "qr_code_data": qr_data,
-                    "needs_ocr_fallback": needs_ocr_fallback,
-
-                    "cargo_roi": self.cargo_roi if self.cargo_roi else None,
-                    "edge_thing_name": self.event_publisher.thing_name
-                }
-
-
-                # --------------------------------------------------------------------
-                # 步驟：捕獲影像並發布事件
-                # --------------------------------------------------------------------
-                if current_frame_data: # 確保有當前幀數據
-                    # # 在捕獲的影像上繪製貨物框、QR 框、OCR 狀態等
-                    # frame_to_capture_np = current_frame_data.frame_np.copy()
-                    # cargo_bbox_np_for_drawing = [int(first_cargo_detection.Left), int(first_cargo_detection.Top), int(first_cargo_detection.Right), int(first_cargo_detection.Bottom)]
-                    # color = (0, 255, 255)
-                    # thickness = 2
-                    # cv2.rectangle(frame_to_capture_np, (cargo_bbox_np_for_drawing[0], cargo_bbox_np_for_drawing[1]), (cargo_bbox_np_for_drawing[2], cargo_bbox_np_for_drawing[3]), color, thickness)
-                    # info_text = f"QR: {qr_data if qr_data else 'None'}"
-                    # if needs_ocr_fallback:
-                    #     info_text += " OCR Needed"
-                    # text_pos_y = cargo_bbox_np_for_drawing[1] - 10
-                    # if text_pos_y < 15: text_pos_y = cargo_bbox_np_for_drawing[3] + 15
-                    # cv2.putText(frame_to_capture_np, info_text, (cargo_bbox_np_for_drawing[0], text_pos_y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, thickness)
-
-
+                    # ... 計算所有貨物的 QR 掃描區域 (一幀中的所有貨物邊框一次批次掃描) ...
+                    # QR 裁剪使用最高分辨率的幀 (雙分辨率模式下為原始分辨率環形緩衝區中的同一幀)
+                    qr_image, qr_scale = self.capture_manager.get_full_resolution_frame(current_frame_data)
+                    h, w = qr_image.shape[:2]
+                    cargo_bboxes = [cargo_detections.bbox_of(row) for row in range(len(cargo_detections))]
+                    cargo_track_ids = [int(track_id) for track_id in cargo_detections.track_ids] if per_track else [None] * len(cargo_bboxes)
+
+                    # --------------------------------------------------------------------
+                    # 步驟：構建貨物事件元數據 (QR/OCR 欄位在掃描完成後填入)
+                    # --------------------------------------------------------------------
+                    metadata: Dict[str, Any] = {
+                        "cargo_count_in_frame": len(cargo_detections),
+                        "cargo_detection_bbox_edge": first_cargo_bbox,
+                        "cargo_detection_confidence_edge": float(cargo_detections.confidences[0]),
+                        "frame_timestamp_edge": self.clock(),
+
+                        "related_person_id": latest_person_id,
+                        "person_recognition_time": latest_result_timestamp,
+                        "person_match_confidence": latest_match_confidence,
+
+                        "qr_code_data": None,
+                        "qr_codes": [],
+                        "needs_ocr_fallback": False,
+
+                        "cargo_roi": self.cargo_roi if self.cargo_roi else None,
+                        "track_id": cargo_track_id,
+                        "edge_thing_name": self.event_publisher.thing_name
+                    }
+
+                    # --------------------------------------------------------------------
+                    # 步驟：捕獲影像 (編碼與上傳在背景執行，立即返回 S3 URL)
+                    # --------------------------------------------------------------------
                     frame_data_with_drawing = FrameData(
                         frame_np=current_frame_data.frame_np,
                         frame_cuda=current_frame_data.frame_cuda,
                         timestamp=current_frame_data.timestamp,
-                        detections_raw=current_frame_data.detections_raw
+                        detections_raw=current_frame_data.detections_raw,
+                        seq=current_frame_data.seq,
+                        scale=current_frame_data.scale
                     )
 
                     # 捕獲並上傳貨物入庫影像
@@ -310,17 +259,32 @@ class CargoDetector(BaseDetector):
                         self.cargo_processing_event_type,
                         frame_data_with_drawing,
                         self.s3_cargo_checkin_folder, # <-- 傳入貨物入庫檔案夾
-                        metadata # metadata 包含 QR/OCR 信息等
+                        metadata
                     )
 
                     if s3_image_path:
-                        self.event_publisher.publish_event(self.cargo_processing_event_type, s3_image_path=s3_image_path, metadata=metadata)
-                        # 記錄事件觸發時間 (用於冷卻)
-                        self.event_manager.record_event_triggered(cooldown_key)
+                        self._attach_clip(self.cargo_processing_event_type, metadata, current_frame_data.timestamp)
+                        # 冷卻已在提交掃描前記錄，解碼期間同一貨物不會重複觸發；
+                        # 追蹤 ID 在掃描完成後才標記為已觸發 (沒有實際解碼的貨物之後會重新掃描)
+
+                        qr_bboxes = [image_utils.scale_bbox(bbox, qr_scale) for bbox in cargo_bboxes]
+                        if self.qr_service is not None:
+                            # 非同步解碼：掃描完成 (或命中快取) 後才發布事件，不阻塞幀處理
+                            regions = [qr_scanner.expand_bbox(bbox, w, h, self.qr_bbox_expansion) for bbox in qr_bboxes]
+                            crops = [qr_image[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+                            qr_future = self.qr_service.submit_batch(crops, cargo_track_ids)
+                            qr_future.add_done_callback(
+                                lambda f: self._publish_cargo_event(s3_image_path, metadata, cargo_bboxes, cargo_track_ids, f.result())
+                            )
+                        else:
+                            qr_results = qr_scanner.scan_qr_codes(qr_image, qr_bboxes, self.qr_bbox_expansion)
+                            self._publish_cargo_event(s3_image_path, metadata, cargo_bboxes, cargo_track_ids, qr_results)
                     else:
                         logger.warning(f"未能捕獲或添加到佇列影像用於貨物事件 '{self.cargo_processing_event_type}'。跳過發布事件訊息。")
+                        self.event_manager.release(cooldown_key)
                 else:
-                    logger.error("未能獲取當前幀數據用於貨物事件觸發。")
+                    logger.error("沒有偵測結果所屬的幀，無法進行 QR 掃描。")
+                    self.event_manager.release(cooldown_key)
 
             # else:
             #      logger.debug(f"事件 '{event_type}' 仍在冷卻時間內，跳過觸發。")
@@ -334,17 +298,12 @@ class CargoDetector(BaseDetector):
         # --------------------------------------------------------------------
         # 讀取並可能使用最新的貨物處理結果 (如果需要)
         # --------------------------------------------------------------------
-        latest_cargo_info_data = "no_cargo_info"
-        latest_cargo_result_timestamp = 0
-        latest_cargo_related_person_id = "no_person"
-        latest_proposed_location = "pending_assignment"
-
-        with self.recognition_result_lock: # 使用同一個鎖保護
-            latest_cargo_info_data = self.cargo_result_state.get("cargo_id_data", "no_cargo_info")
-            latest_cargo_result_timestamp = self.cargo_result_state.get("timestamp", 0)
-            latest_cargo_related_person_id = self.cargo_result_state.get("related_person_id", "no_person")
-            latest_proposed_location = self.cargo_result_state.get("proposed_location", "pending_assignment")
-            # 可以獲取 extraction_method, bedrock_summary_preview 等
+        latest_cargo_result = self.result_store.latest_cargo() # 無鎖讀取
+        latest_cargo_info_data = latest_cargo_result.get("cargo_id_data") if latest_cargo_result else "no_cargo_info"
+        latest_cargo_result_timestamp = latest_cargo_result.timestamp if latest_cargo_result else 0
+        latest_cargo_related_person_id = latest_cargo_result.get("related_person_id") if latest_cargo_result else "no_person"
+        latest_proposed_location = latest_cargo_result.get("proposed_location") if latest_cargo_result else "pending_assignment"
+        # 可以獲取 extraction_method, bedrock_summary_preview 等
 
         # 您可以在這裡使用這些最新的貨物處理結果，例如：
         # - 在顯示畫面上顯示最新的貨物 ID 和分配位置
@@ -356,4 +315,48 @@ class CargoDetector(BaseDetector):
         #      logger.info(f"最新貨物 '{latest_cargo_info_data}' 已分配位置: {latest_proposed_location}")
 
 
+    def _publish_cargo_event(self, s3_image_path: str, metadata: Dict[str, Any], cargo_bboxes: List[List[int]],
+                             cargo_track_ids: List[Optional[int]], qr_results: List[Optional[str]]):
+        """
+        填入 QR 掃描結果並發布貨物處理事件 (非同步解碼時由解碼完成回調調用)。
+        Args:
+            s3_image_path (str): 貨物入庫影像的 S3 URL。
+            metadata (Dict[str, Any]): 貨物事件元數據。
+            cargo_bboxes (List[List[int]]): 這一幀所有貨物的邊界框。
+            cargo_track_ids (List[Optional[int]]): 對應的追蹤 ID (未啟用追蹤時為 None)。
+            qr_results (List[Optional[str]]): 對應的 QR Code 數據，掃描失敗時為 None，沒有實際解碼時為 NOT_ATTEMPTED。
+        """
+        attempted = [qr_data is not NOT_ATTEMPTED for qr_data in qr_results]
+        # 只有實際解碼 (或命中快取) 的貨物追蹤標記為已觸發，其餘的貨物在之後的幀重新掃描
+        self._reported_track_ids.update(
+            track_id for track_id, done in zip(cargo_track_ids, attempted) if done and track_id is not None
+        )
+        if not any(attempted):
+            # 冷卻保持有效，作為重試前的退避時間
+            logger.warning("這一批貨物都沒有進行 QR Code 解碼，跳過發布貨物事件，稍後重新掃描。")
+            return
+        qr_results = [qr_data if done else None for qr_data, done in zip(qr_results, attempted)]
+
+        metadata["qr_codes"] = [
+            {"bbox": bbox, "track_id": track_id, "qr_code_data": qr_data, "qr_scan_attempted": done}
+            for bbox, track_id, qr_data, done in zip(cargo_bboxes, cargo_track_ids, qr_results, attempted)
+        ]
+        # 主要的 QR Code 數據：優先使用第一個貨物的結果，否則使用任一成功解碼的結果
+        qr_data = next((data for data in qr_results if data is not None), None)
+
+        # ... 判斷是否需要 OCR 備案 (沒有實際解碼的貨物不算掃描失敗) ...
+        needs_ocr_fallback = False
+        if qr_data is None and self.enable_ocr_fallback:
+            logger.warning("QR Code 掃描失敗，已啟用 OCR 備案，將標記需要雲端 OCR。")
+            needs_ocr_fallback = True
+        elif qr_data is not None:
+            logger.info("QR Code 掃描成功。")
+
+        metadata["qr_code_data"] = qr_data
+        metadata["needs_ocr_fallback"] = needs_ocr_fallback
+        try:
+            self.event_publisher.publish_event(self.cargo_processing_event_type, s3_image_path=s3_image_path, metadata=metadata)
+        except Exception as e:
+            logger.error(f"發布貨物事件時發生錯誤: {e}", exc_info=True)
+
 # 移除人臉識別相關的輔助方法
\ No newline at end of file
@@ -1,13 +1,8 @@
 # detectors/person_detector.py
 
-import os
 import logging
-import time # 添加 time 模組用於時間戳
 from typing import List, Dict, Optional, Any
 # 修正：將舊的導入方式改為新的帶底線的方式
-# import jetson.inference # <-- 移除這行或註釋掉
-import jetson.inference   # <-- 改為導入新的庫
-import jetson.utils
 from events.event_types import EventType
 from events.event_manager import EventManager
 from events.event_publisher import EventPublisher
@@ -18,6 +13,8 @@ from data_capture.capture_manager import CaptureManager, FrameData # 引入 Fram
 
 # 引入 ObjectDetector 推論器類型
 from inference.inferencer import ObjectDetector
+from .tracker import select_new_tracks
+from inference.detection_table import DetectionTable
 
 
 logger = logging.getLogger(__name__)
@@ -26,6 +23,8 @@ class PersonDetector(BaseDetector):
     """
     專注於偵測人員和與人員相關的事件，並進行人臉識別。
     """
+    default_zone_type = "restricted" # 人員區域預設為限制區域 (進入即觸發 PERSON_IN_RESTRICTED_AREA)
+    default_zone_anchor = "bottom" # 以邊框底邊中點 (腳的位置) 判斷人員所在區域
     def __init__(self, settings: dict,
                  object_detector: ObjectDetector, # 主要物件偵測器
                  event_manager: EventManager,
@@ -53,6 +52,11 @@ class PersonDetector(BaseDetector):
         # 新增：從設定中獲取是否在偵測到人物時觸發雲端識別事件
         self.alert_on_person_detection = self.settings.get('alert_on_person_detection', True)
 
+        # 啟用追蹤器時，每個新的人員追蹤只觸發一次識別 (而不是每 cooldown_seconds 重複觸發)
+        self.trigger_once_per_track = self.settings.get('trigger_once_per_track', True)
+        self.person_class_ids = self._class_ids_for([self.person_class_name])
+        self._reported_track_ids = set()
+
         # 新增：獲取人臉識別影像的 S3 檔案夾前綴
         self.s3_face_recognition_folder = self.capture_manager.s3_settings.get('s3_face_recognition_folder')
         if not self.s3_face_recognition_folder:
@@ -61,22 +65,32 @@ class PersonDetector(BaseDetector):
         logger.info("PersonDetector 初始化成功 (觸發雲端人臉識別)。")
 
     # 修正：將 detections_raw 的類型提示從 List 改為 List[Any] 並在註釋中說明
-    def process(self, frame_cuda: jetson.utils.cudaImage, detections_raw: List[Any]):
+    def process(self, frame_cuda: Any, detections_raw: List[Any], tracks: Optional[List] = None,
+                detection_table: Optional[DetectionTable] = None, frame_data: Optional[FrameData] = None):
         """
         處理人員偵測邏輯。
         在偵測到人物後，觸發雲端進行人臉識別的事件。
         Args:
-            frame_cuda (jetson.utils.cudaImage): 當前幀的 CUDA 影像數據。
-            detections_raw (List[Any]): 物件偵測模型輸出的原始偵測結果列表 (預期類型為 List[jetson.inference.Detection])。
+            frame_cuda (Any): 當前幀的模型輸入 (Jetson 後端為 CUDA 影像)。
+            detections_raw (List[Any]): 物件偵測模型輸出的原始偵測結果列表 (具有 jetson.inference.Detection 相同的屬性)。
+            tracks (List[Track], optional): 多目標追蹤器的追蹤快照；提供時每個新的人員追蹤只觸發一次。
+            detection_table (DetectionTable, optional): 管線每幀建立一次的結構化偵測結果表。
+            frame_data (FrameData, optional): 偵測結果所屬的幀 (上傳人臉識別影像使用)。
         """
         if not self.is_enabled:
             return
 
-        # 篩選出人員偵測結果
-        person_detections = [
-            det for det in detections_raw
-            if det and self.object_detector.class_mapping.get(det.ClassID) == self.person_class_name
-        ]
+        table = self._get_detection_table(detections_raw, detection_table)
+
+        # 人員進入限制區域 (所有人員邊框一次完成區域判斷)
+        self._check_zones(table, [self.person_class_name], EventType.PERSON_IN_RESTRICTED_AREA.value, frame_data)
+
+        if tracks is not None and self.trigger_once_per_track:
+            self._process_tracks(tracks, frame_data)
+            return
+
+        # 篩選出人員偵測結果 (布林遮罩，不逐一查詢 class_mapping)
+        person_detections = table.select(table.class_mask([self.person_class_name]))
 
         # --------------------------------------------------------------------
         # 規則範例 1: 偵測到至少一人，觸發雲端人臉識別事件
@@ -85,18 +99,18 @@ class PersonDetector(BaseDetector):
             event_type = EventType.PERSON_FOR_IDENTIFICATION.value
             cooldown_key = event_type
 
-            if self.event_manager.should_trigger_event(cooldown_key, cooldown_override=self.cooldown_seconds):
+            # 原子地檢查並記錄冷卻時間與限流 (捕獲失敗時撤銷)
+            if self.event_manager.try_acquire(cooldown_key, cooldown_override=self.cooldown_seconds, event_type=event_type):
                 logger.info(f"事件 '{event_type}' 觸發。")
 
                 metadata: Dict[str, Any] = {
                     "person_count_in_frame": len(person_detections),
-                    "person_detection_bbox": [int(person_detections[0].Left), int(person_detections[0].Top), int(person_detections[0].Right), int(person_detections[0].Bottom)] if person_detections else None,
-                    "person_detection_confidence": float(person_detections[0].Confidence) if person_detections else None,
-                    "frame_timestamp": time.time()
+                    "person_detection_bbox": person_detections.bbox_of(0),
+                    "person_detection_confidence": float(person_detections.confidences[0]),
+                    "frame_timestamp": self.clock()
                 }
 
-                frame_buffer = self.capture_manager.get_frame_buffer()
-                current_frame_data = frame_buffer[-1] if frame_buffer else None
+                current_frame_data = frame_data
 
                 if current_frame_data:
                     # 修正：調用 capture_and_upload_image 時傳入人臉識別檔案夾前綴
@@ -108,14 +122,16 @@ class PersonDetector(BaseDetector):
                         metadata
                     )
                     if s3_image_path:
+                        self._attach_clip(event_type, metadata, current_frame_data.timestamp)
                         self.event_publisher.publish_event(event_type, s3_image_path=s3_image_path, metadata=metadata)
-                        self.event_manager.record_event_triggered(cooldown_key)
                     else:
                         logger.warning(f"未能捕獲或添加到佇列影像用於事件 '{event_type}'。跳過發布事件訊息。")
+                        self.event_manager.release(cooldown_key)
                     # else:
                     #     logger.error("未設定人臉識別影像 S3 檔案夾，跳過捕獲和發布事件。")
                 else:
-                     logger.error("捕獲管理器緩衝區為空，無法捕獲影像用於事件觸發。")
+                     logger.error("沒有偵測結果所屬的幀，無法捕獲影像用於事件觸發。")
+                     self.event_manager.release(cooldown_key)
 
             # else:
             #      logger.debug(f"事件 '{event_type}' 仍在冷卻時間內，跳過觸發。")
@@ -124,30 +140,51 @@ class PersonDetector(BaseDetector):
         # --------------------------------------------------------------------
         # 可擴展其他人員相關規則 (如跌倒、靜止過久等，這些可能不需要人臉識別)
         # --------------------------------------------------------------------
-        # 規則範例 2: 偵測到人員在特定區域 (需要額外的區域設定和檢查邏輯)
-        # if self.settings.get('alert_in_restricted_area', False) and 'restricted_area' in self.settings:
-        #     restricted_area_roi = self.settings.get('restricted_area')
-        #     if restricted_area_roi:
-        #          for person_det in person_detections:
-        #               # 這裡使用基類中的 is_in_roi 方法，需要確保 BaseDetector 實現了這個方法
-        #               if self._is_in_roi(person_det, restricted_area_roi):
-        #                    # 這裡可以再決定是否對在限制區域內的人進行人臉識別
-        #                    # 如果決定識別，走類似上面的邏輯，觸發 RestrictedArea_Known/Unknown 事件
-        #                    # 如果不識別，只觸發一個 PERSON_IN_RESTRICTED_AREA 事件 (EventTypes 中需要定義)
-        #                    event_type_restricted = "PERSON_IN_RESTRICTED_AREA" # 需要在 EventTypes 中定義
-        #                    if self.event_manager.should_trigger_event(event_type_restricted): # 使用另一個冷卻
-        #                         metadata_restricted = {
-        #                              "person_bbox": [int(person_det.Left), int(person_det.Top), int(person_det.Right), int(person_det.Bottom)],
-        #                              "restricted_area_roi": restricted_area_roi
-        #                         }
-        #                         # 捕獲當前幀用於此事件
-        #                         current_frame_data = self.capture_manager.get_frame_buffer()[-1] # 獲取最新一幀
-        #                         s3_path_restricted = self.capture_manager.capture_and_upload_image(event_type_restricted, current_frame_data, metadata_restricted)
-        #                         if s3_path_restricted:
-        #                              self.event_publisher.publish_event(event_type_restricted, s3_image_path=s3_path_restricted, metadata=metadata_restricted)
-        #                              self.event_manager.record_event_triggered(event_type_restricted)
-        #                         else:
-        #                              logger.warning(f"未能捕獲影像用於限制區域事件 '{event_type_restricted}'。")
-        #                    break # 找到一個在限制區域的人就處理一次
-
-        # ... 其他規則範例 ...
\ No newline at end of file
+        # 規則範例 2: 人員進入限制區域已由 BaseDetector._check_zones 實現 (設定於 detectors.person.zones)
+        #
+        # ... 其他規則範例 ...
+
+    def _process_tracks(self, tracks: List, frame_data: Optional[FrameData]):
+        """
+        追蹤模式：對每個新出現 (已確認且尚未觸發過) 的人員追蹤觸發一次雲端識別事件。
+        """
+        if not self.alert_on_person_detection:
+            return
+
+        person_tracks = [track for track in tracks if track.class_id in self.person_class_ids and track.is_visible]
+        new_tracks = select_new_tracks(tracks, self.person_class_ids, self._reported_track_ids)
+        if not new_tracks:
+            return
+
+        current_frame_data = frame_data
+        if not current_frame_data:
+            logger.error("沒有偵測結果所屬的幀，無法捕獲影像用於事件觸發。")
+            return
+
+        event_type = EventType.PERSON_FOR_IDENTIFICATION.value
+        for track in new_tracks:
+            # 每個追蹤只觸發一次，這裡主要套用事件類型與全域的速率限制 (被限流的追蹤下一幀重試)
+            cooldown_key = f"{event_type}_track_{track.track_id}"
+            if not self.event_manager.try_acquire(cooldown_key, cooldown_override=self.cooldown_seconds, event_type=event_type):
+                continue
+            logger.info(f"事件 '{event_type}' 觸發 (新的人員追蹤 {track.track_id})。")
+            metadata: Dict[str, Any] = {
+                "person_count_in_frame": len(person_tracks),
+                "person_detection_bbox": list(track.bbox),
+                "person_detection_confidence": track.confidence,
+                "track_id": track.track_id,
+                "frame_timestamp": self.clock()
+            }
+            s3_image_path = self.capture_manager.capture_and_upload_image(
+                event_type,
+                current_frame_data,
+                self.s3_face_recognition_folder,
+                metadata
+            )
+            if s3_image_path:
+                self._attach_clip(event_type, metadata, current_frame_data.timestamp)
+                self.event_publisher.publish_event(event_type, s3_image_path=s3_image_path, metadata=metadata)
+                self._reported_track_ids.add(track.track_id)
+            else:
+                logger.warning(f"未能捕獲或添加到佇列影像用於事件 '{event_type}' (追蹤 {track.track_id})。下一幀將重試。")
+                self.event_manager.release(cooldown_key)
@@ -0,0 +1,264 @@
+# detectors/tracker.py
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from inference.detection_table import DetectionTable
+
+logger = logging.getLogger(__name__)
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    向量化計算兩組邊界框之間的 IoU。
+    Args:
+        boxes_a (np.ndarray): (N, 4) 邊界框 [x1, y1, x2, y2]。
+        boxes_b (np.ndarray): (M, 4) 邊界框 [x1, y1, x2, y2]。
+    Returns:
+        np.ndarray: (N, M) IoU 矩陣。
+    """
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    intersection = wh[..., 0] * wh[..., 1]
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def greedy_match(scores: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """
+    依分數由高到低貪婪配對 (每列、每欄最多配對一次)。
+    Args:
+        scores (np.ndarray): (N, M) 配對分數矩陣 (例如 IoU)。
+        threshold (float): 配對所需的最低分數。
+    Returns:
+        List[Tuple[int, int]]: (列索引, 欄索引) 配對列表。
+    """
+    matches = []
+    if scores.size == 0:
+        return matches
+    scores = scores.copy()
+    for _ in range(min(scores.shape)):
+        row, col = np.unravel_index(np.argmax(scores), scores.shape)
+        if scores[row, col] < threshold:
+            break
+        matches.append((int(row), int(col)))
+        scores[row, :] = -1.0
+        scores[:, col] = -1.0
+    return matches
+
+
+def _bbox_to_z(bbox: np.ndarray) -> np.ndarray:
+    """[x1, y1, x2, y2] -> [cx, cy, 面積, 長寬比]"""
+    w = bbox[2] - bbox[0]
+    h = bbox[3] - bbox[1]
+    return np.array([bbox[0] + w / 2.0, bbox[1] + h / 2.0, w * h, w / float(h) if h > 0 else 1.0])
+
+
+def _x_to_bbox(x: np.ndarray) -> np.ndarray:
+    """[cx, cy, 面積, 長寬比, ...] -> [x1, y1, x2, y2]"""
+    area = max(float(x[2]), 0.0)
+    ratio = max(float(x[3]), 1e-6)
+    w = np.sqrt(area * ratio)
+    h = area / w if w > 0 else 0.0
+    return np.array([x[0] - w / 2.0, x[1] - h / 2.0, x[0] + w / 2.0, x[1] + h / 2.0])
+
+
+class KalmanBoxFilter:
+    """
+    SORT 使用的等速模型卡爾曼濾波器。
+    狀態為 [cx, cy, 面積, 長寬比, vx, vy, v面積]，觀測為 [cx, cy, 面積, 長寬比]。
+    """
+    _F = np.eye(7)
+    _F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+    _H = np.eye(4, 7)
+    _R = np.diag([1.0, 1.0, 10.0, 10.0])
+    _Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+
+    def __init__(self, bbox: np.ndarray):
+        self.x = np.zeros(7)
+        self.x[:4] = _bbox_to_z(bbox)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 10000.0, 10000.0, 10000.0]) # 初始速度未知
+
+    def predict(self) -> np.ndarray:
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0.0
+        self.x = self._F @ self.x
+        self.P = self._F @ self.P @ self._F.T + self._Q
+        return _x_to_bbox(self.x)
+
+    def update(self, bbox: np.ndarray):
+        z = _bbox_to_z(bbox)
+        y = z - self._H @ self.x
+        S = self._H @ self.P @ self._H.T + self._R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self._H) @ self.P
+
+    @property
+    def bbox(self) -> np.ndarray:
+        return _x_to_bbox(self.x)
+
+
+class Track:
+    """
+    追蹤結果的唯讀快照 (在管線階段之間傳遞，不會被追蹤器後續的更新改變)。
+    """
+    __slots__ = ("track_id", "class_id", "bbox", "confidence", "hits", "age",
+                 "time_since_update", "confirmed", "detection")
+
+    def __init__(self, track_id: int, class_id: int, bbox: Tuple[int, int, int, int], confidence: float,
+                 hits: int, age: int, time_since_update: int, confirmed: bool, detection: Any):
+        self.track_id = track_id # 穩定的追蹤 ID
+        self.class_id = class_id # 模型原始類別 ID
+        self.bbox = bbox # 濾波後的邊界框 [x1, y1, x2, y2]
+        self.confidence = confidence # 最近一次配對偵測的信心度
+        self.hits = hits # 累計配對次數
+        self.age = age # 建立後經過的更新次數
+        self.time_since_update = time_since_update # 0 表示這一幀有配對到偵測
+        self.confirmed = confirmed # 配對次數已達 min_hits
+        self.detection = detection # 最近一次配對的原始偵測結果
+
+    @property
+    def is_visible(self) -> bool:
+        return self.time_since_update == 0
+
+    def __repr__(self) -> str:
+        return f"Track(id={self.track_id}, class={self.class_id}, bbox={self.bbox}, hits={self.hits}, confirmed={self.confirmed})"
+
+
+class _TrackState:
+    def __init__(self, track_id: int, class_id: int, bbox: np.ndarray, detection: Any):
+        self.track_id = track_id
+        self.class_id = class_id
+        self.kf = KalmanBoxFilter(bbox)
+        self.detection = detection
+        self.confidence = float(detection.Confidence)
+        self.hits = 1
+        self.age = 0
+        self.time_since_update = 0
+
+
+class MultiObjectTracker:
+    """
+    輕量的 SORT 風格多目標追蹤器：卡爾曼濾波預測 + 向量化 IoU 配對 (只在同類別之間配對)，
+    為每個物件提供跨幀穩定的追蹤 ID，讓偵測器可以每個新物件只觸發一次事件。
+    """
+    def __init__(self, tracker_settings: dict):
+        """
+        初始化追蹤器。
+        Args:
+            tracker_settings (dict): 追蹤器設定 (config.detectors.tracker)，包含 iou_threshold, max_age, min_hits。
+        """
+        self.iou_threshold = float(tracker_settings.get('iou_threshold', 0.3))
+        self.max_age = int(tracker_settings.get('max_age', 30)) # 連續多少次推論未配對到偵測後刪除追蹤
+        self.min_hits = int(tracker_settings.get('min_hits', 3)) # 配對多少次後才視為確認的追蹤
+
+        self._tracks: List[_TrackState] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.created_count = 0
+
+    def update(self, detections: Any) -> List[Track]:
+        """
+        以一幀的偵測結果更新追蹤器。
+        Args:
+            detections (DetectionTable | List[Any]): 偵測結果表，或偵測結果列表 (具有 Left/Top/Right/Bottom/ClassID/Confidence 屬性)。
+                                                     傳入偵測結果表時，會將追蹤 ID 寫入表的 track_id 欄位。
+        Returns:
+            List[Track]: 所有存活追蹤的快照 (包含這一幀未配對、仍在預測中的追蹤)。
+        """
+        table = detections if isinstance(detections, DetectionTable) else None
+        if table is not None:
+            detections = table.detections
+            det_boxes = table.bboxes.astype(np.float64)
+            det_classes = table.records['class_id'].astype(np.int64)
+        else:
+            detections = [det for det in detections if det is not None]
+            det_boxes = np.array([[det.Left, det.Top, det.Right, det.Bottom] for det in detections],
+                                 dtype=np.float64).reshape(-1, 4)
+            det_classes = np.array([det.ClassID for det in detections], dtype=np.int64)
+
+        with self._lock:
+            predicted = np.array([track.kf.predict() for track in self._tracks]).reshape(-1, 4)
+            for track in self._tracks:
+                track.age += 1
+                track.time_since_update += 1
+
+            track_classes = np.array([track.class_id for track in self._tracks], dtype=np.int64)
+
+            scores = iou_matrix(predicted, det_boxes)
+            scores[track_classes[:, None] != det_classes[None, :]] = 0.0 # 只在同類別之間配對
+            matches = greedy_match(scores, self.iou_threshold)
+
+            det_track_ids = np.full(len(detections), -1, dtype=np.int32)
+            for track_idx, det_idx in matches:
+                track = self._tracks[track_idx]
+                track.kf.update(det_boxes[det_idx])
+                track.detection = detections[det_idx]
+                track.confidence = float(detections[det_idx].Confidence)
+                track.hits += 1
+                track.time_since_update = 0
+                det_track_ids[det_idx] = track.track_id
+
+            for det_idx, det in enumerate(detections):
+                if det_track_ids[det_idx] < 0:
+                    self._tracks.append(_TrackState(self._next_id, int(det_classes[det_idx]), det_boxes[det_idx], det))
+                    det_track_ids[det_idx] = self._next_id
+                    self._next_id += 1
+                    self.created_count += 1
+
+            if table is not None:
+                table.records['track_id'] = det_track_ids
+
+            self._tracks = [track for track in self._tracks if track.time_since_update <= self.max_age]
+            return [self._snapshot(track) for track in self._tracks]
+
+    def _snapshot(self, track: _TrackState) -> Track:
+        x1, y1, x2, y2 = track.kf.bbox
+        return Track(
+            track.track_id, track.class_id, (int(x1), int(y1), int(x2), int(y2)), track.confidence,
+            track.hits, track.age, track.time_since_update, track.hits >= self.min_hits, track.detection
+        )
+
+    def reset(self):
+        with self._lock:
+            self._tracks = []
+
+    def get_metrics(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: 存活/已確認的追蹤數量與累計建立的追蹤數。
+        """
+        with self._lock:
+            return {
+                "active_tracks": len(self._tracks),
+                "confirmed_tracks": sum(1 for track in self._tracks if track.hits >= self.min_hits),
+                "created_tracks": self.created_count,
+            }
+
+
+def select_new_tracks(tracks: Optional[List[Track]], class_ids: set, reported_ids: set) -> List[Track]:
+    """
+    從追蹤快照中選出這一幀可見、已確認、指定類別且尚未觸發過事件的追蹤，
+    並從 reported_ids 中移除已消失的追蹤 ID (原地修改)。
+    Args:
+        tracks (List[Track]): 追蹤器返回的快照。
+        class_ids (set): 感興趣的模型類別 ID。
+        reported_ids (set): 已觸發過事件的追蹤 ID。
+    Returns:
+        List[Track]: 新的追蹤列表。
+    """
+    tracks = tracks or []
+    alive_ids = {track.track_id for track in tracks}
+    reported_ids.intersection_update(alive_ids)
+    return [
+        track for track in tracks
+        if track.class_id in class_ids and track.confirmed and track.is_visible
+        and track.track_id not in reported_ids
+    ]
@@ -0,0 +1,206 @@
+# detectors/zones.py
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ZONE_TYPE_RESTRICTED = "restricted" # 物件進入區域內即違規
+ZONE_TYPE_ALLOWED = "allowed"       # 物件不在任何 allowed 區域內即違規
+OUTSIDE_ALLOWED_ZONES = "outside_allowed_zones" # 違規結果中代表「不在任何允許區域內」的名稱
+MAX_ZONES = 32 # 位元遮罩最多可容納的區域數量
+
+
+class Zone:
+    """
+    一個具名的多邊形區域。
+    """
+    def __init__(self, name: str, polygon: Sequence[Sequence[float]], zone_type: str, normalized: bool = False):
+        """
+        Args:
+            name (str): 區域名稱 (會出現在事件元數據中)。
+            polygon (Sequence[Sequence[float]]): 多邊形頂點 [[x, y], ...]。
+            zone_type (str): 'restricted' 或 'allowed'。
+            normalized (bool): 頂點是否為 0~1 的正規化座標 (否則為像素座標)。
+        """
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+        self.zone_type = zone_type
+        self.normalized = normalized
+
+    def to_pixels(self, frame_width: int, frame_height: int) -> np.ndarray:
+        points = self.polygon * np.array([frame_width, frame_height], dtype=np.float32) if self.normalized else self.polygon
+        return np.round(points).astype(np.int32)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "type": self.zone_type, "polygon": self.polygon.tolist(), "normalized": self.normalized}
+
+
+def parse_zones(zones_config: Optional[List[Dict[str, Any]]], default_type: str) -> List[Zone]:
+    """
+    解析區域設定。
+    Args:
+        zones_config (List[Dict[str, Any]]): 區域設定列表，每個項目包含 name, polygon (或 rect: [x1, y1, x2, y2])，
+                                             可選 type ('restricted'/'allowed') 與 normalized。
+        default_type (str): 未指定 type 時使用的類型。
+    Returns:
+        List[Zone]: 有效的區域列表 (無效項目會被略過並記錄警告)。
+    """
+    zones = []
+    for idx, zone_config in enumerate(zones_config or []):
+        if not isinstance(zone_config, dict):
+            logger.warning(f"區域設定格式無效，已略過: {zone_config}")
+            continue
+        name = str(zone_config.get('name', f"zone_{idx}"))
+        zone_type = zone_config.get('type', default_type)
+        polygon = zone_config.get('polygon')
+        rect = zone_config.get('rect')
+        if polygon is None and rect is not None and len(rect) == 4:
+            x1, y1, x2, y2 = rect
+            polygon = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+        if zone_type not in (ZONE_TYPE_RESTRICTED, ZONE_TYPE_ALLOWED):
+            logger.warning(f"區域 '{name}' 的類型 '{zone_type}' 無效，已略過。")
+            continue
+        try:
+            zone = Zone(name, polygon, zone_type, bool(zone_config.get('normalized', False)))
+        except (TypeError, ValueError):
+            logger.warning(f"區域 '{name}' 的多邊形格式無效，已略過: {polygon}")
+            continue
+        if len(zone.polygon) < 3:
+            logger.warning(f"區域 '{name}' 至少需要 3 個頂點，已略過。")
+            continue
+        zones.append(zone)
+    if len(zones) > MAX_ZONES:
+        logger.warning(f"區域數量超過上限 {MAX_ZONES}，只使用前 {MAX_ZONES} 個。")
+        zones = zones[:MAX_ZONES]
+    return zones
+
+
+class ZoneMap:
+    """
+    將一組多邊形區域光柵化為位元遮罩 (每個區域佔一個位元)，只在區域或幀尺寸改變時重建。
+    查詢時以 NumPy 索引一次取出所有錨點所在像素的位元，完成整幀所有邊框的區域判斷。
+    """
+    def __init__(self, zones_config: Optional[List[Dict[str, Any]]] = None, default_type: str = ZONE_TYPE_RESTRICTED):
+        """
+        Args:
+            zones_config (List[Dict[str, Any]], optional): 區域設定列表 (見 parse_zones)。
+            default_type (str): 未指定 type 時使用的類型。
+        """
+        self.default_type = default_type
+        self._lock = threading.Lock()
+        self._zones: List[Zone] = parse_zones(zones_config, default_type)
+        self._mask: Optional[np.ndarray] = None
+        self._mask_size: Optional[Tuple[int, int]] = None # (寬, 高)
+        self._restricted_bits = np.zeros(len(self._zones), dtype=bool)
+        self._allowed_bits = np.zeros(len(self._zones), dtype=bool)
+        self._update_type_bits()
+
+    @property
+    def zones(self) -> List[Zone]:
+        return self._zones
+
+    def __len__(self) -> int:
+        return len(self._zones)
+
+    def update(self, zones_config: Optional[List[Dict[str, Any]]]):
+        """
+        替換所有區域 (執行期間由 update_roi 或雲端命令調用)。遮罩在下次查詢時重建。
+        """
+        zones = parse_zones(zones_config, self.default_type)
+        with self._lock:
+            self._zones = zones
+            self._mask = None
+            self._mask_size = None
+            self._update_type_bits()
+        logger.info(f"區域已更新: {[zone.name for zone in zones]}")
+
+    def _update_type_bits(self):
+        self._restricted_bits = np.array([zone.zone_type == ZONE_TYPE_RESTRICTED for zone in self._zones], dtype=bool)
+        self._allowed_bits = np.array([zone.zone_type == ZONE_TYPE_ALLOWED for zone in self._zones], dtype=bool)
+
+    def _ensure_mask(self, frame_width: int, frame_height: int) -> np.ndarray:
+        """
+        需要時以 cv2.fillPoly 重建位元遮罩 (需在持有鎖時調用)。
+        """
+        if self._mask is not None and self._mask_size == (frame_width, frame_height):
+            return self._mask
+        dtype = np.uint8 if len(self._zones) <= 8 else np.uint16 if len(self._zones) <= 16 else np.uint32
+        mask = np.zeros((frame_height, frame_width), dtype=dtype)
+        zone_mask = np.zeros((frame_height, frame_width), dtype=np.uint8)
+        for bit, zone in enumerate(self._zones):
+            zone_mask.fill(0)
+            cv2.fillPoly(zone_mask, [zone.to_pixels(frame_width, frame_height)], 1)
+            mask[zone_mask > 0] |= dtype(1 << bit)
+        self._mask = mask
+        self._mask_size = (frame_width, frame_height)
+        logger.debug(f"已為 {len(self._zones)} 個區域建立 {frame_width}x{frame_height} 的查找遮罩。")
+        return mask
+
+    def membership(self, points: np.ndarray, frame_width: int, frame_height: int) -> np.ndarray:
+        """
+        查詢每個點位於哪些區域內。
+        Args:
+            points (np.ndarray): (N, 2) 點座標 [x, y] (像素)。
+            frame_width (int): 幀寬度。
+            frame_height (int): 幀高度。
+        Returns:
+            np.ndarray: (N, 區域數量) 布林矩陣。
+        """
+        with self._lock:
+            if not self._zones or len(points) == 0:
+                return np.zeros((len(points), len(self._zones)), dtype=bool)
+            mask = self._ensure_mask(frame_width, frame_height)
+            xs = np.clip(points[:, 0].astype(np.int64), 0, frame_width - 1)
+            ys = np.clip(points[:, 1].astype(np.int64), 0, frame_height - 1)
+            bits = mask[ys, xs].astype(np.int64)
+            return ((bits[:, None] >> np.arange(len(self._zones))) & 1).astype(bool)
+
+    def violations(self, points: np.ndarray, frame_width: int, frame_height: int) -> List[Tuple[int, str]]:
+        """
+        找出違反區域規則的點。
+        Args:
+            points (np.ndarray): (N, 2) 點座標 [x, y] (像素)。
+            frame_width (int): 幀寬度。
+            frame_height (int): 幀高度。
+        Returns:
+            List[Tuple[int, str]]: (點索引, 區域名稱) 列表。進入 restricted 區域時為該區域名稱，
+                                   不在任何 allowed 區域內時為 OUTSIDE_ALLOWED_ZONES。
+        """
+        member = self.membership(points, frame_width, frame_height)
+        with self._lock:
+            zones, restricted_bits, allowed_bits = self._zones, self._restricted_bits, self._allowed_bits
+        if member.shape[1] != len(zones):
+            return [] # 查詢期間區域被更新，略過這一幀
+
+        results = []
+        restricted_hits = member & restricted_bits
+        for point_idx, zone_idx in zip(*np.nonzero(restricted_hits)):
+            results.append((int(point_idx), zones[zone_idx].name))
+        if np.any(allowed_bits):
+            outside = ~np.any(member & allowed_bits, axis=1)
+            results.extend((int(point_idx), OUTSIDE_ALLOWED_ZONES) for point_idx in np.flatnonzero(outside))
+        return results
+
+    def to_config(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [zone.to_dict() for zone in self._zones]
+
+
+def anchor_points(bboxes: np.ndarray, anchor: str = "center") -> np.ndarray:
+    """
+    由邊界框計算判斷區域時使用的錨點。
+    Args:
+        bboxes (np.ndarray): (N, 4) 邊界框 [x1, y1, x2, y2]。
+        anchor (str): 'center' (中心點) 或 'bottom' (底邊中點，適合判斷人員站立位置)。
+    Returns:
+        np.ndarray: (N, 2) 錨點座標。
+    """
+    center_x = (bboxes[:, 0] + bboxes[:, 2]) / 2
+    if anchor == "bottom":
+        return np.column_stack([center_x, bboxes[:, 3]])
+    return np.column_stack([center_x, (bboxes[:, 1] + bboxes[:, 3]) / 2])
@@ -2,27 +2,179 @@
 
 import time
 import logging
-from typing import Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+
+class TokenBucket:
+    """
+    令牌桶限流器：允許短時間的突發 (burst)，長期平均不超過 rate_per_sec。
+    本身不加鎖，由 EventManager 在持有鎖時調用。
+    """
+    def __init__(self, rate_per_sec: float, burst: float, now: float):
+        """
+        Args:
+            rate_per_sec (float): 持續速率 (每秒補充的令牌數)。
+            burst (float): 桶容量 (最多可連續觸發的次數)。
+            now (float): 當前單調時鐘時間。
+        """
+        self.rate_per_sec = float(rate_per_sec)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_sec)
+            self.updated = now
+
+    def available(self, now: float, tokens: float = 1.0) -> bool:
+        self._refill(now)
+        return self.tokens >= tokens
+
+    def consume(self, now: float, tokens: float = 1.0):
+        self._refill(now)
+        self.tokens = max(0.0, self.tokens - tokens) # 允許 record 在未檢查時調用，不欠令牌
+
+
 class EventManager:
     """
-    管理邊緣端事件的觸發，處理冷卻時間等邏輯。
+    管理邊緣端事件的觸發，處理冷卻時間與限流。
+    - 冷卻時間以單調時鐘計算 (不受 NTP 校時影響)，冷卻鍵數量以 TTL + LRU 限制，不會無限增長。
+    - 每個事件類型可設定令牌桶 (突發 + 持續速率)，並有全域每秒事件上限。
+    - try_acquire() 在鎖內原子地完成「檢查並記錄」，多個執行緒不會同時通過同一個冷卻。
     """
-    def __init__(self, settings: dict):
+    def __init__(self, settings: dict, clock=time.monotonic):
         """
         初始化事件管理器。
         Args:
-            settings (dict): 事件相關設定。
+            settings (dict): 事件相關設定 (config.events)，包含 default_cooldown_seconds, max_keys, key_ttl_sec,
+                             global_rate_per_sec, global_burst，以及以事件類型為鍵的個別設定
+                             (cooldown_seconds, rate_per_sec, burst)。
+            clock (callable): 時鐘函數。Defaults to time.monotonic.
         """
         self.settings = settings
-        self._last_event_time: Dict[str, float] = {} # 記錄上次觸發某個事件類型的時間
-        # 可以擴展為記錄更精細的冷卻時間，例如按物體 ID 或區域
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_event_time: "OrderedDict[str, float]" = OrderedDict() # 冷卻鍵 -> 上次觸發時間 (單調時鐘，依最近使用排序)
+        self.max_keys = max(1, int(settings.get('max_keys', 4096))) # 最多記錄的冷卻鍵數量 (超出時移除最久未觸發的鍵)
+        self.key_ttl_sec = float(settings.get('key_ttl_sec', 3600)) # 冷卻鍵超過此時間未觸發即移除
+        self._max_cooldown = 0.0 # 見過的最長冷卻時間 (TTL 不會短於它，避免冷卻中的鍵被提早移除)
+
+        now = self._clock()
+        self._type_buckets: Dict[str, TokenBucket] = {}
+        for event_type, type_settings in settings.items():
+            if isinstance(type_settings, dict) and type_settings.get('rate_per_sec') is not None:
+                self._type_buckets[event_type] = TokenBucket(
+                    type_settings['rate_per_sec'], type_settings.get('burst', 1), now
+                )
+        global_rate = settings.get('global_rate_per_sec')
+        self._global_bucket: Optional[TokenBucket] = (
+            TokenBucket(global_rate, settings.get('global_burst', global_rate), now) if global_rate else None
+        )
+
+        self.accepted_count = 0
+        self.cooldown_rejected_count = 0
+        self.rate_rejected_count = 0
+        self.evicted_count = 0
+
+    def _cooldown_for(self, key: str, cooldown_override: Optional[float]) -> float:
+        # 獲取冷卻時間，優先使用覆蓋值，然後是設定中的特定事件類型值，最後是預設值
+        cooldown = cooldown_override
+        if cooldown is None:
+            type_settings = self.settings.get(key)
+            if isinstance(type_settings, dict):
+                cooldown = type_settings.get('cooldown_seconds') # 檢查特定事件類型的設定
+        if cooldown is None:
+            cooldown = self.settings.get('default_cooldown_seconds', 5) # 使用預設值
+        return float(cooldown)
+
+    def _bucket_for(self, key: str, event_type: Optional[str]) -> Optional[TokenBucket]:
+        """
+        找出冷卻鍵對應的事件類型令牌桶 (未指定 event_type 時以鍵的前綴比對，例如 "CARGO_INFO_FOR_PROCESSING_Nick")。
+        """
+        if event_type is not None:
+            return self._type_buckets.get(event_type)
+        bucket = self._type_buckets.get(key)
+        if bucket is None:
+            for bucket_type, type_bucket in self._type_buckets.items():
+                if key.startswith(bucket_type + "_"):
+                    return type_bucket
+        return bucket
+
+    def _in_cooldown(self, key: str, cooldown: float, now: float) -> bool:
+        last_time = self._last_event_time.get(key)
+        return last_time is not None and (now - last_time) <= cooldown
+
+    def _rate_available(self, bucket: Optional[TokenBucket], now: float) -> bool:
+        if bucket is not None and not bucket.available(now):
+            return False
+        return self._global_bucket is None or self._global_bucket.available(now)
+
+    def _record(self, key: str, bucket: Optional[TokenBucket], now: float):
+        """
+        記錄觸發並消耗令牌 (需在持有鎖時調用)。
+        """
+        self._last_event_time[key] = now
+        self._last_event_time.move_to_end(key)
+        if bucket is not None:
+            bucket.consume(now)
+        if self._global_bucket is not None:
+            self._global_bucket.consume(now)
+        self._evict(now)
+
+    def _evict(self, now: float):
+        # 鍵依最近觸發時間排序，從最舊的開始移除過期或超出數量上限的鍵
+        ttl = max(self.key_ttl_sec, self._max_cooldown)
+        while self._last_event_time:
+            oldest_key, oldest_time = next(iter(self._last_event_time.items()))
+            if len(self._last_event_time) <= self.max_keys and now - oldest_time <= ttl:
+                break
+            del self._last_event_time[oldest_key]
+            self.evicted_count += 1
+
+    def try_acquire(self, key: str, cooldown_override: float = None, event_type: str = None) -> bool:
+        """
+        原子地檢查冷卻時間與限流，通過時立即記錄觸發 (取代 should_trigger_event + record_event_triggered)。
+        Args:
+            key (str): 冷卻鍵 (事件類型，或事件類型加上人物/區域/追蹤 ID)。
+            cooldown_override (float, optional): 此觸發的冷卻時間覆蓋值。
+            event_type (str, optional): 用於選擇令牌桶的事件類型；未提供時以冷卻鍵的前綴比對。
+        Returns:
+            bool: True 表示允許觸發 (已記錄)，False 表示仍在冷卻中或超出速率限制。
+        """
+        cooldown = self._cooldown_for(key, cooldown_override)
+        with self._lock:
+            self._max_cooldown = max(self._max_cooldown, cooldown)
+            now = self._clock()
+            if self._in_cooldown(key, cooldown, now):
+                self.cooldown_rejected_count += 1
+                return False
+            bucket = self._bucket_for(key, event_type)
+            if not self._rate_available(bucket, now):
+                self.rate_rejected_count += 1
+                logger.debug(f"事件 '{key}' 超出速率限制，跳過觸發。")
+                return False
+            self._record(key, bucket, now)
+            self.accepted_count += 1
+            return True
+
+    def release(self, key: str):
+        """
+        撤銷 try_acquire 記錄的冷卻 (例如捕獲影像失敗、事件未發布時)，讓下一幀可以重試。已消耗的令牌不退還。
+        Args:
+            key (str): 冷卻鍵。
+        """
+        with self._lock:
+            self._last_event_time.pop(key, None)
 
     def should_trigger_event(self, event_type: str, cooldown_override: float = None) -> bool:
         """
-        判斷某個事件類型是否應該觸發 (基於冷卻時間)。
+        判斷某個事件類型是否應該觸發 (基於冷卻時間與限流，不會記錄觸發)。
+        多執行緒同時觸發同一個鍵時，請改用 try_acquire()。
         Args:
             event_type (str): 事件類型名稱 (string 或 EventType value)。
             cooldown_override (float, optional): 為此特定觸發設置的冷卻時間覆蓋值。
@@ -30,21 +182,14 @@ class EventManager:
         Returns:
             bool: 如果事件應該觸發則為 True，否則為 False。
         """
-        current_time = time.time()
-        last_time = self._last_event_time.get(event_type, 0)
-
-        # 獲取冷卻時間，優先使用覆蓋值，然後是設定中的特定事件類型值，最後是預設值
-        cooldown = cooldown_override
-        if cooldown is None:
-             cooldown = self.settings.get(event_type, {}).get('cooldown_seconds') # 檢查特定事件類型的設定
-        if cooldown is None:
-             cooldown = self.settings.get('default_cooldown_seconds', 5) # 使用預設值
-
-        if (current_time - last_time) > cooldown:
-            return True
-        else:
-            # logger.debug(f"事件 '{event_type}' 仍在冷卻時間內。") # 如果不需要頻繁輸出，可註釋掉
-            return False
+        cooldown = self._cooldown_for(event_type, cooldown_override)
+        with self._lock:
+            self._max_cooldown = max(self._max_cooldown, cooldown)
+            now = self._clock()
+            if self._in_cooldown(event_type, cooldown, now):
+                # logger.debug(f"事件 '{event_type}' 仍在冷卻時間內。") # 如果不需要頻繁輸出，可註釋掉
+                return False
+            return self._rate_available(self._bucket_for(event_type, None), now)
 
     def record_event_triggered(self, event_type: str):
         """
@@ -52,10 +197,22 @@ class EventManager:
         Args:
             event_type (str): 事件類型名稱。
         """
-        self._last_event_time[event_type] = time.time()
+        with self._lock:
+            now = self._clock()
+            self._record(event_type, self._bucket_for(event_type, None), now)
+            self.accepted_count += 1
         logger.info(f"事件 '{event_type}' 已記錄觸發時間。")
 
-    # 可以擴展方法來管理更精細的冷卻時間，例如基於 object_id + event_type
-    # def should_trigger_per_object(self, event_type: str, object_id: int, cooldown_seconds: float) -> bool:
-    #     # 實現按物體 ID 的冷卻邏輯
-    #     pass
\ No newline at end of file
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 允許/冷卻拒絕/限流拒絕次數、目前記錄的冷卻鍵數量與被移除的鍵數量。
+        """
+        with self._lock:
+            return {
+                "accepted": self.accepted_count,
+                "cooldown_rejected": self.cooldown_rejected_count,
+                "rate_rejected": self.rate_rejected_count,
+                "tracked_keys": len(self._last_event_time),
+                "evicted_keys": self.evicted_count,
+            }
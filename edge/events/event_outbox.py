@@ -0,0 +1,160 @@
+# events/event_outbox.py
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EventOutbox:
+    """
+    持久化、只追加的事件寄件匣 (SQLite WAL 模式)。
+    事件先寫入寄件匣，發布成功 (收到 PUBACK) 後才移除，
+    因此網路中斷或程式重啟時事件不會遺失。寄件匣以事件數量與存放時間限制大小。
+    """
+    def __init__(self, outbox_settings: dict):
+        """
+        初始化事件寄件匣。
+        Args:
+            outbox_settings (dict): 寄件匣設定 (config.events.outbox)，包含 path, max_events, max_age_sec。
+        """
+        self.path = outbox_settings.get('path', 'spool/event_outbox.db')
+        self.max_events = int(outbox_settings.get('max_events', 10000))
+        self.max_age_sec = float(outbox_settings.get('max_age_sec', 7 * 24 * 3600))
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # isolation_level=None：每個語句自動提交；WAL 模式下寫入不阻塞讀取
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created_at REAL NOT NULL,"
+            " event_type TEXT NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        # 依存放時間丟棄事件時以索引範圍刪除，不需要掃描整個寄件匣
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_created_at ON outbox (created_at)")
+
+        self.appended_count = 0
+        self.removed_count = 0
+        self.evicted_count = 0 # 因超出數量或時間限制而被丟棄的事件
+
+        pending = self.count()
+        self._pending = pending # 寄件匣中的事件數量 (在鎖內維護，追加時不需要 COUNT(*))
+        if pending:
+            logger.info(f"事件寄件匣中有 {pending} 個待發布事件 (上次執行遺留)，連線後將依序補發。")
+
+    def append(self, event_type: str, event_payload: Dict[str, Any]) -> int:
+        """
+        追加一個事件到寄件匣。
+        Args:
+            event_type (str): 事件類型。
+            event_payload (Dict[str, Any]): 完整的事件 Payload。
+        Returns:
+            int: 事件在寄件匣中的 ID。
+        """
+        payload_json = json.dumps(event_payload)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (created_at, event_type, payload) VALUES (?, ?, ?)",
+                (time.time(), event_type, payload_json)
+            )
+            self.appended_count += 1
+            self._pending += 1
+            self._enforce_bounds()
+            return cursor.lastrowid
+
+    def _enforce_bounds(self):
+        """
+        丟棄超出時間或數量限制的最舊事件 (需在持有鎖時調用)。
+        兩者都只觸及被丟棄的列：時間限制使用 created_at 索引，數量限制只在超出時依 ID 刪除超出的最舊事件。
+        """
+        evicted = 0
+        if self.max_age_sec > 0:
+            cursor = self._conn.execute("DELETE FROM outbox WHERE created_at < ?", (time.time() - self.max_age_sec,))
+            evicted += cursor.rowcount
+            self._pending -= cursor.rowcount
+        if self.max_events > 0 and self._pending > self.max_events:
+            cursor = self._conn.execute(
+                "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)",
+                (self._pending - self.max_events,)
+            )
+            evicted += cursor.rowcount
+            self._pending -= cursor.rowcount
+        if evicted > 0:
+            self.evicted_count += evicted
+            logger.warning(f"事件寄件匣超出限制，已丟棄 {evicted} 個最舊的事件。")
+
+    def peek(self, limit: int, exclude_ids: Optional[Set[int]] = None) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """
+        依寫入順序取得待發布的事件 (不移除)。
+        Args:
+            limit (int): 最多返回的數量。
+            exclude_ids (Set[int], optional): 要略過的事件 ID (例如正在發布中的事件)。
+        Returns:
+            List[Tuple[int, str, Dict[str, Any]]]: (ID, 事件類型, Payload) 列表。
+        """
+        exclude_ids = exclude_ids or set()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, event_type, payload FROM outbox ORDER BY id LIMIT ?",
+                (limit + len(exclude_ids),)
+            ).fetchall()
+        events = []
+        for event_id, event_type, payload_json in rows:
+            if event_id in exclude_ids:
+                continue
+            try:
+                events.append((event_id, event_type, json.loads(payload_json)))
+            except json.JSONDecodeError:
+                logger.error(f"寄件匣中的事件 {event_id} 無法解析，已移除。")
+                self.remove(event_id)
+            if len(events) >= limit:
+                break
+        return events
+
+    def remove(self, event_id: int):
+        """
+        移除已成功發布的事件。
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM outbox WHERE id = ?", (event_id,))
+            self.removed_count += cursor.rowcount
+            self._pending -= cursor.rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 待發布事件數量、總大小、最舊事件的存放秒數，以及追加/移除/丟棄計數。
+        """
+        with self._lock:
+            count, total_bytes, oldest = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0), MIN(created_at) FROM outbox"
+            ).fetchone()
+        return {
+            "pending": count,
+            "pending_bytes": total_bytes,
+            "oldest_age_sec": round(time.time() - oldest, 1) if oldest else 0.0,
+            "appended": self.appended_count,
+            "removed": self.removed_count,
+            "evicted": self.evicted_count,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -2,26 +2,53 @@
 
 import logging
 import json
-from typing import Dict, Any
+import time
+import threading
+from typing import Dict, Any, Optional, Set
+from concurrent.futures import Future
 from datetime import datetime
 from iot_client.aws_iot_client import AWSIoTClient # 引入 IoT 客戶端
+from events.event_outbox import EventOutbox
 
 logger = logging.getLogger(__name__)
 
 class EventPublisher:
     """
     負責將邊緣事件數據格式化並通過 AWS IoT Core 發布到雲端。
+    啟用寄件匣時，事件先寫入本地持久化寄件匣，再由發送執行緒依序發布，
+    連接中斷期間的事件會在連接恢復後依序補發 (有速率限制)，收到 PUBACK 後才從寄件匣移除。
     """
-    def __init__(self, iot_client: AWSIoTClient, thing_name: str):
+    def __init__(self, iot_client: AWSIoTClient, thing_name: str, outbox_settings: Optional[dict] = None):
         """
         初始化事件發布器。
         Args:
             iot_client (AWSIoTClient): AWS IoT 客戶端實例。
             thing_name (str): 設備 (Thing) 名稱。
+            outbox_settings (dict, optional): 寄件匣設定 (config.events.outbox)。未提供或 enabled 為 false 時不使用寄件匣。
         """
         self.iot_client = iot_client
         self.thing_name = thing_name
 
+        outbox_settings = outbox_settings or {}
+        self.outbox: Optional[EventOutbox] = None
+        if outbox_settings.get('enabled', False):
+            self.outbox = EventOutbox(outbox_settings)
+
+        self.replay_rate_per_sec = float(outbox_settings.get('replay_rate_per_sec', 10))
+        self.max_in_flight = int(outbox_settings.get('max_in_flight', 5))
+        self._in_flight: Set[int] = set()
+        self._in_flight_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._retry_not_before = 0.0 # 發布失敗後暫停補發直到此時間 (monotonic)
+        self._sender_thread = None
+
+        if self.outbox is not None:
+            # 連接恢復後立即喚醒發送執行緒補發寄件匣中的事件
+            self.iot_client.add_connection_resumed_callback(self._on_connection_resumed)
+            self._sender_thread = threading.Thread(target=self._sender_loop, name="event-outbox-sender", daemon=True)
+            self._sender_thread.start()
+
     def publish_event(self, event_type: str, s3_image_path: str = None, metadata: Dict[str, Any] = None):
         """
         發布一個邊緣事件到 AWS IoT Core。
@@ -42,6 +69,21 @@ class EventPublisher:
             "metadata": metadata # 附加額外的元數據 (例如偵測信心度、邊界框、QR Code 內容等)
         }
 
+        if self.outbox is not None:
+            # 先寫入寄件匣，由發送執行緒依序發布 (連接斷開時會保留到連接恢復)
+            try:
+                self.outbox.append(event_type, event_payload)
+            except Exception as e:
+                logger.error(f"寫入事件寄件匣失敗，改為直接發布事件 '{event_type}': {e}", exc_info=True)
+                self._publish_direct(event_type, event_payload)
+                return
+            logger.info(f"已將事件 '{event_type}' 寫入寄件匣。")
+            self._wake_event.set()
+            return
+
+        self._publish_direct(event_type, event_payload)
+
+    def _publish_direct(self, event_type: str, event_payload: Dict[str, Any]):
         # 檢查 IoT 客戶端連接狀態再發布
         if self.iot_client.is_connected():
             # publish_event 方法會返回 Future，這裡選擇不阻塞等待結果
@@ -49,4 +91,89 @@ class EventPublisher:
             logger.info(f"已提交事件 '{event_type}' 到發布佇列。")
         else:
             logger.warning(f"AWS IoT Core 連接斷開，無法發布事件 '{event_type}'。")
-            # 可以在這裡添加將事件暫存到本地的邏輯，待連接恢復後發送 (需要更複雜的狀態管理)
\ No newline at end of file
+
+    def _on_connection_resumed(self):
+        self._wake_event.set()
+
+    def _sender_loop(self):
+        """
+        寄件匣發送執行緒：連接可用時依寫入順序發布寄件匣中的事件。
+        """
+        min_interval = 1.0 / self.replay_rate_per_sec if self.replay_rate_per_sec > 0 else 0.0
+        last_send_time = 0.0
+        while not self._stop_event.is_set():
+            # 定期輪詢連接狀態，避免錯過連接恢復的通知
+            self._wake_event.wait(timeout=5.0)
+            self._wake_event.clear()
+
+            while not self._stop_event.is_set() and self.iot_client.is_connected():
+                if time.monotonic() < self._retry_not_before:
+                    break
+                with self._in_flight_lock:
+                    available = self.max_in_flight - len(self._in_flight)
+                    exclude = set(self._in_flight)
+                if available <= 0:
+                    # 等待發布中的事件完成 (完成回調會喚醒)
+                    self._wake_event.wait(timeout=1.0)
+                    self._wake_event.clear()
+                    continue
+
+                pending = self.outbox.peek(available, exclude_ids=exclude)
+                if not pending:
+                    break
+
+                for event_id, event_type, event_payload in pending:
+                    # 速率限制，避免連接恢復後瞬間送出大量積壓事件
+                    wait = min_interval - (time.monotonic() - last_send_time)
+                    if wait > 0 and self._stop_event.wait(wait):
+                        return
+                    if not self.iot_client.is_connected():
+                        break
+                    with self._in_flight_lock:
+                        self._in_flight.add(event_id)
+                    last_send_time = time.monotonic()
+                    future = self.iot_client.publish_event(event_payload)
+                    future.add_done_callback(
+                        lambda f, event_id=event_id, event_type=event_type: self._on_publish_done(event_id, event_type, f)
+                    )
+
+    def _on_publish_done(self, event_id: int, event_type: str, future: Future):
+        """
+        發布完成回調：成功時從寄件匣移除事件，失敗時保留以便稍後重試。
+        """
+        try:
+            future.result()
+            self.outbox.remove(event_id)
+            logger.debug(f"事件 '{event_type}' (寄件匣 ID {event_id}) 發布成功，已從寄件匣移除。")
+        except Exception as e:
+            logger.warning(f"事件 '{event_type}' (寄件匣 ID {event_id}) 發布失敗，保留在寄件匣中稍後重試: {e}")
+            self._retry_not_before = time.monotonic() + 5.0
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(event_id)
+            self._wake_event.set()
+
+    def get_outbox_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 寄件匣的大小與存放時間統計；未啟用寄件匣時為空字典。
+        """
+        if self.outbox is None:
+            return {}
+        metrics = self.outbox.get_metrics()
+        with self._in_flight_lock:
+            metrics["in_flight"] = len(self._in_flight)
+        return metrics
+
+    def close(self):
+        """
+        停止發送執行緒並關閉寄件匣 (未發布的事件保留到下次啟動)。
+        """
+        if self.outbox is None:
+            return
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._sender_thread is not None:
+            self._sender_thread.join(timeout=5.0)
+        self.outbox.close()
+        logger.info("事件寄件匣已關閉。")
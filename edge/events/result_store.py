@@ -0,0 +1,244 @@
+# events/result_store.py
+
+import time
+import logging
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RESULT_RECOGNITION = "recognition" # 雲端人臉識別結果
+RESULT_CARGO = "cargo"             # 雲端貨物處理結果
+
+NO_PERSON = "no_person"
+UNKNOWN_PERSON = "unknown"
+
+_EMPTY: Mapping = MappingProxyType({})
+
+
+def is_valid_person_id(person_id: Optional[str]) -> bool:
+    """
+    判斷識別結果的 Person ID 是否為有效身分 (排除 no_person、unknown 與 error_*)。
+    """
+    return bool(person_id) and person_id not in (NO_PERSON, UNKNOWN_PERSON) and not person_id.startswith("error_")
+
+
+class CloudResult:
+    """
+    一筆不可變的雲端結果 (建立後不再修改，可在執行緒之間自由共享)。
+    """
+    __slots__ = ("kind", "key", "camera_id", "timestamp", "data")
+
+    def __init__(self, kind: str, key: str, camera_id: str, timestamp: float, data: Dict[str, Any]):
+        """
+        Args:
+            kind (str): 結果類型 (RESULT_RECOGNITION 或 RESULT_CARGO)。
+            key (str): 結果的主鍵 (識別結果為 Person ID，貨物結果為貨物編號)。
+            camera_id (str): 產生原始事件的攝影機 (邊緣設備) ID。
+            timestamp (float): 收到結果的時間 (Unix 時間戳)。
+            data (Dict[str, Any]): 結果欄位 (會複製為唯讀映射)。
+        """
+        object.__setattr__(self, "kind", kind)
+        object.__setattr__(self, "key", key)
+        object.__setattr__(self, "camera_id", camera_id)
+        object.__setattr__(self, "timestamp", timestamp)
+        object.__setattr__(self, "data", MappingProxyType(dict(data)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CloudResult 為不可變物件。")
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.data.get(name, default)
+
+    def __repr__(self) -> str:
+        return f"CloudResult(kind={self.kind}, key={self.key}, camera={self.camera_id}, timestamp={self.timestamp:.2f})"
+
+
+class ResultSnapshot:
+    """
+    某一時刻所有雲端結果的不可變快照。寫入者每次建立新的快照並以單一參考替換，
+    讀取者取得快照後不需要任何鎖，也不會看到寫到一半的狀態。
+    """
+    __slots__ = ("version", "latest_recognition", "latest_cargo", "person_history", "camera_history")
+
+    def __init__(self, version: int = 0,
+                 latest_recognition: Optional[CloudResult] = None,
+                 latest_cargo: Optional[CloudResult] = None,
+                 person_history: Mapping[str, Tuple[CloudResult, ...]] = _EMPTY,
+                 camera_history: Mapping[str, Tuple[CloudResult, ...]] = _EMPTY):
+        self.version = version
+        self.latest_recognition = latest_recognition # 最新一筆識別結果 (不論是否為有效身分)
+        self.latest_cargo = latest_cargo # 最新一筆貨物處理結果
+        self.person_history = person_history # Person ID -> 該人員的識別結果 (由新到舊)
+        self.camera_history = camera_history # 攝影機 ID -> 該攝影機的識別結果 (由新到舊)
+
+
+class ResultStore:
+    """
+    雲端結果的寫時複製 (copy-on-write) 狀態儲存。
+    MQTT 回調 (寫入者) 之間以鎖序列化；每幀讀取的偵測器透過 snapshot 讀取，不需要取得鎖。
+    每個人員與每個攝影機保留少量依時間排序的歷史，可查詢「時間 t 時最近的有效身分」。
+    """
+    def __init__(self, store_settings: Optional[dict] = None, default_camera_id: str = "default"):
+        """
+        初始化結果儲存。
+        Args:
+            store_settings (dict, optional): 設定 (config.events.result_store)，包含 history_size, max_persons。
+            default_camera_id (str): 結果中未包含 camera_id 時使用的攝影機 ID (通常為 Thing Name)。
+        """
+        store_settings = store_settings or {}
+        self.history_size = max(1, int(store_settings.get('history_size', 8))) # 每個人員/攝影機保留的結果數量
+        self.max_persons = max(1, int(store_settings.get('max_persons', 256))) # 最多保留歷史的人員數量
+        self.default_camera_id = default_camera_id
+        self._write_lock = threading.Lock()
+        self._snapshot = ResultSnapshot()
+        self._listeners: List[Callable[[CloudResult], None]] = []
+
+    @property
+    def snapshot(self) -> ResultSnapshot:
+        """
+        當前快照 (讀取單一屬性參考是原子操作，不需要鎖)。
+        """
+        return self._snapshot
+
+    def add_listener(self, callback: Callable[[CloudResult], None]):
+        """
+        註冊結果監聽器 (例如錄製器)，每筆結果寫入快照後在寫入者的執行緒中調用 (不持有鎖)。
+        Args:
+            callback (Callable[[CloudResult], None]): 接收寫入的結果。
+        """
+        self._listeners.append(callback)
+
+    def update_recognition(self, result_data: Dict[str, Any], received_at: Optional[float] = None) -> CloudResult:
+        """
+        寫入一筆雲端人臉識別結果。
+        Args:
+            result_data (Dict[str, Any]): 解析後的識別結果 Payload。
+            received_at (float, optional): 收到結果的時間。Defaults to time.time().
+        Returns:
+            CloudResult: 寫入的結果。
+        """
+        person_id = result_data.get("person_id", NO_PERSON) # 如果 Payload 中沒有 person_id，設為 no_person
+        camera_id = result_data.get("camera_id") or self.default_camera_id
+        result = CloudResult(RESULT_RECOGNITION, person_id, camera_id,
+                             received_at if received_at is not None else time.time(), {
+            "person_id": person_id,
+            "original_event_timestamp": result_data.get("original_timestamp", 0), # 邊緣事件的時間戳 (保持原始格式)
+            "match_confidence": result_data.get("match_confidence"),
+            "summary": result_data.get("summary"),
+            "face_bbox_rekognition": result_data.get("face_bbox_rekognition"), # 雲端識別人臉
+            "if_violation": result_data.get("if_violation"),
+            "violation_description": result_data.get("violation_description"),
+        })
+        return self.insert(result)
+
+    def update_cargo(self, result_data: Dict[str, Any], received_at: Optional[float] = None) -> CloudResult:
+        """
+        寫入一筆雲端貨物處理結果。
+        Args:
+            result_data (Dict[str, Any]): 解析後的貨物處理結果 Payload。
+            received_at (float, optional): 收到結果的時間。Defaults to time.time().
+        Returns:
+            CloudResult: 寫入的結果。
+        """
+        cargo_id_data = result_data.get("cargo_number", "no_cargo_number")
+        camera_id = result_data.get("camera_id") or self.default_camera_id
+        result = CloudResult(RESULT_CARGO, cargo_id_data, camera_id,
+                             received_at if received_at is not None else time.time(), {
+            "cargo_id_data": cargo_id_data,
+            "related_person_id": result_data.get("related_person_id", NO_PERSON),
+            "proposed_location": result_data.get("proposed_location", "pending_assignment"), # 入庫位置
+            "extraction_method": result_data.get("extraction_method"), # 提取方法
+            "bedrock_summary_preview": result_data.get("bedrock_summary_preview"), # Bedrock 摘要
+        })
+        return self.insert(result)
+
+    def insert(self, result: CloudResult) -> CloudResult:
+        """
+        將已建立的結果寫入新的快照並通知監聽器 (update_* 與重播錄製檔時使用)。
+        Args:
+            result (CloudResult): 識別結果或貨物處理結果。
+        Returns:
+            CloudResult: 寫入的結果。
+        """
+        if result.kind == RESULT_RECOGNITION:
+            self._insert_recognition(result)
+        elif result.kind == RESULT_CARGO:
+            self._insert_cargo(result)
+        else:
+            raise ValueError(f"未知的雲端結果類型: {result.kind}")
+        for listener in self._listeners:
+            try:
+                listener(result)
+            except Exception as e:
+                logger.error(f"雲端結果監聽器執行失敗: {e}", exc_info=True)
+        return result
+
+    def _insert_recognition(self, result: CloudResult):
+        person_id, camera_id = result.key, result.camera_id
+        with self._write_lock:
+            current = self._snapshot
+            camera_history = dict(current.camera_history)
+            camera_history[camera_id] = self._prepend(current.camera_history.get(camera_id, ()), result)
+
+            person_history = current.person_history
+            if is_valid_person_id(person_id):
+                person_history = dict(person_history)
+                person_history[person_id] = self._prepend(current.person_history.get(person_id, ()), result)
+                if len(person_history) > self.max_persons:
+                    # 移除最久沒有出現的人員
+                    oldest = min(person_history, key=lambda pid: person_history[pid][0].timestamp)
+                    del person_history[oldest]
+                person_history = MappingProxyType(person_history)
+
+            self._snapshot = ResultSnapshot(
+                current.version + 1, result, current.latest_cargo,
+                person_history, MappingProxyType(camera_history)
+            )
+        logger.debug(f"已更新識別結果快照：{result}")
+
+    def _insert_cargo(self, result: CloudResult):
+        with self._write_lock:
+            current = self._snapshot
+            self._snapshot = ResultSnapshot(
+                current.version + 1, current.latest_recognition, result,
+                current.person_history, current.camera_history
+            )
+        logger.debug(f"已更新貨物處理結果快照：{result}")
+
+    def _prepend(self, history: Tuple[CloudResult, ...], result: CloudResult) -> Tuple[CloudResult, ...]:
+        return (result,) + history[:self.history_size - 1]
+
+    def latest_recognition(self) -> Optional[CloudResult]:
+        return self._snapshot.latest_recognition
+
+    def latest_cargo(self) -> Optional[CloudResult]:
+        return self._snapshot.latest_cargo
+
+    def identity_at(self, timestamp: float, max_age_sec: float, camera_id: Optional[str] = None) -> Optional[CloudResult]:
+        """
+        查詢時間 timestamp 時最近的有效身分 (不會被之後的 unknown/no_person 結果覆蓋)。
+        Args:
+            timestamp (float): 查詢時間 (Unix 時間戳)。
+            max_age_sec (float): 結果的有效時間 (收到結果後多久內有效)。
+            camera_id (str, optional): 只查詢此攝影機的結果。Defaults to default_camera_id.
+        Returns:
+            Optional[CloudResult]: 在 [timestamp - max_age_sec, timestamp] 內收到的最新有效識別結果，沒有時為 None。
+        """
+        history = self._snapshot.camera_history.get(camera_id or self.default_camera_id, ())
+        for result in history: # 由新到舊
+            if result.timestamp > timestamp:
+                continue
+            if timestamp - result.timestamp > max_age_sec:
+                break
+            if is_valid_person_id(result.key):
+                return result
+        return None
+
+    def person_history(self, person_id: str) -> Tuple[CloudResult, ...]:
+        """
+        Returns:
+            Tuple[CloudResult, ...]: 該人員的識別結果 (由新到舊)。
+        """
+        return self._snapshot.person_history.get(person_id, ())
@@ -0,0 +1,396 @@
+# inference/backends.py
+
+import os
+import glob
+import shutil
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils import metrics
+
+# jetson-inference 只在 Jetson (JetPack) 上可用；其他平台改用 CPU 後端
+try:
+    import jetson.inference
+    import jetson.utils
+except ImportError:
+    jetson = None
+
+# ONNX Runtime 為可選依賴
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+
+class Detection:
+    """
+    與後端無關的偵測結果，屬性與 jetson.inference.detectNet 的 Detection 相同，
+    因此偵測器與繪圖函數可以不區分後端地使用 (Left/Top/Right/Bottom 為像素座標)。
+    """
+    __slots__ = ("ClassID", "Confidence", "Left", "Top", "Right", "Bottom")
+
+    def __init__(self, class_id: int, confidence: float, left: float, top: float, right: float, bottom: float):
+        self.ClassID = int(class_id)
+        self.Confidence = float(confidence)
+        self.Left = float(left)
+        self.Top = float(top)
+        self.Right = float(right)
+        self.Bottom = float(bottom)
+
+    @property
+    def Width(self) -> float:
+        return self.Right - self.Left
+
+    @property
+    def Height(self) -> float:
+        return self.Bottom - self.Top
+
+    @property
+    def Area(self) -> float:
+        return self.Width * self.Height
+
+    @property
+    def Center(self) -> Tuple[float, float]:
+        return ((self.Left + self.Right) / 2, (self.Top + self.Bottom) / 2)
+
+    def __repr__(self) -> str:
+        return (f"Detection(ClassID={self.ClassID}, Confidence={self.Confidence:.3f}, "
+                f"Left={self.Left:.1f}, Top={self.Top:.1f}, Right={self.Right:.1f}, Bottom={self.Bottom:.1f})")
+
+
+def scale_detections(detections: List[Any], scale: float) -> List[Detection]:
+    """
+    將偵測結果的座標乘以縮放比例 (例如從推論分辨率映射回攝影機原始分辨率)。
+    Args:
+        detections (List[Any]): 偵測結果 (具有 Left/Top/Right/Bottom/ClassID/Confidence 屬性)。
+        scale (float): 縮放比例。
+    Returns:
+        List[Detection]: 映射後的新偵測結果列表。
+    """
+    return [Detection(det.ClassID, det.Confidence, det.Left * scale, det.Top * scale,
+                      det.Right * scale, det.Bottom * scale) for det in detections]
+
+
+class InferenceBackend:
+    """
+    物件偵測推論後端的基類。
+    prepare_input 將攝影機的 BGR 幀轉換為後端需要的輸入格式 (例如 CUDA 影像)，
+    detect 在該輸入上執行偵測並返回具有 Detection 屬性的結果列表。
+    """
+    name = "base"
+    engine_cache: Optional[str] = None # 序列化引擎快取狀態："hit" (從快取載入)、"miss" (重新建置並寫入快取) 或 None (未使用快取)
+
+    def prepare_input(self, frame_bgr: np.ndarray) -> Any:
+        """
+        Args:
+            frame_bgr (np.ndarray): 攝影機讀取的 BGR 幀 (HWC, uint8)。
+        Returns:
+            Any: 後端的模型輸入 (在管線中以 frame_cuda 的名稱傳遞給偵測器)。
+        """
+        raise NotImplementedError("Subclass must implement abstract method 'prepare_input'")
+
+    def detect(self, model_input: Any) -> List:
+        """
+        Args:
+            model_input (Any): prepare_input 返回的模型輸入。
+        Returns:
+            List: 偵測結果列表 (Detection 或屬性相同的物件)。
+        """
+        raise NotImplementedError("Subclass must implement abstract method 'detect'")
+
+
+class JetsonDetectNetBackend(InferenceBackend):
+    """
+    使用 jetson.inference.detectNet (TensorRT) 的 GPU 後端。
+    直接返回 detectNet 的 Detection 物件，屬性與 Detection 相同，不需轉換。
+    """
+    name = "jetson"
+
+    def __init__(self, model_config: dict):
+        """
+        Args:
+            model_config (dict): 模型設定 (config.models.object_detection)。
+        """
+        if jetson is None:
+            raise RuntimeError("jetson.inference 無法導入，請在 Jetson 裝置上使用或改用 CPU 後端 ('opencv' 或 'onnxruntime')。")
+        self._rgb: Optional[np.ndarray] = None # 預先配置的 RGB 轉換緩衝區 (cudaFromNumpy 會複製內容，可重複使用)
+
+        threshold = model_config.get('threshold')
+        built_in_name = model_config.get('built_in_model_name')
+        if built_in_name:
+            logger.info(f"載入內建物件偵測模型: '{built_in_name}', 閾值: {threshold}")
+            self.net = jetson.inference.detectNet(built_in_name, threshold=threshold)
+            logger.info(f"內建物件偵測模型 '{built_in_name}' 載入成功。")
+            return
+
+        model_file_path = model_config.get('model_file')
+        labels_file_path = model_config.get('labels_file')
+        if not model_file_path or not labels_file_path:
+            raise ValueError("Jetson 後端需要設定 'built_in_model_name' 或 'model_file' 和 'labels_file'。")
+        _check_files_exist(model_file_path, labels_file_path)
+
+        # 內建模型的引擎由 jetson-inference 快取在其 networks 目錄中；自訂模型的引擎另外保存到 engine_cache_dir，
+        # 重新部署或清除模型目錄後仍可直接反序列化，不需要重新建置 (建置 TensorRT 引擎可能需要數分鐘)。
+        # 引擎精度由 jetson-inference 依裝置選擇，快取的是它實際建置的引擎
+        cache_path = engine_cache_path(model_config, model_file_path, "engine")
+        if cache_path and cache_is_fresh(cache_path, model_file_path):
+            try:
+                self.net = self._load_net(model_config, cache_path, labels_file_path, threshold)
+                self.engine_cache = "hit"
+                logger.info(f"已從引擎快取載入物件偵測模型: {cache_path}")
+                return
+            except Exception as e:
+                logger.warning(f"無法從引擎快取 '{cache_path}' 載入模型，改為從模型檔案載入: {e}")
+
+        self.net = self._load_net(model_config, model_file_path, labels_file_path, threshold)
+        if cache_path:
+            self.engine_cache = "miss"
+            self._store_engine(model_file_path, cache_path)
+
+    @staticmethod
+    def _load_net(model_config: dict, model_path: str, labels_file_path: str, threshold: Optional[float]):
+        logger.info(f"載入物件偵測模型檔案: {model_path}, 標籤檔案: {labels_file_path}, 閾值: {threshold}")
+        net = jetson.inference.detectNet(
+            model=model_path, labels=labels_file_path, threshold=threshold,
+            input_blob=model_config.get('input_blob'), output_cvg=model_config.get('output_cvg'),
+            output_bbox=model_config.get('output_bbox')
+        )
+        logger.info(f"物件偵測模型檔案 '{model_path}' 載入成功。")
+        return net
+
+    @staticmethod
+    def _store_engine(model_file_path: str, cache_path: str):
+        """
+        將 jetson-inference 在模型檔案旁建置的 TensorRT 引擎 (<model_file>.*.engine，不早於模型檔案的最新一個) 複製到引擎快取。
+        """
+        candidates = [path for path in glob.glob(f"{glob.escape(model_file_path)}.*.engine")
+                      if cache_is_fresh(path, model_file_path)]
+        if not candidates:
+            logger.warning(f"找不到 jetson-inference 為 '{model_file_path}' 建置的引擎檔案，未寫入引擎快取。")
+            return
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            shutil.copy2(max(candidates, key=os.path.getmtime), cache_path)
+            logger.info(f"TensorRT 引擎已寫入快取: {cache_path}")
+        except OSError as e:
+            logger.warning(f"無法寫入引擎快取 '{cache_path}': {e}")
+
+    def prepare_input(self, frame_bgr: np.ndarray) -> Any:
+        # jetson.utils.cudaFromNumpy 需要 RGB
+        with metrics.timed("color_convert"):
+            if self._rgb is None or self._rgb.shape != frame_bgr.shape:
+                self._rgb = np.empty_like(frame_bgr)
+            cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        with metrics.timed("cuda_upload"):
+            return jetson.utils.cudaFromNumpy(self._rgb)
+
+    def detect(self, model_input: Any) -> List:
+        return self.net.Detect(model_input)
+
+
+class OpenCVDnnBackend(InferenceBackend):
+    """
+    使用 OpenCV DNN 在 CPU 上執行 SSD 系列偵測模型 (例如 TensorFlow 的 SSD-MobileNet
+    frozen_inference_graph.pb + .pbtxt，或 ONNX 匯出的 SSD 模型)。
+    類別 ID 與 jetson-inference 的 COCO SSD-MobileNet 相同 (0 為背景)，因此可共用 class_mapping。
+    """
+    name = "opencv"
+
+    def __init__(self, model_config: dict):
+        """
+        Args:
+            model_config (dict): 模型設定，使用 model_file、config_file、input_size、
+                                 input_scale、input_mean、swap_rb、threshold、nms_threshold。
+        """
+        model_file_path = model_config.get('model_file')
+        config_file_path = model_config.get('config_file', '')
+        if not model_file_path:
+            raise ValueError("OpenCV DNN 後端需要設定 'model_file' (以及 TensorFlow 模型的 'config_file')。")
+        _check_files_exist(model_file_path, *([config_file_path] if config_file_path else []))
+
+        self.threshold = float(model_config.get('threshold', 0.5))
+        self.nms_threshold = float(model_config.get('nms_threshold', 0.45))
+        input_width, input_height = model_config.get('input_size', [300, 300])
+
+        logger.info(f"載入 OpenCV DNN 物件偵測模型: {model_file_path}, 閾值: {self.threshold}")
+        self.model = cv2.dnn_DetectionModel(model_file_path, config_file_path)
+        self.model.setInputParams(
+            size=(int(input_width), int(input_height)),
+            scale=float(model_config.get('input_scale', 1.0 / 127.5)),
+            mean=tuple(model_config.get('input_mean', [127.5, 127.5, 127.5])),
+            swapRB=bool(model_config.get('swap_rb', True))
+        )
+        self.model.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.model.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        logger.info(f"OpenCV DNN 物件偵測模型 '{model_file_path}' 載入成功。")
+
+    def prepare_input(self, frame_bgr: np.ndarray) -> Any:
+        # 縮放與色彩轉換在 detect 內部的 blob 建立中一次完成
+        return frame_bgr
+
+    def detect(self, model_input: Any) -> List:
+        class_ids, confidences, boxes = self.model.detect(model_input, confThreshold=self.threshold,
+                                                          nmsThreshold=self.nms_threshold)
+        if len(class_ids) == 0:
+            return []
+        return [
+            Detection(class_id, confidence, x, y, x + w, y + h)
+            for class_id, confidence, (x, y, w, h) in zip(np.ravel(class_ids), np.ravel(confidences), boxes)
+        ]
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    使用 ONNX Runtime 在 CPU 上執行 jetson-inference 訓練腳本 (pytorch-ssd) 匯出的
+    SSD-MobileNet ONNX 模型，即 Jetson 後端以 model_file/input_blob/output_cvg/output_bbox 載入的同一模型。
+    模型輸出每個先驗框的類別分數 (scores) 與正規化角點座標 (boxes)，在此進行閾值過濾與逐類別 NMS。
+    """
+    name = "onnxruntime"
+
+    def __init__(self, model_config: dict):
+        """
+        Args:
+            model_config (dict): 模型設定，使用 model_file、input_blob、output_cvg、output_bbox、
+                                 input_size、input_mean、input_std、threshold、nms_threshold、num_threads。
+        """
+        if onnxruntime is None:
+            raise RuntimeError("onnxruntime 無法導入，請安裝 onnxruntime 或改用 'opencv' 後端。")
+        model_file_path = model_config.get('model_file')
+        if not model_file_path:
+            raise ValueError("ONNX Runtime 後端需要設定 'model_file'。")
+        _check_files_exist(model_file_path)
+
+        self.threshold = float(model_config.get('threshold', 0.5))
+        self.nms_threshold = float(model_config.get('nms_threshold', 0.45))
+        input_width, input_height = model_config.get('input_size', [300, 300])
+        self.input_size = (int(input_width), int(input_height))
+        self.input_mean = np.array(model_config.get('input_mean', [127.0, 127.0, 127.0]), dtype=np.float32)
+        self.input_std = float(model_config.get('input_std', 128.0))
+
+        options = onnxruntime.SessionOptions()
+        num_threads = int(model_config.get('num_threads', 0))
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+
+        # 引擎快取保存圖優化後的 ORT 格式模型，之後啟動時直接載入，省去解析與圖優化
+        cache_path = engine_cache_path(model_config, model_file_path, "ort")
+        self.session = None
+        if cache_path and cache_is_fresh(cache_path, model_file_path):
+            try:
+                self.session = onnxruntime.InferenceSession(cache_path, sess_options=options,
+                                                            providers=["CPUExecutionProvider"])
+                self.engine_cache = "hit"
+                logger.info(f"已從引擎快取載入 ONNX Runtime 物件偵測模型: {cache_path}")
+            except Exception as e:
+                self.session = None
+                logger.warning(f"無法從引擎快取 '{cache_path}' 載入模型，改為從模型檔案載入: {e}")
+        if self.session is None:
+            if cache_path:
+                os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+                options.optimized_model_filepath = cache_path
+                options.add_session_config_entry("session.save_model_format", "ORT")
+                self.engine_cache = "miss"
+            logger.info(f"載入 ONNX Runtime 物件偵測模型: {model_file_path}, 閾值: {self.threshold}")
+            self.session = onnxruntime.InferenceSession(model_file_path, sess_options=options,
+                                                        providers=["CPUExecutionProvider"])
+        self.input_name = model_config.get('input_blob') or self.session.get_inputs()[0].name
+        self.output_names = [
+            model_config.get('output_cvg') or self.session.get_outputs()[0].name,
+            model_config.get('output_bbox') or self.session.get_outputs()[1].name,
+        ]
+        logger.info(f"ONNX Runtime 物件偵測模型 '{model_file_path}' 載入成功。")
+
+    def prepare_input(self, frame_bgr: np.ndarray) -> Any:
+        frame_h, frame_w = frame_bgr.shape[:2]
+        resized = cv2.resize(frame_bgr, self.input_size, interpolation=cv2.INTER_LINEAR)
+        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB).astype(np.float32)
+        rgb -= self.input_mean
+        rgb /= self.input_std
+        blob = np.ascontiguousarray(rgb.transpose(2, 0, 1)[np.newaxis]) # NCHW
+        return blob, (frame_w, frame_h)
+
+    def detect(self, model_input: Any) -> List:
+        blob, (frame_w, frame_h) = model_input
+        scores, boxes = self.session.run(self.output_names, {self.input_name: blob})
+        scores, boxes = scores[0], boxes[0] # [N, num_classes], [N, 4] (x1, y1, x2, y2，正規化座標)
+
+        # 略過背景類別 (0)，每個先驗框只保留分數最高的類別
+        class_ids = np.argmax(scores[:, 1:], axis=1) + 1
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences >= self.threshold
+        if not np.any(keep):
+            return []
+        class_ids, confidences, boxes = class_ids[keep], confidences[keep], boxes[keep]
+
+        pixel_boxes = boxes * np.array([frame_w, frame_h, frame_w, frame_h], dtype=np.float32)
+        xywh = np.column_stack([pixel_boxes[:, :2], pixel_boxes[:, 2:] - pixel_boxes[:, :2]])
+        indices = cv2.dnn.NMSBoxesBatched(xywh.tolist(), confidences.tolist(), class_ids.tolist(),
+                                          self.threshold, self.nms_threshold)
+        return [
+            Detection(class_ids[i], confidences[i], *pixel_boxes[i])
+            for i in np.ravel(indices)
+        ]
+
+
+BACKENDS: Dict[str, type] = {
+    JetsonDetectNetBackend.name: JetsonDetectNetBackend,
+    OpenCVDnnBackend.name: OpenCVDnnBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+}
+
+
+def create_backend(model_config: dict, backend_name: Optional[str] = None) -> InferenceBackend:
+    """
+    根據模型設定建立推論後端。與後端同名的子區塊 (例如 model_config['opencv']) 會覆蓋共用設定，
+    因此各後端可以使用各自格式的模型檔案。
+    Args:
+        model_config (dict): 模型設定 (config.models.object_detection)。
+        backend_name (str, optional): 後端名稱。預設為設定中的 backend ('jetson')。
+    Returns:
+        InferenceBackend: 已載入模型的推論後端。
+    """
+    backend_name = str(backend_name or model_config.get('backend', 'jetson')).lower()
+    backend_cls = BACKENDS.get(backend_name)
+    if backend_cls is None:
+        raise ValueError(f"未知的推論後端 '{backend_name}'，可用的後端: {', '.join(BACKENDS)}。")
+    backend_config = {key: value for key, value in model_config.items() if key not in BACKENDS}
+    backend_config.update(model_config.get(backend_name) or {})
+    return backend_cls(backend_config)
+
+
+def engine_cache_path(model_config: dict, model_file_path: str, extension: str) -> Optional[str]:
+    """
+    返回模型的序列化引擎快取路徑 (以模型檔案的絕對路徑為鍵，各後端以副檔名區分)。
+    Args:
+        model_config (dict): 模型設定 (使用 engine_cache_dir)。
+        model_file_path (str): 模型檔案路徑。
+        extension (str): 快取檔案的副檔名。
+    Returns:
+        Optional[str]: 快取路徑，未設定 engine_cache_dir 時為 None。
+    """
+    cache_dir = model_config.get('engine_cache_dir')
+    if not cache_dir:
+        return None
+    stem = os.path.splitext(os.path.basename(model_file_path))[0]
+    digest = hashlib.sha1(os.path.abspath(model_file_path).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{stem}-{digest}.{extension}")
+
+
+def cache_is_fresh(cache_path: str, model_file_path: str) -> bool:
+    """
+    Returns:
+        bool: 快取檔案存在且不早於模型檔案 (模型更新後快取失效，會重新建置)。
+    """
+    return os.path.isfile(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(model_file_path)
+
+
+def _check_files_exist(*paths: str):
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"模型相關檔案不存在: {missing}")
@@ -0,0 +1,159 @@
+# inference/detection_table.py
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 每一列為一個偵測結果
+DETECTION_DTYPE = np.dtype([
+    ('class_id', np.int32),     # 模型原始類別 ID
+    ('class_idx', np.int16),    # 在 ClassIndex.class_names 中的索引 (-1 表示不在 class_mapping 中)
+    ('confidence', np.float32),
+    ('bbox', np.float32, (4,)), # [x1, y1, x2, y2] (像素)
+    ('center', np.float32, (2,)),
+    ('track_id', np.int32),     # 追蹤 ID (-1 表示未追蹤)
+])
+
+
+class ClassIndex:
+    """
+    class_mapping (模型類別 ID -> 內部類別名稱) 的向量化查找表，只在啟動時建立一次。
+    """
+    def __init__(self, class_mapping: Dict[int, str]):
+        """
+        Args:
+            class_mapping (Dict[int, str]): 模型原始類別 ID 到內部類別名稱的映射。
+        """
+        self.class_mapping = {int(class_id): name for class_id, name in (class_mapping or {}).items()}
+        self.class_names: List[str] = sorted(set(self.class_mapping.values()))
+        name_to_idx = {name: idx for idx, name in enumerate(self.class_names)}
+        max_id = max(self.class_mapping.keys(), default=-1)
+        self._lookup = np.full(max_id + 2, -1, dtype=np.int16) # 最後一格用於超出範圍的 ID
+        for class_id, name in self.class_mapping.items():
+            if class_id >= 0:
+                self._lookup[class_id] = name_to_idx[name]
+
+    def map_ids(self, class_ids: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            class_ids (np.ndarray): 模型原始類別 ID 陣列。
+        Returns:
+            np.ndarray: 對應的類別索引陣列 (不在映射中為 -1)。
+        """
+        out_of_range = len(self._lookup) - 1
+        safe_ids = np.where((class_ids >= 0) & (class_ids < out_of_range), class_ids, out_of_range)
+        return self._lookup[safe_ids]
+
+    def indices_for(self, class_names: Iterable[str]) -> np.ndarray:
+        """
+        Args:
+            class_names (Iterable[str]): 內部類別名稱。
+        Returns:
+            np.ndarray: 這些類別的索引 (忽略不在映射中的名稱)。
+        """
+        wanted = set(class_names)
+        return np.array([idx for idx, name in enumerate(self.class_names) if name in wanted], dtype=np.int16)
+
+    def name_of(self, class_idx: int) -> Optional[str]:
+        return self.class_names[class_idx] if 0 <= class_idx < len(self.class_names) else None
+
+
+class DetectionTable:
+    """
+    每幀只建立一次的結構化偵測結果表 (NumPy structured array)。
+    偵測器以布林遮罩完成類別過濾與幾何判斷，不需在 Python 中逐一迴圈與查字典。
+    detections 保留原始偵測物件，順序與表中的列相同。
+    """
+    __slots__ = ("records", "detections", "class_index")
+
+    def __init__(self, records: np.ndarray, detections: Sequence[Any], class_index: ClassIndex):
+        self.records = records
+        self.detections = detections
+        self.class_index = class_index
+
+    @classmethod
+    def from_detections(cls, detections: Optional[Sequence[Any]], class_index: ClassIndex) -> "DetectionTable":
+        """
+        將偵測結果列表轉換為偵測結果表。
+        Args:
+            detections (Sequence[Any]): 偵測結果 (具有 Left/Top/Right/Bottom/ClassID/Confidence 屬性)。
+            class_index (ClassIndex): 類別查找表。
+        Returns:
+            DetectionTable: 偵測結果表。
+        """
+        detections = [det for det in (detections or []) if det is not None]
+        records = np.zeros(len(detections), dtype=DETECTION_DTYPE)
+        if detections:
+            raw = np.array(
+                [(det.ClassID, det.Confidence, det.Left, det.Top, det.Right, det.Bottom) for det in detections],
+                dtype=np.float32
+            )
+            records['class_id'] = raw[:, 0]
+            records['confidence'] = raw[:, 1]
+            records['bbox'] = raw[:, 2:6]
+            records['center'] = (raw[:, 2:4] + raw[:, 4:6]) / 2
+            records['class_idx'] = class_index.map_ids(records['class_id'])
+        records['track_id'] = -1
+        return cls(records, detections, class_index)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def bboxes(self) -> np.ndarray:
+        return self.records['bbox']
+
+    @property
+    def centers(self) -> np.ndarray:
+        return self.records['center']
+
+    @property
+    def confidences(self) -> np.ndarray:
+        return self.records['confidence']
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        return self.records['track_id']
+
+    def class_mask(self, class_names: Iterable[str]) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: 屬於指定內部類別的列的布林遮罩。
+        """
+        return np.isin(self.records['class_idx'], self.class_index.indices_for(class_names))
+
+    def center_in_rect_mask(self, rect: Optional[Sequence[float]]) -> np.ndarray:
+        """
+        Args:
+            rect (Sequence[float]): 矩形 [x1, y1, x2, y2]；未提供時全部為 True。
+        Returns:
+            np.ndarray: 中心點在矩形內 (含邊界) 的列的布林遮罩。
+        """
+        if not rect:
+            return np.ones(len(self.records), dtype=bool)
+        centers = self.records['center']
+        return ((centers[:, 0] >= rect[0]) & (centers[:, 0] <= rect[2]) &
+                (centers[:, 1] >= rect[1]) & (centers[:, 1] <= rect[3]))
+
+    def select(self, mask: np.ndarray) -> "DetectionTable":
+        """
+        Args:
+            mask (np.ndarray): 布林遮罩或索引陣列。
+        Returns:
+            DetectionTable: 只包含選取列的新表。
+        """
+        indices = np.flatnonzero(mask) if mask.dtype == bool else mask
+        return DetectionTable(self.records[indices], [self.detections[i] for i in indices], self.class_index)
+
+    def bbox_of(self, row: int) -> List[int]:
+        """
+        Returns:
+            List[int]: 第 row 列的整數邊界框 [x1, y1, x2, y2]。
+        """
+        return [int(v) for v in self.records['bbox'][row]]
+
+    def class_name_of(self, row: int) -> Optional[str]:
+        return self.class_index.name_of(int(self.records['class_idx'][row]))
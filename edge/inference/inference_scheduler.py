@@ -0,0 +1,130 @@
+# inference/inference_scheduler.py
+
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceScheduler:
+    """
+    以運動量決定每一幀是否需要執行物件偵測推論。
+    在縮小的灰階幀上做幀差 (NumPy 向量化) 計算運動量：
+    畫面靜止時只以最低頻率推論，偵測到運動時立即切換為全速推論並維持一段時間 (burst)。
+    被略過的幀沿用最後一次的偵測結果。
+    """
+    def __init__(self, scheduler_settings: dict):
+        """
+        初始化推論排程器。
+        Args:
+            scheduler_settings (dict): 排程設定 (config.pipeline.scheduler)，包含
+                                       motion_width, pixel_delta_threshold, motion_threshold,
+                                       min_inference_interval_sec, burst_duration_sec。
+        """
+        self.motion_width = max(16, int(scheduler_settings.get('motion_width', 160)))
+        self.pixel_delta_threshold = int(scheduler_settings.get('pixel_delta_threshold', 25)) # 單一像素灰階變化超過此值才算變動
+        self.motion_threshold = float(scheduler_settings.get('motion_threshold', 0.01)) # 變動像素比例超過此值視為運動
+        self.min_inference_interval_sec = float(scheduler_settings.get('min_inference_interval_sec', 1.0)) # 靜止時的最低推論頻率
+        self.burst_duration_sec = float(scheduler_settings.get('burst_duration_sec', 3.0)) # 運動後維持全速推論的時間
+
+        self._lock = threading.Lock()
+        self._previous_gray: Optional[np.ndarray] = None
+        self._small_bgr: Optional[np.ndarray] = None # 預先配置的縮小幀緩衝區
+        self._small_gray: Optional[np.ndarray] = None
+        self._burst_until = 0.0
+        self._last_inference_time = 0.0
+        self._last_detections: List = []
+
+        self.last_motion_energy = 0.0
+        self.frame_count = 0
+        self.inferred_count = 0
+        self.motion_trigger_count = 0 # 從靜止進入全速推論的次數
+
+    def compute_motion_energy(self, frame_bgr: np.ndarray) -> float:
+        """
+        計算當前幀相對上一幀的運動量。
+        Args:
+            frame_bgr (np.ndarray): 攝影機讀取的 BGR 幀。
+        Returns:
+            float: 灰階變化超過 pixel_delta_threshold 的像素比例 (0.0 ~ 1.0)。第一幀返回 1.0。
+        """
+        h, w = frame_bgr.shape[:2]
+        small_size = (self.motion_width, max(1, int(h * self.motion_width / w)))
+        if self._small_bgr is None or self._small_bgr.shape[1::-1] != small_size:
+            self._small_bgr = np.empty((small_size[1], small_size[0], 3), dtype=np.uint8)
+            self._small_gray = np.empty((small_size[1], small_size[0]), dtype=np.uint8)
+            self._previous_gray = None
+
+        # 先縮小再轉灰階，只處理少量像素
+        cv2.resize(frame_bgr, small_size, dst=self._small_bgr, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small_bgr, cv2.COLOR_BGR2GRAY, dst=self._small_gray)
+
+        if self._previous_gray is None:
+            self._previous_gray = self._small_gray.copy()
+            return 1.0
+
+        diff = np.abs(self._small_gray.astype(np.int16) - self._previous_gray)
+        energy = float(np.count_nonzero(diff > self.pixel_delta_threshold)) / diff.size
+        np.copyto(self._previous_gray, self._small_gray)
+        return energy
+
+    def should_infer(self, frame_bgr: np.ndarray, timestamp: Optional[float] = None) -> bool:
+        """
+        判斷這一幀是否需要執行推論。
+        Args:
+            frame_bgr (np.ndarray): 攝影機讀取的 BGR 幀。
+            timestamp (float, optional): 幀的時間戳 (秒)。Defaults to time.time().
+        Returns:
+            bool: True 表示執行推論，False 表示沿用 last_detections。
+        """
+        now = timestamp if timestamp is not None else time.time()
+        with self._lock:
+            self.frame_count += 1
+            energy = self.compute_motion_energy(frame_bgr)
+            self.last_motion_energy = energy
+
+            if energy >= self.motion_threshold:
+                if now >= self._burst_until:
+                    self.motion_trigger_count += 1
+                    logger.debug(f"偵測到運動 (運動量 {energy:.3f})，切換為全速推論。")
+                self._burst_until = now + self.burst_duration_sec
+
+            infer = now < self._burst_until or now - self._last_inference_time >= self.min_inference_interval_sec
+            if infer:
+                self._last_inference_time = now
+                self.inferred_count += 1
+            return infer
+
+    def update_detections(self, detections: List):
+        """
+        記錄最近一次推論的偵測結果，供被略過的幀沿用。
+        """
+        with self._lock:
+            self._last_detections = detections
+
+    @property
+    def last_detections(self) -> List:
+        with self._lock:
+            return self._last_detections
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 總幀數、推論/略過幀數、略過比例、運動觸發次數與最近的運動量。
+        """
+        with self._lock:
+            skipped = self.frame_count - self.inferred_count
+            return {
+                "frames": self.frame_count,
+                "inferred": self.inferred_count,
+                "skipped": skipped,
+                "skip_ratio": round(skipped / self.frame_count, 3) if self.frame_count else 0.0,
+                "motion_triggers": self.motion_trigger_count,
+                "last_motion_energy": round(self.last_motion_energy, 4),
+                "in_burst": time.time() < self._burst_until,
+            }
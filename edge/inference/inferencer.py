@@ -1,11 +1,12 @@
 # inference/inferencer.py
 
-import jetson.utils
-import jetson.inference
 import logging
 import numpy as np
 from typing import List, Any # 引入類型提示
 
+from inference.backends import InferenceBackend
+from inference.detection_table import ClassIndex
+
 logger = logging.getLogger(__name__)
 
 class BaseInferencer:
@@ -16,20 +17,31 @@ class BaseInferencer:
         """
         初始化推論器。
         Args:
-            model: 載入的模型實例 (如 jetson.inference.detectNet)。
+            model: 載入的模型實例 (如 inference.backends 中的推論後端)。
             class_mapping (dict, optional): 模型原始類別 ID 到內部類別名稱的映射。Defaults to None.
         """
         if model is None:
             raise ValueError("Model cannot be None for Inferencer.")
         self.model = model
         self.class_mapping = class_mapping if class_mapping is not None else {}
+        self.class_index = ClassIndex(self.class_mapping) # 向量化的類別查找表 (用於建立 DetectionTable)
+
+    def prepare_input(self, frame_bgr: np.ndarray) -> Any:
+        """
+        將 BGR 幀轉換為模型輸入 (Jetson 後端為 CUDA 影像)。
+        Args:
+            frame_bgr (np.ndarray): 攝影機讀取的 BGR 幀。
+        Returns:
+            Any: 模型輸入。
+        """
+        return self.model.prepare_input(frame_bgr)
 
-    def infer(self, frame_cuda: jetson.utils.cudaImage) -> Any:
+    def infer(self, frame_cuda: Any) -> Any:
         """
-        在給定的 CUDA 影像上執行模型推論。
+        在給定的模型輸入上執行模型推論。
         這個方法應由子類實現。
         Args:
-            frame_cuda (jetson.utils.cudaImage): CUDA 影像數據。
+            frame_cuda (Any): prepare_input 返回的模型輸入 (Jetson 後端為 CUDA 影像)。
         Returns:
             Any: 推論結果。
         """
@@ -39,25 +51,25 @@ class ObjectDetector(BaseInferencer):
     """
     物件偵測模型推論器。
     """
-    def infer(self, frame_cuda: jetson.utils.cudaImage) -> List:
+    def infer(self, frame_cuda: Any) -> List:
         """
         執行物件偵測推論。
         Args:
-            frame_cuda (jetson.utils.cudaImage): CUDA 影像數據。
+            frame_cuda (Any): prepare_input 返回的模型輸入 (Jetson 後端為 CUDA 影像)。
         Returns:
-            List: 偵測結果列表。
+            List: 偵測結果列表 (具有 Left/Top/Right/Bottom/ClassID/Confidence 屬性)。
         """
-        if not isinstance(self.model, jetson.inference.detectNet):
-             logger.error("指定的模型不是 jetson.inference.detectNet 類型。")
+        if not isinstance(self.model, InferenceBackend):
+             logger.error("指定的模型不是推論後端 (InferenceBackend) 類型。")
              return []
-        return self.model.Detect(frame_cuda) # 執行偵測並返回結果
+        return self.model.detect(frame_cuda) # 執行偵測並返回結果
 
 # 可擴展其他推論器，例如：
 # class Classifier(BaseInferencer):
 #     """
 #     影像分類模型推論器。
 #     """
-#     def infer(self, frame_cuda: jetson.utils.cudaImage) -> Any: # 根據模型輸出類型調整返回類型
+#     def infer(self, frame_cuda: Any) -> Any: # 根據模型輸出類型調整返回類型
 #          # 執行分類推論的邏輯
 #          pass
 #
@@ -65,6 +77,6 @@ class ObjectDetector(BaseInferencer):
 #     """
 #     姿勢估計模型推論器。
 #     """
-#     def infer(self, frame_cuda: jetson.utils.cudaImage) -> Any: # 根據模型輸出類型調整返回類型
+#     def infer(self, frame_cuda: Any) -> Any: # 根據模型輸出類型調整返回類型
 #          # 執行姿勢估計推論的邏輯
 #          pass
\ No newline at end of file
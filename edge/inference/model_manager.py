@@ -1,8 +1,12 @@
 # inference/model_manager.py
 
-import jetson.inference
+import time
 import logging
-import os # 引入 os 模組用於路徑檢查
+from typing import Any, Dict
+
+import numpy as np
+
+from inference.backends import create_backend
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +22,7 @@ class ModelManager:
         """
         self.model_settings = model_settings
         self.models = {} # 字典存放載入的模型實例
+        self.timings: Dict[str, Dict[str, Any]] = {} # 各模型的載入與預熱時間
 
     def load_model(self, model_type: str):
         """
@@ -25,7 +30,7 @@ class ModelManager:
         Args:
             model_type (str): 模型類型名稱 (如 "object_detection")。
         Returns:
-            object: 載入的模型實例，如果設定中沒有該類型或載入失敗則為 None。
+            InferenceBackend: 載入的推論後端實例 (依設定中的 backend 選擇)，如果設定中沒有該類型或載入失敗則為 None。
         """
         # 確保模型類型是我們期望的字符串
         model_type_str = model_type if isinstance(model_type, str) else str(model_type)
@@ -35,51 +40,28 @@ class ModelManager:
             return None
 
         model_config = self.model_settings[model_type_str]
-        threshold = model_config.get('threshold')
-
-        net = None
 
         # 載入物件偵測模型 (只保留物件偵測)
         if model_type_str == "object_detection":
-             built_in_name = model_config.get('built_in_model_name')
-             if built_in_name:
-                 try:
-                     logger.info(f"載入內建物件偵測模型: '{built_in_name}', 閾值: {threshold}")
-                     net = jetson.inference.detectNet(built_in_name, threshold=threshold)
-                     logger.info(f"內建物件偵測模型 '{built_in_name}' 載入成功。")
-                     self.models[model_type_str] = net
-                     return net
-                 except Exception as e:
-                    logger.error(f"載入內建物件偵測模型 '{built_in_name}' 時發生錯誤: {e}", exc_info=True)
-                    return None
-             else:
-                 model_file_path = model_config.get('model_file')
-                 labels_file_path = model_config.get('labels_file')
-                 input_blob = model_config.get('input_blob')
-                 output_cvg = model_config.get('output_cvg')
-                 output_bbox = model_config.get('output_bbox')
-
-                 if not model_file_path or not labels_file_path:
-                      logger.error(f"模型類型 '{model_type_str}' 需要設定 'built_in_model_name' 或 'model_file' 和 'labels_file'。")
-                      return None
-
-                 if not os.path.exists(model_file_path) or not os.path.exists(labels_file_path):
-                     logger.error(f"模型或標籤檔案不存在 ('{model_file_path}', '{labels_file_path}')。")
-                     return None
-
+             backend_name = model_config.get('backend', 'jetson')
+             fallback_name = model_config.get('fallback_backend') # 主要後端無法載入時 (例如沒有 GPU) 改用的後端
+             for name in [backend_name] + ([fallback_name] if fallback_name and fallback_name != backend_name else []):
                  try:
-                     logger.info(f"載入物件偵測模型檔案: {model_file_path}, 標籤檔案: {labels_file_path}, 閾值: {threshold}")
-                     net = jetson_inference.detectNet(
-                         model=model_file_path, labels=labels_file_path, threshold=threshold,
-                         input_blob=input_blob, output_cvg=output_cvg, output_bbox=output_bbox
-                     )
-                     logger.info(f"物件偵測模型檔案 '{model_file_path}' 載入成功。")
+                     logger.info(f"使用推論後端 '{name}' 載入物件偵測模型。")
+                     start = time.perf_counter()
+                     net = create_backend(model_config, backend_name=name)
+                     load_sec = time.perf_counter() - start
                      self.models[model_type_str] = net
+                     self.timings[model_type_str] = {
+                         "backend": net.name,
+                         "engine_cache": net.engine_cache,
+                         "load_sec": round(load_sec, 3),
+                     }
+                     logger.info(f"物件偵測模型載入耗時 {load_sec:.2f} 秒 (後端: {net.name}，引擎快取: {net.engine_cache or '未使用'})。")
                      return net
                  except Exception as e:
-                     logger.error(f"載入物件偵測模型檔案 '{model_file_path}' 時發生錯誤: {e}", exc_info=True)
-                     return None
-
+                     logger.error(f"使用推論後端 '{name}' 載入物件偵測模型時發生錯誤: {e}", exc_info=True)
+             return None
 
         # 如果模型類型不是 object_detection，則報錯或警告
         else:
@@ -109,10 +91,72 @@ class ModelManager:
         return self.models.get(model_type_str)
 
 
+    def preload(self) -> bool:
+        """
+        啟動時載入設定中所有支援的模型並執行預熱推論，
+        使模型載入、引擎建置/反序列化與首次推論的初始化不會落在第一批實際幀上。
+        Returns:
+            bool: 所有設定的模型都載入成功時為 True。
+        """
+        success = True
+        for model_type in ("object_detection",):
+            if not self.model_settings.get(model_type):
+                continue
+            if self.get_model(model_type) is None:
+                success = False
+                continue
+            self.warm_up(model_type)
+        return success
+
+    def warm_up(self, model_type: str):
+        """
+        以空白幀執行數次推論 (設定中的 warmup.runs 與 warmup.frame_size)，並記錄首次與預熱後的推論時間。
+        Args:
+            model_type (str): 模型類型名稱 (如 "object_detection")。
+        """
+        model = self.models.get(model_type)
+        if model is None:
+            return
+        warmup_settings = (self.model_settings.get(model_type) or {}).get('warmup', {}) or {}
+        runs = int(warmup_settings.get('runs', 3))
+        if runs <= 0:
+            return
+        width, height = warmup_settings.get('frame_size', [1280, 720])
+        frame = np.zeros((int(height), int(width), 3), dtype=np.uint8)
+
+        durations = []
+        start = time.perf_counter()
+        try:
+            for _ in range(runs):
+                run_start = time.perf_counter()
+                model.detect(model.prepare_input(frame))
+                durations.append(time.perf_counter() - run_start)
+        except Exception as e:
+            logger.error(f"模型 '{model_type}' 預熱推論失敗: {e}", exc_info=True)
+        if not durations:
+            return
+        timings = self.timings.setdefault(model_type, {})
+        timings.update({
+            "warmup_runs": len(durations),
+            "warmup_sec": round(time.perf_counter() - start, 3),
+            "first_inference_ms": round(durations[0] * 1000, 2),
+            "warm_inference_ms": round(durations[-1] * 1000, 2),
+        })
+        logger.info(f"模型 '{model_type}' 預熱完成 ({len(durations)} 次)：首次推論 {timings['first_inference_ms']} ms，"
+                    f"預熱後 {timings['warm_inference_ms']} ms。")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 各模型的後端、引擎快取狀態、載入時間與預熱推論時間。
+        """
+        return {model_type: dict(timings) for model_type, timings in self.timings.items()}
+
     def unload_all_models(self):
         """
         卸載所有已載入的模型 (現在只用於物件偵測)。
         """
         logger.info("卸載所有模型。")
         self.models = {}
+        self.timings = {}
         logger.info("所有模型已卸載 (內部狀態已清除)。")
\ No newline at end of file
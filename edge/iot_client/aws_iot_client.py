@@ -10,7 +10,11 @@ import logging
 import threading
 import time # 添加 time 模組用於延遲或時間相關日誌
 from concurrent.futures import Future
-from typing import Dict, Any, Optional, Callable # 引入類型提示
+from typing import Dict, Any, Optional, Callable, List # 引入類型提示
+
+from iot_client.publish_batcher import PublishBatcher
+from utils import metrics
+from iot_client.topic_router import TopicRouter, TopicRoute, CallbackDispatcher
 
 # 配置 logging
 logger = logging.getLogger(__name__)
@@ -41,10 +45,33 @@ class AWSIoTClient:
         self.cargo_result_callback = cargo_result_callback # 保存貨物處理結果回調
 
         self.mqtt_connection = None
+        self._connection_resumed_callbacks: List[Callable[[], None]] = [] # 連接恢復時通知的回調 (例如事件寄件匣補發)
         self._is_connected = False
         self._connection_lock = threading.Lock()
         self._disconnect_requested = threading.Event()
 
+        # 訊息路由表 (Topic 只在初始化時解析一次) 與回調執行器 (回調不在 SDK 網路執行緒上執行)
+        self._router = TopicRouter()
+        self._route_qos: Dict[str, QoS] = {}
+        self._build_router()
+        event_topic_format = self.iot_settings.get('event_topic')
+        self._event_topic = event_topic_format.format(thing_name=self.iot_settings.get('thing_name', '')) if event_topic_format else None
+        telemetry_topic_format = self.iot_settings.get('telemetry_topic')
+        self._telemetry_topic = telemetry_topic_format.format(thing_name=self.iot_settings.get('thing_name', '')) if telemetry_topic_format else None
+        self._dispatcher = CallbackDispatcher(
+            num_workers=self.iot_settings.get('callback_workers', 2),
+            queue_maxsize=self.iot_settings.get('callback_queue_maxsize', 100)
+        )
+
+        # 可選：批次發布 (合併多個事件為一個陣列 Payload，高優先級事件仍單獨發布)
+        batching_settings = self.iot_settings.get('batching', {}) or {}
+        self._batcher: Optional[PublishBatcher] = None
+        self._priority_event_types = set(batching_settings.get('priority_event_types', []))
+        self._single_publish_count = 0
+        if batching_settings.get('enabled', False):
+            self._batcher = PublishBatcher(self._publish_raw, batching_settings)
+            self._batcher.start()
+
         self._connect()
 
     def _connect(self):
@@ -84,50 +111,16 @@ class AWSIoTClient:
                 self._disconnect_requested.clear()
             logger.info("成功連接到 AWS IoT Core!")
 
-            # 訂閱命令 Topic (如果設定了回調)
-            if self.command_callback:
-                command_topic_format = self.iot_settings.get('command_topic')
-                if not command_topic_format:
-                     logger.warning("設定中未指定命令 Topic 格式，跳過訂閱命令。")
-                else:
-                    command_topic = command_topic_format.format(thing_name=thing_name)
-                    logger.info(f"訂閱命令 Topic: {command_topic}")
-                    subscribe_future, packet_id = self.mqtt_connection.subscribe(
-                        topic=command_topic, qos=QoS.AT_LEAST_ONCE, callback=self._on_mqtt_message
-                    )
-                    logger.debug(f"等待訂閱完成 (最多 {SUBSCRIBE_TIMEOUT_SEC} 秒)...")
-                    subscribe_result = subscribe_future.result(timeout=SUBSCRIBE_TIMEOUT_SEC)
-                    logger.info(f"成功訂閱。Packet ID: {packet_id}, Result QoS: {subscribe_result.get('qos')}")
-
-            # 訂閱人臉識別結果 Topic (如果設定了回調)
-            if self.recognition_result_callback:
-                recognition_result_topic_format = self.iot_settings.get('result_topic') # 使用 'result_topic' for recognition result
-                if not recognition_result_topic_format:
-                     logger.warning("設定中未指定人臉識別結果 Topic 格式 ('result_topic')，跳過訂閱。")
-                else:
-                    recognition_result_topic = recognition_result_topic_format.format(thing_name=thing_name)
-                    logger.info(f"訂閱人臉識別結果 Topic: {recognition_result_topic}")
-                    subscribe_future, packet_id = self.mqtt_connection.subscribe(
-                        topic=recognition_result_topic, qos=QoS.AT_MOST_ONCE, callback=self._on_mqtt_message # QoS 0 for less critical result
-                    )
-                    logger.debug(f"等待訂閱完成 (最多 {SUBSCRIBE_TIMEOUT_SEC} 秒)...")
-                    subscribe_result = subscribe_future.result(timeout=SUBSCRIBE_TIMEOUT_SEC)
-                    logger.info(f"成功訂閱。Packet ID: {packet_id}, Result QoS: {subscribe_result.get('qos')}")
-
-            # 新增：訂閱貨物處理結果 Topic (如果設定了回調)
-            if self.cargo_result_callback:
-                cargo_result_topic_format = self.iot_settings.get('cargo_result_topic') # 使用 'cargo_result_topic' for cargo result
-                if not cargo_result_topic_format:
-                     logger.warning("設定中未指定貨物處理結果 Topic 格式 ('cargo_result_topic')，跳過訂閱。")
-                else:
-                    cargo_result_topic = cargo_result_topic_format.format(thing_name=thing_name)
-                    logger.info(f"訂閱貨物處理結果 Topic: {cargo_result_topic}")
-                    subscribe_future, packet_id = self.mqtt_connection.subscribe(
-                        topic=cargo_result_topic, qos=QoS.AT_MOST_ONCE, callback=self._on_mqtt_message # QoS 0 for less critical result
-                    )
-                    logger.debug(f"等待訂閱完成 (最多 {SUBSCRIBE_TIMEOUT_SEC} 秒)...")
-                    subscribe_result = subscribe_future.result(timeout=SUBSCRIBE_TIMEOUT_SEC)
-                    logger.info(f"成功訂閱。Packet ID: {packet_id}, Result QoS: {subscribe_result.get('qos')}")
+            # 訂閱路由表中的所有 Topic (命令、人臉識別結果、貨物處理結果)
+            for route in self._router.routes:
+                qos = self._route_qos.get(route.name, QoS.AT_MOST_ONCE)
+                logger.info(f"訂閱 {route.name} Topic: {route.topic_filter}")
+                subscribe_future, packet_id = self.mqtt_connection.subscribe(
+                    topic=route.topic_filter, qos=qos, callback=self._on_mqtt_message
+                )
+                logger.debug(f"等待訂閱完成 (最多 {SUBSCRIBE_TIMEOUT_SEC} 秒)...")
+                subscribe_result = subscribe_future.result(timeout=SUBSCRIBE_TIMEOUT_SEC)
+                logger.info(f"成功訂閱。Packet ID: {packet_id}, Result QoS: {subscribe_result.get('qos')}")
 
 
         except TimeoutError:
@@ -147,48 +140,58 @@ class AWSIoTClient:
             with self._connection_lock:
                  self._is_connected = False
 
+    def _build_router(self):
+        """
+        將設定中的 Topic 格式一次性解析為路由表 (收到訊息時只需查表，不再格式化字串)。
+        結果 Topic 可透過 result_thing_filter 使用萬用字元 (例如 "+")，以接收多個 Thing 的結果。
+        """
+        thing_name = self.iot_settings.get('thing_name', '')
+        result_thing = self.iot_settings.get('result_thing_filter') or thing_name
+        # 預設不合併：ResultStore 依人員/攝影機保存結果歷史，合併會遺失中間的識別結果
+        coalesce_results = self.iot_settings.get('coalesce_results', False)
+
+        route_specs = [
+            # (路由名稱, Topic 格式設定鍵, 回調, Thing 名稱, QoS, 是否只保留最新訊息)
+            ("command", 'command_topic', self.command_callback, thing_name, QoS.AT_LEAST_ONCE, False),
+            ("recognition_result", 'result_topic', self.recognition_result_callback, result_thing, QoS.AT_MOST_ONCE, coalesce_results), # QoS 0 for less critical result
+            ("cargo_result", 'cargo_result_topic', self.cargo_result_callback, result_thing, QoS.AT_MOST_ONCE, coalesce_results),
+        ]
+        for name, setting_key, callback, topic_thing, qos, coalesce in route_specs:
+            if not callback:
+                continue
+            topic_format = self.iot_settings.get(setting_key)
+            if not topic_format:
+                logger.warning(f"設定中未指定 {name} Topic 格式 ('{setting_key}')，跳過訂閱。")
+                continue
+            topic_filter = topic_format.format(thing_name=topic_thing)
+            self._router.add_route(TopicRoute(name, topic_filter, callback, coalesce=coalesce))
+            self._route_qos[name] = qos
+
     def _on_mqtt_message(self, topic: str, payload: bytes, **kwargs):
         """
-        內部回調函數，處理收到的 MQTT 訊息。
-        根據 Topic 判斷是命令、人臉識別結果還是貨物處理結果，並調用相應的回調函數。
+        內部回調函數，處理收到的 MQTT 訊息 (在 SDK 的網路執行緒上執行)。
+        以路由表查找 Topic 對應的回調，並交給回調執行器在工作執行緒上執行，避免阻塞網路執行緒。
         Args:
             topic (str): 收到訊息的 Topic。
             payload (bytes): 訊息的 Payload (Bytes 格式)。
         """
-        logger.info(f"收到 MQTT 訊息 - Topic: {topic}")
+        logger.debug(f"收到 MQTT 訊息 - Topic: {topic}")
         try:
-            payload_str = payload.decode('utf-8')
-
-            # 根據 Topic 判斷並調用回調
-            # 獲取 Topic 格式 (使用 .get() 提供預設值 None)
-            command_topic_format = self.iot_settings.get('command_topic', None)
-            recognition_result_topic_format = self.iot_settings.get('result_topic', None) # 使用 'result_topic'
-            cargo_result_topic_format = self.iot_settings.get('cargo_result_topic', None) # 使用 'cargo_result_topic'
-
-            thing_name = self.iot_settings.get('thing_name', '') # 獲取 thing_name 進行格式化比較
-
-            # 格式化 Topic 進行比較
-            command_topic_formatted = command_topic_format.format(thing_name=thing_name) if command_topic_format else None
-            recognition_result_topic_formatted = recognition_result_topic_format.format(thing_name=thing_name) if recognition_result_topic_format else None
-            cargo_result_topic_formatted = cargo_result_topic_format.format(thing_name=thing_name) if cargo_result_topic_format else None
-
-
-            if command_topic_formatted and topic == command_topic_formatted and self.command_callback:
-                 logger.debug("將訊息轉發給命令回調。")
-                 self.command_callback(topic, payload_str)
-            elif recognition_result_topic_formatted and topic == recognition_result_topic_formatted and self.recognition_result_callback:
-                 logger.debug("將訊息轉發給人臉識別結果回調。")
-                 self.recognition_result_callback(topic, payload_str)
-            # 新增：檢查是否是貨物處理結果 Topic
-            elif cargo_result_topic_formatted and topic == cargo_result_topic_formatted and self.cargo_result_callback:
-                 logger.debug("將訊息轉發給貨物處理結果回調。")
-                 self.cargo_result_callback(topic, payload_str)
-            else:
-                 logger.warning(f"收到未知 Topic 的訊息或未設定回調：{topic}")
-
+            route = self._router.resolve(topic)
+            if route is None:
+                logger.warning(f"收到未知 Topic 的訊息或未設定回調：{topic}")
+                return
+            self._dispatcher.submit(route, topic, payload)
         except Exception as e:
             logger.error(f"處理 MQTT 訊息或調用回調時發生錯誤: {e}", exc_info=True)
 
+    def get_dispatch_metrics(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: 回調執行器的待處理、已執行、丟棄與合併訊息數量。
+        """
+        return self._dispatcher.get_metrics()
+
     def _on_connection_interrupted(self, connection, error, **kwargs):
         """
         連接中斷時的回調函數。
@@ -211,13 +214,73 @@ class AWSIoTClient:
         # 連接恢復後，如果 clean_session=False，SDK 會自動重新訂閱之前的 Topic
         # 如果 clean_session=True，則需要手動在這裡重新訂閱
 
+        # 通知註冊的監聽者 (回調在 SDK 的網路執行緒上執行，應只做輕量操作)
+        for callback in list(self._connection_resumed_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"執行連接恢復回調時發生錯誤: {e}", exc_info=True)
+
+    def add_connection_resumed_callback(self, callback: Callable[[], None]):
+        """
+        註冊連接恢復時要調用的回調函數。
+        Args:
+            callback (Callable[[], None]): 無參數的回調函數。
+        """
+        self._connection_resumed_callbacks.append(callback)
+
     def publish_event(self, event_payload: Dict[str, Any]) -> Future:
         """
         將事件訊息發布到 AWS IoT Core 的事件 Topic。
+        啟用批次發布時，非高優先級的事件會加入批次，與其他事件合併為一個陣列 Payload 發布。
         Args:
             event_payload (Dict[str, Any]): 包含事件數據的字典。
         Returns:
-            Future: MQTT 發布操作的 Future 對象。可以選擇等待其結果。
+            Future: 此事件的發布 Future (收到 PUBACK 時完成)。可以選擇等待其結果。
+        """
+        if self._batcher is not None and event_payload.get("event_type") not in self._priority_event_types:
+            return self._batcher.submit(event_payload)
+
+        try:
+            payload_json = json.dumps(event_payload)
+        except Exception as e:
+            logger.error(f"序列化 MQTT 事件時發生錯誤: {e}", exc_info=True)
+            f = Future()
+            f.set_exception(e)
+            return f
+        self._single_publish_count += 1
+        return self._publish_raw(payload_json)
+
+    def publish_telemetry(self, payload: Dict[str, Any]) -> Future:
+        """
+        將遙測摘要發布到遙測 Topic (QoS 0，遺失一則摘要不需要重送)。
+        Args:
+            payload (Dict[str, Any]): 遙測數據。
+        Returns:
+            Future: MQTT 發布操作的 Future 對象。
+        """
+        if not self._telemetry_topic:
+            f = Future()
+            f.set_exception(ValueError("Telemetry topic format is not configured"))
+            return f
+        try:
+            payload_json = json.dumps(payload)
+        except Exception as e:
+            logger.error(f"序列化遙測數據時發生錯誤: {e}", exc_info=True)
+            f = Future()
+            f.set_exception(e)
+            return f
+        return self._publish_raw(payload_json, topic=self._telemetry_topic, qos=QoS.AT_MOST_ONCE)
+
+    def _publish_raw(self, payload_json: str, topic: Optional[str] = None, qos: QoS = QoS.AT_LEAST_ONCE) -> Future:
+        """
+        將已序列化的 Payload 發布到事件 Topic (或指定的 Topic)。
+        Args:
+            payload_json (str): JSON 字串 (單一事件物件或事件陣列)。
+            topic (str, optional): 目標 Topic。Defaults to 事件 Topic.
+            qos (QoS): QoS 等級。Defaults to QoS.AT_LEAST_ONCE.
+        Returns:
+            Future: MQTT 發布操作的 Future 對象。
         """
         with self._connection_lock:
             if not self._is_connected:
@@ -228,25 +291,27 @@ class AWSIoTClient:
                 return f
 
         try:
-            event_topic_format = self.iot_settings.get('event_topic')
-            if not event_topic_format:
+            event_topic = topic or self._event_topic
+            if not event_topic:
                  logger.error("設定中未指定事件 Topic 格式，無法發布事件。")
                  f = Future()
                  f.set_exception(ValueError("Event topic format is not configured"))
                  return f
 
-            event_topic = event_topic_format.format(thing_name=self.iot_settings['thing_name'])
-            payload_json = json.dumps(event_payload)
             # logger.debug(f"發布事件到 {event_topic}: {payload_json}") # DEBUG 級別輸出 Payload
 
-            # 發布訊息
-            publish_future = self.mqtt_connection.publish(
+            # 發布訊息 (awscrt 返回 (Future, packet_id))
+            publish_start = time.perf_counter()
+            publish_future, packet_id = self.mqtt_connection.publish(
                 topic=event_topic,
                 payload=payload_json,
                 # 修正：使用 QoS 枚舉
-                qos=QoS.AT_LEAST_ONCE # 設置 QoS 等級為 1
+                qos=qos # 事件為 QoS 1
             )
             logger.debug(f"已提交發布任務到 {event_topic}。")
+            if metrics.REGISTRY.enabled:
+                # 記錄從提交到 PUBACK (QoS 0 為寫出) 的時間
+                publish_future.add_done_callback(lambda f: self._record_publish_latency(f, publish_start))
             return publish_future
 
         except Exception as e:
@@ -256,6 +321,23 @@ class AWSIoTClient:
             f.set_exception(e)
             return f
 
+    @staticmethod
+    def _record_publish_latency(future: Future, publish_start: float):
+        if future.cancelled() or future.exception() is not None:
+            metrics.count_error("mqtt_publish")
+        else:
+            metrics.observe_stage("mqtt_publish", time.perf_counter() - publish_start)
+
+    def get_publish_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 單獨發布的事件數量，以及 (啟用時) 批次發布的吞吐量與延遲統計。
+        """
+        metrics = {"single_published": self._single_publish_count}
+        if self._batcher is not None:
+            metrics["batching"] = self._batcher.get_metrics()
+        return metrics
+
     def is_connected(self) -> bool:
         """
         檢查 MQTT 連接是否建立且處於活動狀態。
@@ -279,6 +361,11 @@ class AWSIoTClient:
         # 設置標誌表示是應用程式主動請求斷開
         self._disconnect_requested.set()
 
+        # 先送出批次器中剩餘的事件
+        if self._batcher is not None:
+            self._batcher.stop()
+            self._batcher.join(timeout=CONNECT_TIMEOUT_SEC)
+
         if self.mqtt_connection:
             try:
                 disconnect_future = self.mqtt_connection.disconnect()
@@ -292,6 +379,8 @@ class AWSIoTClient:
                      self._is_connected = False # 無論成功失敗，都將狀態設為 False
                 self.mqtt_connection = None # 清空連接實例
 
+        self._dispatcher.stop()
+
     # 可以添加一個方法來檢查是否是應用程式主動斷開
     # def is_disconnect_requested(self) -> bool:
     #     """
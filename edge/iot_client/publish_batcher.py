@@ -0,0 +1,146 @@
+# iot_client/publish_batcher.py
+
+import json
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PublishBatcher(threading.Thread):
+    """
+    將多個事件在一個時間窗口 (或數量上限) 內合併為一個 JSON 陣列 Payload 發布，
+    減少小封包與 PUBACK 往返次數。每個事件仍有自己的 Future，
+    在所屬批次的發布完成 (或失敗) 時一併完成，供呼叫者追蹤個別事件的送達。
+    """
+    def __init__(self, publish_raw: Callable[[str], Future], batching_settings: dict):
+        """
+        初始化發布批次器。
+        Args:
+            publish_raw (Callable[[str], Future]): 發布已序列化 Payload 到事件 Topic 的函數。
+            batching_settings (dict): 批次設定 (config.aws.iot.batching)。
+        """
+        super().__init__(name="mqtt-publish-batcher", daemon=True)
+        self._publish_raw = publish_raw
+        self.max_batch_size = max(1, int(batching_settings.get('max_batch_size', 20)))
+        self.max_wait_sec = max(0.0, float(batching_settings.get('max_wait_ms', 200)) / 1000.0)
+
+        self._pending: deque = deque() # (payload, future, enqueue_time)
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+        self._metrics_lock = threading.Lock()
+        self._start_time = time.monotonic()
+        self._events_sent = 0
+        self._events_failed = 0
+        self._batches_sent = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def submit(self, event_payload: Dict[str, Any]) -> Future:
+        """
+        將事件加入目前的批次。
+        Args:
+            event_payload (Dict[str, Any]): 事件數據。
+        Returns:
+            Future: 此事件的送達 Future (批次收到 PUBACK 時完成)。
+        """
+        future = Future()
+        with self._cond:
+            self._pending.append((event_payload, future, time.monotonic()))
+            if len(self._pending) >= self.max_batch_size:
+                self._cond.notify()
+            elif len(self._pending) == 1:
+                self._cond.notify() # 開始新批次的計時
+        return future
+
+    def run(self):
+        logger.info(f"MQTT 發布批次器啟動 (最多 {self.max_batch_size} 個事件 / {self.max_wait_sec * 1000:.0f} ms)。")
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._send_batch(batch)
+        # 停止前送出剩餘事件
+        with self._cond:
+            remaining = list(self._pending)
+            self._pending.clear()
+        if remaining:
+            self._send_batch(remaining)
+        logger.info("MQTT 發布批次器已終止。")
+
+    def _collect_batch(self) -> List[Tuple[Dict[str, Any], Future, float]]:
+        with self._cond:
+            while not self._pending and not self._stop_event.is_set():
+                self._cond.wait(timeout=1.0)
+            if not self._pending:
+                return []
+            # 等待批次填滿或第一個事件的等待時間到期
+            deadline = self._pending[0][2] + self.max_wait_sec
+            while len(self._pending) < self.max_batch_size and not self._stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+            count = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _send_batch(self, batch: List[Tuple[Dict[str, Any], Future, float]]):
+        try:
+            payload_json = json.dumps([payload for payload, _, _ in batch])
+            publish_future = self._publish_raw(payload_json)
+        except Exception as e:
+            publish_future = Future()
+            publish_future.set_exception(e)
+        publish_future.add_done_callback(lambda f: self._on_batch_done(batch, f))
+
+    def _on_batch_done(self, batch: List[Tuple[Dict[str, Any], Future, float]], publish_future: Future):
+        error = publish_future.exception()
+        now = time.monotonic()
+        with self._metrics_lock:
+            if error is None:
+                self._batches_sent += 1
+                self._events_sent += len(batch)
+                for _, _, enqueue_time in batch:
+                    latency = now - enqueue_time
+                    self._total_latency += latency
+                    if latency > self._max_latency:
+                        self._max_latency = latency
+            else:
+                self._events_failed += len(batch)
+
+        if error is not None:
+            logger.warning(f"批次發布 {len(batch)} 個事件失敗: {error}")
+        for _, future, _ in batch:
+            if error is None:
+                future.set_result(publish_future.result())
+            else:
+                future.set_exception(error)
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 已送達/失敗事件數、批次數、平均批次大小、吞吐量 (事件/秒)
+                            與從加入批次到收到 PUBACK 的平均/最大延遲 (毫秒)。
+        """
+        with self._metrics_lock:
+            elapsed = time.monotonic() - self._start_time
+            sent = self._events_sent
+            return {
+                "events_sent": sent,
+                "events_failed": self._events_failed,
+                "batches_sent": self._batches_sent,
+                "avg_batch_size": round(sent / self._batches_sent, 2) if self._batches_sent else 0.0,
+                "throughput_eps": round(sent / elapsed, 3) if elapsed > 0 else 0.0,
+                "avg_latency_ms": round(self._total_latency / sent * 1000, 1) if sent else 0.0,
+                "max_latency_ms": round(self._max_latency * 1000, 1),
+                "pending": len(self._pending),
+            }
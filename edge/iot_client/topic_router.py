@@ -0,0 +1,173 @@
+# iot_client/topic_router.py
+
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """
+    判斷 Topic 是否符合 MQTT Topic Filter (支援 '+' 單層與 '#' 多層萬用字元)。
+    Args:
+        topic_filter (str): Topic Filter。
+        topic (str): 實際收到的 Topic。
+    Returns:
+        bool: 是否符合。
+    """
+    return _levels_match(topic_filter.split('/'), topic.split('/'))
+
+
+def _levels_match(filter_levels: List[str], topic_levels: List[str]) -> bool:
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class TopicRoute:
+    """
+    一條訊息路由：Topic Filter 與對應的回調函數。
+    """
+    def __init__(self, name: str, topic_filter: str, callback: Callable[[str, str], None], coalesce: bool = False):
+        self.name = name
+        self.topic_filter = topic_filter
+        self.callback = callback
+        self.coalesce = coalesce # 每個 Topic 只保留最新一則待處理訊息 (適用於只關心最新值的訊息)
+        self.filter_levels = topic_filter.split('/')
+        self.is_wildcard = '+' in self.filter_levels or '#' in self.filter_levels
+
+
+class TopicRouter:
+    """
+    預先解析好的 Topic 路由表：精確 Topic 以字典查找，含萬用字元的 Filter 依序比對。
+    """
+    def __init__(self):
+        self._exact: Dict[str, TopicRoute] = {}
+        self._wildcard: List[TopicRoute] = []
+
+    def add_route(self, route: TopicRoute):
+        if route.is_wildcard:
+            self._wildcard.append(route)
+        else:
+            self._exact[route.topic_filter] = route
+
+    def resolve(self, topic: str) -> Optional[TopicRoute]:
+        """
+        Args:
+            topic (str): 收到訊息的 Topic。
+        Returns:
+            Optional[TopicRoute]: 符合的路由，找不到則為 None。
+        """
+        route = self._exact.get(topic)
+        if route is not None:
+            return route
+        topic_levels = topic.split('/')
+        for route in self._wildcard:
+            if _levels_match(route.filter_levels, topic_levels):
+                return route
+        return None
+
+    @property
+    def routes(self) -> List[TopicRoute]:
+        return list(self._exact.values()) + list(self._wildcard)
+
+
+class CallbackDispatcher:
+    """
+    有界的回調執行器：MQTT 訊息回調在工作執行緒上執行，而不是在 SDK 的網路執行緒上。
+    佇列已滿時丟棄訊息 (絕不阻塞網路執行緒)；coalesce 路由在每個實際 Topic 上只保留最新一則待處理訊息
+    (萬用字元 Filter 收到的不同 Thing 的訊息不會互相取代)。
+    """
+    def __init__(self, num_workers: int = 2, queue_maxsize: int = 100):
+        """
+        初始化回調執行器。
+        Args:
+            num_workers (int): 工作執行緒數量。
+            queue_maxsize (int): 待處理訊息的最大數量。
+        """
+        self.queue_maxsize = max(1, int(queue_maxsize))
+        self._queue: deque = deque() # (route, topic, payload)；coalesce 路由的項目 payload 為 None，實際內容在 _latest 中
+        self._latest: Dict[Tuple[str, str], bytes] = {} # coalesce 路由的 (路由名稱, Topic) -> 最新的 payload
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+        self.dispatched_count = 0
+        self.dropped_count = 0
+        self.coalesced_count = 0
+
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"mqtt-callback-{i}", daemon=True)
+            for i in range(max(1, int(num_workers)))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, route: TopicRoute, topic: str, payload: bytes) -> bool:
+        """
+        提交一則訊息 (在 SDK 網路執行緒上調用，只做 O(1) 操作)。
+        Returns:
+            bool: 如果訊息被接受 (含被合併) 則為 True，佇列已滿被丟棄則為 False。
+        """
+        with self._cond:
+            if route.coalesce:
+                key = (route.name, topic)
+                already_queued = key in self._latest
+                self._latest[key] = payload
+                if already_queued:
+                    self.coalesced_count += 1
+                    return True
+                item = (route, topic, None)
+            else:
+                item = (route, topic, payload)
+
+            if len(self._queue) >= self.queue_maxsize:
+                self.dropped_count += 1
+                if route.coalesce:
+                    self._latest.pop((route.name, topic), None)
+                logger.warning(f"MQTT 回調佇列已滿，丟棄 Topic '{topic}' 的訊息。")
+                return False
+            self._queue.append(item)
+            self._cond.notify()
+            return True
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            with self._cond:
+                while not self._queue and not self._stop_event.is_set():
+                    self._cond.wait(timeout=1.0)
+                if not self._queue:
+                    continue
+                route, topic, payload = self._queue.popleft()
+                if route.coalesce:
+                    payload = self._latest.pop((route.name, topic))
+
+            try:
+                payload_str = payload.decode('utf-8') if isinstance(payload, (bytes, bytearray)) else payload
+                route.callback(topic, payload_str)
+            except Exception as e:
+                logger.error(f"執行 MQTT 回調 '{route.name}' 時發生錯誤: {e}", exc_info=True)
+            with self._cond:
+                self.dispatched_count += 1
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def get_metrics(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "pending": len(self._queue),
+                "dispatched": self.dispatched_count,
+                "dropped": self.dropped_count,
+                "coalesced": self.coalesced_count,
+            }
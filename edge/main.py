@@ -1,8 +1,6 @@
 # main.py
 
 import cv2
-import jetson.utils
-import jetson.inference
 import numpy as np
 import time
 import threading
@@ -11,10 +9,9 @@ import yaml
 import logging
 import signal
 import json # 引入 json
+import functools
 
 # 引入我們自己設計的模組
-from utils.cuda_utils import numpy_to_cuda
-from utils.image_utils import resize_for_display, draw_detections
 from utils.s3_uploader import S3Uploader
 from iot_client.aws_iot_client import AWSIoTClient
 from inference.model_manager import ModelManager
@@ -28,15 +25,26 @@ from inference.inferencer import ObjectDetector # 引入具體的推論器
 from events.event_types import EventType # 引入事件類型
 from events.event_manager import EventManager
 from events.event_publisher import EventPublisher
+from events.result_store import ResultStore
 # 引入 CaptureManager 和 FrameData
 from data_capture.capture_manager import CaptureManager, FrameData
+from data_capture.frame_recorder import FrameRecorder
+from data_capture.capture_source import create_capture_source
+# 引入分段幀處理管線
+from pipeline.frame_pipeline import FramePipeline
+from pipeline.display_renderer import DisplayRenderer, display_available
 
 # 引入具體的偵測器
 from detectors.person_detector import PersonDetector
+from detectors.tracker import MultiObjectTracker
 from detectors.cargo_detector import CargoDetector # 引入 CargoDetector
 
 # 新增：引入 QR 掃描工具
 from utils import qr_scanner
+from utils.qr_service import QRService
+# 引入指標收集 (直方圖/計數器、本地 Prometheus 端點與遙測摘要)
+from utils import metrics
+from utils.metrics import MetricsServer, TelemetryReporter
 
 # 配置 logging (這部分可以在載入設定之前完成基礎配置)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
@@ -45,20 +53,8 @@ logger = logging.getLogger(__name__)
 # 全域停止標誌，用於安全退出主循環
 stop_requested = threading.Event()
 
-# 全域共享變數：儲存最新的雲端識別結果和貨物處理結果
-# 使用鎖保護，因為可能被不同執行緒訪問
-latest_recognition_result = {
-    "person_id": "no_person", 
-    "timestamp": 0, 
-    "original_event_timestamp": 0, 
-    "if_violation": False,
-    "violation_description": "",
-    "match_confidence": None, 
-    "summary": None, 
-    "face_bbox_rekognition": None
-    } # 人臉識別結果
-latest_cargo_result = {"cargo_id_data": "no_cargo_info", "timestamp": 0, "related_person_id": "no_person"} # 貨物處理結果 (簡化示例)
-recognition_result_lock = threading.Lock()
+DISPLAY_WINDOW_NAME = "Edge Detection"
+
 
 def signal_handler(signum, frame):
     """
@@ -67,9 +63,9 @@ def signal_handler(signum, frame):
     logger.info(f"收到信號 {signum}，請求停止應用程式。")
     stop_requested.set()
 
-# 新增：處理雲端識別結果的回調函數
-def handle_recognition_result(topic, payload_str):
-    logger.info(f"收到雲端識別結果 Topic: {topic}, Payload: {payload_str}")
+# 新增：處理雲端識別結果的回調函數 (寫入結果儲存，偵測器以無鎖快照讀取)
+def handle_recognition_result(result_store: ResultStore, topic, payload_str):
+    logger.debug(f"收到雲端識別結果 Topic: {topic}, Payload: {payload_str}")
     try:
         result_data = json.loads(payload_str)
         person_id = result_data.get("person_id", "no_person") # 如果 Payload 中沒有 person_id，設為 no_person
@@ -77,20 +73,7 @@ def handle_recognition_result(topic, payload_str):
 
         logger.info(f"解析識別結果: Person ID: {person_id}, Original Timestamp: {original_timestamp}")
 
-        # 更新全局共享的最新識別結果狀態
-        with recognition_result_lock:
-            latest_recognition_result["person_id"] = person_id
-            latest_recognition_result["timestamp"] = time.time() # 記錄收到結果的時間 (Unix)
-            latest_recognition_result["original_event_timestamp"] = original_timestamp # 邊緣事件的時間戳 (保持原始格式)
-            latest_recognition_result["match_confidence"] = result_data.get("match_confidence")
-            latest_recognition_result["summary"] = result_data.get("summary")
-            latest_recognition_result["face_bbox_rekognition"] = result_data.get("face_bbox_rekognition") # 添加雲端識別人臉
-            latest_recognition_result["if_violation"] = result_data.get("if_violation")
-            latest_recognition_result["violation_description"] = result_data.get("violation_description")
-
-            
-
-        logger.info(f"已更新最新識別結果狀態：{latest_recognition_result}")
+        result_store.update_recognition(result_data)
 
     except json.JSONDecodeError:
         logger.error("無法解析收到的識別結果 Payload (非 JSON 格式)。")
@@ -98,32 +81,84 @@ def handle_recognition_result(topic, payload_str):
         logger.error(f"處理雲端識別結果時發生錯誤: {e}", exc_info=True)
 
 # 新增：處理雲端貨物處理結果的回調函數
-def handle_cargo_result(topic, payload_str):
-    logger.info(f"收到雲端貨物處理結果 Topic: {topic}, Payload: {payload_str}")
+def handle_cargo_result(result_store: ResultStore, topic, payload_str):
+    logger.debug(f"收到雲端貨物處理結果 Topic: {topic}, Payload: {payload_str}")
     try:
         result_data = json.loads(payload_str)
         cargo_id_data = result_data.get("cargo_number", "no_cargo_number")
-        # original_edge_timestamp = result_data.get("original_edge_timestamp", 0) # 貨物事件的邊緣時間戳
-        # related_person_id = result_data.get("related_person_id", "no_person") # 雲端識別到的相關人員 ID
 
         logger.info(f"解析貨物處理結果: Cargo Info: {cargo_id_data}")
 
-        with recognition_result_lock: # 使用同一個鎖保護所有共享狀態
-            latest_cargo_result["cargo_id_data"] = cargo_id_data
-            latest_cargo_result["timestamp"] = time.time() # 記錄收到結果的時間
-            # latest_cargo_result["original_edge_timestamp"] = original_edge_timestamp
-            # latest_cargo_result["related_person_id"] = related_person_id
-            latest_cargo_result["proposed_location"] = result_data.get("proposed_location", "pending_assignment") # 入庫位置
-            latest_cargo_result["extraction_method"] = result_data.get("extraction_method") # 提取方法
-            latest_cargo_result["bedrock_summary_preview"] = result_data.get("bedrock_summary_preview") # Bedrock 摘要
-
-        logger.info(f"已更新最新貨物處理結果狀態：{latest_cargo_result}")
+        result_store.update_cargo(result_data)
 
     except json.JSONDecodeError:
         logger.error("無法解析收到的貨物處理結果 Payload (非 JSON 格式)。")
     except Exception as e:
         logger.error(f"處理雲端貨物處理結果時發生錯誤: {e}", exc_info=True)
 
+def create_detectors(settings: dict, object_detector_inferencer, event_manager, event_publisher,
+                     capture_manager, result_store, detectors_by_name: dict):
+    """
+    根據設定建立偵測器 (主程式與基準測試共用，確保兩者走相同的偵測器路徑)。
+    Args:
+        settings (dict): 完整設定。
+        detectors_by_name (dict): 偵測器名稱 -> 實例，建立的偵測器會加入其中 (供雲端命令更新區域設定)。
+    Returns:
+        Tuple[List[BaseDetector], Optional[CargoDetector], Optional[QRService]]: 偵測器列表、貨物偵測器與 QR 解碼服務。
+    """
+    detectors = []
+    detector_settings = settings.get('detectors', {})
+
+    # 修改：PersonDetector 的初始化參數
+    if detector_settings.get('person', {}).get('enabled', False):
+        logger.info("初始化人員偵測器...")
+        if object_detector_inferencer:
+            person_detector = PersonDetector(
+                settings=detector_settings['person'],
+                object_detector=object_detector_inferencer,
+                event_manager=event_manager,
+                event_publisher=event_publisher,
+                capture_manager=capture_manager
+            )
+            detectors.append(person_detector)
+            detectors_by_name["person"] = person_detector
+        else:
+            logger.warning("物件偵測器未成功初始化，無法初始化 PersonDetector。")
+
+
+    # CargoDetector 的初始化 (傳入雲端結果儲存)
+    cargo_detector = None
+    qr_service = None
+    if detector_settings.get('cargo', {}).get('enabled', False):
+        logger.info("初始化貨物偵測器...")
+        if object_detector_inferencer:
+            cargo_settings = detector_settings['cargo']
+            if 'allowed_person_ids' not in cargo_settings or 'recognition_result_validity_sec' not in cargo_settings:
+                logger.warning("CargoDetector 設定不完整 (缺少 allowed_person_ids 或 recognition_result_validity_sec)。貨物事件處理可能無法按預期工作。")
+            if 'cargo_roi' not in cargo_settings:
+                logger.warning("CargoDetector 未設定 cargo_roi。將偵測整個畫面中的貨物。")
+
+            # 非同步 QR 解碼服務 (只有需要在 ROI 內偵測貨物並掃描 QR Code 時才啟動工作進程)
+            qr_service_settings = settings.get('qr_service', {}) or {}
+            if cargo_settings.get('require_cargo_detection', False) and qr_service_settings.get('enabled', True):
+                qr_service = QRService(qr_service_settings)
+
+            cargo_detector = CargoDetector(
+                settings=detector_settings['cargo'],
+                object_detector=object_detector_inferencer,
+                event_manager=event_manager,
+                event_publisher=event_publisher,
+                capture_manager=capture_manager,
+                result_store=result_store, # 雲端人臉識別與貨物處理結果
+                qr_service=qr_service
+            )
+            detectors.append(cargo_detector)
+            detectors_by_name["cargo"] = cargo_detector
+        else:
+            logger.warning("物件偵測器未成功初始化，無法初始化 CargoDetector。")
+
+    return detectors, cargo_detector, qr_service
+
 def main():
     logger.info("應用程式啟動...")
 
@@ -141,6 +176,10 @@ def main():
         logging.getLogger().setLevel(logging.DEBUG)
         logger.debug("已啟用 DEBUG 級別日誌。")
 
+    # 指標收集需在建立其他元件之前啟用 (未啟用時各模組的計時為空操作)
+    metrics_settings = settings.get('metrics', {}) or {}
+    metrics.configure(metrics_settings)
+
     # 驗證關鍵設定是否存在 (現在只需要 aws, camera, models, capture)
     # 檢查 models 中至少有 object_detection 設定
     if not all(k in settings for k in ['aws', 'camera', 'models', 'capture']) or \
@@ -170,6 +209,9 @@ def main():
          s3_uploader.join()
          return
 
+    # 偵測器名稱 -> 實例 (偵測器初始化後填入，供雲端命令更新區域設定)
+    detectors_by_name = {}
+
     def handle_cloud_command(topic, payload):
         logger.info(f"收到雲端命令 Topic: {topic}, Payload: {payload}")
         try:
@@ -184,6 +226,17 @@ def main():
                  logger.info("收到重啟應用程式命令。")
                  # 這裡可以設置一個標誌或使用 os.execv 重新啟動
                  stop_requested.set() # 設置停止標誌，讓主循環結束，然後外部腳本可以重啟
+             elif command_type in ("update_zones", "update_roi"):
+                 # {"type": "update_zones", "detector": "person", "zones": [{"name": ..., "polygon": [[x, y], ...]}]}
+                 # {"type": "update_roi", "roi": [x1, y1, x2, y2]} (CargoDetector)
+                 detector_name = command_data.get("detector", "cargo" if command_type == "update_roi" else None)
+                 target = detectors_by_name.get(detector_name)
+                 if target is None:
+                     logger.warning(f"命令 '{command_type}' 指定的偵測器 '{detector_name}' 不存在或未啟用。")
+                 elif command_type == "update_roi" and hasattr(target, "update_roi"):
+                     target.update_roi(command_data.get("roi"))
+                 else:
+                     target.update_zones(command_data.get("zones"))
              # ...
         except json.JSONDecodeError:
              logger.error("無法解析收到的命令 Payload (非 JSON 格式)。")
@@ -191,20 +244,23 @@ def main():
              logger.error(f"處理雲端命令時發生錯誤: {e}", exc_info=True)
 
 
+    # 雲端結果儲存 (MQTT 回調寫入，偵測器每幀以無鎖快照讀取)
+    result_store = ResultStore(settings.get('events', {}).get('result_store', {}), default_camera_id=iot_settings['thing_name'])
+
     # 初始化 AWSIoTClient，傳入所有回調函數
     iot_client = AWSIoTClient(
         iot_settings,
         command_callback=handle_cloud_command,
-        recognition_result_callback=handle_recognition_result, # 人臉識別結果回調
-        cargo_result_callback=handle_cargo_result # 貨物處理結果回調
+        recognition_result_callback=functools.partial(handle_recognition_result, result_store), # 人臉識別結果回調
+        cargo_result_callback=functools.partial(handle_cargo_result, result_store) # 貨物處理結果回調
     )
 
     # 模型管理器和推論器 (現在只用於物件偵測)
     model_settings = settings.get('models', {})
     model_manager = ModelManager(model_settings)
 
-    # 載入物件偵測模型 (必需)
-    object_detection_model = model_manager.get_model("object_detection")
+    # 載入物件偵測模型 (必需)，並在開啟攝影機前完成預熱，重啟後第一幀的推論延遲與穩定狀態相同
+    object_detection_model = model_manager.get_model("object_detection") if model_manager.preload() else None
     if object_detection_model is None:
         logger.error("無法載入物件偵測模型，應用程式終止。")
         iot_client.disconnect()
@@ -219,7 +275,7 @@ def main():
     # 事件管理器和發布器
     event_settings = settings.get('events', {})
     event_manager = EventManager(event_settings)
-    event_publisher = EventPublisher(iot_client, settings['aws']['iot']['thing_name'])
+    event_publisher = EventPublisher(iot_client, settings['aws']['iot']['thing_name'], event_settings.get('outbox', {}))
 
     # 捕獲管理器
     capture_settings = settings.get('capture', {})
@@ -227,191 +283,195 @@ def main():
 
 
     # 偵測器 (根據設定啟用)
-    detectors = []
-    detector_settings = settings.get('detectors', {})
-
-    # 修改：PersonDetector 的初始化參數
-    if detector_settings.get('person', {}).get('enabled', False):
-        logger.info("初始化人員偵測器...")
-        if object_detector_inferencer:
-            person_detector = PersonDetector(
-                settings=detector_settings['person'],
-                object_detector=object_detector_inferencer,
-                event_manager=event_manager,
-                event_publisher=event_publisher,
-                capture_manager=capture_manager
-            )
-            detectors.append(person_detector)
-        else:
-            logger.warning("物件偵測器未成功初始化，無法初始化 PersonDetector。")
-
-
-    # CargoDetector 的初始化 (傳入共享狀態和鎖)
-    cargo_detector = None
-    if detector_settings.get('cargo', {}).get('enabled', False):
-        logger.info("初始化貨物偵測器...")
-        if object_detector_inferencer:
-            cargo_settings = detector_settings['cargo']
-            if 'allowed_person_ids' not in cargo_settings or 'recognition_result_validity_sec' not in cargo_settings:
-                logger.warning("CargoDetector 設定不完整 (缺少 allowed_person_ids 或 recognition_result_validity_sec)。貨物事件處理可能無法按預期工作。")
-            if 'cargo_roi' not in cargo_settings:
-                logger.warning("CargoDetector 未設定 cargo_roi。將偵測整個畫面中的貨物。")
-
-            cargo_detector = CargoDetector(
-                settings=detector_settings['cargo'],
-                object_detector=object_detector_inferencer,
-                event_manager=event_manager,
-                event_publisher=event_publisher,
-                capture_manager=capture_manager,
-                recognition_result_state=latest_recognition_result, # 人臉識別結果狀態
-                cargo_result_state=latest_cargo_result,
-                recognition_result_lock=recognition_result_lock
-                # 注意：CargoDetector 如果需要訪問貨物處理結果狀態，需要額外傳入或通過共享狀態獲取
-                # 我們目前讓 CargoDetector 訪問的 recognition_result_state 只包含人臉識別結果
-                # 貨物處理結果是在 handle_cargo_result 中更新到 latest_cargo_result 的
-                # 如果 CargoDetector 需要使用 latest_cargo_result，需要修改 CargoDetector 的 __init__ 和 main 的初始化
-                # 例如：
-                # cargo_detector = CargoDetector(..., cargo_result_state=latest_cargo_result, ...)
-            )
-            detectors.append(cargo_detector)
-        else:
-            logger.warning("物件偵測器未成功初始化，無法初始化 CargoDetector。")
+    detectors, cargo_detector, qr_service = create_detectors(
+        settings, object_detector_inferencer, event_manager, event_publisher,
+        capture_manager, result_store, detectors_by_name
+    )
 
     # TODO: 初始化其他偵測器
 
-    # 3. 初始化攝影機
-    # ... 攝影機初始化邏輯 (保持不變) ...
+    # 可選：多目標追蹤器 (偵測器改為每個新追蹤只觸發一次事件)
+    tracker = None
+    tracker_settings = settings.get('detectors', {}).get('tracker', {}) or {}
+    if tracker_settings.get('enabled', False):
+        tracker = MultiObjectTracker(tracker_settings)
+        logger.info("多目標追蹤器已啟用。")
+
+    # 可選：現場錄製 (取樣幀 + 偵測結果 + 雲端結果，之後可離線重播偵測器)
+    frame_recorder = None
+    record_settings = capture_settings.get('record', {}) or {}
+    if record_settings.get('enabled', False):
+        frame_recorder = FrameRecorder(capture_manager, result_store, record_settings,
+                                       object_detector_inferencer.class_mapping)
+
+    # 3. 初始化攝影機 (擷取來源由 camera.backend 選擇：opencv/V4L2、gstreamer 管線或 file 重播)
     camera_settings = settings.get('camera', {})
     camera_source = camera_settings.get('source', 0)
-    camera_width = camera_settings.get('width', 1280)
-    camera_height = camera_settings.get('height', 720)
-    camera_codec = camera_settings.get('codec', 'MJPG')
-
-    cap = cv2.VideoCapture(camera_source)
-    # cap.set(cv2.CAP_PROP_FRAME_WIDTH, camera_width)
-    # cap.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_height)
-    fourcc_code = cv2.VideoWriter_fourcc(*camera_codec)
-    cap.set(cv2.CAP_PROP_FOURCC, fourcc_code)
+    try:
+        cap = create_capture_source(camera_settings)
+    except (ValueError, RuntimeError) as e:
+        logger.error(f"無法建立擷取來源: {e}")
+        cap = None
 
-    if not cap.isOpened():
+    if cap is None or not cap.isOpened():
         logger.error(f"無法開啟攝影機設備 {camera_source}。應用程式終止。")
         iot_client.disconnect()
         s3_uploader.stop()
         s3_uploader.join()
         return
 
-    logger.info(f"攝影機開啟成功，分辨率 {cap.get(cv2.CAP_PROP_FRAME_WIDTH)}x{cap.get(cv2.CAP_PROP_FRAME_HEIGHT)}，編碼 {camera_codec}。")
+    logger.info(f"攝影機開啟成功 ({cap.name})，分辨率 {cap.get(cv2.CAP_PROP_FRAME_WIDTH)}x{cap.get(cv2.CAP_PROP_FRAME_HEIGHT)}，"
+                f"編碼 {camera_settings.get('codec', 'MJPG')}。")
+
+    # 根據攝影機實際分辨率預先配置幀環形緩衝區，攝影機之後直接寫入緩衝區槽位
+    capture_manager.configure_frame_shape(
+        int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), input_scale=cap.decode_scale
+    )
 
 
-    # 4. 主處理迴圈
+    # 4. 主處理迴圈 (分段管線：擷取、推論與偵測器分派在各自的執行緒中重疊執行)
     logger.info("進入主處理迴圈...")
-    processing_frame_count = 0
-    start_time = time.time()
 
     display_settings = settings.get('display', {})
     display_enabled = display_settings.get('enabled', False)
-    display_width = display_settings.get('max_width', 800)
-    display_height = display_settings.get('max_height', 600)
+    if display_enabled and not display_available():
+        logger.warning("沒有可用的圖形顯示環境 (未設定 DISPLAY)，已停用本地顯示。")
+        display_enabled = False
+
+    pipeline_settings = settings.get('pipeline', {})
+    metrics_log_interval = pipeline_settings.get('metrics_log_interval_sec', 30)
+    frame_pipeline = FramePipeline(
+        cap, capture_manager, object_detector_inferencer, detectors,
+        pipeline_settings, stop_requested, display_enabled=display_enabled, tracker=tracker,
+        stage_observer=metrics.observe_stage if metrics.REGISTRY.enabled else None
+    )
+
+    # 本地顯示繪製執行緒 (未啟用顯示時不建立，管線也不會為顯示保留幀)
+    display_renderer = None
+    window_shown = False
+    if display_enabled:
+        display_renderer = DisplayRenderer(frame_pipeline, detectors, object_detector_inferencer.class_mapping,
+                                           display_settings)
+
+    # 本地指標端點與遙測摘要 (各元件的 get_metrics() 在擷取時才讀取)
+    metrics_server = None
+    telemetry_reporter = None
+    if metrics.REGISTRY.enabled:
+        metrics.REGISTRY.register_component("pipeline", frame_pipeline.get_metrics)
+        metrics.REGISTRY.register_component("models", model_manager.get_metrics)
+        metrics.REGISTRY.register_component("encoder", capture_manager.get_encoder_metrics)
+        metrics.REGISTRY.register_component("s3", s3_uploader.get_metrics)
+        metrics.REGISTRY.register_component("event_manager", event_manager.get_metrics)
+        metrics.REGISTRY.register_component("outbox", event_publisher.get_outbox_metrics)
+        metrics.REGISTRY.register_component("mqtt_publish", iot_client.get_publish_metrics)
+        metrics.REGISTRY.register_component("mqtt_dispatch", iot_client.get_dispatch_metrics)
+        if capture_manager.clips_enabled:
+            metrics.REGISTRY.register_component("clips", capture_manager.get_clip_metrics)
+        if frame_recorder:
+            metrics.REGISTRY.register_component("recorder", frame_recorder.get_metrics)
+        if display_renderer:
+            metrics.REGISTRY.register_component("display", display_renderer.get_metrics)
+        if qr_service:
+            metrics.REGISTRY.register_component("qr", qr_service.get_metrics)
+        try:
+            metrics_server = MetricsServer(metrics.REGISTRY, metrics_settings.get('http_host', '127.0.0.1'),
+                                           metrics_settings.get('http_port', 9108))
+            metrics_server.start()
+        except OSError as e:
+            logger.error(f"無法啟動指標端點: {e}")
+        telemetry_settings = metrics_settings.get('telemetry', {}) or {}
+        if telemetry_settings.get('enabled', False):
+            telemetry_reporter = TelemetryReporter(metrics.REGISTRY, iot_client.publish_telemetry,
+                                                   telemetry_settings.get('interval_sec', 60))
+            telemetry_reporter.start()
+
+    frame_pipeline.start()
+    if frame_recorder:
+        frame_recorder.start()
+    if display_renderer:
+        display_renderer.start()
+    last_metrics_log_time = time.time()
 
     while not stop_requested.is_set():
-        ret, frame_np = cap.read()
-        if not ret:
-            logger.warning("無法從攝影機讀取幀。")
-            if not stop_requested.is_set():
-                time.sleep(0.1)
+        # 定期輸出管線統計 (各階段佇列深度、丟棄幀數與處理時間)
+        if metrics_log_interval and (time.time() - last_metrics_log_time) >= metrics_log_interval:
+            logger.info(f"管線統計: {frame_pipeline.get_metrics()}")
+            logger.info(f"影像編碼統計: {capture_manager.get_encoder_metrics()}")
+            if capture_manager.clips_enabled:
+                logger.info(f"事件短片統計: {capture_manager.get_clip_metrics()}")
+            if frame_recorder:
+                logger.info(f"現場錄製統計: {frame_recorder.get_metrics()}")
+            if display_renderer:
+                logger.info(f"顯示繪製統計: {display_renderer.get_metrics()}")
+            logger.info(f"S3 上傳統計: {s3_uploader.get_metrics()}")
+            logger.info(f"事件觸發統計: {event_manager.get_metrics()}")
+            logger.info(f"事件寄件匣統計: {event_publisher.get_outbox_metrics()}")
+            logger.info(f"MQTT 發布統計: {iot_client.get_publish_metrics()}")
+            logger.info(f"MQTT 回調統計: {iot_client.get_dispatch_metrics()}")
+            if qr_service:
+                logger.info(f"QR 解碼統計: {qr_service.get_metrics()}")
+            last_metrics_log_time = time.time()
+
+        if display_renderer is None:
+            stop_requested.wait(0.5)
             continue
 
-        processing_frame_count += 1
-        current_time = time.time()
-
-        frame_cuda = None
-        try:
-             rgb_frame_np = cv2.cvtColor(frame_np, cv2.COLOR_BGR2RGB)
-             frame_cuda = jetson.utils.cudaFromNumpy(rgb_frame_np)
-        except Exception as e:
-             logger.error(f"NumPy 到 CUDA 轉換失敗: {e}", exc_info=True)
-             continue
-
-        # 執行邊緣模型推論 (物件偵測)
-        detections_raw = []
-        try:
-            if object_detector_inferencer:
-                detections_raw = object_detector_inferencer.infer(frame_cuda)
-        except Exception as e:
-            logger.error(f"物件偵測推論失敗: {e}", exc_info=True)
-            detections_raw = []
-
-        # 將包含偵測結果的當前幀添加到捕獲管理器的緩衝區
-        # 注意：這裡緩衝的是最新一幀，PersonDetector 將直接使用當前幀的 detections_raw 判斷是否有人物
-        # 緩衝區主要用於如果未來需要回溯或捕獲延後幀，但目前只捕獲當前幀
-        capture_manager.add_frame_to_buffer(frame_np, frame_cuda, detections_raw)
-
-
-        # 將原始偵測結果和 CUDA 幀傳遞給所有偵測器進行處理
-        for detector in detectors:
-            try:
-                # detectors 現在會從 capture_manager 獲取 buffer，但 process 方法仍然接收當前幀的結果以便觸發判斷
-                detector.process(frame_cuda, detections_raw)
-            except Exception as e:
-                logger.error(f"偵測器 '{detector.__class__.__name__}' 處理失敗: {e}", exc_info=True)
-
-
-        # 可選：在本地顯示處理後的影像
-        # ... 顯示邏輯 (保持不變) ...
-        if display_enabled:
-            # 在 NumPy 影像上繪製物件偵測框
-            frame_to_display = draw_detections(
-                frame_np.copy(), # 在拷貝上繪製
-                detections_raw,
-                object_detector_inferencer.class_mapping
-            )
+        # 可選：在本地顯示處理後的影像 (縮小與繪製在顯示繪製執行緒完成，OpenCV 視窗必須在主執行緒操作)
+        display_frame = display_renderer.get_frame(timeout=0.1)
+        if display_frame is None:
+            continue
+        cv2.imshow(DISPLAY_WINDOW_NAME, display_frame)
+        window_shown = True
 
-            # 新增：如果 CargoDetector 啟用了並且有配置 ROI，則在顯示的幀上繪製 ROI
-            if cargo_detector and cargo_detector.is_enabled and cargo_detector.cargo_roi:
-                try:
-                    roi = cargo_detector.cargo_roi
-                    # 確保 ROI 是有效的 [x1, y1, x2, y2] 格式
-                    if isinstance(roi, list) and len(roi) == 4:
-                        # 使用 OpenCV 在畫面上繪製矩形
-                        # 座標需要是整數
-                        p1 = (int(roi[0]), int(roi[1]))
-                        p2 = (int(roi[2]), int(roi[3]))
-                        color = (0, 0, 255) # 紅色 (BGR 格式)
-                        thickness = 2
-                        cv2.rectangle(frame_to_display, p1, p2, color, thickness)
-                        # 可選：在框附近添加文本標籤
-                        # cv2.putText(frame_to_display, "Cargo ROI", p1, cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                    else:
-                        logger.warning(f"CargoDetector 配置的 ROI 格式無效: {roi}")
-                except Exception as e:
-                    logger.error(f"在顯示影像上繪製 Cargo ROI 時發生錯誤: {e}", exc_info=True)
-
-
-            display_frame = resize_for_display(frame_to_display, display_width, display_height)
-            cv2.imshow("Edge Detection", display_frame)
-
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('q') or key == 27:
-                stop_requested.set()
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord('q') or key == 27:
+            stop_requested.set()
+        elif window_shown and cv2.getWindowProperty(DISPLAY_WINDOW_NAME, cv2.WND_PROP_VISIBLE) < 1:
+            # 視窗被關閉：停止繪製，管線不再為顯示保留幀，應用程式繼續執行
+            logger.info("顯示視窗已被關閉，停止本地顯示。")
+            display_renderer.stop()
+            frame_pipeline.set_display_enabled(False)
+            display_renderer = None
 
 
     # 5. 清理資源
     logger.info("應用程式停止中，開始清理資源...")
     # ... 清理邏輯 (保持不變) ...
 
+    if display_renderer:
+        display_renderer.stop()
+    frame_pipeline.stop()
+    frame_pipeline.join()
+    logger.info(f"管線已停止。最終統計: {frame_pipeline.get_metrics()}")
+
+    if telemetry_reporter:
+        telemetry_reporter.stop()
+    if metrics_server:
+        metrics_server.stop()
+
     if cap.isOpened():
         cap.release()
         logger.info("攝影機已釋放。")
 
-    if display_enabled:
+    if window_shown:
         cv2.destroyAllWindows()
         logger.info("顯示視窗已關閉。")
 
+    if qr_service:
+        qr_service.shutdown()
+
+    if frame_recorder:
+        frame_recorder.stop()
+        frame_recorder.join()
+
+    capture_manager.shutdown()
+
+    s3_uploader.wait_for_completion(timeout=s3_settings.get('shutdown_timeout_sec', 30))
     s3_uploader.stop()
-    s3_uploader.wait_for_completion()
     s3_uploader.join()
     logger.info("S3 上傳執行緒已停止。")
 
+    event_publisher.close()
     iot_client.disconnect()
     logger.info("AWS IoT 連接已斷開。")
 
@@ -0,0 +1,189 @@
+# pipeline/display_renderer.py
+
+import os
+import sys
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.image_utils import INTERPOLATIONS, draw_detections, draw_zones, draw_roi
+
+logger = logging.getLogger(__name__)
+
+
+def display_available() -> bool:
+    """
+    判斷是否有可用的圖形顯示環境 (Linux 上沒有 DISPLAY/WAYLAND_DISPLAY 時 cv2.imshow 會失敗)。
+    """
+    if sys.platform.startswith("linux"):
+        return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return True
+
+
+def display_size(frame_width: int, frame_height: int, max_width: int, max_height: int) -> Tuple[int, int, float]:
+    """
+    Returns:
+        Tuple[int, int, float]: 在最大寬高限制內保持比例的顯示寬度、高度與縮放比例 (不放大)。
+    """
+    scale = min(max_width / frame_width, max_height / frame_height, 1.0)
+    return max(1, int(frame_width * scale)), max(1, int(frame_height * scale)), scale
+
+
+class DisplayRenderer(threading.Thread):
+    """
+    本地顯示的繪製執行緒。
+    以不超過 max_fps 的頻率從管線的 display 佇列取最新幀 (期間到達的幀由佇列直接丟棄，不會排隊)，
+    先縮小到顯示大小 (寫入預先配置的緩衝區後立即釋放環形緩衝區中的幀)，再依縮放比例繪製偵測框、區域與 ROI。
+    OpenCV 視窗操作 (imshow/waitKey) 仍在主執行緒進行，主執行緒只需取出已繪製完成的影像。
+    輸出使用三個輪替的緩衝區，繪製中的緩衝區不會是主執行緒正在顯示的緩衝區。
+    """
+    def __init__(self, frame_pipeline, detectors: List[Any], class_mapping: dict, display_settings: dict):
+        """
+        初始化顯示繪製執行緒。
+        Args:
+            frame_pipeline (FramePipeline): 幀處理管線 (需以 display_enabled=True 建立)。
+            detectors (List[BaseDetector]): 偵測器列表 (繪製各偵測器目前的區域與 ROI)。
+            class_mapping (dict): 模型類別 ID 到內部類別名稱的映射。
+            display_settings (dict): 顯示設定 (config.display)。
+        """
+        super().__init__(name="display-renderer", daemon=True)
+        self.frame_pipeline = frame_pipeline
+        self.detectors = detectors
+        self.class_mapping = class_mapping
+        self.settings = display_settings or {}
+        self.max_width = int(self.settings.get('max_width', 800))
+        self.max_height = int(self.settings.get('max_height', 600))
+        self.max_fps = max(1.0, float(self.settings.get('max_fps', 15)))
+        self.interpolation = INTERPOLATIONS.get(self.settings.get('interpolation', 'linear'), cv2.INTER_LINEAR)
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._ready = threading.Condition(self._lock)
+        self._buffers: List[np.ndarray] = []
+        self._latest = -1 # 最新繪製完成、尚未被取出的緩衝區
+        self._showing = -1 # 主執行緒正在顯示的緩衝區
+
+        self.rendered_count = 0
+        self.shown_count = 0
+        self.replaced_count = 0 # 繪製完成但在主執行緒取出前被較新的幀取代
+        self._total_render_sec = 0.0
+
+    def run(self):
+        logger.info(f"顯示繪製執行緒啟動 (最高 {self.max_fps} FPS)。")
+        interval = 1.0 / self.max_fps
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            packet = self.frame_pipeline.get_display_packet(timeout=0.5)
+            if packet is None:
+                continue
+            start = time.perf_counter()
+            try:
+                self._render(packet)
+            except Exception as e:
+                logger.error(f"繪製顯示影像失敗: {e}", exc_info=True)
+            self._total_render_sec += time.perf_counter() - start
+
+            # 限制刷新率：等待期間到達的幀會在 display 佇列中被更新的幀取代
+            next_time = max(next_time + interval, time.monotonic())
+            self._stop_event.wait(next_time - time.monotonic())
+        with self._ready:
+            self._ready.notify_all()
+        logger.info("顯示繪製執行緒已終止。")
+
+    def _render(self, packet):
+        """
+        將一幀縮小到顯示大小並繪製疊加資訊 (負責釋放 packet)。
+        """
+        try:
+            frame_np = packet.frame_np
+            h, w = frame_np.shape[:2]
+            width, height, scale = display_size(w, h, self.max_width, self.max_height)
+            idx = self._acquire_buffer(width, height, frame_np.shape[2:], frame_np.dtype)
+            image = self._buffers[idx]
+            if scale < 1.0:
+                cv2.resize(frame_np, (width, height), dst=image, interpolation=self.interpolation)
+            else:
+                np.copyto(image, frame_np)
+            detections = packet.detection_table if packet.detection_table is not None else packet.detections_raw
+            # 偵測結果、區域與 ROI 為原始分辨率的座標；雙分辨率模式下管線中的幀是縮小的推論幀
+            scale *= self.frame_pipeline.capture_manager.coord_scale
+        finally:
+            # 縮小後即可釋放環形緩衝區中的幀，之後只在顯示大小的影像上繪製
+            self.frame_pipeline.release_packet(packet)
+
+        draw_detections(image, detections, self.class_mapping, scale=scale, copy=False)
+        for detector in self.detectors:
+            if not detector.is_enabled:
+                continue
+            if len(detector.zone_map) > 0:
+                draw_zones(image, detector.zone_map.zones, scale=scale)
+            roi = getattr(detector, 'cargo_roi', None)
+            if isinstance(roi, (list, tuple)) and len(roi) == 4:
+                draw_roi(image, roi, scale=scale)
+        self._publish(idx)
+
+    def _acquire_buffer(self, width: int, height: int, channels: tuple, dtype) -> int:
+        """
+        取得一個可以寫入的輸出緩衝區索引 (不是最新待顯示的，也不是主執行緒正在顯示的)，分辨率改變時重新配置。
+        """
+        shape = (height, width) + tuple(channels)
+        with self._lock:
+            if not self._buffers or self._buffers[0].shape != shape or self._buffers[0].dtype != dtype:
+                self._buffers = [np.empty(shape, dtype=dtype) for _ in range(3)]
+                self._latest = self._showing = -1
+            for idx in range(len(self._buffers)):
+                if idx not in (self._latest, self._showing):
+                    return idx
+        raise RuntimeError("沒有可用的顯示緩衝區。") # 三個緩衝區中最多只有兩個被佔用，不會發生
+
+    def _publish(self, idx: int):
+        with self._ready:
+            if self._latest >= 0:
+                self.replaced_count += 1
+            self._latest = idx
+            self.rendered_count += 1
+            self._ready.notify()
+
+    def get_frame(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        取出最新繪製完成的影像 (由主執行緒調用，之後交給 cv2.imshow)。
+        返回的緩衝區在下一次調用 get_frame() 之前不會被繪製執行緒覆寫。
+        Args:
+            timeout (float, optional): 最長等待秒數。
+        Returns:
+            Optional[np.ndarray]: 顯示影像，逾時或已停止時為 None。
+        """
+        with self._ready:
+            if self._latest < 0 and not self._stop_event.is_set():
+                self._ready.wait(timeout)
+            if self._latest < 0:
+                return None
+            self._showing, self._latest = self._latest, -1
+            self.shown_count += 1
+            return self._buffers[self._showing]
+
+    def stop(self):
+        """
+        請求停止繪製並喚醒等待中的主執行緒。
+        """
+        self._stop_event.set()
+        with self._ready:
+            self._ready.notify_all()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 繪製與顯示的幀數、被取代的幀數與平均繪製時間 (毫秒)。
+        """
+        with self._lock:
+            return {
+                "rendered": self.rendered_count,
+                "shown": self.shown_count,
+                "replaced": self.replaced_count,
+                "avg_render_ms": round(self._total_render_sec / self.rendered_count * 1000, 2) if self.rendered_count else 0.0,
+            }
+
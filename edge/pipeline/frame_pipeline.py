@@ -0,0 +1,469 @@
+# pipeline/frame_pipeline.py
+
+import cv2
+import time
+import threading
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from inference.backends import scale_detections
+from inference.inference_scheduler import InferenceScheduler
+from inference.detection_table import ClassIndex, DetectionTable
+
+logger = logging.getLogger(__name__)
+
+
+class FramePacket:
+    """
+    在管線各階段之間傳遞的單幀數據。
+    """
+    def __init__(self, frame_np, timestamp: float, seq: int):
+        self.frame_np = frame_np # 攝影機讀取的 BGR 幀 (捕獲管理器環形緩衝區中的唯讀視圖；雙分辨率模式下為縮小的推論幀)
+        self.timestamp = timestamp # 讀取時間 (Unix)
+        self.seq = seq # 幀在環形緩衝區中的序號
+        self.frame_cuda = None # 推論階段填入的模型輸入 (Jetson 後端為 CUDA 影像)
+        self.detections_raw: List = [] # 推論階段填入的偵測結果
+        self.detection_table: Optional[DetectionTable] = None # 推論階段建立的結構化偵測結果表
+        self.inferred = False # 這一幀是否實際執行了推論 (False 表示沿用上一次的偵測結果)
+        self.tracks: Optional[List] = None # 追蹤器啟用時填入的追蹤快照 (List[Track])
+
+
+class LatestFrameQueue:
+    """
+    有界的幀佇列，採用「最新幀優先」的丟棄策略。
+    佇列滿時放入新幀會丟棄最舊的幀，而不是阻塞生產者，
+    確保較慢的下游階段不會拖慢攝影機讀取。
+    """
+    def __init__(self, name: str, maxsize: int = 1, on_drop: Optional[Callable[[Any], None]] = None):
+        """
+        初始化佇列。
+        Args:
+            name (str): 佇列名稱 (用於日誌與統計)。
+            maxsize (int): 佇列最大長度，至少為 1。
+            on_drop (Callable, optional): 項目被丟棄時調用的回調函數 (例如釋放緩衝區中的幀)。
+        """
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.on_drop = on_drop
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.put_count = 0 # 放入的總幀數
+        self.dropped_count = 0 # 因佇列已滿而丟棄的幀數
+        self.max_depth = 0 # 觀察到的最大深度
+
+    def put(self, item) -> bool:
+        """
+        放入一個項目。佇列已滿時丟棄最舊的項目。
+        Args:
+            item: 要放入的項目。
+        Returns:
+            bool: 如果有舊項目被丟棄則為 True。
+        """
+        dropped_item = None
+        with self._cond:
+            if self._closed:
+                dropped_item = item
+            else:
+                if len(self._items) >= self.maxsize:
+                    dropped_item = self._items.popleft()
+                    self.dropped_count += 1
+                self._items.append(item)
+                self.put_count += 1
+                if len(self._items) > self.max_depth:
+                    self.max_depth = len(self._items)
+                self._cond.notify()
+        if dropped_item is not None and self.on_drop:
+            self.on_drop(dropped_item)
+        return dropped_item is not None
+
+    def get(self, timeout: Optional[float] = None):
+        """
+        取出最舊的項目。
+        Args:
+            timeout (float, optional): 最長等待秒數。None 表示無限等待。
+        Returns:
+            項目，如果逾時或佇列已關閉則為 None。
+        """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+    def close(self):
+        """
+        關閉佇列並喚醒所有等待中的消費者。
+        """
+        with self._cond:
+            self._closed = True
+            remaining = list(self._items)
+            self._items.clear()
+            self._cond.notify_all()
+        if self.on_drop:
+            for item in remaining:
+                self.on_drop(item)
+
+    def get_metrics(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: 佇列目前深度、最大深度、放入與丟棄計數。
+        """
+        with self._cond:
+            return {
+                "depth": len(self._items),
+                "max_depth": self.max_depth,
+                "maxsize": self.maxsize,
+                "put": self.put_count,
+                "dropped": self.dropped_count,
+            }
+
+
+class PipelineStage(threading.Thread):
+    """
+    管線中的一個處理階段：從輸入佇列取幀，調用處理函數，
+    並將結果放入輸出佇列 (如果有)。
+    """
+    def __init__(self, name: str, handler: Callable[[FramePacket], Optional[FramePacket]],
+                 input_queue: LatestFrameQueue, output_queues: Optional[List[LatestFrameQueue]] = None,
+                 stop_event: Optional[threading.Event] = None,
+                 on_discard: Optional[Callable[[FramePacket], None]] = None,
+                 observer: Optional[Callable[[str, float], None]] = None):
+        """
+        初始化處理階段。
+        Args:
+            name (str): 階段名稱 (同時作為執行緒名稱)。
+            handler (Callable): 處理函數，返回 None 表示不再往下游傳遞。
+            input_queue (LatestFrameQueue): 輸入佇列。
+            output_queues (List[LatestFrameQueue], optional): 輸出佇列列表。
+            stop_event (threading.Event, optional): 停止標誌。
+            on_discard (Callable, optional): 幀在此階段結束生命週期 (處理失敗或沒有下游) 時調用。
+            observer (Callable, optional): 每次處理完成後以 (階段名稱, 處理秒數) 調用 (例如基準測試收集延遲分佈)。
+        """
+        super().__init__(name=name, daemon=True)
+        self.on_discard = on_discard
+        self.observer = observer
+        self.handler = handler
+        self.input_queue = input_queue
+        self.output_queues = output_queues or []
+        self._stop_event = stop_event if stop_event is not None else threading.Event()
+
+        self.processed_count = 0
+        self.error_count = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._metrics_lock = threading.Lock()
+
+    def run(self):
+        logger.info(f"管線階段 '{self.name}' 啟動。")
+        while not self._stop_event.is_set():
+            packet = self.input_queue.get(timeout=0.5)
+            if packet is None:
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = self.handler(packet)
+            except Exception as e:
+                logger.error(f"管線階段 '{self.name}' 處理失敗: {e}", exc_info=True)
+                with self._metrics_lock:
+                    self.error_count += 1
+                if self.on_discard:
+                    self.on_discard(packet)
+                continue
+            elapsed = time.perf_counter() - start
+
+            with self._metrics_lock:
+                self.processed_count += 1
+                self._total_latency += elapsed
+                if elapsed > self._max_latency:
+                    self._max_latency = elapsed
+            if self.observer is not None:
+                self.observer(self.name, elapsed)
+
+            if result is not None and self.output_queues:
+                for output_queue in self.output_queues:
+                    output_queue.put(result)
+            elif self.on_discard:
+                self.on_discard(packet)
+
+        logger.info(f"管線階段 '{self.name}' 已終止。")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 已處理幀數、錯誤數、平均與最大處理時間 (毫秒)。
+        """
+        with self._metrics_lock:
+            avg_ms = (self._total_latency / self.processed_count * 1000) if self.processed_count else 0.0
+            return {
+                "processed": self.processed_count,
+                "errors": self.error_count,
+                "avg_latency_ms": round(avg_ms, 2),
+                "max_latency_ms": round(self._max_latency * 1000, 2),
+            }
+
+
+class FramePipeline:
+    """
+    多執行緒的分段幀處理管線：
+        擷取執行緒 -> [inference 佇列] -> 推論階段 -> [dispatch 佇列] -> 偵測器分派階段 -> [display 佇列]
+    各階段之間以有界的 LatestFrameQueue 連接，讓攝影機讀取與推論重疊執行，
+    且較慢的偵測器處理 (如 QR 掃描、JPEG 編碼) 不會阻塞攝影機讀取。
+    """
+    def __init__(self, cap: cv2.VideoCapture, capture_manager, object_detector, detectors: List,
+                 pipeline_settings: dict, stop_event: threading.Event, display_enabled: bool = False,
+                 tracker=None, stage_observer: Optional[Callable[[str, float], None]] = None):
+        """
+        初始化幀處理管線。
+        Args:
+            cap (CaptureSource): 已開啟的擷取來源 (或任何與 cv2.VideoCapture 介面相同的物件)。
+            capture_manager (CaptureManager): 捕獲管理器實例 (緩衝推論後的幀)。
+            object_detector (ObjectDetector): 物件偵測推論器實例。
+            detectors (List[BaseDetector]): 要分派的偵測器列表。
+            pipeline_settings (dict): 管線設定 (config.pipeline)。
+            stop_event (threading.Event): 全域停止標誌。
+            display_enabled (bool): 是否將處理後的幀送到 display 佇列供主執行緒顯示。
+            tracker (MultiObjectTracker, optional): 多目標追蹤器，提供時在推論後更新追蹤並傳遞給偵測器。
+            stage_observer (Callable, optional): 延遲觀察者，以 (名稱, 秒數) 接收攝影機讀取 ("capture")、
+                                                 模型輸入轉換 ("prepare_input")、模型推論 ("model_inference")、
+                                                 各階段、各偵測器 ("detector.<類別名稱>") 與端到端 ("end_to_end") 的耗時。
+                                                 未提供時不做額外計時。
+        """
+        self.cap = cap
+        self.capture_manager = capture_manager
+        self.object_detector = object_detector
+        self.detectors = detectors
+        self.settings = pipeline_settings or {}
+        self._stop_event = stop_event
+        self.display_enabled = display_enabled
+        self.tracker = tracker
+        self.stage_observer = stage_observer
+        self._last_tracks: Optional[List] = [] if tracker is not None else None
+        # 每幀將偵測結果轉換為 DetectionTable 時使用的類別查找表
+        self.class_index: ClassIndex = getattr(object_detector, 'class_index', None) or ClassIndex({})
+        self._last_table = DetectionTable.from_detections([], self.class_index)
+
+        # 在管線中流動的幀會在環形緩衝區中被持有，直到離開管線 (處理完成或被丟棄) 才釋放
+        self.inference_queue = LatestFrameQueue("inference", self.settings.get('inference_queue_size', 1),
+                                                on_drop=self.release_packet)
+        self.dispatch_queue = LatestFrameQueue("dispatch", self.settings.get('dispatch_queue_size', 2),
+                                               on_drop=self.release_packet)
+        self.display_queue = LatestFrameQueue("display", 1, on_drop=self.release_packet)
+
+        # 可選：依運動量略過靜止畫面的推論
+        scheduler_settings = self.settings.get('scheduler', {}) or {}
+        self.scheduler: Optional[InferenceScheduler] = None
+        if scheduler_settings.get('enabled', False):
+            self.scheduler = InferenceScheduler(scheduler_settings)
+
+        self._capture_thread = threading.Thread(target=self._capture_loop, name="capture", daemon=True)
+        self._inference_stage = PipelineStage(
+            "inference", self._run_inference, self.inference_queue,
+            output_queues=[self.dispatch_queue], stop_event=self._stop_event,
+            on_discard=self.release_packet, observer=self.stage_observer
+        )
+        dispatch_outputs = [self.display_queue] if self.display_enabled else []
+        self._dispatch_stage = PipelineStage(
+            "dispatch", self._run_detectors, self.dispatch_queue,
+            output_queues=dispatch_outputs, stop_event=self._stop_event,
+            on_discard=self.release_packet, observer=self.stage_observer
+        )
+
+        self.captured_count = 0
+        self.read_failure_count = 0
+        self._start_time = None
+
+    def start(self):
+        """
+        啟動所有階段執行緒 (下游先啟動，避免初期幀被丟棄)。
+        """
+        self._start_time = time.time()
+        self._dispatch_stage.start()
+        self._inference_stage.start()
+        self._capture_thread.start()
+        logger.info("幀處理管線已啟動 (capture -> inference -> dispatch)。")
+
+    def stop(self):
+        """
+        請求停止管線並喚醒所有等待中的階段。
+        """
+        self._stop_event.set()
+        for q in (self.inference_queue, self.dispatch_queue, self.display_queue):
+            q.close()
+
+    def join(self, timeout: float = 5.0):
+        for t in (self._capture_thread, self._inference_stage, self._dispatch_stage):
+            if t.is_alive():
+                t.join(timeout)
+
+    def set_display_enabled(self, enabled: bool):
+        """
+        開啟或關閉送往 display 佇列的幀 (例如顯示視窗被關閉後，分派階段直接釋放幀，不再為顯示保留)。
+        """
+        self.display_enabled = enabled
+        self._dispatch_stage.output_queues = [self.display_queue] if enabled else []
+        if not enabled:
+            while True:
+                packet = self.display_queue.get(timeout=0)
+                if packet is None:
+                    break
+                self.release_packet(packet)
+
+    def get_display_packet(self, timeout: Optional[float] = None) -> Optional[FramePacket]:
+        """
+        取得最新已處理完成、可供顯示的幀。使用完畢後需調用 release_packet()。
+        Args:
+            timeout (float, optional): 最長等待秒數。
+        Returns:
+            Optional[FramePacket]: 幀數據，逾時則為 None。
+        """
+        return self.display_queue.get(timeout=timeout)
+
+    def release_packet(self, packet: FramePacket):
+        """
+        幀離開管線時釋放它在環形緩衝區中的持有。
+        """
+        self.capture_manager.frame_ring.release(packet.seq)
+
+    def _capture_loop(self):
+        """
+        擷取執行緒：持續從攝影機讀取幀 (直接寫入捕獲管理器的環形緩衝區槽位) 並放入 inference 佇列。
+        """
+        logger.info("攝影機擷取執行緒啟動。")
+        while not self._stop_event.is_set():
+            seq, slot = self.capture_manager.acquire_frame_slot()
+            read_start = time.perf_counter()
+            ret, frame_np = self.cap.read(slot) if slot is not None else self.cap.read()
+            if not ret:
+                self.read_failure_count += 1
+                logger.warning("無法從攝影機讀取幀。")
+                self._stop_event.wait(0.1)
+                continue
+
+            # 擷取來源提供幀的時間戳 (grab 返回的時間) 時使用它，否則使用讀取完成的時間
+            timestamp = getattr(self.cap, 'last_timestamp', None) or time.time()
+            if self.stage_observer is not None:
+                self.stage_observer("capture", time.perf_counter() - read_start)
+            # MJPEG 直通模式下連同攝影機的 JPEG 一起提交 (證據影像直接上傳，不重新編碼)
+            encoded = getattr(self.cap, 'last_encoded', None)
+            seq = self.capture_manager.commit_frame(seq, frame_np, timestamp, encoded=encoded)
+            frame_data = self.capture_manager.get_frame(seq)
+            if frame_data is None or not self.capture_manager.frame_ring.retain(seq):
+                continue
+
+            self.captured_count += 1
+            self.inference_queue.put(FramePacket(frame_data.frame_np, timestamp, seq))
+        logger.info("攝影機擷取執行緒已終止。")
+
+    def _run_inference(self, packet: FramePacket) -> Optional[FramePacket]:
+        """
+        推論階段：轉換為推論後端的模型輸入 (Jetson 後端為色彩轉換並上傳到 CUDA)、執行物件偵測，
+        並將結果加入捕獲管理器緩衝區。啟用排程器時，靜止畫面的幀略過推論並沿用上一次的偵測結果。
+        """
+        if self.scheduler is not None and not self.scheduler.should_infer(packet.frame_np, packet.timestamp):
+            packet.detections_raw = self.scheduler.last_detections
+            packet.detection_table = self._last_table
+            packet.tracks = self._last_tracks
+            self.capture_manager.set_frame_detections(packet.seq, None, packet.detections_raw, packet.detection_table)
+            return packet
+
+        start = time.perf_counter()
+        try:
+            packet.frame_cuda = self.object_detector.prepare_input(packet.frame_np) if self.object_detector else None
+        except Exception as e:
+            logger.error(f"轉換模型輸入失敗: {e}", exc_info=True)
+            return None
+        if self.stage_observer is not None:
+            self.stage_observer("prepare_input", time.perf_counter() - start)
+
+        # 執行邊緣模型推論 (物件偵測)
+        start = time.perf_counter()
+        try:
+            if self.object_detector:
+                packet.detections_raw = self.object_detector.infer(packet.frame_cuda)
+        except Exception as e:
+            logger.error(f"物件偵測推論失敗: {e}", exc_info=True)
+            packet.detections_raw = []
+        if self.stage_observer is not None:
+            self.stage_observer("model_inference", time.perf_counter() - start)
+        coord_scale = self.capture_manager.coord_scale
+        if coord_scale != 1.0 and packet.detections_raw:
+            # 雙分辨率模式：推論在縮小的幀上執行，偵測座標映射回原始分辨率 (區域、ROI 與證據裁剪使用的座標)
+            packet.detections_raw = scale_detections(packet.detections_raw, 1.0 / coord_scale)
+        packet.inferred = True
+        # 每幀只轉換一次，偵測器、追蹤器與顯示共用同一份偵測結果表
+        packet.detection_table = DetectionTable.from_detections(packet.detections_raw, self.class_index)
+        self._last_table = packet.detection_table
+        if self.scheduler is not None:
+            self.scheduler.update_detections(packet.detections_raw)
+        if self.tracker is not None:
+            try:
+                self._last_tracks = self.tracker.update(packet.detection_table)
+            except Exception as e:
+                logger.error(f"多目標追蹤更新失敗: {e}", exc_info=True)
+            packet.tracks = self._last_tracks
+
+        # 將偵測結果附加到緩衝區中的當前幀 (幀本身已由擷取執行緒直接寫入緩衝區)
+        self.capture_manager.set_frame_detections(packet.seq, packet.frame_cuda, packet.detections_raw,
+                                                  packet.detection_table)
+        return packet
+
+    def _run_detectors(self, packet: FramePacket) -> FramePacket:
+        """
+        分派階段：將偵測結果傳遞給所有偵測器進行處理。
+        推論階段會領先分派階段 (分派佇列中可能還有較新的幀)，因此偵測器裁剪與上傳使用封包本身保留的幀，
+        而不是緩衝區中最新的幀，偵測座標與影像一定屬於同一幀。
+        """
+        frame_data = self.capture_manager.get_frame(packet.seq)
+        for detector in self.detectors:
+            start = time.perf_counter()
+            try:
+                detector.process(packet.frame_cuda, packet.detections_raw, tracks=packet.tracks,
+                                 detection_table=packet.detection_table, frame_data=frame_data)
+            except Exception as e:
+                logger.error(f"偵測器 '{detector.__class__.__name__}' 處理失敗: {e}", exc_info=True)
+            if self.stage_observer is not None:
+                self.stage_observer(f"detector.{detector.__class__.__name__}", time.perf_counter() - start)
+        if self.stage_observer is not None:
+            self.stage_observer("end_to_end", time.time() - packet.timestamp)
+        return packet
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取管線的統計數據，包含每個階段的佇列深度與處理時間。
+        Returns:
+            Dict[str, Any]: 統計數據字典。
+        """
+        elapsed = time.time() - self._start_time if self._start_time else 0.0
+        return {
+            "uptime_sec": round(elapsed, 1),
+            "captured_frames": self.captured_count,
+            "read_failures": self.read_failure_count,
+            "frame_buffer": self.capture_manager.frame_ring.get_metrics(),
+            "full_frame_buffer": dict(self.capture_manager.full_ring.get_metrics(),
+                                      misses=self.capture_manager.full_frame_misses)
+                                 if self.capture_manager.full_ring is not None else {},
+            "capture_fps": round(self.captured_count / elapsed, 2) if elapsed > 0 else 0.0,
+            "queues": {
+                q.name: q.get_metrics()
+                for q in (self.inference_queue, self.dispatch_queue, self.display_queue)
+            },
+            "stages": {
+                "inference": self._inference_stage.get_metrics(),
+                "dispatch": self._dispatch_stage.get_metrics(),
+            },
+            "scheduler": self.scheduler.get_metrics() if self.scheduler is not None else {},
+            "tracker": self.tracker.get_metrics() if self.tracker is not None else {},
+            "source": self.cap.get_metrics() if hasattr(self.cap, 'get_metrics') else {},
+        }
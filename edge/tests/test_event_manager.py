@@ -0,0 +1,64 @@
+# tests/test_event_manager.py
+
+from events.event_manager import EventManager, TokenBucket
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(rate_per_sec=2, burst=3, now=0.0)
+    for _ in range(3):
+        assert bucket.available(0.0)
+        bucket.consume(0.0)
+    assert not bucket.available(0.0)
+    assert bucket.available(0.5) # 0.5 秒補充 1 個令牌
+    bucket.consume(0.5)
+    assert not bucket.available(0.5)
+    assert bucket.available(100.0) and bucket.tokens == bucket.capacity == 3
+
+
+def test_token_bucket_never_owes_tokens():
+    bucket = TokenBucket(rate_per_sec=1, burst=1, now=0.0)
+    bucket.consume(0.0)
+    bucket.consume(0.0)
+    assert bucket.tokens == 0.0
+    assert bucket.available(1.0)
+
+
+def test_cooldown_and_release():
+    clock = FakeClock()
+    manager = EventManager({"default_cooldown_seconds": 5}, clock=clock)
+    assert manager.try_acquire("A")
+    assert not manager.try_acquire("A")
+    manager.release("A")
+    assert manager.try_acquire("A")
+    clock.now = 6.0
+    assert manager.try_acquire("A")
+
+
+def test_per_type_rate_limit_applies_to_prefixed_keys():
+    clock = FakeClock()
+    manager = EventManager({"default_cooldown_seconds": 0, "CARGO": {"rate_per_sec": 1, "burst": 2}}, clock=clock)
+    assert manager.try_acquire("CARGO_alice")
+    assert manager.try_acquire("CARGO_bob")
+    assert not manager.try_acquire("CARGO_carol")
+    assert manager.try_acquire("OTHER")
+    clock.now = 1.0
+    assert manager.try_acquire("CARGO_carol")
+    metrics = manager.get_metrics()
+    assert metrics["accepted"] == 4 and metrics["rate_rejected"] == 1
+
+
+def test_long_cooldown_outlives_key_ttl():
+    clock = FakeClock()
+    manager = EventManager({"default_cooldown_seconds": 0, "key_ttl_sec": 10}, clock=clock)
+    assert manager.try_acquire("LONG", cooldown_override=100)
+    clock.now = 50.0
+    assert manager.try_acquire("OTHER") # 觸發淘汰：冷卻中的鍵不會因 key_ttl_sec 被移除
+    assert not manager.try_acquire("LONG", cooldown_override=100)
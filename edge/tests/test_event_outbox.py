@@ -0,0 +1,59 @@
+# tests/test_event_outbox.py
+
+import time
+
+from events.event_outbox import EventOutbox
+
+
+def _outbox(tmp_path, **settings) -> EventOutbox:
+    return EventOutbox(dict(settings, path=str(tmp_path / "outbox.db")))
+
+
+def test_append_peek_remove_in_order(tmp_path):
+    outbox = _outbox(tmp_path)
+    ids = [outbox.append("T", {"i": i}) for i in range(3)]
+    events = outbox.peek(10)
+    assert [event_id for event_id, _, _ in events] == ids
+    assert [payload["i"] for _, _, payload in events] == [0, 1, 2]
+    assert [event_id for event_id, _, _ in outbox.peek(10, exclude_ids={ids[0]})] == ids[1:]
+
+    outbox.remove(ids[0])
+    assert outbox.count() == 2
+    assert outbox.get_metrics()["removed"] == 1
+    outbox.close()
+
+
+def test_max_events_drops_oldest(tmp_path):
+    outbox = _outbox(tmp_path, max_events=3)
+    for i in range(5):
+        outbox.append("T", {"i": i})
+    assert [payload["i"] for _, _, payload in outbox.peek(10)] == [2, 3, 4]
+    metrics = outbox.get_metrics()
+    assert (metrics["pending"], metrics["evicted"]) == (3, 2)
+
+    outbox.remove(outbox.peek(1)[0][0])
+    outbox.append("T", {"i": 5})
+    assert [payload["i"] for _, _, payload in outbox.peek(10)] == [3, 4, 5]
+    outbox.close()
+
+
+def test_max_age_drops_expired(tmp_path):
+    outbox = _outbox(tmp_path, max_age_sec=0.05)
+    outbox.append("T", {"i": 0})
+    time.sleep(0.1)
+    outbox.append("T", {"i": 1})
+    assert [payload["i"] for _, _, payload in outbox.peek(10)] == [1]
+    outbox.close()
+
+
+def test_pending_events_survive_reopen(tmp_path):
+    outbox = _outbox(tmp_path, max_events=2)
+    for i in range(2):
+        outbox.append("T", {"i": i})
+    outbox.close()
+
+    reopened = _outbox(tmp_path, max_events=2)
+    assert reopened.count() == 2
+    reopened.append("T", {"i": 2})
+    assert [payload["i"] for _, _, payload in reopened.peek(10)] == [1, 2]
+    reopened.close()
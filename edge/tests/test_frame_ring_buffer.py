@@ -0,0 +1,72 @@
+# tests/test_frame_ring_buffer.py
+
+import numpy as np
+
+from data_capture.frame_ring_buffer import FrameRingBuffer
+
+SHAPE = (4, 6, 3)
+
+
+def _write(ring: FrameRingBuffer, value: int, timestamp: float) -> int:
+    seq, slot = ring.acquire_write_slot()
+    slot[:] = value
+    return ring.commit(seq, timestamp)
+
+
+def test_overwritten_frame_is_gone():
+    ring = FrameRingBuffer(2, SHAPE)
+    first = _write(ring, 1, 1.0)
+    _write(ring, 2, 2.0)
+    _write(ring, 3, 3.0)
+    assert ring.get(first) is None
+    assert ring.get_recent_seqs() == [1, 2]
+
+
+def test_retained_frame_survives_overwrite_until_release():
+    ring = FrameRingBuffer(2, SHAPE)
+    first = _write(ring, 1, 1.0)
+    assert ring.retain(first)
+    ring.set_metadata(first, None, ["det"])
+    for value in range(2, 6):
+        _write(ring, value, float(value))
+
+    frame, timestamp, _, detections = ring.get(first)
+    assert np.all(frame == 1) and timestamp == 1.0 and detections == ["det"]
+    assert not frame.flags.writeable
+    assert ring.get_metrics()["evicted_copies"] == 1
+
+    ring.release(first)
+    assert ring.get(first) is None
+    assert ring.get_metrics()["retained"] == 0
+
+
+def test_retain_is_reference_counted():
+    ring = FrameRingBuffer(2, SHAPE)
+    first = _write(ring, 7, 1.0)
+    assert ring.retain(first) and ring.retain(first)
+    _write(ring, 8, 2.0)
+    _write(ring, 9, 3.0)
+    ring.release(first)
+    assert ring.get(first) is not None
+    ring.release(first)
+    assert ring.get(first) is None
+
+
+def test_retain_fails_for_overwritten_frame():
+    ring = FrameRingBuffer(1, SHAPE)
+    first = _write(ring, 1, 1.0)
+    _write(ring, 2, 2.0)
+    assert not ring.retain(first)
+
+
+def test_commit_copies_foreign_array_and_keeps_encoded():
+    ring = FrameRingBuffer(3)
+    frame = np.full(SHAPE, 5, dtype=np.uint8)
+    encoded = np.frombuffer(b"\xff\xd8jpeg", dtype=np.uint8)
+    seq, slot = ring.acquire_write_slot()
+    assert slot is None # 第一幀寫入時才配置
+    seq = ring.commit(seq, 1.0, frame, encoded)
+    frame[:] = 0
+    stored, _, _, _ = ring.get(seq)
+    assert np.all(stored == 5)
+    assert ring.get_encoded(seq) is encoded
@@ -0,0 +1,97 @@
+# tests/test_qr_service.py
+
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from utils.qr_service import QRService, NOT_ATTEMPTED
+
+
+class ManualExecutor:
+    """手動完成的執行器：提交的任務保持進行中，直到測試調用 finish()。"""
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def finish(self, result=None):
+        for future in self.futures:
+            if not future.done():
+                future.set_result((result, 0.001))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def make_service(**settings) -> QRService:
+    service = QRService(dict({"num_workers": 0}, **settings))
+    service._executor = ManualExecutor()
+    return service
+
+
+def make_crops(count: int):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (40, 40, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def test_batch_is_not_truncated_by_max_pending():
+    service = make_service(max_pending=2)
+    batch = service.submit_batch(make_crops(3), [1, 2, 3])
+    assert len(service._executor.futures) == 3
+    service._executor.finish("QR-DATA")
+    assert batch.result(timeout=1) == ["QR-DATA"] * 3
+    assert service.get_metrics()["rejected"] == 0
+
+
+def test_batch_rejected_when_full_is_not_attempted():
+    service = make_service(max_pending=2)
+    first = service.submit_batch(make_crops(2), [1, 2])
+    second = service.submit_batch(make_crops(2), [3, 4])
+    assert second.result(timeout=1) == [NOT_ATTEMPTED, NOT_ATTEMPTED]
+    assert service.get_metrics()["rejected"] == 2
+    service._executor.finish(None)
+    assert first.result(timeout=1) == [None, None] # 已解碼但沒有 QR Code
+
+
+def test_failed_decode_is_not_attempted():
+    service = make_service()
+    batch = service.submit_batch(make_crops(1), [1])
+    service._executor.futures[0].set_exception(RuntimeError("boom"))
+    assert batch.result(timeout=1) == [NOT_ATTEMPTED]
+    assert service.get_metrics()["errors"] == 1
+
+
+class BrokenExecutor(ManualExecutor):
+    def submit(self, fn, *args):
+        raise BrokenProcessPool("worker died")
+
+
+def test_restarts_pool_broken_on_submit():
+    service = make_service()
+    service._executor = BrokenExecutor()
+    replacement = ManualExecutor()
+    service._create_executor = lambda: replacement
+    future = service.submit(make_crops(1)[0], track_id=1)
+    assert service._executor is replacement and len(replacement.futures) == 1
+    replacement.finish("QR-DATA")
+    assert future.result(timeout=1) == "QR-DATA"
+    assert service.get_metrics()["pool_restarts"] == 1
+
+
+def test_restarts_pool_broken_while_decoding():
+    service = make_service()
+    replacements = []
+    service._create_executor = lambda: replacements.append(ManualExecutor()) or replacements[-1]
+    batch = service.submit_batch(make_crops(2), [1, 2])
+    for worker_future in service._executor.futures:
+        worker_future.set_exception(BrokenProcessPool("worker died"))
+    assert len(replacements) == 1 # 同一個損壞的進程池只重建一次
+    assert not batch.done()
+    replacements[0].futures[0].set_exception(BrokenProcessPool("worker died again"))
+    replacements[0].finish("QR-DATA")
+    assert batch.result(timeout=1) == [NOT_ATTEMPTED, "QR-DATA"] # 每個任務只重試一次
+    assert service.get_metrics()["pool_restarts"] == 1
@@ -0,0 +1,67 @@
+# tests/test_recording.py
+
+import cv2
+import numpy as np
+
+from data_capture.recording import KIND_FRAME, RecordedFrame, RecordedResult, RecordingReader, RecordingWriter
+from inference.detection_table import DETECTION_DTYPE
+
+
+def _records(count: int) -> np.ndarray:
+    records = np.zeros(count, dtype=DETECTION_DTYPE)
+    records['class_id'] = np.arange(count) + 1
+    records['confidence'] = 0.5
+    records['bbox'] = [10, 20, 30, 40]
+    return records
+
+
+def _write_sample(path: str):
+    image = np.zeros((24, 32, 3), dtype=np.uint8)
+    image[:, :16] = 255
+    ret, jpeg = cv2.imencode('.jpg', image)
+    assert ret
+    writer = RecordingWriter(path, {"frame_width": 64, "frame_height": 48}, chunk_bytes=4096)
+    writer.write_frame(10.0, 0, jpeg, _records(2))
+    writer.write_result(10.5, "recognition", "alice", "cam-1", {"person_id": "alice"})
+    writer.write_frame(11.0, 1, jpeg, _records(0))
+    return writer, jpeg.tobytes()
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "a.edgerec")
+    writer, jpeg = _write_sample(path)
+    writer.close()
+
+    with RecordingReader(path) as reader:
+        assert reader.complete
+        assert reader.header["frame_width"] == 64
+        assert (len(reader), reader.frame_count, reader.result_count) == (3, 2, 1)
+        assert (reader.start_time, reader.end_time) == (10.0, 11.0)
+
+        records = list(reader.iter_records())
+        assert isinstance(records[0], RecordedFrame) and isinstance(records[1], RecordedResult)
+        first = records[0]
+        assert bytes(first.jpeg) == jpeg
+        assert first.records['class_id'].tolist() == [1, 2]
+        assert first.records['bbox'][0].tolist() == [10, 20, 30, 40]
+        assert first.decode().shape == (24, 32, 3)
+        result = records[1]
+        assert (result.kind, result.key, result.camera_id, result.data) == ("recognition", "alice", "cam-1", {"person_id": "alice"})
+        assert len(records[2].records) == 0
+        del records, first, result # 釋放檔案視圖後 mmap 才能關閉
+
+        assert [r.timestamp for r in reader.iter_records(start=10.5)] == [10.5, 11.0]
+        assert [r.timestamp for r in reader.iter_records(kind=KIND_FRAME)] == [10.0, 11.0]
+
+
+def test_interrupted_recording_rebuilds_index(tmp_path):
+    path = str(tmp_path / "b.edgerec")
+    writer, _ = _write_sample(path)
+    writer.flush() # 模擬錄製中斷：區塊已寫入，但沒有索引與檔尾
+    with open(path, 'ab') as f:
+        f.write(b"FRME\x00\x10") # 寫到一半的記錄
+
+    with RecordingReader(path) as reader:
+        assert not reader.complete
+        assert (reader.frame_count, reader.result_count) == (2, 1)
+    writer._file.close()
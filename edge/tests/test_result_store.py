@@ -0,0 +1,56 @@
+# tests/test_result_store.py
+
+from events.result_store import ResultStore
+
+
+def _recognize(store: ResultStore, person_id: str, at: float, camera_id: str = None):
+    payload = {"person_id": person_id}
+    if camera_id:
+        payload["camera_id"] = camera_id
+    return store.update_recognition(payload, received_at=at)
+
+
+def test_identity_not_overwritten_by_later_unknown():
+    store = ResultStore(default_camera_id="cam")
+    _recognize(store, "alice", 100.0)
+    _recognize(store, "unknown", 101.0)
+    _recognize(store, "no_person", 102.0)
+    identity = store.identity_at(103.0, max_age_sec=10)
+    assert identity is not None and identity.key == "alice"
+    assert store.latest_recognition().key == "no_person"
+
+
+def test_identity_respects_query_time_and_max_age():
+    store = ResultStore(default_camera_id="cam")
+    _recognize(store, "alice", 100.0)
+    _recognize(store, "bob", 105.0)
+    assert store.identity_at(104.0, max_age_sec=10).key == "alice"
+    assert store.identity_at(106.0, max_age_sec=10).key == "bob"
+    assert store.identity_at(99.0, max_age_sec=10) is None
+    assert store.identity_at(120.0, max_age_sec=10) is None
+
+
+def test_identity_is_per_camera():
+    store = ResultStore(default_camera_id="cam-a")
+    _recognize(store, "alice", 100.0, camera_id="cam-a")
+    _recognize(store, "bob", 101.0, camera_id="cam-b")
+    assert store.identity_at(102.0, 10).key == "alice"
+    assert store.identity_at(102.0, 10, camera_id="cam-b").key == "bob"
+
+
+def test_history_is_bounded_and_newest_first():
+    store = ResultStore({"history_size": 2}, default_camera_id="cam")
+    for i in range(4):
+        _recognize(store, "alice", 100.0 + i)
+    assert [r.timestamp for r in store.person_history("alice")] == [103.0, 102.0]
+    assert store.person_history("unknown") == ()
+
+
+def test_snapshot_is_not_mutated_by_later_writes():
+    store = ResultStore(default_camera_id="cam")
+    _recognize(store, "alice", 100.0)
+    snapshot = store.snapshot
+    _recognize(store, "bob", 101.0)
+    assert snapshot.latest_recognition.key == "alice"
+    assert "bob" not in snapshot.person_history
+    assert store.snapshot.version == snapshot.version + 1
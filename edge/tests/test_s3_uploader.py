@@ -0,0 +1,45 @@
+# tests/test_s3_uploader.py
+
+import queue
+import time
+
+from benchmark.stubs import MockS3Client
+from utils.s3_uploader import S3Uploader
+
+
+def make_uploader(spool_dir, queue_size: int = 2) -> S3Uploader:
+    aws_settings = {"s3": {"bucket_name": "test-bucket", "spool_dir": str(spool_dir),
+                           "spool_max_mb": 1, "spool_drain_interval_sec": 0.05}}
+    return S3Uploader(aws_settings, queue.Queue(maxsize=queue_size), s3_client=MockS3Client())
+
+
+def test_spool_size_seeded_from_existing_files(tmp_path):
+    (tmp_path / "1_a.jpg").write_bytes(b"x" * 100)
+    (tmp_path / "2_b.jpg").write_bytes(b"x" * 50)
+    (tmp_path / "3_c.jpg.tmp").write_bytes(b"x" * 999) # 未完成的暫存檔不計入
+    metrics = make_uploader(tmp_path).get_metrics()
+    assert metrics["spool_files"] == 2
+    assert metrics["spool_bytes"] == 150
+
+
+def test_spool_size_tracks_writes_limit_and_drain(tmp_path):
+    uploader = make_uploader(tmp_path)
+    for index in range(2): # 佔滿佇列
+        uploader.put_upload_task(b"q" * 10, f"queued-{index}.jpg")
+    uploader.put_upload_task(b"s" * 600 * 1024, "spooled-1.jpg")
+    metrics = uploader.get_metrics()
+    assert (metrics["spool_files"], metrics["spool_bytes"]) == (1, 600 * 1024)
+
+    uploader.put_upload_task(b"s" * 600 * 1024, "spooled-2.jpg") # 超過 spool_max_mb
+    metrics = uploader.get_metrics()
+    assert metrics["spool_dropped"] == 1 and metrics["spool_files"] == 1
+
+    uploader.start()
+    deadline = time.monotonic() + 5
+    while uploader.get_metrics()["spool_files"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    uploader.stop()
+    uploader.join(timeout=5)
+    metrics = uploader.get_metrics()
+    assert (metrics["spool_files"], metrics["spool_bytes"]) == (0, 0)
+    assert metrics["drained"] == 1 and list(tmp_path.iterdir()) == []
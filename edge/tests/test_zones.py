@@ -0,0 +1,67 @@
+# tests/test_zones.py
+
+import queue
+
+import numpy as np
+import pytest
+
+from benchmark.stubs import MockS3Client, StubInferenceBackend
+from data_capture.capture_manager import CaptureManager
+from inference.backends import Detection
+from utils.s3_uploader import S3Uploader
+
+# 攝影機 1920x1080，MJPEG 直通模式以 1/4 縮小解碼供推論 (偵測座標為原始分辨率)
+CAMERA_HEIGHT, CAMERA_WIDTH = 1080, 1920
+INPUT_SCALE = 0.25
+# 位於畫面右下角的限制區域 (超出縮小幀 480x270 的範圍)
+ZONE = {"name": "dock", "rect": [1500, 800, 1900, 1060]}
+
+
+@pytest.fixture
+def capture_manager():
+    aws_settings = {"s3": {"bucket_name": "test-bucket", "spool_dir": ""}}
+    uploader = S3Uploader(aws_settings, queue.Queue(maxsize=10), s3_client=MockS3Client())
+    manager = CaptureManager(uploader, aws_settings["s3"], {"frame_buffer_size": 4})
+    manager.configure_frame_shape(CAMERA_HEIGHT, CAMERA_WIDTH, 3, input_scale=INPUT_SCALE)
+    yield manager
+    manager.shutdown()
+
+
+def test_mjpeg_mode_reports_camera_resolution(capture_manager):
+    assert capture_manager.frame_shape == (CAMERA_HEIGHT, CAMERA_WIDTH, 3)
+    assert capture_manager.frame_ring.frame_shape == (270, 480, 3)
+    assert capture_manager.coord_scale == pytest.approx(INPUT_SCALE)
+
+
+def test_zone_violation_in_mjpeg_mode(capture_manager):
+    pytest.importorskip("awsiot") # 偵測器經由 EventPublisher 導入 AWS IoT SDK
+    from detectors.base_detector import BaseDetector
+    from events.event_manager import EventManager
+    from inference.detection_table import DetectionTable
+    from inference.inferencer import ObjectDetector
+
+    class RecordingPublisher:
+        thing_name = "test-thing"
+
+        def __init__(self):
+            self.events = []
+
+        def publish_event(self, event_type, s3_image_path=None, metadata=None):
+            self.events.append((event_type, metadata))
+
+    publisher = RecordingPublisher()
+    object_detector = ObjectDetector(model=StubInferenceBackend(), class_mapping={1: "person"})
+    detector = BaseDetector({"enabled": True, "zones": [ZONE], "zone_cooldown_seconds": 0}, object_detector,
+                            EventManager({}), publisher, capture_manager)
+
+    seq, slot = capture_manager.acquire_frame_slot()
+    slot[:] = 0
+    capture_manager.commit_frame(seq, slot, 1.0)
+    detections = [Detection(1, 0.9, 1600, 850, 1700, 1000), Detection(1, 0.9, 100, 100, 200, 200)]
+    table = DetectionTable.from_detections(detections, object_detector.class_index)
+    capture_manager.set_frame_detections(seq, None, detections, table)
+
+    detector._check_zones(table, ["person"], "PERSON_IN_RESTRICTED_AREA", capture_manager.get_frame(seq))
+    assert [(event_type, metadata["zone_name"], metadata["object_bbox"]) for event_type, metadata in publisher.events] == [
+        ("PERSON_IN_RESTRICTED_AREA", "dock", [1600.0, 850.0, 1700.0, 1000.0])
+    ]
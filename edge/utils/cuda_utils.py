@@ -1,5 +1,6 @@
 # utils/cuda_utils.py
 
+import cv2
 import jetson.utils
 import numpy as np
 
@@ -2,6 +2,49 @@
 
 import cv2
 import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+# 縮放插值方法 (設定值 -> OpenCV 常數)
+INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "area": cv2.INTER_AREA, # 品質最好，但從 4K 縮小時成本明顯較高
+}
+
+def shrink_to_width(image: np.ndarray, max_width: int, dst: Optional[np.ndarray] = None,
+                    interpolation: int = cv2.INTER_AREA) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    將影像按比例縮小到 max_width 以內，縮小結果寫入可重複使用的預先配置緩衝區 (每幀不重新配置記憶體)。
+    Args:
+        image (np.ndarray): OpenCV 影像。
+        max_width (int): 最大寬度 (0 表示不縮小)。
+        dst (np.ndarray, optional): 上一次返回的緩衝區，尺寸不符時重新配置。
+        interpolation (int): OpenCV 插值方法。
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: (縮小後的影像 (不需縮小時為原影像), 供下一次使用的緩衝區)。
+    """
+    h, w = image.shape[:2]
+    if not max_width or w <= max_width:
+        return image, dst
+    size = (max_width, max(1, int(h * max_width / w)))
+    if dst is None or dst.shape[1::-1] != size or dst.shape[2:] != image.shape[2:] or dst.dtype != image.dtype:
+        dst = np.empty((size[1], size[0]) + image.shape[2:], dtype=image.dtype)
+    cv2.resize(image, size, dst=dst, interpolation=interpolation)
+    return dst, dst
+
+def scale_bbox(bbox: Sequence[float], scale: float) -> List[int]:
+    """
+    將邊界框從一個座標空間映射到另一個 (例如原始分辨率與推論分辨率之間)。
+    Args:
+        bbox (Sequence[float]): 邊界框 [x1, y1, x2, y2]。
+        scale (float): 目標座標相對來源座標的縮放比例。
+    Returns:
+        List[int]: 映射後的整數邊界框 (向外取整，確保包含原本的範圍)。
+    """
+    if scale == 1.0:
+        return [int(v) for v in bbox]
+    x1, y1, x2, y2 = bbox
+    return [int(np.floor(x1 * scale)), int(np.floor(y1 * scale)), int(np.ceil(x2 * scale)), int(np.ceil(y2 * scale))]
 
 def resize_for_display(image: np.ndarray, max_width: int, max_height: int) -> np.ndarray:
     """
@@ -21,25 +64,38 @@ def resize_for_display(image: np.ndarray, max_width: int, max_height: int) -> np
         return cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA)
     return image
 
-def draw_detections(image: np.ndarray, detections: list, class_mapping: dict) -> np.ndarray:
+def draw_detections(image: np.ndarray, detections, class_mapping: dict, scale: float = 1.0,
+                    copy: bool = True) -> np.ndarray:
     """
     在影像上繪製偵測結果的邊框和標籤。
     Args:
         image (np.ndarray): 原始 OpenCV 影像。
-        detections (list): jetson.inference.detectNet 輸出的偵測結果列表。
+        detections (DetectionTable | list): 每幀建立的偵測結果表，或推論後端輸出的偵測結果列表
+                                            (jetson.inference.Detection 或 inference.backends.Detection)。
         class_mapping (dict): 模型類別 ID 到內部類別名稱的映射。
+        scale (float): 偵測結果座標 (原始分辨率) 到 image 的縮放比例 (在已縮小的顯示影像上繪製時使用)。
+        copy (bool): 是否在拷貝上繪製 (False 時原地繪製，image 需可寫入)。
     Returns:
         np.ndarray: 繪製後的影像。
     """
-    output_image = image.copy() # 避免修改原始影像
-    for det in detections:
-        class_id = det.ClassID
-        confidence = det.Confidence
-        left, top, right, bottom = int(det.Left), int(det.Top), int(det.Right), int(det.Bottom)
+    output_image = image.copy() if copy else image # 避免修改原始影像
+    if hasattr(detections, 'records'):
+        # 偵測結果表：一次取出所有邊框與欄位，不逐一存取偵測物件屬性
+        records = detections.records
+        bboxes = records['bbox'] * scale if scale != 1.0 else records['bbox']
+        rows = zip(records['class_id'].tolist(), records['confidence'].tolist(),
+                   bboxes.astype(np.int32).tolist(), records['track_id'].tolist())
+    else:
+        rows = ((det.ClassID, det.Confidence,
+                 [int(det.Left * scale), int(det.Top * scale), int(det.Right * scale), int(det.Bottom * scale)], -1)
+                for det in detections)
 
+    for class_id, confidence, (left, top, right, bottom), track_id in rows:
         # 根據信心度和類別繪製不同的顏色或標籤
         color = (0, 255, 0) # 綠色
         label = class_mapping.get(class_id, f"Class {class_id}") # 使用內部類別名或原始 ID
+        if track_id >= 0:
+            label += f" #{track_id}"
         label += f": {confidence:.2f}"
 
         cv2.rectangle(output_image, (left, top), (right, bottom), color, 2)
@@ -47,18 +103,40 @@ def draw_detections(image: np.ndarray, detections: list, class_mapping: dict) ->
 
     return output_image
 
-# 可擴展添加其他繪圖函數，如繪製 ROI
-# def draw_roi(image: np.ndarray, roi: list, color=(255, 0, 0), thickness=2) -> np.ndarray:
-#     """
-#     在影像上繪製感興趣區域 (ROI)。
-#     Args:
-#         image (np.ndarray): 原始 OpenCV 影像。
-#         roi (list): ROI 座標 [x1, y1, x2, y2]。
-#         color (tuple): 繪製顏色 (BGR)。
-#         thickness (int): 線條粗細。
-#     Returns:
-#         np.ndarray: 繪製後的影像。
-#     """
-#     output_image = image.copy()
-#     cv2.rectangle(output_image, (roi[0], roi[1]), (roi[2], roi[3]), color, thickness)
-#     return output_image
\ No newline at end of file
+def draw_zones(image: np.ndarray, zones: list, scale: float = 1.0) -> np.ndarray:
+    """
+    在影像上繪製多邊形區域 (原地繪製)。
+    Args:
+        image (np.ndarray): OpenCV 影像 (需可寫入)。
+        zones (list): detectors.zones.Zone 列表。
+        scale (float): 原始分辨率到 image 的縮放比例 (像素座標的區域依此換算)。
+    Returns:
+        np.ndarray: 繪製後的影像。
+    """
+    h, w = image.shape[:2]
+    frame_w, frame_h = int(round(w / scale)), int(round(h / scale)) # 區域座標所在的原始分辨率
+    for zone in zones:
+        color = (0, 0, 255) if zone.zone_type == "restricted" else (255, 128, 0) # 限制區域紅色，允許區域藍色
+        points = zone.to_pixels(frame_w, frame_h)
+        if scale != 1.0:
+            points = np.round(points * scale).astype(np.int32)
+        cv2.polylines(image, [points], isClosed=True, color=color, thickness=2)
+        cv2.putText(image, zone.name, (int(points[0][0]), int(points[0][1]) - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return image
+
+def draw_roi(image: np.ndarray, roi: list, scale: float = 1.0, color=(0, 0, 255), thickness: int = 2) -> np.ndarray:
+    """
+    在影像上繪製感興趣區域 (ROI) (原地繪製)。
+    Args:
+        image (np.ndarray): OpenCV 影像 (需可寫入)。
+        roi (list): ROI 座標 [x1, y1, x2, y2] (原始分辨率的像素)。
+        scale (float): 原始分辨率到 image 的縮放比例。
+        color (tuple): 繪製顏色 (BGR)。
+        thickness (int): 線條粗細。
+    Returns:
+        np.ndarray: 繪製後的影像。
+    """
+    p1 = (int(roi[0] * scale), int(roi[1] * scale))
+    p2 = (int(roi[2] * scale), int(roi[3] * scale))
+    cv2.rectangle(image, p1, p2, color, thickness)
+    return image
@@ -0,0 +1,428 @@
+# utils/metrics.py
+
+import re
+import json
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 預設的延遲直方圖區間上限 (秒)，涵蓋 1 ms 的色彩轉換到數秒的 S3 上傳
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def sanitize_name(name: str) -> str:
+    """
+    將任意字串轉換為合法的 Prometheus 指標名稱片段。
+    """
+    return _INVALID_NAME_CHARS.sub("_", str(name)).strip("_").lower()
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    """
+    固定區間的直方圖：每次觀察只做一次二分搜尋與計數，不保存樣本。
+    """
+    __slots__ = ("_lock", "buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # 最後一格為 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q: float) -> float:
+        """
+        以區間內線性插值估計分位數 (與 Prometheus histogram_quantile 相同的估計方式)。
+        """
+        counts, _, count = self.snapshot()
+        if count == 0:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index >= len(self.buckets):
+                    return lower # 落在 +Inf 區間，只能返回最大的有限上限
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class _Metric:
+    """
+    有標籤的指標基類。labels() 返回並快取對應標籤值的子指標，熱路徑上只需一次字典查找。
+    """
+    metric_type = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError("Subclass must implement abstract method '_new_child'")
+
+    def labels(self, *label_values) -> Any:
+        key = tuple(str(value) for value in label_values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"指標 '{self.name}' 需要 {len(self.label_names)} 個標籤值，收到 {len(key)} 個。")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(child.value)}"
+                for key, child in self.children()]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def set_buckets(self, buckets: Sequence[float]):
+        """
+        更換區間 (只影響之後建立的子指標，應在開始觀察前調用)。
+        """
+        with self._lock:
+            self.buckets = tuple(sorted(float(b) for b in buckets))
+            self._children.clear()
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, child in self.children():
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for upper, bucket_count in zip(child.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(upper) if upper != float("inf") else "+Inf"}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+    def summary(self, quantiles: Sequence[float] = (0.5, 0.95, 0.99)) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            Dict[str, Dict[str, float]]: 標籤值 (以 "," 連接) -> 次數、平均與估計分位數 (毫秒)。
+        """
+        result = {}
+        for key, child in self.children():
+            _, total, count = child.snapshot()
+            if count == 0:
+                continue
+            item = {"count": count, "avg_ms": round(total / count * 1000, 3)}
+            for q in quantiles:
+                item[f"p{int(q * 100)}_ms"] = round(child.quantile(q) * 1000, 3)
+            result[",".join(key)] = item
+        return result
+
+
+class MetricsRegistry:
+    """
+    輕量的指標註冊表：直方圖與計數器在熱路徑上記錄，各元件既有的 get_metrics() 統計
+    則在擷取 (scrape) 時才讀取並展開為 Prometheus 指標，不增加額外的每幀成本。
+    未啟用時 observe_stage() 等輔助函數直接返回。
+    """
+    def __init__(self, namespace: str = "edge"):
+        self.namespace = namespace
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._components: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(f"{self.namespace}_{name}", help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{self.namespace}_{name}", help_text, label_names, buckets))
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def register_component(self, name: str, get_metrics: Callable[[], Dict[str, Any]]):
+        """
+        註冊一個元件的 get_metrics()，擷取時將其中的數值展開為 <namespace>_<name>_<鍵> 指標
+        (巢狀字典以 "_" 連接鍵名，例如 edge_pipeline_queues_inference_dropped)。
+        """
+        with self._lock:
+            self._components[sanitize_name(name)] = get_metrics
+
+    def unregister_component(self, name: str):
+        with self._lock:
+            self._components.pop(sanitize_name(name), None)
+
+    def _component_values(self) -> Iterable[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            components = list(self._components.items())
+        for name, get_metrics in components:
+            try:
+                yield name, get_metrics() or {}
+            except Exception as e:
+                logger.warning(f"讀取元件 '{name}' 的統計時發生錯誤: {e}")
+
+    @staticmethod
+    def _flatten(prefix: str, values: Dict[str, Any], out: List[Tuple[str, float]]):
+        for key, value in values.items():
+            name = f"{prefix}_{sanitize_name(key)}"
+            if isinstance(value, dict):
+                MetricsRegistry._flatten(name, value, out)
+            elif isinstance(value, bool):
+                out.append((name, 1.0 if value else 0.0))
+            elif isinstance(value, (int, float)):
+                out.append((name, float(value)))
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: Prometheus 文字格式 (0.0.4) 的所有指標。
+        """
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render())
+        for component, values in self._component_values():
+            flattened: List[Tuple[str, float]] = []
+            self._flatten(f"{self.namespace}_{component}", values, flattened)
+            for name, value in flattened:
+                lines.append(f"# TYPE {name} untyped")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 遙測用的摘要 (直方圖的估計分位數、計數器數值與各元件的統計)。
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        result: Dict[str, Any] = {}
+        for metric in metrics:
+            short_name = metric.name[len(self.namespace) + 1:]
+            if isinstance(metric, Histogram):
+                result[short_name] = metric.summary()
+            elif isinstance(metric, Counter):
+                result[short_name] = {",".join(key) or "value": child.value for key, child in metric.children()}
+        result["components"] = dict(self._component_values())
+        return result
+
+
+# 全域預設註冊表與標準指標 (各模組在熱路徑上透過下面的輔助函數記錄)
+REGISTRY = MetricsRegistry()
+STAGE_LATENCY = REGISTRY.histogram("stage_latency_seconds", "各處理階段的耗時 (秒)", ["stage"])
+STAGE_ERRORS = REGISTRY.counter("stage_errors_total", "各處理階段的錯誤次數", ["stage"])
+
+
+def configure(metrics_settings: Optional[dict]):
+    """
+    依設定 (config.metrics) 啟用全域註冊表並設定延遲區間。應在建立其他元件之前調用。
+    """
+    metrics_settings = metrics_settings or {}
+    REGISTRY.enabled = bool(metrics_settings.get('enabled', False))
+    buckets_ms = metrics_settings.get('latency_buckets_ms')
+    if buckets_ms:
+        STAGE_LATENCY.set_buckets([float(b) / 1000.0 for b in buckets_ms])
+
+
+def observe_stage(stage: str, elapsed_sec: float):
+    """
+    記錄一個階段的耗時 (可直接作為 FramePipeline 的 stage_observer)。未啟用時不做任何事。
+    """
+    if REGISTRY.enabled:
+        STAGE_LATENCY.labels(stage).observe(elapsed_sec)
+
+
+def count_error(stage: str):
+    if REGISTRY.enabled:
+        STAGE_ERRORS.labels(stage).inc()
+
+
+class _StageTimer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            observe_stage(self.stage, time.perf_counter() - self.start)
+        else:
+            count_error(self.stage)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage: str):
+    """
+    以 with 區塊記錄階段耗時 (例外時改為記錄錯誤次數)：with metrics.timed("jpeg_encode"): ...
+    未啟用時返回共用的空計時器，不呼叫時鐘。
+    """
+    return _StageTimer(stage) if REGISTRY.enabled else _NULL_TIMER
+
+
+class MetricsServer(threading.Thread):
+    """
+    在本機提供 Prometheus 格式指標的 HTTP 端點 (GET /metrics)。
+    """
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9108):
+        super().__init__(name="metrics-http", daemon=True)
+        self.registry = registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"指標端點請求: {format % args}")
+
+        self._server = ThreadingHTTPServer((host, int(port)), _Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+
+    def run(self):
+        logger.info(f"指標端點已啟動: http://{self.address[0]}:{self.address[1]}/metrics")
+        self._server.serve_forever(poll_interval=0.5)
+        logger.info("指標端點已停止。")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TelemetryReporter(threading.Thread):
+    """
+    每 interval_sec 秒將指標摘要發布到遙測 MQTT Topic。
+    """
+    def __init__(self, registry: MetricsRegistry, publish: Callable[[Dict[str, Any]], Any], interval_sec: float = 60.0):
+        """
+        Args:
+            registry (MetricsRegistry): 指標註冊表。
+            publish (Callable): 發布函數 (例如 AWSIoTClient.publish_telemetry)，接收 Payload 字典。
+            interval_sec (float): 發布間隔秒數。
+        """
+        super().__init__(name="telemetry-reporter", daemon=True)
+        self.registry = registry
+        self.publish = publish
+        self.interval_sec = max(1.0, float(interval_sec))
+        self._stop_event = threading.Event()
+        self.published_count = 0
+
+    def run(self):
+        logger.info(f"遙測發布執行緒啟動 (間隔 {self.interval_sec} 秒)。")
+        while not self._stop_event.wait(self.interval_sec):
+            try:
+                payload = {"timestamp": time.time(), "metrics": self.registry.summary()}
+                json.dumps(payload) # 提前檢查可序列化，錯誤記錄在這裡而不是 MQTT 執行緒
+                self.publish(payload)
+                self.published_count += 1
+            except Exception as e:
+                logger.warning(f"發布遙測摘要時發生錯誤: {e}")
+        logger.info("遙測發布執行緒已終止。")
+
+    def stop(self):
+        self._stop_event.set()
@@ -3,79 +3,196 @@
 import cv2
 import numpy as np
 import logging
-from typing import Optional, Tuple
+import threading
+from typing import List, Optional, Sequence, Tuple
 
 # 嘗試導入 pyzbar，這是常見的 QR Code 掃描庫
 try:
     from pyzbar import pyzbar
 except ImportError:
     pyzbar = None
-    logging.warning("pyzbar 庫未安裝。QR Code 掃描功能將不可用。請執行 'pip install pyzbar opencv-python'。")
+    logging.warning("pyzbar 庫未安裝。QR Code 掃描將改用 OpenCV QRCodeDetector (解碼率較低)。建議執行 'pip install pyzbar opencv-python'。")
     # 注意：pyzbar 可能需要安裝額外的依賴，例如 libzbar0
 
 logger = logging.getLogger(__name__)
 
 
+# 重試階梯：(縮放倍率, 二值化方式)，依序嘗試直到解碼成功
+DECODE_LADDER: Tuple[Tuple[float, Optional[str]], ...] = (
+    (1.0, None),
+    (1.0, "otsu"),
+    (2.0, None),
+    (1.0, "adaptive"),
+    (0.5, None),
+    (2.0, "otsu"),
+)
+LOCATE_MAX_WIDTH = 640 # 粗定位時縮小到的最大寬度
+LOCATE_PADDING = 0.15  # 粗定位區域向外擴展的比例 (保留靜區，提高解碼率)
+
+_thread_local = threading.local()
+
+
+def _qr_detector() -> "cv2.QRCodeDetector":
+    # cv2.QRCodeDetector 不是執行緒安全的，每個執行緒各自建立一個
+    detector = getattr(_thread_local, "detector", None)
+    if detector is None:
+        detector = cv2.QRCodeDetector()
+        _thread_local.detector = detector
+    return detector
+
+
+def expand_bbox(bbox: Sequence[int], frame_width: int, frame_height: int, expansion: float = 0.1) -> List[int]:
+    """
+    向外擴展邊界框 (確保 QR Code 完全在裁剪區域內)，並限制在影像範圍內。
+    Args:
+        bbox (Sequence[int]): 邊界框 [x1, y1, x2, y2]。
+        frame_width (int): 影像寬度。
+        frame_height (int): 影像高度。
+        expansion (float): 擴展比例 (相對邊框寬高)。
+    Returns:
+        List[int]: 擴展後的邊界框 [x1, y1, x2, y2]。
+    """
+    x1, y1, x2, y2 = [int(v) for v in bbox]
+    x_expansion = int((x2 - x1) * expansion)
+    y_expansion = int((y2 - y1) * expansion)
+    return [max(0, x1 - x_expansion), max(0, y1 - y_expansion),
+            min(frame_width, x2 + x_expansion), min(frame_height, y2 + y_expansion)]
+
+
+def locate_qr_regions(gray_image: np.ndarray, max_width: int = LOCATE_MAX_WIDTH,
+                      padding: float = LOCATE_PADDING) -> List[List[int]]:
+    """
+    在縮小的灰階影像上粗定位 QR Code 候選區域 (cv2.QRCodeDetector.detectMulti)。
+    Args:
+        gray_image (np.ndarray): 原始解析度的灰階影像。
+        max_width (int): 粗定位時縮小到的最大寬度。
+        padding (float): 候選區域向外擴展的比例。
+    Returns:
+        List[List[int]]: 原始解析度下的候選區域 [x1, y1, x2, y2] 列表 (找不到時為空列表)。
+    """
+    h, w = gray_image.shape[:2]
+    scale = min(1.0, max_width / float(w))
+    small = gray_image if scale >= 1.0 else cv2.resize(gray_image, (int(w * scale), int(h * scale)),
+                                                       interpolation=cv2.INTER_AREA)
+    try:
+        found, points = _qr_detector().detectMulti(small)
+    except cv2.error as e:
+        logger.debug(f"QR Code 粗定位失敗: {e}")
+        return []
+    if not found or points is None:
+        return []
+
+    regions = []
+    for quad in np.asarray(points, dtype=np.float32).reshape(-1, 4, 2) / scale:
+        x1, y1 = quad.min(axis=0)
+        x2, y2 = quad.max(axis=0)
+        regions.append(expand_bbox([x1, y1, x2, y2], w, h, padding))
+    return regions
+
+
+def _binarize(gray_image: np.ndarray, method: Optional[str]) -> np.ndarray:
+    if method == "otsu":
+        return cv2.threshold(gray_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    if method == "adaptive":
+        return cv2.adaptiveThreshold(gray_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 5)
+    return gray_image
+
+
+def _decode_once(gray_image: np.ndarray) -> Optional[str]:
+    """
+    對灰階影像執行一次解碼 (優先使用 pyzbar，未安裝時使用 OpenCV QRCodeDetector)。
+    """
+    if pyzbar is not None:
+        # 這裡假設影像中只有一個與我們相關的 QR Code，或者我們只處理第一個
+        barcodes = pyzbar.decode(gray_image)
+        return barcodes[0].data.decode('utf-8') if barcodes else None
+    data, _, _ = _qr_detector().detectAndDecode(gray_image)
+    return data or None
+
+
+def decode_with_ladder(gray_image: np.ndarray) -> Optional[str]:
+    """
+    依 DECODE_LADDER 以不同縮放與二值化方式重試解碼，成功即返回。
+    Args:
+        gray_image (np.ndarray): 灰階影像 (通常為候選區域)。
+    Returns:
+        Optional[str]: QR Code 數據，全部失敗時為 None。
+    """
+    h, w = gray_image.shape[:2]
+    for scale, method in DECODE_LADDER:
+        scaled_w, scaled_h = int(w * scale), int(h * scale)
+        if min(scaled_w, scaled_h) < 21 or max(scaled_w, scaled_h) > 4096: # 21 為 QR Code 最小模組數
+            continue
+        scaled = gray_image if scale == 1.0 else cv2.resize(
+            gray_image, (scaled_w, scaled_h), interpolation=cv2.INTER_CUBIC if scale > 1.0 else cv2.INTER_AREA)
+        qr_data = _decode_once(_binarize(scaled, method))
+        if qr_data:
+            if (scale, method) != DECODE_LADDER[0]:
+                logger.debug(f"QR Code 於重試階段 (縮放 {scale}, 二值化 {method}) 解碼成功。")
+            return qr_data
+    return None
+
+
+def _scan_gray_region(gray_region: np.ndarray) -> Optional[str]:
+    """
+    由粗到細掃描單一區域：先解碼粗定位找到的候選區域，找不到或全部失敗時對整個區域執行重試階梯。
+    """
+    for x1, y1, x2, y2 in locate_qr_regions(gray_region):
+        qr_data = decode_with_ladder(gray_region[y1:y2, x1:x2])
+        if qr_data:
+            return qr_data
+    return decode_with_ladder(gray_region)
+
+
+def scan_qr_codes(image_np: np.ndarray, bboxes: Sequence[Sequence[int]], expansion: float = 0.1) -> List[Optional[str]]:
+    """
+    批次掃描一幀中所有貨物邊框內的 QR Code (整幀只轉換一次灰階，只轉換所有邊框的聯集範圍)。
+    Args:
+        image_np (np.ndarray): OpenCV 格式的完整影像 (BGR)。
+        bboxes (Sequence[Sequence[int]]): 貨物邊界框 [x1, y1, x2, y2] 列表。
+        expansion (float): 邊框向外擴展的比例。
+    Returns:
+        List[Optional[str]]: 與 bboxes 順序相同的 QR Code 數據列表 (未偵測到或讀取失敗為 None)。
+    """
+    results: List[Optional[str]] = [None] * len(bboxes)
+    if image_np is None or image_np.size == 0 or len(bboxes) == 0:
+        return results
+
+    h, w = image_np.shape[:2]
+    regions = [expand_bbox(bbox, w, h, expansion) for bbox in bboxes]
+    ux1, uy1 = min(r[0] for r in regions), min(r[1] for r in regions)
+    ux2, uy2 = max(r[2] for r in regions), max(r[3] for r in regions)
+    if ux2 <= ux1 or uy2 <= uy1:
+        return results
+
+    union = image_np[uy1:uy2, ux1:ux2]
+    gray_union = cv2.cvtColor(union, cv2.COLOR_BGR2GRAY) if union.ndim == 3 else union
+    for idx, (x1, y1, x2, y2) in enumerate(regions):
+        if (x2 - x1) < 20 or (y2 - y1) < 20:
+            logger.warning(f"裁剪區域太小: {x2-x1}x{y2-y1}，可能影響QR碼識別")
+        if x2 <= x1 or y2 <= y1:
+            continue
+        try:
+            results[idx] = _scan_gray_region(gray_union[y1 - uy1:y2 - uy1, x1 - ux1:x2 - ux1])
+        except Exception as e:
+            logger.error(f"掃描 QR Code 時發生錯誤: {e}", exc_info=True)
+            continue
+        if results[idx]:
+            logger.info(f"成功掃描到 QR Code: {results[idx]}")
+    return results
+
+
 def scan_qr_code(image_np: np.ndarray) -> Optional[str]:
     """
-    在影像中掃描並讀取 QR Code。
+    在影像中掃描並讀取 QR Code (由粗到細：粗定位候選區域，再以重試階梯解碼)。
     Args:
         image_np (np.ndarray): OpenCV 格式的影像。
     Returns:
         Optional[str]: 讀取到的 QR Code 數據字符串，如果未偵測到或讀取失敗則為 None。
     """
-    if pyzbar is None:
-        logger.error("pyzbar 庫未安裝，無法執行 QR Code 掃描。")
-        return None
-
     if image_np is None or image_np.size == 0:
          logger.warning("輸入影像無效，無法掃描 QR Code。")
          return None
 
-    # 將影像轉換為灰階，有利於 QR Code 偵測
-    gray_image = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
-
-    try:
-        # 偵測並解碼影像中的 QR Code
-        barcodes = pyzbar.decode(gray_image)
-
-        # 這裡假設影像中只有一個與我們相關的 QR Code，或者我們只處理第一個
-        if barcodes:
-            # 解碼成功，返回數據
-            qr_data = barcodes[0].data.decode('utf-8')
-            logger.info(f"成功掃描到 QR Code: {qr_data}")
-            # 可選：繪製偵測到的 QR 框 (用於調試或保存影像)
-            # for barcode in barcodes:
-            #      (x, y, w, h) = barcode.rect
-            #      cv2.rectangle(image_np, (x, y), (x + w, y + h), (0, 0, 255), 2)
-            #      logger.debug(f"QR Code 框: ({x}, {y}, {w}, {h})")
-            # 返回讀取到的數據
-            return qr_data
-        else:
-            # 未偵測到 QR Code
-            # logger.debug("未偵測到 QR Code。") # 避免頻繁日誌
-            return None
-
-    except Exception as e:
-        logger.error(f"掃描 QR Code 時發生錯誤: {e}", exc_info=True)
-        return None
-
-# 可選：添加一個函數來掃描特定 ROI 中的 QR Code
-# def scan_qr_code_in_roi(image_np: np.ndarray, roi: List[int]) -> Optional[str]:
-#     """
-#     在指定的 ROI 區域中掃描 QR Code。
-#     Args:
-#         image_np (np.ndarray): 原始 OpenCV 影像。
-#         roi (List[int]): 感興趣區域 [x1, y1, x2, y2]。
-#     Returns:
-#         Optional[str]: 讀取到的 QR Code 數據，或 None。
-#     """
-#     if image_np is None or image_np.size == 0 or not roi:
-#          return None
-#     try:
-#          # 裁剪 ROI 區域
-#          roi_image = image_np[roi[1]:roi[3], roi[0]:roi[2]]
-#          return scan_qr_code(roi_image)
-#     except Exception as e:
-#          logger.error(f"在 ROI 中掃描 QR Code 時發生錯誤: {e}", exc_info=True)
-#          return None
\ No newline at end of file
+    h, w = image_np.shape[:2]
+    return scan_qr_codes(image_np, [[0, 0, w, h]], expansion=0.0)[0]
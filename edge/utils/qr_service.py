@@ -0,0 +1,345 @@
+# utils/qr_service.py
+
+import time
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils import metrics, qr_scanner
+
+logger = logging.getLogger(__name__)
+
+# 沒有實際解碼的結果 (服務已關閉、輸入無效、解碼任務已滿或工作進程失敗)，與「已解碼但沒有 QR Code」的 None 區分
+NOT_ATTEMPTED = object()
+
+
+def crop_dhash(image_np: np.ndarray, hash_size: int = 8) -> int:
+    """
+    計算影像的差異雜湊 (dHash)，用於判斷貨物裁剪區域的內容是否改變。
+    先縮小再轉灰階，計算量與裁剪區域大小無關。
+    Args:
+        image_np (np.ndarray): BGR 或灰階影像。
+        hash_size (int): 雜湊邊長 (hash_size * hash_size 位元)。
+    Returns:
+        int: 雜湊值。
+    """
+    small = cv2.resize(image_np, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).tobytes().hex(), 16)
+
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    return bin(hash_a ^ hash_b).count("1")
+
+
+def _decode_in_worker(image_np: np.ndarray) -> Tuple[Optional[str], float]:
+    """
+    在工作進程中執行的解碼函數 (需為模組層級函數才能被 pickle)。
+    Returns:
+        Tuple[Optional[str], float]: (QR Code 數據或 None, 解碼耗時秒數)。
+    """
+    start = time.perf_counter()
+    return qr_scanner.scan_qr_code(image_np), time.perf_counter() - start
+
+
+class _CacheEntry:
+    __slots__ = ("crop_hash", "result", "timestamp")
+
+    def __init__(self, crop_hash: int, result: Optional[str], timestamp: float):
+        self.crop_hash = crop_hash
+        self.result = result
+        self.timestamp = timestamp
+
+
+class QRService:
+    """
+    非同步 QR Code 解碼服務。
+    以進程池執行 cvtColor + pyzbar 解碼 (避開 GIL，不阻塞幀處理)，submit() 立即返回 Future。
+    結果以追蹤 ID (沒有時以裁剪區域的 dHash) 快取，在 TTL 內且影像內容沒有明顯改變時直接返回快取結果，
+    同一個鍵正在解碼時也不會重複提交。
+    """
+    def __init__(self, qr_settings: dict):
+        """
+        初始化 QR 解碼服務。
+        Args:
+            qr_settings (dict): 設定 (config.qr_service)，包含 num_workers, max_pending, start_method,
+                                cache_ttl_sec, negative_cache_ttl_sec, cache_max_entries, hash_distance_threshold。
+        """
+        self.num_workers = max(0, int(qr_settings.get('num_workers', 1))) # 0 表示在呼叫執行緒中同步解碼
+        self.max_pending = max(1, int(qr_settings.get('max_pending', 4))) # 解碼中的任務上限 (超過時拒絕新任務)
+        self.cache_ttl_sec = float(qr_settings.get('cache_ttl_sec', 60.0)) # 解碼成功結果的快取時間
+        self.negative_cache_ttl_sec = float(qr_settings.get('negative_cache_ttl_sec', 5.0)) # 解碼失敗結果的快取時間
+        self.cache_max_entries = max(1, int(qr_settings.get('cache_max_entries', 256)))
+        self.hash_distance_threshold = int(qr_settings.get('hash_distance_threshold', 10)) # dHash 漢明距離超過此值視為內容改變
+
+        self.start_method = qr_settings.get('start_method', 'spawn') # 避免 fork 已啟動執行緒的主進程
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if self.num_workers > 0:
+            self._executor = self._create_executor()
+
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Any, _CacheEntry]" = OrderedDict()
+        self._pending: Dict[Any, Future] = {}
+        self._closed = False
+
+        self.submitted_count = 0
+        self.cache_hit_count = 0
+        self.coalesced_count = 0 # 併入正在進行中解碼的次數
+        self.rejected_count = 0
+        self.decoded_count = 0
+        self.decode_success_count = 0
+        self.error_count = 0
+        self.pool_restart_count = 0
+        self.total_decode_sec = 0.0
+
+        logger.info(f"QR 解碼服務已啟動 (工作進程: {self.num_workers}，快取 TTL: {self.cache_ttl_sec}s)。")
+
+    def submit(self, image_np: np.ndarray, track_id: Optional[int] = None) -> Optional[Future]:
+        """
+        提交一個貨物裁剪區域進行 QR Code 解碼。
+        Args:
+            image_np (np.ndarray): 貨物裁剪區域 (BGR)。
+            track_id (int, optional): 貨物的追蹤 ID；提供時以追蹤 ID 作為快取鍵。
+        Returns:
+            Future | None: 結果為 QR Code 數據字符串或 None (沒有 QR Code) 的 Future，解碼任務失敗時為 NOT_ATTEMPTED；
+                           服務已關閉或解碼任務已滿時返回 None。
+        """
+        return self._submit(image_np, track_id, enforce_limit=True)
+
+    def _submit(self, image_np: np.ndarray, track_id: Optional[int], enforce_limit: bool) -> Optional[Future]:
+        """
+        submit() 的實作；enforce_limit 為 False 時不檢查 max_pending (批次提交已在批次層級檢查)。
+        """
+        if image_np is None or image_np.size == 0:
+            logger.warning("輸入影像無效，無法提交 QR Code 解碼。")
+            return None
+
+        crop_hash = crop_dhash(image_np)
+        now = time.monotonic()
+        with self._lock:
+            if self._closed:
+                return None
+            self.submitted_count += 1
+
+            key, entry = self._lookup(track_id, crop_hash, now)
+            if entry is not None:
+                self.cache_hit_count += 1
+                self._cache.move_to_end(key)
+                future = Future()
+                future.set_result(entry.result)
+                return future
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.coalesced_count += 1
+                return pending
+
+            if enforce_limit and len(self._pending) >= self.max_pending:
+                self.rejected_count += 1
+                logger.warning(f"QR 解碼任務已滿 ({self.max_pending})，略過此次解碼。")
+                return None
+
+            result_future = Future()
+            self._pending[key] = result_future
+            if self._executor is not None:
+                # 進程之間以 pickle 傳遞影像，序列化在之後的 feeder 執行緒進行：一定要傳入拷貝
+                # (連續的裁剪區域經 ascontiguousarray 仍是幀緩衝區的視圖，槽位可能在序列化前被覆寫)
+                image_np = image_np.copy()
+
+        self._dispatch(key, crop_hash, result_future, image_np, retried=False)
+        return result_future
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.num_workers,
+                                   mp_context=multiprocessing.get_context(self.start_method))
+
+    def _dispatch(self, key: Any, crop_hash: int, result_future: Future, image_np: np.ndarray, retried: bool):
+        """
+        將解碼任務交給工作進程 (或在呼叫執行緒中同步解碼)；進程池損壞時重建並重試一次。
+        Args:
+            retried (bool): 是否已經因進程池損壞重試過。
+        """
+        executor = self._executor
+        worker_future = Future()
+        try:
+            if executor is None:
+                worker_future.set_result(_decode_in_worker(image_np))
+            else:
+                worker_future = executor.submit(_decode_in_worker, image_np)
+        except BrokenProcessPool as e:
+            if not retried and self._restart_executor(executor):
+                self._dispatch(key, crop_hash, result_future, image_np, retried=True)
+                return
+            worker_future.set_exception(e)
+        except Exception as e:
+            worker_future.set_exception(e)
+        worker_future.add_done_callback(
+            lambda f: self._on_decoded(key, crop_hash, result_future, f, image_np, retried, executor)
+        )
+
+    def _restart_executor(self, broken: Optional[ProcessPoolExecutor]) -> bool:
+        """
+        重建已損壞的進程池 (例如工作進程被 OOM killer 終止)。多個任務同時發現損壞時只重建一次。
+        Args:
+            broken (ProcessPoolExecutor): 發現損壞的進程池。
+        Returns:
+            bool: 可以重試 (服務仍在運行) 時返回 True。
+        """
+        with self._lock:
+            if self._closed:
+                return False
+            if self._executor is broken:
+                self._executor = self._create_executor()
+                self.pool_restart_count += 1
+                metrics.count_error("qr_pool_restart")
+                logger.warning(f"QR 解碼進程池已損壞，已重建進程池 (第 {self.pool_restart_count} 次)。")
+            return True
+
+    def submit_batch(self, images: List[np.ndarray], track_ids: Optional[List[Optional[int]]] = None) -> Future:
+        """
+        批次提交一幀中所有貨物的裁剪區域 (每個區域各自查詢快取，未命中的區域並行解碼)。
+        max_pending 以整個批次為單位檢查：批次開始時任務未滿就接受整個批次，不會只解碼前幾個貨物。
+        Args:
+            images (List[np.ndarray]): 貨物裁剪區域列表 (BGR)。
+            track_ids (List[Optional[int]], optional): 對應的追蹤 ID 列表。
+        Returns:
+            Future: 結果為與 images 順序相同的列表，每項為 QR Code 數據、None (已解碼但沒有 QR Code)
+                    或 NOT_ATTEMPTED (沒有實際解碼，呼叫者可稍後重試)。
+        """
+        track_ids = track_ids or [None] * len(images)
+        with self._lock:
+            accepted = self._closed or len(self._pending) < self.max_pending
+            if not accepted:
+                self.rejected_count += len(images)
+        if accepted:
+            futures = [self._submit(image_np, track_id, enforce_limit=False) for image_np, track_id in zip(images, track_ids)]
+        else:
+            logger.warning(f"QR 解碼任務已滿 ({self.max_pending})，略過此批次 {len(images)} 個貨物的解碼。")
+            futures = [None] * len(images)
+        batch_future = Future()
+        remaining = [len(futures)]
+        remaining_lock = threading.Lock()
+
+        def _on_item_done(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            batch_future.set_result([future.result() if future is not None else NOT_ATTEMPTED for future in futures])
+
+        if not futures:
+            batch_future.set_result([])
+        for future in futures:
+            if future is None:
+                _on_item_done(None)
+            else:
+                future.add_done_callback(_on_item_done)
+        return batch_future
+
+    def _lookup(self, track_id: Optional[int], crop_hash: int, now: float) -> Tuple[Any, Optional[_CacheEntry]]:
+        """
+        查找有效的快取項目 (需在持有鎖時調用)。
+        Returns:
+            Tuple[Any, Optional[_CacheEntry]]: (快取鍵, 有效的快取項目或 None)。
+        """
+        if track_id is not None:
+            key = ("track", int(track_id))
+            entry = self._cache.get(key)
+            if entry is not None and self._is_valid(entry, crop_hash, now):
+                return key, entry
+            return key, None
+
+        for key, entry in self._cache.items():
+            if key[0] == "hash" and self._is_valid(entry, crop_hash, now):
+                return key, entry
+        return ("hash", crop_hash), None
+
+    def _is_valid(self, entry: _CacheEntry, crop_hash: int, now: float) -> bool:
+        ttl = self.cache_ttl_sec if entry.result is not None else self.negative_cache_ttl_sec
+        return (now - entry.timestamp < ttl and
+                hamming_distance(entry.crop_hash, crop_hash) <= self.hash_distance_threshold)
+
+    def _on_decoded(self, key: Any, crop_hash: int, result_future: Future, worker_future: Future,
+                    image_np: np.ndarray, retried: bool, executor: Optional[ProcessPoolExecutor]):
+        """
+        解碼完成時更新快取與統計，並完成對外的 Future (只返回 QR Code 數據，任務失敗時為 NOT_ATTEMPTED)。
+        進程池在任務執行期間損壞時，重建進程池並重新提交一次 (對外的 Future 保持進行中)。
+        """
+        if (not retried and not worker_future.cancelled()
+                and isinstance(worker_future.exception(), BrokenProcessPool)
+                and self._restart_executor(executor)):
+            self._dispatch(key, crop_hash, result_future, image_np, retried=True)
+            return
+
+        qr_data = NOT_ATTEMPTED
+        with self._lock:
+            self._pending.pop(key, None)
+            if worker_future.cancelled() or worker_future.exception() is not None:
+                self.error_count += 1
+                metrics.count_error("qr_decode")
+                if not worker_future.cancelled():
+                    logger.error(f"QR Code 解碼任務失敗: {worker_future.exception()}")
+            else:
+                qr_data, elapsed = worker_future.result()
+                metrics.observe_stage("qr_decode", elapsed)
+                self.decoded_count += 1
+                self.total_decode_sec += elapsed
+                if qr_data is not None:
+                    self.decode_success_count += 1
+
+                self._cache[key] = _CacheEntry(crop_hash, qr_data, time.monotonic())
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_max_entries:
+                    self._cache.popitem(last=False)
+        result_future.set_result(qr_data)
+
+    def invalidate(self, track_id: int):
+        """
+        移除指定追蹤 ID 的快取結果 (例如追蹤結束時)。
+        """
+        with self._lock:
+            self._cache.pop(("track", int(track_id)), None)
+
+    def shutdown(self, wait: bool = True):
+        """
+        關閉服務並停止工作進程。
+        Args:
+            wait (bool): 是否等待進行中的解碼完成。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+        logger.info("QR 解碼服務已關閉。")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 提交/快取命中/合併/拒絕次數、解碼次數與成功率、平均解碼時間、進程池重建次數、進行中任務與快取大小。
+        """
+        with self._lock:
+            return {
+                "submitted": self.submitted_count,
+                "cache_hits": self.cache_hit_count,
+                "coalesced": self.coalesced_count,
+                "rejected": self.rejected_count,
+                "decoded": self.decoded_count,
+                "decode_success": self.decode_success_count,
+                "errors": self.error_count,
+                "pool_restarts": self.pool_restart_count,
+                "avg_decode_ms": round(self.total_decode_sec / self.decoded_count * 1000, 2) if self.decoded_count else 0.0,
+                "pending": len(self._pending),
+                "cache_size": len(self._cache),
+            }
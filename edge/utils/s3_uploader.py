@@ -3,56 +3,164 @@
 import threading
 import queue
 import boto3
+import shutil
 import logging
 import os
-from botocore.exceptions import NoCredentialsError, ClientError
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import NoCredentialsError, ClientError, BotoCoreError, EndpointConnectionError, \
+    ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError
+
+from utils import metrics
 
 # 配置 logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class S3Uploader(threading.Thread):
+# 視為暫時性、可以重試的 S3 錯誤碼
+RETRYABLE_ERROR_CODES = {
+    "InternalError", "ServiceUnavailable", "SlowDown", "RequestTimeout", "RequestTimeTooSkewed",
+    "Throttling", "ThrottlingException", "RequestLimitExceeded", "500", "502", "503", "504",
+}
+# 表示網路不可用 (離線) 的錯誤類型，重試用盡後會寫入磁碟暫存區
+OFFLINE_ERRORS = (EndpointConnectionError, ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError)
+
+
+def build_object_key(prefix: str, timestamp: Optional[float] = None, extension: str = "jpg") -> str:
     """
-    使用獨立執行緒處理 S3 上傳的類別。
-    接收佇列中的上傳任務，並異步執行。
+    生成不會互相覆蓋的 S3 Key：<prefix>/<時間戳>_<隨機碼>.<副檔名>。
+    Args:
+        prefix (str): S3 檔案夾前綴。
+        timestamp (float, optional): Unix 時間戳，預設為目前時間。
+        extension (str): 副檔名。
+    Returns:
+        str: S3 Key。
+    """
+    timestamp_str = datetime.fromtimestamp(timestamp if timestamp is not None else time.time()).strftime("%Y%m%d_%H%M%S_%f")
+    prefix = prefix or ""
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    return f"{prefix}{timestamp_str}_{uuid.uuid4().hex[:8]}.{extension}"
+
+
+class UploadTask:
     """
-    def __init__(self, aws_settings: dict, upload_queue: queue.Queue):
+    一個 S3 上傳任務。數據可以在記憶體中 (data)、在本地檔案中 (file_path，例如事件短片)
+    或在磁碟暫存區中 (spool_path)。
+    """
+    def __init__(self, s3_key: str, data: Optional[bytes] = None, spool_path: Optional[str] = None,
+                 file_path: Optional[str] = None, delete_after: bool = False):
+        self.s3_key = s3_key
+        self.data = data
+        self.spool_path = spool_path
+        self.file_path = file_path
+        self.delete_after = delete_after # 上傳成功 (或放棄) 後刪除 file_path
+        self.attempts = 0
+
+    @property
+    def path(self) -> Optional[str]:
+        return self.spool_path or self.file_path
+
+    def read_body(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+class S3Uploader:
+    """
+    S3 上傳子系統：多個工作執行緒共用一個連線池化的 S3 客戶端，
+    從佇列中獲取上傳任務，失敗時以指數退避重試。
+    佇列已滿或網路離線時，任務會寫入磁碟暫存區 (spool)，待恢復後自動補傳。
+    """
+    def __init__(self, aws_settings: dict, upload_queue: queue.Queue, s3_client=None):
         """
         初始化 S3 上傳器。
         Args:
             aws_settings (dict): AWS 相關設定，包含 region, s3 config 等。
-            upload_queue (queue.Queue): 儲存待上傳任務的佇列 (tuple: (bytes, s3_key))。
+            upload_queue (queue.Queue): 儲存待上傳任務的佇列 (UploadTask)。
+            s3_client (optional): 已建立的 S3 客戶端 (例如指向本地 S3 相容服務)，未提供時依設定建立。
         """
-        super().__init__(daemon=True) # 設定為 daemon 執行緒，主程式結束時會自動終止
         self.aws_settings = aws_settings
+        self.s3_settings = aws_settings.get('s3', {})
         self.upload_queue = upload_queue
-        self.s3_client = self._create_s3_client()
-        self._stop_event = threading.Event() # 用於安全停止執行緒
+        self.bucket_name = self.s3_settings.get('bucket_name')
+
+        self.num_workers = max(1, int(self.s3_settings.get('upload_threads', 2)))
+        self.max_retries = int(self.s3_settings.get('max_retries', 3))
+        self.retry_base_delay = float(self.s3_settings.get('retry_base_delay_sec', 0.5))
+        self.retry_max_delay = float(self.s3_settings.get('retry_max_delay_sec', 30.0))
+
+        # 檔案上傳 (例如事件短片) 超過門檻時以 upload_file 分段上傳
+        self.multipart_threshold = int(self.s3_settings.get('multipart_threshold_mb', 8)) * 1024 * 1024
+        self._transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=int(self.s3_settings.get('multipart_chunksize_mb', 8)) * 1024 * 1024,
+            max_concurrency=int(self.s3_settings.get('multipart_concurrency', 4)),
+            use_threads=True
+        )
+
+        # 磁碟暫存區設定 (spool_dir 設為空字串可停用)
+        self.spool_dir = self.s3_settings.get('spool_dir', 'spool/s3')
+        self.spool_max_bytes = int(self.s3_settings.get('spool_max_mb', 512)) * 1024 * 1024
+        self.spool_drain_interval = float(self.s3_settings.get('spool_drain_interval_sec', 5.0))
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+
+        self.s3_client = s3_client if s3_client is not None else self._create_s3_client()
+        self._stop_event = threading.Event()
+        self._workers: List[threading.Thread] = []
+        self._drainer: Optional[threading.Thread] = None
+
+        self._spool_lock = threading.Lock()
+        self._spool_in_flight = set() # 已從暫存區加入佇列、尚未完成的檔案
+        # 暫存區檔案數與總大小 (啟動時掃描一次，之後在寫入與刪除時更新，避免每次寫入都 stat 所有檔案)
+        self._spool_file_count, self._spool_bytes = self._scan_spool() if self.spool_dir else (0, 0)
+        self._offline_until = 0.0 # 網路離線時，暫停補傳暫存區直到此時間 (monotonic)
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"uploaded": 0, "uploaded_bytes": 0, "retries": 0, "failed": 0, "spooled": 0,
+                         "spool_dropped": 0, "drained": 0}
 
     def _create_s3_client(self):
         """
-        建立 Boto3 S3 客戶端實例。
+        建立 Boto3 S3 客戶端實例 (執行緒安全，所有工作執行緒共用其連線池)。
         可以從設定檔、環境變數或 IAM Role 獲取憑證。
         """
+        client_config = Config(
+            max_pool_connections=max(10, self.num_workers * 2),
+            retries={'max_attempts': 1, 'mode': 'standard'} # 重試由上傳器自行處理 (含退避與暫存)
+        )
+        client_kwargs = {
+            'region_name': self.aws_settings.get('region') or None,
+            'config': client_config,
+        }
+        # 可選：指向本地 S3 相容服務 (例如 MinIO) 進行測試
+        if self.s3_settings.get('endpoint_url'):
+            client_kwargs['endpoint_url'] = self.s3_settings['endpoint_url']
         try:
             # 優先使用設定檔中的 Access Key/Secret Key (如果提供)
-            if 'access_key_id' in self.aws_settings and 'secret_access_key' in self.aws_settings:
+            if self.aws_settings.get('access_key_id') and self.aws_settings.get('secret_access_key'):
                 return boto3.client('s3',
-                    region_name=self.aws_settings.get('region'),
                     aws_access_key_id=self.aws_settings['access_key_id'],
-                    aws_secret_access_key=self.aws_settings['secret_access_key']
+                    aws_secret_access_key=self.aws_settings['secret_access_key'],
+                    **client_kwargs
                 )
             # 其次使用 profile (如果提供)
-            elif 'profile_name' in self.aws_settings:
-                 return boto3.client('s3',
-                    region_name=self.aws_settings.get('region'),
-                    profile_name=self.aws_settings['profile_name']
-                )
+            elif self.aws_settings.get('profile_name'):
+                 session = boto3.Session(profile_name=self.aws_settings['profile_name'])
+                 return session.client('s3', **client_kwargs)
             # 否則依賴環境變數或 EC2/ECS 的 IAM Role (Jetson 上較可能使用環境變數或 profile)
             else:
-                 return boto3.client('s3',
-                    region_name=self.aws_settings.get('region')
-                )
+                 return boto3.client('s3', **client_kwargs)
         except NoCredentialsError:
             logger.error("AWS 憑證找不到，無法建立 S3 客戶端。請檢查設定檔或環境變數。")
             return None
@@ -60,15 +168,25 @@ class S3Uploader(threading.Thread):
             logger.error(f"建立 S3 客戶端時發生錯誤: {e}")
             return None
 
-    def run(self):
+    def start(self):
         """
-        執行緒的主體，不斷從佇列中獲取任務並上傳。
+        啟動上傳工作執行緒與暫存區補傳執行緒。
         """
         if not self.s3_client:
-            logger.error("S3 客戶端初始化失敗，上傳執行緒終止。")
-            return
+            logger.error("S3 客戶端初始化失敗，上傳任務將只寫入磁碟暫存區。")
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"s3-upload-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        if self.spool_dir:
+            self._drainer = threading.Thread(target=self._drain_loop, name="s3-spool-drain", daemon=True)
+            self._drainer.start()
+        logger.info(f"S3 上傳器啟動，工作執行緒數量: {self.num_workers}，暫存區: {self.spool_dir or '停用'}")
 
-        logger.info("S3 上傳執行緒啟動...")
+    def _worker_loop(self):
+        """
+        工作執行緒的主體，不斷從佇列中獲取任務並上傳。
+        """
         while not self._stop_event.is_set():
             try:
                 # 設置 timeout 避免在佇列為空時永久阻塞，以便檢查停止事件
@@ -77,58 +195,319 @@ class S3Uploader(threading.Thread):
                 continue # 佇列為空，繼續循環檢查停止事件
 
             if task is None:
-                logger.info("收到停止任務，S3 上傳執行緒準備結束。")
+                self.upload_queue.task_done()
                 break # 收到 None 任務，表示停止
 
             try:
-                image_data, s3_key = task
-                bucket_name = self.aws_settings['s3']['bucket_name']
-                logger.info(f"開始上傳: s3://{bucket_name}/{s3_key} ({len(image_data)} bytes)")
-
-                # 使用 put_object 進行上傳
-                self.s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=image_data)
-                logger.info(f"成功上傳: s3://{bucket_name}/{s3_key}")
-
-            except ClientError as e:
-                 logger.error(f"S3 上傳失敗 (ClientError): {e}. Key: {s3_key}", exc_info=True)
-                 # 可以在這裡添加重試邏輯或將任務放回佇列的機制 (根據需求複雜度)
+                self._upload_with_retry(task)
             except Exception as e:
-                logger.error(f"S3 上傳失敗 (其他錯誤): {e}. Key: {s3_key}", exc_info=True)
+                logger.error(f"S3 上傳任務處理失敗 (其他錯誤): {e}. Key: {task.s3_key}", exc_info=True)
             finally:
                 self.upload_queue.task_done() # 通知佇列任務已完成
 
-        logger.info("S3 上傳執行緒已終止。")
+    def _upload_with_retry(self, task: UploadTask):
+        """
+        上傳一個任務，暫時性錯誤以指數退避重試；網路離線且重試用盡時寫入暫存區。
+        """
+        if not self.s3_client:
+            self._spool_or_drop(task)
+            return
+
+        while True:
+            task.attempts += 1
+            try:
+                size = self._put(task)
+                logger.info(f"成功上傳: s3://{self.bucket_name}/{task.s3_key} ({size} bytes)")
+                with self._metrics_lock:
+                    self._metrics["uploaded"] += 1
+                    self._metrics["uploaded_bytes"] += size
+                self._finish_spooled(task, delete=True)
+                self._offline_until = 0.0
+                return
+            except FileNotFoundError:
+                logger.warning(f"暫存檔案已不存在，跳過: {task.path}")
+                self._finish_spooled(task, delete=False)
+                return
+            except (ClientError, BotoCoreError, S3UploadFailedError) as e:
+                offline = isinstance(e, OFFLINE_ERRORS)
+                retryable = offline or self._is_retryable(e)
+                if retryable and task.attempts <= self.max_retries and not self._stop_event.is_set():
+                    delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** (task.attempts - 1)))
+                    delay *= random.uniform(0.8, 1.2)
+                    logger.warning(f"S3 上傳失敗 ({e})，{delay:.1f} 秒後重試 (第 {task.attempts} 次)。Key: {task.s3_key}")
+                    with self._metrics_lock:
+                        self._metrics["retries"] += 1
+                    self._stop_event.wait(delay)
+                    continue
+
+                if retryable:
+                    # 網路離線或服務持續不可用：寫入暫存區，待恢復後補傳
+                    logger.error(f"S3 上傳重試用盡 ({e})。Key: {task.s3_key}")
+                    self._offline_until = time.monotonic() + self.retry_max_delay
+                    self._spool_or_drop(task)
+                else:
+                    logger.error(f"S3 上傳失敗 (不可重試的 ClientError): {e}. Key: {task.s3_key}", exc_info=True)
+                    with self._metrics_lock:
+                        self._metrics["failed"] += 1
+                    self._finish_spooled(task, delete=True)
+                return
+
+    def _put(self, task: UploadTask) -> int:
+        """
+        上傳一個任務的數據。檔案任務超過分段門檻時以 upload_file + TransferConfig 分段上傳 (不整個讀入記憶體)。
+        Returns:
+            int: 上傳的位元組數。
+        """
+        with metrics.timed("s3_put"):
+            if task.data is None:
+                size = os.path.getsize(task.path)
+                if size >= self.multipart_threshold:
+                    self.s3_client.upload_file(task.path, self.bucket_name, task.s3_key, Config=self._transfer_config)
+                    return size
+            body = task.read_body()
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=task.s3_key, Body=body)
+            return len(body)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, S3UploadFailedError):
+            return True # upload_file 包裝了底層錯誤，無法區分錯誤碼，視為可重試
+        if isinstance(error, ClientError):
+            code = str(error.response.get('Error', {}).get('Code', ''))
+            status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+            return code in RETRYABLE_ERROR_CODES or status >= 500 or status == 429
+        return isinstance(error, BotoCoreError)
+
+    def _spool_or_drop(self, task: UploadTask):
+        """
+        將任務寫入磁碟暫存區；已在暫存區中的任務保留原檔案，等待下次補傳。
+        """
+        if task.spool_path is not None:
+            self._finish_spooled(task, delete=False)
+            return
+        if not self.spool_dir:
+            logger.warning(f"暫存區已停用，丟棄上傳任務: {task.s3_key}")
+            with self._metrics_lock:
+                self._metrics["spool_dropped"] += 1
+            self._finish_file(task)
+            return
+
+        with self._spool_lock:
+            try:
+                task_bytes = len(task.data) if task.data is not None else os.path.getsize(task.file_path)
+            except OSError:
+                task_bytes = 0
+            if self._spool_bytes + task_bytes > self.spool_max_bytes:
+                logger.warning(f"S3 暫存區已滿 ({self._spool_bytes} bytes)，丟棄上傳任務: {task.s3_key}")
+                with self._metrics_lock:
+                    self._metrics["spool_dropped"] += 1
+                self._finish_file(task)
+                return
+            file_name = f"{time.time_ns()}_{quote(task.s3_key, safe='')}"
+            tmp_path = os.path.join(self.spool_dir, file_name + ".tmp")
+            try:
+                if task.data is not None:
+                    with open(tmp_path, 'wb') as f:
+                        f.write(task.data)
+                elif task.delete_after:
+                    shutil.move(task.file_path, tmp_path) # 檔案任務直接移入暫存區
+                else:
+                    shutil.copyfile(task.file_path, tmp_path)
+                os.replace(tmp_path, os.path.join(self.spool_dir, file_name))
+            except OSError as e:
+                logger.error(f"寫入 S3 暫存區失敗: {e}. Key: {task.s3_key}")
+                with self._metrics_lock:
+                    self._metrics["spool_dropped"] += 1
+                return
+            self._spool_file_count += 1
+            self._spool_bytes += task_bytes
+        logger.info(f"上傳任務已寫入暫存區: {task.s3_key}")
+        with self._metrics_lock:
+            self._metrics["spooled"] += 1
+
+    def _finish_file(self, task: UploadTask):
+        """
+        檔案任務完成 (上傳成功或放棄) 時，依 delete_after 刪除本地檔案。
+        """
+        if task.file_path is not None and task.delete_after:
+            try:
+                os.remove(task.file_path)
+            except FileNotFoundError:
+                pass
+
+    def _finish_spooled(self, task: UploadTask, delete: bool):
+        if task.spool_path is None:
+            if delete:
+                self._finish_file(task)
+            return
+        with self._spool_lock:
+            self._spool_in_flight.discard(task.spool_path)
+            if delete:
+                try:
+                    size = os.path.getsize(task.spool_path)
+                    os.remove(task.spool_path)
+                except FileNotFoundError:
+                    return
+                self._spool_file_count -= 1
+                self._spool_bytes = max(0, self._spool_bytes - size)
+
+    def _spool_files(self) -> List[str]:
+        try:
+            return sorted(name for name in os.listdir(self.spool_dir) if not name.endswith(".tmp"))
+        except FileNotFoundError:
+            return []
+
+    def _scan_spool(self) -> Tuple[int, int]:
+        """
+        掃描暫存區 (只在啟動時調用)。
+        Returns:
+            Tuple[int, int]: (檔案數, 總大小 bytes)。
+        """
+        count, total = 0, 0
+        for name in self._spool_files():
+            try:
+                total += os.path.getsize(os.path.join(self.spool_dir, name))
+                count += 1
+            except OSError:
+                pass
+        return count, total
+
+    def _drain_loop(self):
+        """
+        暫存區補傳執行緒：網路恢復且佇列有空位時，將暫存檔案依序重新加入上傳佇列。
+        """
+        while not self._stop_event.wait(self.spool_drain_interval):
+            if time.monotonic() < self._offline_until or not self.s3_client:
+                continue
+            capacity = self._queue_capacity()
+            if capacity <= 0:
+                continue
+            with self._spool_lock:
+                candidates = [name for name in self._spool_files()
+                              if os.path.join(self.spool_dir, name) not in self._spool_in_flight]
+            for name in candidates[:capacity]:
+                path = os.path.join(self.spool_dir, name)
+                s3_key = unquote(name.split('_', 1)[1]) if '_' in name else name
+                task = UploadTask(s3_key, spool_path=path)
+                try:
+                    with self._spool_lock:
+                        self._spool_in_flight.add(path)
+                    self.upload_queue.put_nowait(task)
+                    with self._metrics_lock:
+                        self._metrics["drained"] += 1
+                except queue.Full:
+                    with self._spool_lock:
+                        self._spool_in_flight.discard(path)
+                    break
+
+    def _queue_capacity(self) -> int:
+        """
+        佇列剩餘空間的一半 (保留空間給即時的新任務)。
+        """
+        if self.upload_queue.maxsize <= 0:
+            return self.num_workers * 2
+        return (self.upload_queue.maxsize - self.upload_queue.qsize()) // 2
 
     def stop(self):
         """
-        請求停止上傳執行緒。
+        請求停止所有上傳執行緒。
         """
         logger.info("請求停止 S3 上傳執行緒...")
         self._stop_event.set() # 設定停止事件
-        # 將 None 任務放入佇列，喚醒正在等待的 get()
-        try:
-             self.upload_queue.put_nowait(None)
-        except queue.Full:
-             pass # 如果佇列滿了，就無法放入 None，等待 timeout 結束
+        # 為每個工作執行緒放入 None 任務，喚醒正在等待的 get()
+        for _ in self._workers:
+            try:
+                self.upload_queue.put_nowait(None)
+            except queue.Full:
+                pass # 如果佇列滿了，就無法放入 None，等待 timeout 結束
+
+    def join(self, timeout: Optional[float] = None):
+        """
+        等待所有上傳執行緒結束。
+        """
+        for worker in self._workers:
+            worker.join(timeout)
+        if self._drainer is not None:
+            self._drainer.join(timeout)
+
+        # 停止後仍留在佇列中的任務寫入暫存區，下次啟動時補傳
+        while True:
+            try:
+                task = self.upload_queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                self._spool_or_drop(task)
+            self.upload_queue.task_done()
+        logger.info("S3 上傳執行緒已終止。")
 
     def put_upload_task(self, image_data: bytes, s3_key: str):
         """
-        將一個上傳任務添加到佇列。
+        將一個上傳任務添加到佇列。佇列已滿時寫入磁碟暫存區，而不是丟棄。
         Args:
             image_data (bytes): 圖片的二進位數據。
             s3_key (str): 上傳到 S3 的目標 Key (檔案路徑)。
         """
+        task = UploadTask(s3_key, data=image_data)
         try:
-            self.upload_queue.put_nowait((image_data, s3_key)) # 非阻塞地放入佇列
+            self.upload_queue.put_nowait(task) # 非阻塞地放入佇列
             logger.debug(f"已將任務添加到 S3 上傳佇列: {s3_key}")
         except queue.Full:
-            logger.warning(f"S3 上傳佇列已滿，丟棄任務: {s3_key}")
-            # 佇列滿了可以選擇丟棄任務或阻塞等待，這裡選擇丟棄以保持主迴圈響應
+            logger.warning(f"S3 上傳佇列已滿，任務寫入暫存區: {s3_key}")
+            self._spool_or_drop(task)
 
-    def wait_for_completion(self):
+    def put_file_task(self, file_path: str, s3_key: str, delete_after: bool = True) -> bool:
         """
-        等待佇列中的所有任務完成。
+        將一個本地檔案 (例如事件短片) 的上傳任務添加到佇列。大檔案以分段上傳，不會整個讀入記憶體。
+        Args:
+            file_path (str): 本地檔案路徑。
+            s3_key (str): 上傳到 S3 的目標 Key。
+            delete_after (bool): 上傳完成 (或放棄) 後是否刪除本地檔案。
+        Returns:
+            bool: 如果任務加入佇列或寫入暫存區則為 True。
+        """
+        if not os.path.isfile(file_path):
+            logger.warning(f"上傳檔案不存在: {file_path}")
+            return False
+        task = UploadTask(s3_key, file_path=file_path, delete_after=delete_after)
+        try:
+            self.upload_queue.put_nowait(task)
+            logger.debug(f"已將檔案任務添加到 S3 上傳佇列: {s3_key}")
+        except queue.Full:
+            logger.warning(f"S3 上傳佇列已滿，檔案任務寫入暫存區: {s3_key}")
+            self._spool_or_drop(task)
+        return True
+
+    def wait_for_completion(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待佇列中的所有任務完成 (應在 stop() 之前調用；未完成的任務在 join() 時寫入暫存區)。
+        Args:
+            timeout (float, optional): 最長等待秒數，None 表示無限等待。
+        Returns:
+            bool: 如果佇列在時限內清空則為 True。
         """
         logger.info("等待 S3 上傳佇列清空...")
-        self.upload_queue.join()
-        logger.info("S3 上傳佇列已清空。")
\ No newline at end of file
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.upload_queue.all_tasks_done:
+            while self.upload_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    logger.warning("等待 S3 上傳佇列清空逾時，剩餘任務將寫入暫存區。")
+                    return False
+                self.upload_queue.all_tasks_done.wait(remaining)
+        logger.info("S3 上傳佇列已清空。")
+        return True
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: 上傳、重試、失敗、暫存與補傳數量，以及目前佇列深度與暫存區大小。
+        """
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["queue_depth"] = self.upload_queue.qsize()
+        if self.spool_dir:
+            with self._spool_lock:
+                metrics["spool_files"] = self._spool_file_count
+                metrics["spool_bytes"] = self._spool_bytes
+        return metrics